@@ -1,62 +1,141 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import List, Dict, Optional
 import asyncio
+import json
+import time
 import uuid
 import os
-import hashlib
+import shutil
 from datetime import datetime
 from pathlib import Path
 
 from config import config
 from models.schemas import (
     AnalyzeResponse, FileInfo, BatchUploadResponse, 
-    BatchStatusResponse, Progress, Downloads
+    BatchStatusResponse, Progress, Downloads, FileResult,
+    UploadCreateRequest, UploadStatusResponse, BatchFromUploadsRequest
 )
 from services.detector import DocumentDetector
 from services.converter import DocumentConverter
 from services.zipper import ZipperService
 from services.text_pipeline import TextPipeline
+from services.batch_worker import BatchWorkerPool, process_file
+from services.ooxml_inspector import read_docx_paragraphs, compute_content_hash
 from utils.file_handler import FileHandler
 from utils.logger import get_logger
 from utils.cleaner import StorageCleaner
-from utils.dedup_store import DedupStore, compute_file_sha256, compute_sha256
+from utils.dedup_store import DedupStore, compute_file_sha256, normalize_namespace
+from utils.async_dedup_store import AsyncDedupStore
+from utils.task_store import create_task_store
+from utils.stream_upload import MultipartFileReceiver
+from utils.result_cache import build_cache_entry, create_result_cache
+from utils.chunked_upload import (
+    UploadNamespaceMismatch, UploadOffsetMismatch, check_upload_namespace, create_upload_store
+)
 
 logger = get_logger("api")
 
 router = APIRouter()
 
+# 进度推送无变化时发送保活注释的间隔（秒）
+SSE_KEEPALIVE_SECONDS = 15
+
 # 初始化去重存储（从配置读取）
 dedup_store = DedupStore(
     backend="redis" if config.Redis.ENABLED else "memory",
-    redis_config=config.get_redis_config()
+    redis_config=config.get_redis_config(),
+    simhash_max_distance=config.TextPipeline.SIMHASH_DISTANCE_THRESHOLD,
+    doc_ttl_days=config.Redis.DOC_TTL_DAYS,
+    para_ttl_days=config.Redis.PARA_TTL_DAYS,
+    max_memory_paras=config.Redis.MEMORY_MAX_PARAS,
+    sweep_interval=config.Redis.SWEEP_INTERVAL_SECONDS,
+    bloom_capacity=config.Redis.PARA_BLOOM_CAPACITY,
+    bloom_error_rate=config.Redis.PARA_BLOOM_ERROR_RATE,
+    bloom_refresh_interval=config.Redis.PARA_BLOOM_REFRESH_SECONDS,
+    hash_format=config.Redis.HASH_FORMAT,
+    namespace=config.Redis.NAMESPACE,
+    shard_count=config.Redis.SHARD_COUNT
+)
+
+# 异步去重存储（同一份数据，事件循环中通过 redis.asyncio 连接池访问；批量处理与维护操作仍使用同步版本）
+async_dedup_store = AsyncDedupStore(
+    dedup_store,
+    redis_config=config.get_redis_config(),
+    max_connections=config.Redis.ASYNC_MAX_CONNECTIONS
 )
 
 # 初始化文本管线（从配置读取）
 text_pipeline = TextPipeline(
     dedup_store=dedup_store,
+    async_dedup_store=async_dedup_store,
     min_paragraph_len=config.TextPipeline.MIN_PARAGRAPH_LEN,
     simhash_distance_threshold=config.TextPipeline.SIMHASH_DISTANCE_THRESHOLD,
     enable_near_duplicate=config.TextPipeline.ENABLE_NEAR_DUPLICATE,
     custom_noise_patterns=config.TextPipeline.CUSTOM_NOISE_PATTERNS,
-    enable_cross_doc_dedup=False
+    enable_cross_doc_dedup=False,
+    simhash_tokenizer=config.TextPipeline.SIMHASH_TOKENIZER,
+    simhash_ngram=config.TextPipeline.SIMHASH_NGRAM
 )
 
 # 初始化服务（注入 text_pipeline）
-file_handler = FileHandler()
+file_handler = FileHandler(chunk_size=config.Storage.UPLOAD_CHUNK_SIZE)
 detector = DocumentDetector()
 converter = DocumentConverter(text_pipeline=text_pipeline)
-zipper = ZipperService()
+zipper = ZipperService(max_workers=config.Storage.ZIP_WORKERS)
 cleaner = StorageCleaner()
 
-# 存储批量任务状态
-batch_tasks = {}
+# 转换结果缓存（按原始文件 SHA-256 + 管线配置指纹复用检测与转换结果）
+result_cache = create_result_cache(text_pipeline)
+
+# 初始化批量处理工作层（从配置读取，线程模式下复用上面的服务实例）
+def _resolve_worker_mode() -> str:
+    """
+    批量工作层的执行方式
+    
+    进程模式下每个工作进程各自创建去重存储，只有 Redis 后端能在进程间共享去重状态。
+    内存后端（REDIS_ENABLED=false 或 Redis 不可用而回退）时改用线程模式，
+    文档去重在整个 API 进程内共享（与单文件分析共用同一个去重存储）。
+    """
+    mode = config.BatchProcess.WORKER_MODE
+    if mode == "process" and dedup_store.backend != "redis":
+        logger.warning("去重存储使用内存后端，批量工作层改用线程模式（进程模式下各工作进程的去重状态互不共享）")
+        return "thread"
+    return mode
+
+
+worker_pool = BatchWorkerPool(
+    mode=_resolve_worker_mode(),
+    max_workers=config.BatchProcess.WORKER_COUNT or min(
+        config.BatchProcess.MAX_CONCURRENT_TASKS, os.cpu_count() or 1
+    ),
+    detector=detector,
+    converter=converter,
+    result_cache=result_cache
+)
+
+# 批量任务状态与工作队列（Redis / SQLite 共享存储，支持多进程）
+task_store = create_task_store()
+
+# 可续传分块上传（未完成上传的数据与状态保存在 storage/uploads）
+upload_store = create_upload_store()
+
+
+def _resolve_namespace(namespace: Optional[str]) -> str:
+    """校验请求的去重命名空间（未指定时使用配置的默认命名空间）"""
+    try:
+        return normalize_namespace(namespace) or dedup_store.namespace
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/document/analyze", response_model=AnalyzeResponse)
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(file: UploadFile = File(...),
+                           namespace: Optional[str] = Query(None, description="去重命名空间（知识库标识）")):
     """单文件上传和分析（集成文本管线）"""
-    logger.info(f"单文件分析请求: {file.filename}")
+    namespace = _resolve_namespace(namespace)
+    logger.info(f"单文件分析请求: {file.filename}" + (f" [命名空间 {namespace}]" if namespace else ""))
     
     try:
         # 保存原始文件
@@ -67,71 +146,119 @@ async def analyze_document(file: UploadFile = File(...)):
         )
         logger.debug(f"文件保存成功: {original_path}")
         
-        # 检测文档类型
-        is_pure_text, reason = detector.detect(original_path)
-        logger.info(f"文档检测结果: {file.filename} -> 纯文本={is_pure_text}, 原因={reason}")
-        
-        # 获取路径信息
-        path_info = file_handler.parse_file_path(file)
-        file_id = str(uuid.uuid4())
-        
-        # 构建原始文件信息
-        original_file = FileInfo(
-            name=path_info['filename'],
-            path=path_info['full_path'],
-            download_url=f"/api/v1/files/download/original/{file_id}{path_info['extension']}"
-        )
-        
-        converted_file = None
-        pipeline_info = None
-        
-        # 如果是纯文本，转换为 docx（应用文本管线）
-        if is_pure_text:
-            converted_path = file_handler.converted_dir / f"{file_id}.docx"
-            result = converter.convert_to_docx(
+        # 检测与转换
+        return await _analyze_saved_file(original_path, file_handler.parse_file_path(file),
+                                         file.filename or "unknown", namespace)
+    except Exception as e:
+        logger.error(f"单文件分析错误: {file.filename}, 错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"处理文件失败: {str(e)}")
+
+
+async def _analyze_saved_file(original_path: str, path_info: Dict[str, str], doc_name: str,
+                              namespace: str, file_hash: Optional[str] = None) -> AnalyzeResponse:
+    """
+    检测并转换已保存的原始文件（单文件上传与分块上传共用）
+    
+    Args:
+        original_path: 原始文件路径
+        path_info: 路径信息
+        doc_name: 文档名（日志与去重记录）
+        namespace: 去重命名空间
+        file_hash: 原始文件 SHA-256（已知时不再计算）
+    """
+    file_id = str(uuid.uuid4())
+    
+    # 查询转换结果缓存（相同内容的文件无需重复检测与转换）
+    cache_key = None
+    cached = None
+    inspection = {}
+    if result_cache.enabled:
+        if not file_hash:
+            file_hash = await asyncio.to_thread(compute_file_sha256, original_path)
+        cache_key = result_cache.make_key(file_hash, path_info['extension'].lower(), "analyze")
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+    
+    if cached is not None:
+        is_pure_text, reason = cached['is_pure_text'], cached['reason']
+        logger.info(f"缓存命中: {doc_name} -> 纯文本={is_pure_text}, 原因={reason}")
+    else:
+        # 检测文档类型（docx 同时提取段落，转换时复用）
+        inspection = await asyncio.to_thread(detector.inspect, original_path)
+        is_pure_text, reason = inspection['is_pure_text'], inspection['reason']
+        logger.info(f"文档检测结果: {doc_name} -> 纯文本={is_pure_text}, 原因={reason}")
+        if cache_key and not is_pure_text:
+            await asyncio.to_thread(result_cache.put, cache_key, build_cache_entry(is_pure_text, reason))
+    
+    # 构建原始文件信息
+    original_file = FileInfo(
+        name=path_info['filename'],
+        path=path_info['full_path'],
+        download_url=f"/api/v1/files/download/original/{file_id}{path_info['extension']}"
+    )
+    
+    converted_file = None
+    pipeline_info = None
+    
+    # 如果是纯文本，转换为 docx（应用文本管线）
+    if is_pure_text:
+        converted_path = file_handler.converted_dir / f"{file_id}.docx"
+        if cached is not None and cached.get('convert') and await asyncio.to_thread(
+                result_cache.restore_blob, cached, str(converted_path)):
+            result = await converter.replay_cached_result_async(
+                cached['convert'], doc_name=doc_name, namespace=namespace
+            )
+        else:
+            # 格式转换与清洗在线程池执行，去重查询走异步客户端（Redis 延迟不阻塞其他请求）
+            result = await converter.convert_to_docx_async(
                 original_path, 
                 str(converted_path),
-                doc_name=file.filename or "unknown"
+                doc_name=doc_name,
+                source_paragraphs=inspection.get('paragraphs'),
+                namespace=namespace
             )
-            
-            if result["success"]:
-                logger.info(f"文档转换成功: {file.filename} -> {converted_path.name}")
-                
-                # 记录管线统计信息
-                if "pipeline_stats" in result:
-                    pipeline_info = result["pipeline_stats"]
-                    logger.debug(f"文本管线统计: {pipeline_info}")
-                
-                converted_file = FileInfo(
-                    name=f"{path_info['stem']}.docx",
-                    path=f"{path_info['directory']}/{path_info['stem']}.docx".lstrip('/'),
-                    download_url=f"/api/v1/files/download/converted/{file_id}.docx"
-                )
-            elif result.get("doc_duplicate"):
-                # 文档级去重命中
-                logger.warning(f"文档去重命中: {file.filename}")
-                return AnalyzeResponse(
-                    is_pure_text=is_pure_text,
-                    original_file=original_file,
-                    converted_file=None,
-                    message=result.get("message", "文档已存在")
+            if cache_key and (result["success"] or result.get("doc_duplicate")):
+                await asyncio.to_thread(
+                    result_cache.put, cache_key, build_cache_entry(is_pure_text, reason, result),
+                    blob_file=str(converted_path)
                 )
-            else:
-                logger.error(f"文档转换失败: {file.filename}, {result.get('message')}")
         
-        return AnalyzeResponse(
-            is_pure_text=is_pure_text,
-            original_file=original_file,
-            converted_file=converted_file
-        )
-    except Exception as e:
-        logger.error(f"单文件分析错误: {file.filename}, 错误: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"处理文件失败: {str(e)}")
+        if result["success"]:
+            logger.info(f"文档转换成功: {doc_name} -> {converted_path.name}")
+            
+            # 记录管线统计信息
+            if "pipeline_stats" in result:
+                pipeline_info = result["pipeline_stats"]
+                logger.debug(f"文本管线统计: {pipeline_info}")
+            
+            converted_file = FileInfo(
+                name=f"{path_info['stem']}.docx",
+                path=f"{path_info['directory']}/{path_info['stem']}.docx".lstrip('/'),
+                download_url=f"/api/v1/files/download/converted/{file_id}.docx"
+            )
+        elif result.get("doc_duplicate"):
+            # 文档级去重命中
+            logger.warning(f"文档去重命中: {doc_name}")
+            return AnalyzeResponse(
+                is_pure_text=is_pure_text,
+                original_file=original_file,
+                converted_file=None,
+                message=result.get("message", "文档已存在")
+            )
+        else:
+            logger.error(f"文档转换失败: {doc_name}, {result.get('message')}")
+    
+    return AnalyzeResponse(
+        is_pure_text=is_pure_text,
+        original_file=original_file,
+        converted_file=converted_file
+    )
 
 
 @router.post("/documents/batch-upload", response_model=BatchUploadResponse)
-async def batch_upload_documents(files: List[UploadFile] = File(...)):
+async def batch_upload_documents(files: List[UploadFile] = File(...),
+                                 namespace: Optional[str] = Query(None, description="去重命名空间（知识库标识）")):
     """批量上传文档"""
+    namespace = _resolve_namespace(namespace)
     logger.info(f"批量上传请求: {len(files)} 个文件")
     
     # 生成任务 ID
@@ -142,59 +269,399 @@ async def batch_upload_documents(files: List[UploadFile] = File(...)):
     task_dir = file_handler.get_batch_dir(task_id)
     logger.debug(f"任务目录: {task_dir}")
     
-    # 初始化任务状态
-    batch_tasks[task_id] = {
-        'status': 'processing',
-        'total': len(files),
+    # 先把上传内容分块落盘到任务目录（同时计算哈希），队列中只传递文件路径和哈希
+    logger.info(f"开始保存 {len(files)} 个文件...")
+    file_entries = []
+    for i, file in enumerate(files):
+        try:
+            # 保存原始文件（保留路径），包括重复和临时文件
+            original_file = _build_original_file_path(task_dir, _build_path_info(file.filename))
+            size, file_hash = await file_handler.write_upload_file(file, original_file)
+            file_entries.append({
+                'filename': file.filename,
+                'original_file': str(original_file),
+                'sha256': file_hash,
+                'size': size
+            })
+            logger.debug(f"保存文件 [{i+1}/{len(files)}]: {file.filename} ({size} bytes)")
+        except Exception as e:
+            logger.error(f"保存文件 {file.filename} 失败: {e}")
+            # 记录失败但继续处理
+            file_entries.append(None)
+        finally:
+            await file.close()
+    
+    logger.info(f"文件保存完成, 成功: {len([f for f in file_entries if f is not None])}/{len(files)}")
+    
+    return await _enqueue_batch_task(task_id, task_dir, file_entries, namespace)
+
+
+@router.post("/documents/batch-upload-stream", response_model=BatchUploadResponse)
+async def batch_upload_documents_stream(request: Request,
+                                        namespace: Optional[str] = Query(None, description="去重命名空间（知识库标识）")):
+    """
+    批量上传文档（流式接收）
+    
+    表单格式与 /documents/batch-upload 相同（多个 files 字段），但直接解析请求流，
+    文件数据块边接收边写入任务目录，不经过临时文件，也不在内存中缓存整个文件。
+    """
+    namespace = _resolve_namespace(namespace)
+    task_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    task_dir = file_handler.get_batch_dir(task_id)
+    logger.info(f"流式批量上传请求, 创建任务: {task_id}")
+    
+    try:
+        receiver = MultipartFileReceiver(
+            request.headers.get("content-type", ""),
+            lambda filename: _build_original_file_path(task_dir, _build_path_info(filename))
+        )
+        file_entries = await receiver.receive(request.stream())
+    except ValueError as e:
+        shutil.rmtree(task_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"[任务 {task_id}] 接收上传流失败: {e}")
+        shutil.rmtree(task_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"上传中断: {e}")
+    
+    if not file_entries:
+        shutil.rmtree(task_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="未接收到文件")
+    
+    logger.info(f"文件保存完成, 成功: {len([f for f in file_entries if f is not None])}/{len(file_entries)}")
+    
+    return await _enqueue_batch_task(task_id, task_dir, file_entries, namespace)
+
+
+@router.post("/uploads", response_model=UploadStatusResponse)
+async def create_upload(body: UploadCreateRequest,
+                        namespace: Optional[str] = Query(None, description="去重命名空间（知识库标识）")):
+    """
+    创建可续传分块上传
+    
+    声明了 sha256 且该命名空间已有相同文件时直接返回 complete（duplicate=true），无需上传数据；
+    这样的上传只能在同一命名空间中分析或创建批量任务。
+    """
+    namespace = _resolve_namespace(namespace)
+    try:
+        session = await asyncio.to_thread(
+            upload_store.create, body.filename, body.size, body.sha256, namespace
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"创建分块上传: {body.filename} ({body.size} bytes) -> {session['upload_id']}")
+    return _upload_status(session)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadStatusResponse)
+async def get_upload(upload_id: str):
+    """查询分块上传状态（断线后从 offset 继续上传）"""
+    return _upload_status(await _get_upload_session(upload_id))
+
+
+@router.patch("/uploads/{upload_id}", response_model=UploadStatusResponse)
+async def upload_chunk(upload_id: str, request: Request,
+                       offset: int = Query(..., ge=0, description="分块在文件中的起始偏移（等于上传状态中的 offset）")):
+    """
+    上传一个分块（请求体为分块的原始字节，可选 X-Chunk-SHA256 头校验分块）
+    
+    偏移与服务端已接收的字节数不一致时返回 409，detail.offset 为服务端当前偏移。
+    """
+    await _get_upload_session(upload_id)
+    try:
+        session = await upload_store.write_chunk(
+            upload_id, offset, request.stream(), request.headers.get("x-chunk-sha256")
+        )
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _upload_status(session)
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """取消分块上传，删除已接收的数据"""
+    if not await asyncio.to_thread(upload_store.abort, upload_id):
+        raise HTTPException(status_code=404, detail="上传不存在")
+    return {"upload_id": upload_id, "deleted": True}
+
+
+@router.post("/uploads/{upload_id}/analyze", response_model=AnalyzeResponse)
+async def analyze_upload(upload_id: str,
+                         namespace: Optional[str] = Query(None, description="去重命名空间（知识库标识）")):
+    """分析已完成的分块上传（文件移动到 storage/original，与 /document/analyze 结果相同）"""
+    namespace = _resolve_namespace(namespace)
+    session = await _get_upload_session(upload_id, require_complete=True, namespace=namespace)
+    logger.info(f"分块上传分析请求: {session['filename']}" + (f" [命名空间 {namespace}]" if namespace else ""))
+    
+    try:
+        path_info = _build_path_info(session['filename'])
+        destination = file_handler.original_dir / f"{uuid.uuid4()}_{path_info['filename']}"
+        claimed = await asyncio.to_thread(upload_store.claim, upload_id, destination, namespace)
+        # 上传时已增量计算 SHA-256，缓存查询无需再读文件
+        return await _analyze_saved_file(
+            claimed['original_file'], path_info, session['filename'], namespace, file_hash=claimed['sha256']
+        )
+    except Exception as e:
+        logger.error(f"单文件分析错误: {session['filename']}, 错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"处理文件失败: {str(e)}")
+
+
+@router.post("/documents/batch-from-uploads", response_model=BatchUploadResponse)
+async def batch_from_uploads(body: BatchFromUploadsRequest,
+                             namespace: Optional[str] = Query(None, description="去重命名空间（知识库标识）")):
+    """由已完成的分块上传创建批量任务（按上传时的文件名保留目录结构）"""
+    namespace = _resolve_namespace(namespace)
+    if not body.upload_ids:
+        raise HTTPException(status_code=400, detail="未指定上传")
+    # 先确认全部上传都已完成，再移动文件
+    sessions = [
+        await _get_upload_session(upload_id, require_complete=True, namespace=namespace)
+        for upload_id in body.upload_ids
+    ]
+    
+    task_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    task_dir = file_handler.get_batch_dir(task_id)
+    logger.info(f"分块上传批量请求: {len(sessions)} 个文件, 创建任务: {task_id}")
+    
+    file_entries = []
+    for session in sessions:
+        try:
+            original_file = _build_original_file_path(task_dir, _build_path_info(session['filename']))
+            claimed = await asyncio.to_thread(upload_store.claim, session['upload_id'], original_file, namespace)
+            file_entries.append(claimed)
+        except Exception as e:
+            logger.error(f"[任务 {task_id}] 移动上传文件 {session['filename']} 失败: {e}")
+            file_entries.append(None)
+    
+    return await _enqueue_batch_task(task_id, task_dir, file_entries, namespace)
+
+
+async def _get_upload_session(upload_id: str, require_complete: bool = False,
+                              namespace: Optional[str] = None) -> Dict:
+    """
+    获取分块上传状态
+    
+    Args:
+        namespace: 使用该上传的命名空间（指定时校验免传输命中的上传属于该命名空间）
+    
+    Raises:
+        HTTPException: 上传不存在（404）、要求已完成但尚未完成（409）或命名空间不符（403）
+    """
+    session = await asyncio.to_thread(upload_store.get, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传不存在")
+    if require_complete and session['status'] != 'complete':
+        raise HTTPException(
+            status_code=409,
+            detail={"message": f"上传未完成: {session['filename']}", "offset": session['offset']}
+        )
+    if namespace is not None:
+        try:
+            check_upload_namespace(session, namespace)
+        except UploadNamespaceMismatch as e:
+            raise HTTPException(status_code=403, detail=str(e))
+    return session
+
+
+def _upload_status(session: Dict) -> UploadStatusResponse:
+    """上传状态 -> 响应（写入中的上传对外显示为 uploading）"""
+    return UploadStatusResponse(
+        upload_id=session['upload_id'],
+        filename=session['filename'],
+        size=session['size'],
+        offset=session['offset'],
+        status='complete' if session['status'] == 'complete' else 'uploading',
+        chunk_size=config.ChunkedUpload.CHUNK_SIZE,
+        duplicate=bool(session['duplicate_of']),
+        sha256=session['file_sha256']
+    )
+
+
+async def _enqueue_batch_task(task_id: str, task_dir: Path, file_entries: List[Optional[Dict]],
+                              namespace: str = "") -> BatchUploadResponse:
+    """创建任务状态并提交到工作队列（namespace 为文档/段落去重使用的命名空间）"""
+    # 初始化任务状态（写入共享任务存储）
+    await asyncio.to_thread(task_store.create_task, task_id, {
+        'status': 'queued',
+        'total': len(file_entries),
         'completed': 0,
         'pure_text_count': 0,
         'rich_media_count': 0,
         'pure_text_files': [],
         'rich_media_files': [],
         'task_dir': str(task_dir),
+        'namespace': namespace,
+        'created_at': datetime.now().isoformat(),
         'dedup_stats': {  # 新增：去重统计
             'doc_duplicates': 0,
             'para_exact_dup_total': 0,
             'para_near_dup_total': 0,
             'noise_removed_total': 0
         }
-    }
-    
-    # 关键修复：在这里先读取所有文件内容
-    logger.info(f"开始读取 {len(files)} 个文件内容...")
-    file_data_list = []
-    for i, file in enumerate(files):
-        try:
-            # 读取文件内容和元数据
-            content = await file.read()
-            file_data = {
-                'filename': file.filename,
-                'content': content,
-                'content_type': file.content_type
-            }
-            file_data_list.append(file_data)
-            logger.debug(f"读取文件 [{i+1}/{len(files)}]: {file.filename} ({len(content)} bytes)")
-        except Exception as e:
-            logger.error(f"读取文件 {file.filename} 失败: {e}")
-            # 记录失败但继续处理
-            file_data_list.append(None)
+    })
     
-    logger.info(f"文件读取完成, 成功: {len([f for f in file_data_list if f is not None])}/{len(files)}")
+    # 登记已保存的文件：之后同一命名空间中声明相同 SHA-256 的分块上传无需再传输数据
+    await asyncio.to_thread(
+        upload_store.register_files,
+        [(entry['sha256'], entry['original_file'], entry['size'])
+         for entry in file_entries if entry is not None and entry.get('sha256')],
+        namespace
+    )
     
-    # 启动异步处理（传入文件数据而非 UploadFile 对象）
-    asyncio.create_task(process_batch_files(file_data_list, task_id, task_dir))
-    logger.info(f"后台处理任务已启动: {task_id}")
+    # 提交到工作队列，由任意 worker 进程领取处理
+    payload = {'task_dir': str(task_dir), 'files': file_entries, 'namespace': namespace}
+    if not await asyncio.to_thread(task_store.enqueue, task_id, payload):
+        await asyncio.to_thread(task_store.update_task, task_id, {'status': 'failed'})
+        raise HTTPException(status_code=503, detail="任务入队失败")
+    logger.info(f"任务已入队: {task_id}")
     
     return BatchUploadResponse(
         task_id=task_id,
-        total_files=len(files),
+        total_files=len(file_entries),
         status_url=f"/api/v1/batch/status/{task_id}"
     )
 
 
-async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir: Path):
-    """异步处理批量文件（接收文件数据而非 UploadFile）"""
-    logger.info(f"[任务 {task_id}] 开始处理 {len(file_data_list)} 个文件")
+def _build_path_info(filename: Optional[str]) -> Dict[str, str]:
+    """解析上传文件名中的相对路径信息（手动构建 path_info）"""
+    filename = filename or "unknown_file"
+    path_obj = Path(filename)
+    return {
+        'full_path': filename,
+        'directory': str(path_obj.parent) if path_obj.parent != Path('.') else '',
+        'filename': path_obj.name,
+        'stem': path_obj.stem,
+        'extension': path_obj.suffix
+    }
+
+
+def _build_original_file_path(task_dir: Path, path_info: Dict[str, str]) -> Path:
+    """计算原始文件在任务目录下的保存路径（保留目录结构）"""
+    original_dir = task_dir / "original"
+    if path_info['directory']:
+        file_dir = original_dir / path_info['directory']
+        file_dir.mkdir(parents=True, exist_ok=True)
+        return file_dir / path_info['filename']
+    original_dir.mkdir(parents=True, exist_ok=True)
+    return original_dir / path_info['filename']
+
+
+async def run_queue_worker(worker_name: str):
+    """
+    任务队列消费者：持续领取批量任务并处理
+    
+    可运行在 API 进程内（RUN_WORKER_IN_API），也可由 worker.py 独立运行多个进程。
+    """
+    logger.info(f"队列消费者启动: {worker_name}")
+    await asyncio.to_thread(task_store.recover_stale_jobs, config.BatchProcess.TASK_TIMEOUT_SECONDS)
+    
+    while True:
+        job = await asyncio.to_thread(
+            task_store.dequeue, config.TaskQueue.DEQUEUE_TIMEOUT, worker_name
+        )
+        if job is None:
+            continue
+        
+        task_id = job['task_id']
+        payload = job['payload']
+        logger.info(f"[{worker_name}] 领取任务: {task_id}")
+        heartbeat = asyncio.create_task(_heartbeat_job(job, worker_name))
+        try:
+            await process_batch_files(
+                payload['files'], task_id, Path(payload['task_dir']), payload.get('namespace', "")
+            )
+        except asyncio.CancelledError:
+            # 进程退出：不确认，心跳停止后由失效任务检查重新入队
+            raise
+        except Exception as e:
+            logger.error(f"[任务 {task_id}] 处理失败: {e}", exc_info=True)
+            await asyncio.to_thread(task_store.update_task, task_id, {'status': 'failed', 'error': str(e)})
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(task_store.ack, job)
+
+
+async def _heartbeat_job(job: Dict, worker_name: str):
+    """处理期间定期刷新任务心跳，长任务不会被当作失效任务重新入队"""
+    while True:
+        await asyncio.sleep(config.TaskQueue.HEARTBEAT_SECONDS)
+        try:
+            if not await asyncio.to_thread(task_store.heartbeat, job, worker_name):
+                logger.warning(f"[任务 {job['task_id']}] 已被重新放回队列，可能被重复处理")
+                return
+        except Exception as e:
+            logger.error(f"[任务 {job['task_id']}] 刷新心跳失败: {e}")
+
+
+async def run_task_recovery():
+    """失效任务检查：按配置间隔把超时没有心跳的任务（worker 崩溃或退出）重新放回队列"""
+    while True:
+        await asyncio.sleep(config.TaskQueue.RECOVERY_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(task_store.recover_stale_jobs, config.BatchProcess.TASK_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f"失效任务检查失败: {e}", exc_info=True)
+
+
+async def run_dedup_sweeper():
+    """去重数据清理：按配置间隔删除各命名空间过期的文档/段落哈希与 SimHash 指纹"""
+    while True:
+        await asyncio.sleep(config.Redis.SWEEP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(dedup_store.purge_all_namespaces)
+        except Exception as e:
+            logger.error(f"去重数据清理失败: {e}", exc_info=True)
+
+
+def _summarize_file_result(index: int, file_entry: Optional[Dict], result: Optional[Dict]) -> Dict:
+    """
+    单文件处理结果 -> 发布到任务存储的精简结果（分类规则与任务结束时的汇总一致）
+    
+    file 为该文件可下载的路径（纯文本为转换后文件，其他为原文件），只在服务端使用。
+    """
+    summary = {
+        'index': index,
+        'filename': (file_entry or {}).get('filename') or f"<file_{index}>",
+        'status': 'failed',
+        'reason': '未知错误',
+        'doc_duplicate': False,
+        'file': ''
+    }
+    if result is None:
+        return summary
+    
+    summary['filename'] = result.get('filename') or summary['filename']
+    summary['doc_duplicate'] = bool(result.get('doc_duplicate'))
+    if result.get('skipped'):
+        skip_reason = result.get('skip_reason')
+        if skip_reason == 'duplicate':
+            summary.update(status='duplicate', reason='原始文件与其他文件完全相同（已去重）')
+        elif skip_reason == 'temp_file':
+            summary.update(status='temp_file', reason=result.get('reason', '临时锁文件，已跳过'))
+        else:
+            summary['reason'] = result.get('error_message', '未知错误')
+        summary['file'] = result.get('original_file', '')
+    elif 'is_pure_text' not in result:
+        summary['reason'] = '处理结果不完整'
+    elif result.get('is_pure_text') and result.get('converted_file'):
+        summary.update(status='pure_text', reason=result.get('reason'), file=result['converted_file'])
+    else:
+        summary.update(
+            status='rich_media', reason=result.get('reason', '富媒体文档'),
+            file=result.get('converted_file') or result.get('original_file', '')
+        )
+    return summary
+
+
+async def process_batch_files(file_entries: List[Optional[Dict]], task_id: str, task_dir: Path,
+                              namespace: str = ""):
+    """异步处理批量文件（接收已落盘的文件路径，namespace 为去重命名空间）"""
+    logger.info(f"[任务 {task_id}] 开始处理 {len(file_entries)} 个文件")
+    # 任务可能被重新领取（worker 超时恢复），清空上次处理中发布的单文件结果
+    await asyncio.to_thread(task_store.clear_file_results, task_id)
+    await asyncio.to_thread(task_store.update_task, task_id, {'status': 'processing', 'processed': 0, 'completed': 0})
     
     # 步骤1：先计算所有文件的SHA256，实现任务内原始文件去重
     seen_file_hashes = {}  # {file_hash: (index, filename)}
@@ -202,16 +669,17 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
     duplicate_indices = set()  # 记录重复文件的索引
     
     logger.info(f"[任务 {task_id}] 步骤1: 计算原始文件哈希并去重...")
-    for i, file_data in enumerate(file_data_list):
-        if file_data is None:
+    for i, file_entry in enumerate(file_entries):
+        if file_entry is None:
             continue
         
         try:
-            filename = file_data['filename']
-            content = file_data['content']
+            filename = file_entry['filename']
             
-            # 计算原始文件的SHA256
-            file_hash = hashlib.sha256(content).hexdigest()
+            # 上传时已增量计算 SHA256；缺失时再分块读取计算（放到线程中避免阻塞事件循环）
+            file_hash = file_entry.get('sha256')
+            if not file_hash:
+                file_hash = await asyncio.to_thread(compute_file_sha256, file_entry['original_file'])
             file_hash_map[i] = file_hash
             
             # 检查是否已经见过这个哈希
@@ -225,51 +693,26 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
         except Exception as e:
             logger.error(f"[任务 {task_id}] 计算文件 {i+1} 哈希失败: {e}")
     
-    logger.info(f"[任务 {task_id}] 原始文件去重完成: 总数={len(file_data_list)}, 独一份={len(seen_file_hashes)}, 重复={len(duplicate_indices)}")
+    logger.info(f"[任务 {task_id}] 原始文件去重完成: 总数={len(file_entries)}, 独一份={len(seen_file_hashes)}, 重复={len(duplicate_indices)}")
     
     # 从配置读取并发数
     semaphore = asyncio.Semaphore(config.BatchProcess.MAX_CONCURRENT_TASKS)
     
-    async def process_one(file_data: Dict, index: int):
+    async def process_one(file_entry: Optional[Dict], index: int):
         async with semaphore:
-            if file_data is None:
+            if file_entry is None:
                 logger.warning(f"[任务 {task_id}] 文件 [{index+1}] 数据为空，跳过")
                 return None
                 
             filename = ""
             original_file = None  # 初始化为None
             try:
-                # 从文件数据中获取信息
-                filename = file_data['filename']
-                content = file_data['content']
+                # 从文件条目中获取信息（原始文件已在上传时保存）
+                filename = file_entry['filename']
+                original_file = Path(file_entry['original_file'])
                 logger.debug(f"[任务 {task_id}] 开始处理文件 [{index+1}]: {filename}")
                 
-                # 解析路径（手动构建 path_info）
-                from pathlib import Path as PathLib
-                path_obj = PathLib(filename)
-                path_info = {
-                    'full_path': filename,
-                    'directory': str(path_obj.parent) if path_obj.parent != PathLib('.') else '',
-                    'filename': path_obj.name,
-                    'stem': path_obj.stem,
-                    'extension': path_obj.suffix
-                }
-                
-                # 保存原始文件（保留路径） - 所有文件都先保存，包括重复和临时文件
-                original_dir = task_dir / "original"
-                original_dir.mkdir(exist_ok=True)
-                
-                if path_info['directory']:
-                    file_dir = original_dir / path_info['directory']
-                    file_dir.mkdir(parents=True, exist_ok=True)
-                    original_file = file_dir / path_info['filename']
-                else:
-                    original_file = original_dir / path_info['filename']
-                
-                # 写入磁盘
-                with open(original_file, 'wb') as f:
-                    f.write(content)
-                logger.debug(f"[任务 {task_id}] 文件保存: {original_file}")
+                path_info = _build_path_info(filename)
                 
                 # 检查是否为重复文件，如果是则返回特殊标记（但文件已保存）
                 if index in duplicate_indices:
@@ -294,107 +737,11 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
                         'skip_reason': 'temp_file'
                     }
                 
-                # 先检测原文件内容类型
-                is_pure_text, reason = detector.detect(str(original_file))
-                logger.info(f"[任务 {task_id}] 检测结果: {filename} -> 纯文本={is_pure_text}, {reason}")
-                
-                result = {
-                    'path_info': path_info,
-                    'original_file': str(original_file),
-                    'filename': filename,
-                    'is_pure_text': is_pure_text,
-                    'reason': reason
-                }
-                
-                # 富媒体文件的去重已经在任务开始时完成，这里不需要再次检查
-                
-                # 判断是否需要格式转换
-                old_format_map = {
-                    '.doc': '.docx',
-                    '.xls': '.xlsx',
-                    '.ppt': '.pptx'
-                }
-                
-                need_conversion = False
-                target_ext = path_info['extension']
-                
-                # 旧格式转换策略：根据是否纯文本决定目标格式
-                if path_info['extension'] in old_format_map:
-                    need_conversion = True
-                    if is_pure_text:
-                        # 纯文本：统一转为 docx 并应用文本管线
-                        target_ext = '.docx'
-                        logger.info(f"[任务 {task_id}] 纯文本旧格式转为docx: {path_info['extension']} -> {target_ext}")
-                    else:
-                        # 富媒体：转为对应的新格式（保留富媒体内容）
-                        target_ext = old_format_map[path_info['extension']]
-                        logger.info(f"[任务 {task_id}] 富媒体旧格式转为新格式: {path_info['extension']} -> {target_ext}")
-                # 新格式文档转换策略
-                elif path_info['extension'] in ['.docx', '.xlsx', '.pptx']:
-                    if is_pure_text:
-                        # 纯文本：转为 docx 应用文本管线清洗
-                        need_conversion = True
-                        target_ext = '.docx'
-                        logger.info(f"[任务 {task_id}] 纯文本文档转为docx清洗: {path_info['extension']} -> {target_ext}")
-                    else:
-                        # 富媒体：保持原格式，不转换
-                        need_conversion = False
-                        logger.info(f"[任务 {task_id}] 富媒体文档保持原格式: {path_info['extension']}")
-                
-                # 执行格式转换
-                if need_conversion:
-                    converted_dir = task_dir / "converted"
-                    converted_dir.mkdir(exist_ok=True)
-                    
-                    if path_info['directory']:
-                        converted_file_dir = converted_dir / path_info['directory']
-                        converted_file_dir.mkdir(parents=True, exist_ok=True)
-                        converted_file = converted_file_dir / f"{path_info['stem']}{target_ext}"
-                    else:
-                        converted_file = converted_dir / f"{path_info['stem']}{target_ext}"
-                    
-                    # 修复：使用 Path 处理路径拼接，然后转为 posix 格式（修复问题1）
-                    if path_info['directory']:
-                        # Windows 路径转换为正斜杠，兼容 ZIP 归档
-                        converted_path = str(Path(path_info['directory']) / f"{path_info['stem']}{target_ext}").replace('\\', '/')
-                    else:
-                        # 根目录文件，无前导分隔符（修复问题4）
-                        converted_path = f"{path_info['stem']}{target_ext}"
-                    
-                    logger.debug(f"[任务 {task_id}] 开始转换: {filename} -> {converted_file.name}")
-                    convert_result = converter.convert_to_docx(
-                        str(original_file), 
-                        str(converted_file),
-                        doc_name=filename,
-                        apply_pipeline=is_pure_text  # 只有纯文本才应用文本管线
-                    )
-                    
-                    if convert_result["success"]:
-                        logger.info(f"[任务 {task_id}] 转换成功: {filename} -> {converted_file.name}")
-                        
-                        result['converted_file'] = str(converted_file)
-                        result['converted_path'] = converted_path
-                        
-                        # 富媒体文档转换后，不再需要执行去重（已经在任务开始时去重）
-                        
-                        # 记录管线统计（仅纯文本docx有）
-                        if "pipeline_stats" in convert_result:
-                            pipeline_stats = convert_result["pipeline_stats"]
-                            result['pipeline_stats'] = pipeline_stats
-                            logger.debug(f"[任务 {task_id}] 管线统计: 段落去重={pipeline_stats.get('paragraphs_exact_dup', 0)+pipeline_stats.get('paragraphs_near_dup', 0)}, 噪声移除={pipeline_stats.get('noise_removed_count', 0)}")
-                    elif convert_result.get("doc_duplicate"):
-                        # 纯文本文档级去重命中（文本管线内部去重）
-                        # 注意：清洗后的文件已经被保存到 converted_file 路径
-                        logger.warning(f"[任务 {task_id}] 文档去重命中: {filename}")
-                        result['doc_duplicate'] = True
-                        # 保留 converted_file 路径，因为清洗后的文件已经存在
-                        result['converted_file'] = str(converted_file)
-                        result['converted_path'] = converted_path
-                    else:
-                        logger.error(f"[任务 {task_id}] 转换失败: {filename}, {convert_result.get('message')}")
-                        # 转换失败，保留原文件信息
-                
-                return result
+                # 检测与转换交给工作层执行，避免阻塞事件循环
+                return await worker_pool.run(
+                    process_file, str(original_file), path_info, str(task_dir), task_id,
+                    file_hash_map.get(index), namespace
+                )
                 
             except Exception as e:
                 # 使用保存的 filename
@@ -410,10 +757,32 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
                     'original_file': str(original_file) if original_file else ''  # 如果文件已保存则返回路径
                 }
     
+    # 每个文件处理完成即发布结果与计数（串行写入，计数不会被并发覆盖）
+    publish_lock = asyncio.Lock()
+    progress = {
+        'processed': 0, 'completed': 0, 'pure_text_count': 0, 'rich_media_count': 0,
+        'duplicate_count': 0, 'failed_count': 0, 'temp_file_count': 0
+    }
+    
+    async def process_and_publish(file_entry: Optional[Dict], index: int):
+        result = await process_one(file_entry, index)
+        summary = _summarize_file_result(index, file_entry, result)
+        async with publish_lock:
+            progress['processed'] += 1
+            if summary['status'] in ('pure_text', 'rich_media'):
+                progress['completed'] += 1
+            progress[f"{summary['status']}_count"] += 1
+            await asyncio.to_thread(task_store.append_file_result, task_id, summary)
+            await asyncio.to_thread(task_store.update_task, task_id, dict(progress))
+        return result
+    
     # 并发处理所有文件
-    tasks = [process_one(file_data, i) for i, file_data in enumerate(file_data_list)]
-    logger.info(f"[任务 {task_id}] 开始并发处理，并发数: {config.BatchProcess.MAX_CONCURRENT_TASKS}")
-    results = await asyncio.gather(*tasks)
+    tasks = [process_and_publish(file_entry, i) for i, file_entry in enumerate(file_entries)]
+    logger.info(f"[任务 {task_id}] 开始并发处理，并发数: {config.BatchProcess.MAX_CONCURRENT_TASKS}, 工作层: {worker_pool.mode} x {worker_pool.max_workers}")
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        worker_pool.release_task(task_id)
     logger.info(f"[任务 {task_id}] 所有文件处理完成")
     
     # 分类结果
@@ -432,13 +801,16 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
     para_exact_dup_total = 0
     para_near_dup_total = 0
     noise_removed_total = 0
+    noise_pattern_hits: Dict[str, int] = {}
+    normalize_slow_paragraphs_total = 0
+    memo_snapshots: Dict[int, Dict] = {}  # {工作进程: 段落指纹备忘的累计命中}
     
     for i, result in enumerate(results):
         if result is None:
             # 真正的处理失败（非重复）
             try:
-                if i < len(file_data_list) and file_data_list[i] is not None:
-                    failed_file = file_data_list[i]['filename']
+                if i < len(file_entries) and file_entries[i] is not None:
+                    failed_file = file_entries[i]['filename']
                     failed_files.append({'filename': failed_file, 'reason': '未知错误'})
                     logger.warning(f"[任务 {task_id}] 文件处理失败，已跳过: {failed_file}")
             except (KeyError, IndexError, TypeError) as e:
@@ -479,6 +851,16 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
             para_exact_dup_total += stats.get("paragraphs_exact_dup", 0)
             para_near_dup_total += stats.get("paragraphs_near_dup", 0)
             noise_removed_total += stats.get("noise_removed_count", 0)
+            for pattern, count in (stats.get("noise_pattern_hits") or {}).items():
+                noise_pattern_hits[pattern] = noise_pattern_hits.get(pattern, 0) + count
+            normalize_slow_paragraphs_total += stats.get("normalize_slow_paragraphs", 0)
+        
+        # 段落指纹备忘（每个工作进程的计数是累计值，保留最新的一份）
+        memo_stats = result.get('paragraph_memo')
+        if memo_stats:
+            latest = memo_snapshots.get(memo_stats['worker'])
+            if latest is None or memo_stats['lookups'] > latest['lookups']:
+                memo_snapshots[memo_stats['worker']] = memo_stats
         
         # 文档级去重命中，记录但仍然保存文件（因为已经清洗过）
         if result.get("doc_duplicate"):
@@ -507,14 +889,11 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
             try:
                 converted_file_path = result.get('converted_file', '')
                 if converted_file_path and Path(converted_file_path).exists():
-                    # 提取docx文本内容
-                    from docx import Document
                     try:
-                        doc = Document(converted_file_path)
-                        # 提取所有段落文本
-                        text_content = '\n'.join([para.text for para in doc.paragraphs if para.text.strip()])
-                        # 基于文本内容计算hash
-                        content_hash = compute_sha256(text_content)
+                        # 转换阶段已根据写入的段落计算内容哈希；缺失时流式读取 docx 段落计算
+                        content_hash = result.get('content_hash')
+                        if not content_hash:
+                            content_hash = compute_content_hash(read_docx_paragraphs(converted_file_path))
                         
                         if content_hash not in unique_pure_text_files:
                             unique_pure_text_files[content_hash] = file_info
@@ -554,7 +933,11 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
                 logger.error(f"[任务 {task_id}] 计算富媒体文件哈希失败: {e}")
     
     logger.info(f"[任务 {task_id}] 分类结果: 纯文本={len(pure_text_files)}, 富媒体={len(rich_media_files)}, 失败={len(failed_files)}, 原始重复={len(duplicate_files)}, 临时锁文件={len(temp_files)}, 文档去重={doc_duplicates}")
+    memo_hits = sum(snapshot['hits'] for snapshot in memo_snapshots.values())
+    memo_lookups = sum(snapshot['lookups'] for snapshot in memo_snapshots.values())
+    memo_hit_rate = round(memo_hits / memo_lookups, 4) if memo_lookups else 0.0
     logger.info(f"[任务 {task_id}] 清洗统计: 段落精确去重={para_exact_dup_total}, 段落近重复={para_near_dup_total}, 噪声移除={noise_removed_total}")
+    logger.info(f"[任务 {task_id}] 段落指纹备忘: 命中 {memo_hits}/{memo_lookups} ({memo_hit_rate:.1%})")
     logger.info(f"[任务 {task_id}] 独一份统计: 纯文本={len(unique_pure_text_files)}, 富媒体={len(unique_rich_media_files)}")
     
     # 创建 ZIP 包
@@ -562,57 +945,48 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
     zip_dir.mkdir(exist_ok=True)
     logger.info(f"[任务 {task_id}] 开始创建 ZIP 包...")
     
-    pure_zip = None
-    rich_zip = None
-    all_zip = None
-    unique_pure_zip = None  # 新增
-    unique_rich_zip = None  # 新增
-    duplicate_zip = None  # 新增：原始文件重复的 ZIP
-    failed_zip = None  # 新增：处理失败的 ZIP
-    temp_zip = None  # 新增：临时锁文件的 ZIP
+    # 所有 ZIP 包一次生成：每个源文件只压缩一次，拼接到所有包含它的包（在线程中执行，不阻塞事件循环）
+    # 按需下载模式只保存清单，不生成 ZIP 文件
+    archive_names = {
+        'pure': f"converted_{task_id}.zip",
+        'rich': f"original_{task_id}.zip",
+        'all': f"all_{task_id}.zip",
+        'unique_pure': f"converted_{task_id}_unique_pure.zip",
+        'unique_rich': f"original_{task_id}_unique_rich.zip",
+        'duplicates': f"original_{task_id}_duplicates.zip",
+        'failed': f"original_{task_id}_failed.zip",
+        'temp': f"original_{task_id}_temp.zip"
+    }
+    archives: Dict[str, list] = {}
+    archive_paths: Dict[str, str] = {}
     
     try:
         if pure_text_files:
-            logger.debug(f"[任务 {task_id}] 创建纯文本文档 ZIP: {len(pure_text_files)} 个文件")
-            pure_zip = zipper.create_structured_zip(
-                pure_text_files, 'converted', task_id, str(zip_dir)
-            )
-            logger.info(f"[任务 {task_id}] 纯文本 ZIP 创建成功: {pure_zip}")
+            logger.debug(f"[任务 {task_id}] 纯文本文档 ZIP: {len(pure_text_files)} 个文件")
+            archives[archive_names['pure']] = zipper.structured_entries(pure_text_files, 'converted')
         
         if rich_media_files:
-            logger.debug(f"[任务 {task_id}] 创建富媒体文档 ZIP: {len(rich_media_files)} 个文件")
-            rich_zip = zipper.create_structured_zip(
-                rich_media_files, 'original', task_id, str(zip_dir)
-            )
-            logger.info(f"[任务 {task_id}] 富媒体 ZIP 创建成功: {rich_zip}")
+            logger.debug(f"[任务 {task_id}] 富媒体文档 ZIP: {len(rich_media_files)} 个文件")
+            archives[archive_names['rich']] = zipper.structured_entries(rich_media_files, 'original')
         
         if pure_text_files or rich_media_files:
-            logger.debug(f"[任务 {task_id}] 创建综合 ZIP: 纯文本={len(pure_text_files)}, 富媒体={len(rich_media_files)}")
-            all_zip = zipper.create_combined_zip(
-                pure_text_files, rich_media_files, task_id, str(zip_dir)
-            )
-            logger.info(f"[任务 {task_id}] 综合 ZIP 创建成功: {all_zip}")
+            logger.debug(f"[任务 {task_id}] 综合 ZIP: 纯文本={len(pure_text_files)}, 富媒体={len(rich_media_files)}")
+            archives[archive_names['all']] = zipper.combined_entries(pure_text_files, rich_media_files)
         
-        # 新增：创建独一份 ZIP
+        # 新增：独一份 ZIP
         if unique_pure_text_files:
             unique_pure_list = list(unique_pure_text_files.values())
-            logger.debug(f"[任务 {task_id}] 创建纯文本独一份 ZIP: {len(unique_pure_list)} 个文件")
-            unique_pure_zip = zipper.create_structured_zip(
-                unique_pure_list, 'converted', f"{task_id}_unique_pure", str(zip_dir)
-            )
-            logger.info(f"[任务 {task_id}] 纯文本独一份 ZIP 创建成功: {unique_pure_zip}")
+            logger.debug(f"[任务 {task_id}] 纯文本独一份 ZIP: {len(unique_pure_list)} 个文件")
+            archives[archive_names['unique_pure']] = zipper.structured_entries(unique_pure_list, 'converted')
         
         if unique_rich_media_files:
             unique_rich_list = list(unique_rich_media_files.values())
-            logger.debug(f"[任务 {task_id}] 创建富媒体独一份 ZIP: {len(unique_rich_list)} 个文件")
-            unique_rich_zip = zipper.create_structured_zip(
-                unique_rich_list, 'original', f"{task_id}_unique_rich", str(zip_dir)
-            )
-            logger.info(f"[任务 {task_id}] 富媒体独一份 ZIP 创建成功: {unique_rich_zip}")
+            logger.debug(f"[任务 {task_id}] 富媒体独一份 ZIP: {len(unique_rich_list)} 个文件")
+            archives[archive_names['unique_rich']] = zipper.structured_entries(unique_rich_list, 'original')
         
-        # 新增：创建原始文件重复的 ZIP
+        # 新增：原始文件重复的 ZIP
         if duplicate_files:
-            logger.debug(f"[任务 {task_id}] 创建原始文件重复 ZIP: {len(duplicate_files)} 个文件")
+            logger.debug(f"[任务 {task_id}] 原始文件重复 ZIP: {len(duplicate_files)} 个文件")
             # 构建重复文件的信息列表
             duplicate_file_list = []
             for dup_info in duplicate_files:
@@ -627,14 +1001,11 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
                     })
             
             if duplicate_file_list:
-                duplicate_zip = zipper.create_structured_zip(
-                    duplicate_file_list, 'original', f"{task_id}_duplicates", str(zip_dir)
-                )
-                logger.info(f"[任务 {task_id}] 原始文件重复 ZIP 创建成功: {duplicate_zip}")
+                archives[archive_names['duplicates']] = zipper.structured_entries(duplicate_file_list, 'original')
         
-        # 新增：创建处理失败的 ZIP
+        # 新增：处理失败的 ZIP
         if failed_files:
-            logger.debug(f"[任务 {task_id}] 创建处理失败文件 ZIP: {len(failed_files)} 个文件")
+            logger.debug(f"[任务 {task_id}] 处理失败文件 ZIP: {len(failed_files)} 个文件")
             # 构建失败文件的信息列表
             failed_file_list = []
             for failed_info in failed_files:
@@ -662,14 +1033,11 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
                     logger.warning(f"[任务 {task_id}] 失败文件的原始副本不存在: {failed_info.get('filename', 'unknown')}, 原因: {failed_info.get('reason', '未知')}")
             
             if failed_file_list:
-                failed_zip = zipper.create_structured_zip(
-                    failed_file_list, 'original', f"{task_id}_failed", str(zip_dir)
-                )
-                logger.info(f"[任务 {task_id}] 处理失败文件 ZIP 创建成功: {failed_zip}")
+                archives[archive_names['failed']] = zipper.structured_entries(failed_file_list, 'original')
         
-        # 新增：创建临时锁文件的 ZIP
+        # 新增：临时锁文件的 ZIP
         if temp_files:
-            logger.debug(f"[任务 {task_id}] 创建临时锁文件 ZIP: {len(temp_files)} 个文件")
+            logger.debug(f"[任务 {task_id}] 临时锁文件 ZIP: {len(temp_files)} 个文件")
             # 构建临时文件的信息列表
             temp_file_list = []
             for temp_info in temp_files:
@@ -696,16 +1064,30 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
                     })
             
             if temp_file_list:
-                temp_zip = zipper.create_structured_zip(
-                    temp_file_list, 'original', f"{task_id}_temp", str(zip_dir)
-                )
-                logger.info(f"[任务 {task_id}] 临时锁文件 ZIP 创建成功: {temp_zip}")
+                archives[archive_names['temp']] = zipper.structured_entries(temp_file_list, 'original')
+        
+        if config.Storage.ZIP_DOWNLOAD_MODE == "stream":
+            # 按需下载：只保存清单，下载时流式生成
+            archive_paths = await asyncio.to_thread(zipper.write_manifest, archives, str(zip_dir))
+            logger.info(f"[任务 {task_id}] ZIP 清单已保存（按需生成）: {len(archive_paths)} 个")
+        else:
+            archive_paths = await asyncio.to_thread(zipper.build_archives, archives, str(zip_dir))
+            logger.info(f"[任务 {task_id}] ZIP 创建成功: {len(archive_paths)}/{len(archives)} 个")
     except Exception as e:
         logger.error(f"[任务 {task_id}] ZIP 创建失败: {e}", exc_info=True)
     
+    pure_zip = archive_paths.get(archive_names['pure'])
+    rich_zip = archive_paths.get(archive_names['rich'])
+    all_zip = archive_paths.get(archive_names['all'])
+    unique_pure_zip = archive_paths.get(archive_names['unique_pure'])
+    unique_rich_zip = archive_paths.get(archive_names['unique_rich'])
+    duplicate_zip = archive_paths.get(archive_names['duplicates'])
+    failed_zip = archive_paths.get(archive_names['failed'])
+    temp_zip = archive_paths.get(archive_names['temp'])
+    
     # 更新任务状态
     successful_count = len([r for r in results if r is not None and not (r.get('skipped') and r.get('skip_reason') in ('duplicate', 'error', 'temp_file'))])
-    batch_tasks[task_id].update({
+    await asyncio.to_thread(task_store.update_task, task_id, {
         'status': 'completed',
         'completed': successful_count,  # 只统计成功处理的文件（不包括重复和失败）
         'pure_text_count': len(pure_text_files),
@@ -738,30 +1120,42 @@ async def process_batch_files(file_data_list: List[Dict], task_id: str, task_dir
             'doc_duplicates': doc_duplicates,
             'para_exact_dup_total': para_exact_dup_total,
             'para_near_dup_total': para_near_dup_total,
-            'noise_removed_total': noise_removed_total
+            'noise_removed_total': noise_removed_total,
+            'noise_pattern_hits': noise_pattern_hits,
+            'normalize_slow_paragraphs_total': normalize_slow_paragraphs_total,
+            'paragraph_memo_hits': memo_hits,
+            'paragraph_memo_lookups': memo_lookups,
+            'paragraph_memo_hit_rate': memo_hit_rate
         }
     })
     logger.info(f"[任务 {task_id}] 任务完成! 成功={successful_count}, 纯文本={len(pure_text_files)}, 富媒体={len(rich_media_files)}, 原始重复={len(duplicate_files)}, 处理失败={len(failed_files)}, 临时锁文件={len(temp_files)}")
 
 
 @router.get("/batch/status/{task_id}", response_model=BatchStatusResponse)
-async def get_batch_status(task_id: str):
-    """查询批量任务状态"""
+async def get_batch_status(task_id: str,
+                           since: int = Query(0, ge=0, description="只返回第 since 个之后完成的单文件结果（传入上次响应的 next_since）")):
+    """查询批量任务状态（file_results 为从 since 开始新完成的单文件结果）"""
     logger.debug(f"查询任务状态: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
-    
-    task = batch_tasks[task_id]
     logger.debug(f"任务 {task_id} 状态: {task['status']}, 进度: {task['completed']}/{task['total']}")
     
+    file_results = await asyncio.to_thread(task_store.get_file_results, task_id, since)
+    return _build_batch_status(task_id, task, file_results, since)
+
+
+def _build_batch_status(task_id: str, task: Dict, file_results: List[Dict], since: int) -> BatchStatusResponse:
+    """任务状态 + 新完成的单文件结果 -> 状态响应"""
     return BatchStatusResponse(
         task_id=task_id,
         status=task['status'],
         progress=Progress(
             total=task['total'],
             completed=task['completed'],
+            processed=task.get('processed', 0),  # 新增：已处理完成的文件数
             pure_text_count=task['pure_text_count'],
             rich_media_count=task['rich_media_count'],
             unique_pure_count=task.get('unique_pure_count', 0),  # 新增
@@ -782,7 +1176,135 @@ async def get_batch_status(task_id: str):
             failed=f"/api/v1/batch/download/failed/{task_id}" if task.get('downloads', {}).get('failed') else None,
             temp_files=f"/api/v1/batch/download/temp-files/{task_id}" if task.get('downloads', {}).get('temp_files') else None
         ),
-        dedup_stats=task.get('dedup_stats', {})  # 新增：返回去重统计
+        dedup_stats=task.get('dedup_stats', {}),  # 新增：返回去重统计
+        file_results=[_build_file_result(task_id, summary) for summary in file_results],
+        next_since=since + len(file_results)
+    )
+
+
+def _build_file_result(task_id: str, summary: Dict) -> FileResult:
+    """发布的单文件结果 -> 响应（有可下载文件时附带单文件下载链接）"""
+    return FileResult(
+        index=summary['index'],
+        filename=summary['filename'],
+        status=summary['status'],
+        reason=summary.get('reason'),
+        doc_duplicate=summary.get('doc_duplicate', False),
+        download_url=f"/api/v1/batch/download/file/{task_id}/{summary['index']}" if summary.get('file') else None
+    )
+
+
+@router.get("/batch/progress/{task_id}")
+async def stream_batch_progress(task_id: str, request: Request,
+                                since: int = Query(0, ge=0, description="从第 since 个单文件结果开始推送")):
+    """
+    批量任务进度推送（Server-Sent Events），替代轮询 /batch/status
+    
+    事件:
+        file: 单文件结果（每个文件完成时推送一次，id 为下次续传的 since）
+        progress: 计数变化时推送任务状态与进度
+        done: 任务结束（completed/failed）时推送完整状态（不含单文件结果），随后关闭连接
+    
+    断线重连时浏览器 EventSource 自动携带 Last-Event-ID，从上次收到的位置继续推送。
+    """
+    if await asyncio.to_thread(task_store.get_task, task_id) is None:
+        logger.warning(f"任务不存在: {task_id}")
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    last_event_id = request.headers.get('last-event-id', '')
+    if last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+    
+    return StreamingResponse(
+        _progress_events(task_id, request, since),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _sse_event(event: str, data, event_id: Optional[int] = None) -> str:
+    """格式化一条 SSE 事件"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def _progress_events(task_id: str, request: Request, since: int):
+    """按间隔读取任务存储，推送新完成的文件与进度变化（任务可能由其他 worker 进程处理）"""
+    last_progress = None
+    last_sent = time.monotonic()
+    while True:
+        task = await asyncio.to_thread(task_store.get_task, task_id)
+        if task is None:
+            yield _sse_event('error', {'detail': '任务不存在'})
+            return
+        # 先读任务状态再读单文件结果：状态为结束时，所有单文件结果都已写入
+        file_results = await asyncio.to_thread(task_store.get_file_results, task_id, since)
+        
+        events = []
+        for summary in file_results:
+            since += 1
+            events.append(_sse_event('file', _build_file_result(task_id, summary), since))
+        status = _build_batch_status(task_id, task, [], since)
+        if status.progress != last_progress:
+            last_progress = status.progress
+            events.append(_sse_event('progress', {'status': status.status, 'progress': status.progress}))
+        finished = status.status in ('completed', 'failed')
+        if finished:
+            events.append(_sse_event('done', status))
+        
+        if events:
+            yield "".join(events)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+            # 注释行保活，防止代理断开空闲连接
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        
+        if finished or await request.is_disconnected():
+            return
+        await asyncio.sleep(config.BatchProcess.PROGRESS_POLL_INTERVAL)
+
+
+@router.get("/batch/download/file/{task_id}/{index}")
+async def download_batch_file(task_id: str, index: int):
+    """下载批量任务中单个已处理完成的文件（纯文本为转换后文件，其他为原文件），无需等待整个任务结束"""
+    file_results = await asyncio.to_thread(task_store.get_file_results, task_id)
+    summary = next((r for r in file_results if r['index'] == index), None)
+    if summary is None or not summary.get('file'):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    file_path = Path(summary['file'])
+    if not file_path.exists():
+        logger.error(f"单文件不存在: {file_path}")
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return FileResponse(str(file_path), filename=file_path.name)
+
+
+async def _zip_download_response(zip_path: str):
+    """
+    批量下载 ZIP 响应：已生成的 ZIP 直接返回文件，按需下载模式根据清单流式生成
+    
+    Raises:
+        HTTPException: ZIP 文件与清单都不存在
+    """
+    zip_name = Path(zip_path).name
+    if await asyncio.to_thread(Path(zip_path).exists):
+        return FileResponse(zip_path, media_type='application/zip', filename=zip_name)
+    
+    entries = await asyncio.to_thread(zipper.load_manifest_entries, zip_path)
+    if entries is None:
+        logger.error(f"ZIP 文件不存在: {zip_path}")
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    logger.debug(f"流式生成 ZIP: {zip_name} ({len(entries)} 个文件)")
+    return StreamingResponse(
+        zipper.stream_archive(entries),
+        media_type='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{zip_name}"'}
     )
 
 
@@ -791,29 +1313,20 @@ async def download_pure_converted(task_id: str):
     """下载纯文字文档（转换后）"""
     logger.info(f"请求下载纯文本文档: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('pure_text_converted'):
         logger.warning(f"纯文本 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['pure_text_converted']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回纯文本 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/rich-original/{task_id}")
@@ -821,53 +1334,36 @@ async def download_rich_original(task_id: str):
     """下载富媒体文档（原文件）"""
     logger.info(f"请求下载富媒体文档: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('rich_media_original'):
         logger.warning(f"富媒体 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['rich_media_original']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回富媒体 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/all/{task_id}")
 async def download_all_files(task_id: str):
     """下载所有文件"""
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('all_files'):
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['all_files']
     
-    if not Path(zip_path).exists():
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/unique-pure/{task_id}")
@@ -875,29 +1371,20 @@ async def download_unique_pure_text(task_id: str):
     """下载纯文本独一份文档（去除完全相同文件）"""
     logger.info(f"请求下载纯文本独一份文档: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('unique_pure_text'):
         logger.warning(f"纯文本独一份 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['unique_pure_text']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回纯文本独一份 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/unique-rich/{task_id}")
@@ -905,29 +1392,20 @@ async def download_unique_rich_media(task_id: str):
     """下载富媒体独一份文档（去除完全相同文件）"""
     logger.info(f"请求下载富媒体独一份文档: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('unique_rich_media'):
         logger.warning(f"富媒体独一份 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['unique_rich_media']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回富媒体独一份 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/duplicates/{task_id}")
@@ -935,29 +1413,20 @@ async def download_duplicates(task_id: str):
     """下载原始重复文件"""
     logger.info(f"请求下载原始重复文件: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('duplicates'):
         logger.warning(f"原始重复文件 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['duplicates']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回原始重复文件 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/failed/{task_id}")
@@ -965,29 +1434,20 @@ async def download_failed(task_id: str):
     """下载处理失败的文件"""
     logger.info(f"请求下载处理失败的文件: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('failed'):
         logger.warning(f"处理失败文件 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['failed']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回处理失败文件 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/batch/download/temp-files/{task_id}")
@@ -995,29 +1455,20 @@ async def download_temp_files(task_id: str):
     """下载临时锁文件"""
     logger.info(f"请求下载临时锁文件: {task_id}")
     
-    if task_id not in batch_tasks:
+    task = await asyncio.to_thread(task_store.get_task, task_id)
+    if task is None:
         logger.warning(f"任务不存在: {task_id}")
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = batch_tasks[task_id]
-    
     if 'downloads' not in task or not task['downloads'].get('temp_files'):
         logger.warning(f"临时锁文件 ZIP 不存在: {task_id}")
         raise HTTPException(status_code=404, detail="文件不存在")
     
     zip_path = task['downloads']['temp_files']
     
-    if not Path(zip_path).exists():
-        logger.error(f"ZIP 文件不存在: {zip_path}")
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
     logger.info(f"返回临时锁文件 ZIP: {Path(zip_path).name}")
     
-    return FileResponse(
-        zip_path,
-        media_type='application/zip',
-        filename=Path(zip_path).name
-    )
+    return await _zip_download_response(zip_path)
 
 
 @router.get("/files/download/original/{file_name}")
@@ -1064,7 +1515,7 @@ async def clean_storage(days: int = 7):
     logger.info(f"手动清理请求: 保留最近 {days} 天的文件")
     
     try:
-        result = cleaner.clean_all(days)
+        result = await asyncio.to_thread(cleaner.clean_all, days)
         return {
             "success": True,
             "message": f"清理完成，保留最近 {days} 天的文件",
@@ -1086,7 +1537,10 @@ async def get_storage_info():
     logger.debug("查询存储使用情况")
     
     try:
-        info = cleaner.get_storage_info()
+        info = await asyncio.to_thread(cleaner.get_storage_info)
+        info['result_cache'] = await asyncio.to_thread(result_cache.get_stats)
+        info['dedup_store'] = await async_dedup_store.get_stats()
+        info['dedup_store']['namespaces'] = await asyncio.to_thread(dedup_store.known_namespaces)
         return {
             "success": True,
             "data": info
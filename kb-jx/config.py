@@ -4,6 +4,7 @@
 系统配置文件 - 集中管理所有配置项
 """
 import os
+import re
 from typing import Optional
 
 
@@ -22,14 +23,41 @@ class RedisConfig:
     DOC_HASHES_KEY: str = f"{KEY_PREFIX}:doc:hashes"
     PARA_HASHES_KEY: str = f"{KEY_PREFIX}:para:hashes"
     PARA_SIMHASH_KEY: str = f"{KEY_PREFIX}:para:simhash"
+    PARA_SIMHASH_INDEX_KEY: str = f"{KEY_PREFIX}:para:simidx"  # SimHash 分块索引前缀
+    PARA_BLOOM_KEY: str = f"{KEY_PREFIX}:para:bloom"  # 段落哈希布隆过滤器（位图: {键}:{代号}，参数: {键}:meta）
+    DEDUP_NAMESPACES_KEY: str = f"{KEY_PREFIX}:dedup:namespaces"  # 已使用的去重命名空间
+    TASK_KEY_PREFIX: str = f"{KEY_PREFIX}:task"  # 批量任务状态: {前缀}:{task_id}
+    TASK_QUEUE_KEY: str = f"{KEY_PREFIX}:task:queue"  # 待处理任务队列
+    TASK_PROCESSING_KEY: str = f"{KEY_PREFIX}:task:processing"  # 处理中任务列表
+    
+    # 哈希存储格式: hex（原格式，默认）, binary（16 字节截断摘要 + 8 字节指纹，键名带 :bin 后缀，约省 2/3 内存）
+    # 切换到 binary 前先运行 python migrate_dedup_store.py binary 迁移已有数据
+    HASH_FORMAT: str = os.getenv("DEDUP_HASH_FORMAT", "hex").lower()
+    
+    # 默认去重命名空间（空 = 沿用原键名；请求可通过 namespace 参数指定知识库，键名为 {前缀}:{命名空间}:...）
+    NAMESPACE: str = os.getenv("DEDUP_NAMESPACE", "").strip()
+    # 文档/段落哈希与 SimHash 的分片数（1 = 不分片），调整后运行 python migrate_dedup_store.py --from-shards=旧分片数 迁移
+    SHARD_COUNT: int = int(os.getenv("DEDUP_SHARD_COUNT", "1"))
     
     # 连接配置
     SOCKET_CONNECT_TIMEOUT: int = 5
     SOCKET_TIMEOUT: int = 5
+    # 异步客户端（API 事件循环中的去重查询）连接池上限
+    ASYNC_MAX_CONNECTIONS: int = int(os.getenv("REDIS_ASYNC_MAX_CONNECTIONS", "50"))
     
-    # TTL 配置（可选，秒）
-    DOC_TTL_DAYS: Optional[int] = None  # 文档级不过期
-    PARA_TTL_DAYS: Optional[int] = 90   # 段落级 90 天过期
+    # 去重数据过期（天，0 = 不过期）：每个哈希单独记录过期时间，由后台定期清理
+    DOC_TTL_DAYS: int = int(os.getenv("DEDUP_DOC_TTL_DAYS", "0"))  # 文档级默认不过期
+    PARA_TTL_DAYS: int = int(os.getenv("DEDUP_PARA_TTL_DAYS", "90"))  # 段落级 90 天过期
+    # 过期去重数据的清理间隔（秒）
+    SWEEP_INTERVAL_SECONDS: int = int(os.getenv("DEDUP_SWEEP_INTERVAL_SECONDS", "3600"))
+    # 内存后端段落哈希数上限（0 = 不限制），超过后按最近使用时间（LRU）淘汰
+    MEMORY_MAX_PARAS: int = int(os.getenv("DEDUP_MEMORY_MAX_PARAS", "1000000"))
+    
+    # 段落哈希布隆过滤器（Redis 后端的进程内预过滤，0 = 不启用）：确定不存在的段落不再访问 Redis
+    PARA_BLOOM_CAPACITY: int = int(os.getenv("DEDUP_BLOOM_CAPACITY", "1000000"))
+    PARA_BLOOM_ERROR_RATE: float = float(os.getenv("DEDUP_BLOOM_ERROR_RATE", "0.01"))
+    # 从 Redis 重新载入位图的间隔（秒），其他进程新写入的段落最多延迟这么久被本进程识别
+    PARA_BLOOM_REFRESH_SECONDS: int = int(os.getenv("DEDUP_BLOOM_REFRESH_SECONDS", "60"))
 
 
 class TextPipelineConfig:
@@ -40,6 +68,11 @@ class TextPipelineConfig:
     # 近重复检测
     SIMHASH_DISTANCE_THRESHOLD: int = int(os.getenv("SIMHASH_DISTANCE_THRESHOLD", "3"))
     ENABLE_NEAR_DUPLICATE: bool = os.getenv("ENABLE_NEAR_DUPLICATE", "true").lower() == "true"
+    # SimHash 分词策略：legacy（simhash 库，兼容已存储的指纹）/ cjk（中文逐字 + 英文单词）/ char（逐字符，同 simhash 库预处理）
+    # cjk/char 更快，但与已存储的指纹不可比，需在清空或重建去重数据时切换
+    SIMHASH_TOKENIZER: str = os.getenv("SIMHASH_TOKENIZER", "legacy").lower()
+    # SimHash shingle 包含的 token 数
+    SIMHASH_NGRAM: int = int(os.getenv("SIMHASH_NGRAM", "2"))
     
     # 噪声过滤模式（正则表达式）
     NOISE_PATTERNS: list = [
@@ -82,12 +115,86 @@ class StorageConfig:
     
     # 清理配置
     CLEAN_KEEP_DAYS: int = int(os.getenv("STORAGE_CLEAN_KEEP_DAYS", "0"))
+    
+    # 上传文件分块读写大小（字节），峰值内存按块而不是按文件/批量计算
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    
+    # 批量下载 ZIP 打包的并行压缩线程数（0 = CPU 核数）
+    ZIP_WORKERS: int = int(os.getenv("ZIP_WORKERS", "0"))
+    # 批量下载 ZIP 生成方式: prebuilt（任务结束时生成 ZIP 文件）, stream（只保存清单，下载时流式生成）
+    ZIP_DOWNLOAD_MODE: str = os.getenv("ZIP_DOWNLOAD_MODE", "prebuilt")
 
 
 class BatchProcessConfig:
     """批量处理配置"""
     MAX_CONCURRENT_TASKS: int = int(os.getenv("MAX_CONCURRENT_TASKS", "5"))
+    # 领取的任务超过该时长没有心跳视为 worker 已失效，重新放回队列
     TASK_TIMEOUT_SECONDS: int = int(os.getenv("TASK_TIMEOUT_SECONDS", "3600"))
+    
+    # 工作层执行方式: process（进程池，多核并行）, thread（线程池，共享进程内状态）
+    # 去重存储为内存后端时 process 自动改用 thread（各进程的内存去重状态无法共享）
+    WORKER_MODE: str = os.getenv("BATCH_WORKER_MODE", "process")
+    # 工作进程/线程数（0 = 取 MAX_CONCURRENT_TASKS 与 CPU 核数的较小值）
+    WORKER_COUNT: int = int(os.getenv("BATCH_WORKER_COUNT", "0"))
+    # 批量任务内段落指纹备忘的段落数上限（0 = 不启用）：重复出现的段落复用 SHA-256 与 SimHash
+    PARAGRAPH_MEMO_SIZE: int = int(os.getenv("BATCH_PARAGRAPH_MEMO_SIZE", "50000"))
+    # 进度推送（SSE）读取任务存储的间隔（秒）
+    PROGRESS_POLL_INTERVAL: float = float(os.getenv("BATCH_PROGRESS_POLL_INTERVAL", "0.5"))
+
+
+class TaskQueueConfig:
+    """批量任务队列与状态存储配置"""
+    # 后端: auto（Redis 启用时用 Redis，否则 SQLite）, redis, sqlite, memory（仅单进程）
+    BACKEND: str = os.getenv("TASK_STORE_BACKEND", "auto")
+    SQLITE_PATH: str = os.getenv("TASK_STORE_SQLITE_PATH", os.path.join(StorageConfig.BASE_DIR, "tasks.db"))
+    
+    # 是否在 API 进程内运行队列消费者（关闭后需单独运行 worker.py）
+    RUN_WORKER_IN_API: bool = os.getenv("RUN_WORKER_IN_API", "true").lower() == "true"
+    # 每个进程同时处理的批量任务数
+    WORKER_CONCURRENCY: int = int(os.getenv("TASK_WORKER_CONCURRENCY", "2"))
+    
+    # 出队阻塞等待时间（秒）
+    DEQUEUE_TIMEOUT: int = 2
+    # 处理中任务刷新心跳的间隔（秒，需小于 TASK_TIMEOUT_SECONDS）
+    HEARTBEAT_SECONDS: int = int(os.getenv("TASK_HEARTBEAT_SECONDS", "30"))
+    # 检查失效任务并重新入队的间隔（秒）
+    RECOVERY_INTERVAL_SECONDS: int = int(os.getenv("TASK_RECOVERY_INTERVAL_SECONDS", "60"))
+    # 任务状态保留天数
+    TASK_TTL_DAYS: int = int(os.getenv("TASK_TTL_DAYS", "7"))
+
+
+class ResultCacheConfig:
+    """转换结果缓存配置（按原始文件 SHA-256 缓存检测结论与转换结果）"""
+    ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    DIR: str = os.getenv("RESULT_CACHE_DIR", os.path.join(StorageConfig.BASE_DIR, "cache"))
+    # 索引数据库路径（留空 = 缓存目录下的 index.db）
+    INDEX_PATH: str = os.getenv("RESULT_CACHE_INDEX_PATH", "")
+    # 缓存文件总大小上限（MB），超过后按 LRU 淘汰
+    MAX_SIZE_MB: int = int(os.getenv("RESULT_CACHE_MAX_SIZE_MB", "1024"))
+
+
+class ChunkedUploadConfig:
+    """可续传分块上传配置"""
+    # 未完成上传的数据与状态数据库目录
+    DIR: str = os.getenv("CHUNKED_UPLOAD_DIR", os.path.join(StorageConfig.BASE_DIR, "uploads"))
+    # 建议客户端使用的分块大小（字节）
+    CHUNK_SIZE: int = int(os.getenv("CHUNKED_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    # 单个分块的最大字节数
+    MAX_CHUNK_SIZE: int = int(os.getenv("CHUNKED_UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+    # 未完成上传的保留时长（小时）
+    TTL_HOURS: int = int(os.getenv("CHUNKED_UPLOAD_TTL_HOURS", "24"))
+    # 声明的 SHA-256 命中同一命名空间已有文件时免传输（只凭声明的哈希，上传方互不信任时关闭）
+    DEDUP: bool = os.getenv("CHUNKED_UPLOAD_DEDUP", "true").lower() == "true"
+
+
+class DetectionConfig:
+    """文档检测配置"""
+    # PDF 图片预检：先扫描 xref 表中的 /Image 对象与页面资源，再做开销较大的矢量图形提取
+    PDF_IMAGE_PREPASS: bool = os.getenv("PDF_IMAGE_PREPASS", "true").lower() == "true"
+    # 页数超过该值的 PDF 只抽样检测部分页面（0 = 不抽样，逐页检测）
+    PDF_SAMPLE_THRESHOLD: int = int(os.getenv("PDF_SAMPLE_THRESHOLD", "0"))
+    # 抽样页数（均匀分布，包含首页和末页）
+    PDF_SAMPLE_PAGES: int = int(os.getenv("PDF_SAMPLE_PAGES", "50"))
 
 
 class ConversionConfig:
@@ -110,6 +217,16 @@ class ConversionConfig:
     # 转换超时时间（秒）
     CONVERSION_TIMEOUT: int = int(os.getenv("CONVERSION_TIMEOUT", "60"))
     
+    # LibreOffice 常驻实例池：每个进程的实例数（多进程工作层下总实例数 = 进程数 x 实例数）
+    LIBREOFFICE_POOL_SIZE: int = int(os.getenv("LIBREOFFICE_POOL_SIZE", "1"))
+    # 单个实例转换多少次后回收重启（0 = 不回收）
+    LIBREOFFICE_MAX_CONVERSIONS: int = int(os.getenv("LIBREOFFICE_MAX_CONVERSIONS", "200"))
+    # 实例启动超时时间（秒）
+    LIBREOFFICE_STARTUP_TIMEOUT: int = int(os.getenv("LIBREOFFICE_STARTUP_TIMEOUT", "30"))
+    
+    # TXT/MD 文件超过该大小（MB）时流式清洗并写入 docx（0 = 总是流式）
+    TEXT_STREAM_THRESHOLD_MB: int = int(os.getenv("TEXT_STREAM_THRESHOLD_MB", "20"))
+    
     # 是否跳过临时锁文件（~$ 开头）
     SKIP_TEMP_FILES: bool = os.getenv("SKIP_TEMP_FILES", "true").lower() == "true"
 
@@ -151,6 +268,10 @@ class Config:
     TextPipeline = TextPipelineConfig
     Storage = StorageConfig
     BatchProcess = BatchProcessConfig
+    TaskQueue = TaskQueueConfig
+    ResultCache = ResultCacheConfig
+    ChunkedUpload = ChunkedUploadConfig
+    Detection = DetectionConfig
     Conversion = ConversionConfig
     Log = LogConfig
     App = AppConfig
@@ -177,6 +298,40 @@ class Config:
             if cls.Redis.PORT < 1 or cls.Redis.PORT > 65535:
                 errors.append(f"Redis PORT 无效: {cls.Redis.PORT}")
         
+        # 验证去重数据格式、过期与容量配置
+        if cls.Redis.HASH_FORMAT not in ("binary", "hex"):
+            errors.append(f"DEDUP_HASH_FORMAT 必须是 binary/hex: {cls.Redis.HASH_FORMAT}")
+        
+        if cls.Redis.NAMESPACE and not re.fullmatch(r"[A-Za-z0-9_.-]{1,64}", cls.Redis.NAMESPACE):
+            errors.append(f"DEDUP_NAMESPACE 只允许字母、数字、_ . -（最长 64 个字符）: {cls.Redis.NAMESPACE}")
+        
+        if cls.Redis.SHARD_COUNT < 1:
+            errors.append(f"DEDUP_SHARD_COUNT 必须 >= 1: {cls.Redis.SHARD_COUNT}")
+        
+        if cls.Redis.ASYNC_MAX_CONNECTIONS < 1:
+            errors.append(f"REDIS_ASYNC_MAX_CONNECTIONS 必须 >= 1: {cls.Redis.ASYNC_MAX_CONNECTIONS}")
+        
+        if cls.Redis.DOC_TTL_DAYS < 0:
+            errors.append(f"DEDUP_DOC_TTL_DAYS 必须 >= 0: {cls.Redis.DOC_TTL_DAYS}")
+        
+        if cls.Redis.PARA_TTL_DAYS < 0:
+            errors.append(f"DEDUP_PARA_TTL_DAYS 必须 >= 0: {cls.Redis.PARA_TTL_DAYS}")
+        
+        if cls.Redis.SWEEP_INTERVAL_SECONDS < 1:
+            errors.append(f"DEDUP_SWEEP_INTERVAL_SECONDS 必须 >= 1: {cls.Redis.SWEEP_INTERVAL_SECONDS}")
+        
+        if cls.Redis.MEMORY_MAX_PARAS < 0:
+            errors.append(f"DEDUP_MEMORY_MAX_PARAS 必须 >= 0: {cls.Redis.MEMORY_MAX_PARAS}")
+        
+        if cls.Redis.PARA_BLOOM_CAPACITY < 0:
+            errors.append(f"DEDUP_BLOOM_CAPACITY 必须 >= 0: {cls.Redis.PARA_BLOOM_CAPACITY}")
+        
+        if not 0 < cls.Redis.PARA_BLOOM_ERROR_RATE < 1:
+            errors.append(f"DEDUP_BLOOM_ERROR_RATE 必须在 (0, 1) 之间: {cls.Redis.PARA_BLOOM_ERROR_RATE}")
+        
+        if cls.Redis.PARA_BLOOM_REFRESH_SECONDS < 1:
+            errors.append(f"DEDUP_BLOOM_REFRESH_SECONDS 必须 >= 1: {cls.Redis.PARA_BLOOM_REFRESH_SECONDS}")
+        
         # 验证文本管线配置
         if cls.TextPipeline.MIN_PARAGRAPH_LEN < 1:
             errors.append(f"MIN_PARAGRAPH_LEN 必须 >= 1: {cls.TextPipeline.MIN_PARAGRAPH_LEN}")
@@ -184,10 +339,84 @@ class Config:
         if cls.TextPipeline.SIMHASH_DISTANCE_THRESHOLD < 0:
             errors.append(f"SIMHASH_DISTANCE_THRESHOLD 必须 >= 0: {cls.TextPipeline.SIMHASH_DISTANCE_THRESHOLD}")
         
+        if cls.TextPipeline.SIMHASH_TOKENIZER not in ("cjk", "char", "legacy"):
+            errors.append(f"SIMHASH_TOKENIZER 必须是 cjk/char/legacy: {cls.TextPipeline.SIMHASH_TOKENIZER}")
+        
+        if cls.TextPipeline.SIMHASH_NGRAM < 1:
+            errors.append(f"SIMHASH_NGRAM 必须 >= 1: {cls.TextPipeline.SIMHASH_NGRAM}")
+        
+        # 验证存储配置
+        if cls.Storage.UPLOAD_CHUNK_SIZE < 1:
+            errors.append(f"UPLOAD_CHUNK_SIZE 必须 >= 1: {cls.Storage.UPLOAD_CHUNK_SIZE}")
+        
+        if cls.Storage.ZIP_WORKERS < 0:
+            errors.append(f"ZIP_WORKERS 必须 >= 0: {cls.Storage.ZIP_WORKERS}")
+        
+        if cls.Storage.ZIP_DOWNLOAD_MODE not in ("prebuilt", "stream"):
+            errors.append(f"ZIP_DOWNLOAD_MODE 无效: {cls.Storage.ZIP_DOWNLOAD_MODE}")
+        
         # 验证批量处理配置
         if cls.BatchProcess.MAX_CONCURRENT_TASKS < 1:
             errors.append(f"MAX_CONCURRENT_TASKS 必须 >= 1: {cls.BatchProcess.MAX_CONCURRENT_TASKS}")
         
+        if cls.BatchProcess.WORKER_MODE not in ("process", "thread"):
+            errors.append(f"BATCH_WORKER_MODE 无效: {cls.BatchProcess.WORKER_MODE}")
+        
+        if cls.BatchProcess.WORKER_COUNT < 0:
+            errors.append(f"BATCH_WORKER_COUNT 必须 >= 0: {cls.BatchProcess.WORKER_COUNT}")
+        
+        if cls.BatchProcess.PARAGRAPH_MEMO_SIZE < 0:
+            errors.append(f"BATCH_PARAGRAPH_MEMO_SIZE 必须 >= 0: {cls.BatchProcess.PARAGRAPH_MEMO_SIZE}")
+        
+        if cls.BatchProcess.PROGRESS_POLL_INTERVAL <= 0:
+            errors.append(f"BATCH_PROGRESS_POLL_INTERVAL 必须 > 0: {cls.BatchProcess.PROGRESS_POLL_INTERVAL}")
+        
+        # 验证任务队列配置
+        if cls.TaskQueue.BACKEND not in ("auto", "redis", "sqlite", "memory"):
+            errors.append(f"TASK_STORE_BACKEND 无效: {cls.TaskQueue.BACKEND}")
+        
+        if cls.TaskQueue.WORKER_CONCURRENCY < 1:
+            errors.append(f"TASK_WORKER_CONCURRENCY 必须 >= 1: {cls.TaskQueue.WORKER_CONCURRENCY}")
+        
+        if not 1 <= cls.TaskQueue.HEARTBEAT_SECONDS < cls.BatchProcess.TASK_TIMEOUT_SECONDS:
+            errors.append(
+                f"TASK_HEARTBEAT_SECONDS 必须 >= 1 且小于 TASK_TIMEOUT_SECONDS: {cls.TaskQueue.HEARTBEAT_SECONDS}"
+            )
+        
+        if cls.TaskQueue.RECOVERY_INTERVAL_SECONDS < 1:
+            errors.append(f"TASK_RECOVERY_INTERVAL_SECONDS 必须 >= 1: {cls.TaskQueue.RECOVERY_INTERVAL_SECONDS}")
+        
+        # 验证检测配置
+        if cls.Detection.PDF_SAMPLE_THRESHOLD < 0:
+            errors.append(f"PDF_SAMPLE_THRESHOLD 必须 >= 0: {cls.Detection.PDF_SAMPLE_THRESHOLD}")
+        
+        if cls.Detection.PDF_SAMPLE_PAGES < 1:
+            errors.append(f"PDF_SAMPLE_PAGES 必须 >= 1: {cls.Detection.PDF_SAMPLE_PAGES}")
+        
+        # 验证转换配置
+        if cls.Conversion.LIBREOFFICE_POOL_SIZE < 1:
+            errors.append(f"LIBREOFFICE_POOL_SIZE 必须 >= 1: {cls.Conversion.LIBREOFFICE_POOL_SIZE}")
+        
+        if cls.Conversion.LIBREOFFICE_MAX_CONVERSIONS < 0:
+            errors.append(f"LIBREOFFICE_MAX_CONVERSIONS 必须 >= 0: {cls.Conversion.LIBREOFFICE_MAX_CONVERSIONS}")
+        
+        if cls.Conversion.TEXT_STREAM_THRESHOLD_MB < 0:
+            errors.append(f"TEXT_STREAM_THRESHOLD_MB 必须 >= 0: {cls.Conversion.TEXT_STREAM_THRESHOLD_MB}")
+        
+        # 验证转换结果缓存配置
+        if cls.ResultCache.MAX_SIZE_MB < 0:
+            errors.append(f"RESULT_CACHE_MAX_SIZE_MB 必须 >= 0: {cls.ResultCache.MAX_SIZE_MB}")
+        
+        # 验证分块上传配置
+        if cls.ChunkedUpload.CHUNK_SIZE < 1:
+            errors.append(f"CHUNKED_UPLOAD_CHUNK_SIZE 必须 >= 1: {cls.ChunkedUpload.CHUNK_SIZE}")
+        
+        if cls.ChunkedUpload.MAX_CHUNK_SIZE < cls.ChunkedUpload.CHUNK_SIZE:
+            errors.append(f"CHUNKED_UPLOAD_MAX_CHUNK_SIZE 不能小于 CHUNKED_UPLOAD_CHUNK_SIZE: {cls.ChunkedUpload.MAX_CHUNK_SIZE}")
+        
+        if cls.ChunkedUpload.TTL_HOURS < 1:
+            errors.append(f"CHUNKED_UPLOAD_TTL_HOURS 必须 >= 1: {cls.ChunkedUpload.TTL_HOURS}")
+        
         if errors:
             for error in errors:
                 print(f"[配置错误] {error}")
@@ -205,27 +434,69 @@ class Config:
         print("\n[Redis 配置]")
         print(f"  启用: {cls.Redis.ENABLED}")
         print(f"  地址: {cls.Redis.HOST}:{cls.Redis.PORT}/{cls.Redis.DB}")
+        print(f"  异步连接池上限: {cls.Redis.ASYNC_MAX_CONNECTIONS}")
         print(f"  密码: {'*' * len(cls.Redis.PASSWORD) if cls.Redis.PASSWORD else '无'}")
         print(f"  键前缀: {cls.Redis.KEY_PREFIX}")
+        print(f"  哈希存储格式: {cls.Redis.HASH_FORMAT}")
+        print(f"  默认去重命名空间: {cls.Redis.NAMESPACE or '默认'} (分片数 {cls.Redis.SHARD_COUNT})")
+        print(f"  文档哈希过期: {cls.Redis.DOC_TTL_DAYS or '不过期'} 天")
+        print(f"  段落哈希过期: {cls.Redis.PARA_TTL_DAYS or '不过期'} 天 (清理间隔 {cls.Redis.SWEEP_INTERVAL_SECONDS}s)")
+        print(f"  内存后端段落上限: {cls.Redis.MEMORY_MAX_PARAS or '不限制'}")
+        print(f"  布隆过滤器: {cls.Redis.PARA_BLOOM_CAPACITY or '不启用'} (误判率 {cls.Redis.PARA_BLOOM_ERROR_RATE}, 刷新间隔 {cls.Redis.PARA_BLOOM_REFRESH_SECONDS}s)")
         
         print("\n[文本管线配置]")
         print(f"  最小段落长度: {cls.TextPipeline.MIN_PARAGRAPH_LEN}")
         print(f"  SimHash 距离阈值: {cls.TextPipeline.SIMHASH_DISTANCE_THRESHOLD}")
         print(f"  启用近重复检测: {cls.TextPipeline.ENABLE_NEAR_DUPLICATE}")
+        print(f"  SimHash 分词: {cls.TextPipeline.SIMHASH_TOKENIZER} (n={cls.TextPipeline.SIMHASH_NGRAM})")
         print(f"  噪声模式数: {len(cls.TextPipeline.NOISE_PATTERNS)}")
         
         print("\n[存储配置]")
         print(f"  基础目录: {cls.Storage.BASE_DIR}")
         print(f"  清理保留天数: {cls.Storage.CLEAN_KEEP_DAYS}")
+        print(f"  上传分块大小: {cls.Storage.UPLOAD_CHUNK_SIZE} bytes")
+        print(f"  ZIP 打包线程数: {cls.Storage.ZIP_WORKERS or '自动'}")
+        print(f"  ZIP 下载方式: {cls.Storage.ZIP_DOWNLOAD_MODE}")
         
         print("\n[批量处理配置]")
         print(f"  最大并发数: {cls.BatchProcess.MAX_CONCURRENT_TASKS}")
         print(f"  超时时间: {cls.BatchProcess.TASK_TIMEOUT_SECONDS}s")
+        print(f"  工作层模式: {cls.BatchProcess.WORKER_MODE}")
+        print(f"  工作进程数: {cls.BatchProcess.WORKER_COUNT or '自动'}")
+        print(f"  段落指纹备忘: {cls.BatchProcess.PARAGRAPH_MEMO_SIZE or '不启用'}")
+        print(f"  进度推送间隔: {cls.BatchProcess.PROGRESS_POLL_INTERVAL}s")
+        
+        print("\n[任务队列配置]")
+        print(f"  存储后端: {cls.TaskQueue.BACKEND}")
+        print(f"  API 内置消费者: {cls.TaskQueue.RUN_WORKER_IN_API}")
+        print(f"  单进程并发任务数: {cls.TaskQueue.WORKER_CONCURRENCY}")
+        print(f"  任务心跳间隔: {cls.TaskQueue.HEARTBEAT_SECONDS}s")
+        print(f"  失效任务检查间隔: {cls.TaskQueue.RECOVERY_INTERVAL_SECONDS}s")
+        print(f"  任务保留天数: {cls.TaskQueue.TASK_TTL_DAYS}")
+        
+        print("\n[转换结果缓存配置]")
+        print(f"  启用: {cls.ResultCache.ENABLED}")
+        print(f"  缓存目录: {cls.ResultCache.DIR}")
+        print(f"  容量上限: {cls.ResultCache.MAX_SIZE_MB} MB")
+        
+        print("\n[分块上传配置]")
+        print(f"  上传目录: {cls.ChunkedUpload.DIR}")
+        print(f"  建议分块大小: {cls.ChunkedUpload.CHUNK_SIZE} bytes")
+        print(f"  分块上限: {cls.ChunkedUpload.MAX_CHUNK_SIZE} bytes")
+        print(f"  未完成上传保留: {cls.ChunkedUpload.TTL_HOURS} 小时")
+        print(f"  重复文件免传输: {cls.ChunkedUpload.DEDUP}")
+        
+        print("\n[文档检测配置]")
+        print(f"  PDF 图片预检: {cls.Detection.PDF_IMAGE_PREPASS}")
+        print(f"  PDF 抽样阈值: {cls.Detection.PDF_SAMPLE_THRESHOLD or '不抽样'}")
+        print(f"  PDF 抽样页数: {cls.Detection.PDF_SAMPLE_PAGES}")
         
         print("\n[文档转换配置]")
         print(f"  转换后端: {cls.Conversion.BACKEND}")
         print(f"  LibreOffice 路径: {cls.Conversion.LIBREOFFICE_PATH or '自动检测'}")
         print(f"  转换超时: {cls.Conversion.CONVERSION_TIMEOUT}s")
+        print(f"  LibreOffice 实例池: {cls.Conversion.LIBREOFFICE_POOL_SIZE} 个/进程, 回收阈值 {cls.Conversion.LIBREOFFICE_MAX_CONVERSIONS}")
+        print(f"  文本流式处理阈值: {cls.Conversion.TEXT_STREAM_THRESHOLD_MB} MB")
         print(f"  跳过临时文件: {cls.Conversion.SKIP_TEMP_FILES}")
         
         print("\n[日志配置]")
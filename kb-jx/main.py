@@ -2,7 +2,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from api.v1.endpoints import router as v1_router
+from api.v1.endpoints import (
+    router as v1_router, worker_pool, task_store, upload_store, async_dedup_store, run_queue_worker, run_dedup_sweeper,
+    run_task_recovery
+)
 from pathlib import Path
 from config import config
 from utils.logger import setup_logger, get_logger
@@ -140,6 +143,37 @@ async def startup_clean():
         logger.error(f"临时文件清理失败: {e}", exc_info=True)
 
 
+@app.on_event("startup")
+async def startup_queue_workers():
+    """启动时清理过期任务与未完成的分块上传，启动去重数据清理与失效任务检查，并按配置在 API 进程内启动队列消费者"""
+    import asyncio
+    import os
+    import socket
+    
+    task_store.purge_expired()
+    upload_store.purge_expired()
+    
+    app.state.queue_workers = [asyncio.create_task(run_dedup_sweeper()), asyncio.create_task(run_task_recovery())]
+    if not config.TaskQueue.RUN_WORKER_IN_API:
+        logger.info("API 进程不消费任务队列，请单独运行 worker.py")
+        return
+    
+    for i in range(config.TaskQueue.WORKER_CONCURRENCY):
+        worker_name = f"{socket.gethostname()}:{os.getpid()}:api-{i}"
+        app.state.queue_workers.append(asyncio.create_task(run_queue_worker(worker_name)))
+    logger.info(f"API 进程内队列消费者已启动: {config.TaskQueue.WORKER_CONCURRENCY} 个")
+
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """关闭时停止队列消费者，释放批量处理工作层与异步去重存储的连接池"""
+    for task in getattr(app.state, "queue_workers", []):
+        task.cancel()
+    logger.info("关闭批量处理工作层...")
+    worker_pool.shutdown(wait=False)
+    await async_dedup_store.close()
+
+
 if __name__ == "__main__":
     import uvicorn
     import asyncio
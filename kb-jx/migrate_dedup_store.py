@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+去重数据存储迁移脚本：hex（十六进制字符串）与 binary（截断摘要 + 8 字节指纹）互相转换，或调整分片数
+
+用法: python migrate_dedup_store.py [目标格式 binary|hex] [--from-format=格式] [--from-shards=N] [--namespace=知识库] [--delete-source]
+目标格式默认取 DEDUP_HASH_FORMAT，目标分片数取 DEDUP_SHARD_COUNT；
+源格式默认为另一种格式（只指定 --from-shards 时与目标格式相同），源分片数默认与目标相同；
+源数据默认保留，确认迁移结果后可加 --delete-source 重新运行删除。
+"""
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import config
+from utils.dedup_store import DedupStore, create_hash_codec
+from utils.logger import setup_logger
+
+# 初始化日志
+logger = setup_logger()
+
+
+def key_memory_mb(store: DedupStore, codec, shard_count: int) -> float:
+    """指定格式与分片数的文档/段落/指纹键占用的 Redis 内存（MB，不含分块索引）"""
+    total = 0
+    for get_key in (store._get_doc_key, store._get_para_key, store._get_simhash_key):
+        for key in store._shard_keys(get_key, codec, shard_count):
+            total += store._redis.memory_usage(key) or 0
+    return round(total / 1024 / 1024, 2)
+
+
+def parse_options(argv) -> dict:
+    """解析 --name=value 形式的选项"""
+    options = {}
+    for arg in argv:
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+    return options
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = parse_options(sys.argv[1:])
+    delete_source = "--delete-source" in sys.argv[1:]
+    target_format = args[0] if args else config.Redis.HASH_FORMAT
+    target_shards = config.Redis.SHARD_COUNT
+    source_shards = int(options.get("from-shards", target_shards))
+    default_source = target_format if "from-shards" in options else ("hex" if target_format == "binary" else "binary")
+    source_format = options.get("from-format", default_source)
+    namespace = options.get("namespace", config.Redis.NAMESPACE)
+    
+    logger.info("=" * 60)
+    logger.info(
+        f"去重数据迁移{f' [命名空间 {namespace}]' if namespace else ''}: "
+        f"{source_format} / {source_shards} 分片 -> {target_format} / {target_shards} 分片"
+    )
+    logger.info("=" * 60)
+    
+    try:
+        store = DedupStore(
+            backend="redis",
+            redis_config=config.get_redis_config(),
+            simhash_max_distance=config.TextPipeline.SIMHASH_DISTANCE_THRESHOLD,
+            doc_ttl_days=config.Redis.DOC_TTL_DAYS,
+            para_ttl_days=config.Redis.PARA_TTL_DAYS,
+            bloom_capacity=config.Redis.PARA_BLOOM_CAPACITY,
+            bloom_error_rate=config.Redis.PARA_BLOOM_ERROR_RATE,
+            hash_format=target_format,
+            namespace=namespace,
+            shard_count=target_shards
+        )
+        if store.backend != "redis":
+            logger.error("✗ Redis 不可用，无需迁移")
+            return 1
+        
+        source = create_hash_codec(source_format)
+        source_mb = key_memory_mb(store, source, source_shards)
+        counts = store.migrate_hash_format(
+            source_format, delete_source=delete_source, source_shard_count=source_shards
+        )
+        
+        logger.info("=" * 60)
+        logger.info(f"  文档哈希: {counts['doc_count']} 条")
+        logger.info(f"  段落哈希: {counts['para_count']} 条")
+        logger.info(f"  SimHash: {counts['simhash_count']} 条")
+        logger.info(
+            f"  内存占用: {source_format} {source_mb} MB -> "
+            f"{target_format} {key_memory_mb(store, store.codec, target_shards)} MB"
+        )
+        logger.info("=" * 60)
+        if not delete_source:
+            rerun_args = " ".join([arg for arg in sys.argv[1:] if arg != "--delete-source"] + ["--delete-source"])
+            logger.info(f"源数据已保留，确认无误后运行: python migrate_dedup_store.py {rerun_args}")
+        logger.info("✓ 迁移完成")
+        return 0
+    except Exception as e:
+        logger.error(f"✗ 迁移失败: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    sys.exit(exit_code)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 
 
 class FileInfo(BaseModel):
@@ -24,6 +24,30 @@ class BatchUploadResponse(BaseModel):
     status_url: str
 
 
+class UploadCreateRequest(BaseModel):
+    """创建分块上传请求"""
+    filename: str  # 文件名（批量上传时可含相对路径）
+    size: int  # 文件总字节数
+    sha256: Optional[str] = None  # 整个文件的 SHA-256（可选，服务端已有相同文件时免传输）
+
+
+class UploadStatusResponse(BaseModel):
+    """分块上传状态"""
+    upload_id: str
+    filename: str
+    size: int
+    offset: int  # 服务端已接收的字节数（下一个分块的起始偏移）
+    status: str  # uploading, complete
+    chunk_size: int  # 建议的分块大小
+    duplicate: bool = False  # 服务端已有相同文件，无需传输
+    sha256: Optional[str] = None  # 接收完整后的文件 SHA-256
+
+
+class BatchFromUploadsRequest(BaseModel):
+    """由已完成的分块上传创建批量任务"""
+    upload_ids: List[str]
+
+
 class FilePathInfo(BaseModel):
     """文件路径信息"""
     original_path: str
@@ -35,6 +59,7 @@ class Progress(BaseModel):
     """进度信息"""
     total: int
     completed: int
+    processed: int = 0  # 新增：已处理完成的文件数（含重复、失败、临时锁文件）
     pure_text_count: int
     rich_media_count: int
     unique_pure_count: int = 0  # 新增：独一份纯文本数量
@@ -56,6 +81,16 @@ class Downloads(BaseModel):
     temp_files: Optional[str] = None  # 新增：临时锁文件下载链接
 
 
+class FileResult(BaseModel):
+    """单文件处理结果（处理完成即可查询与下载）"""
+    index: int  # 上传顺序中的序号（从 0 开始）
+    filename: str
+    status: str  # pure_text, rich_media, duplicate, failed, temp_file
+    reason: Optional[str] = None
+    doc_duplicate: bool = False
+    download_url: Optional[str] = None
+
+
 class BatchStatusResponse(BaseModel):
     """批量任务状态响应"""
     task_id: str
@@ -64,4 +99,6 @@ class BatchStatusResponse(BaseModel):
     pure_text_files: List[Dict[str, str]]
     rich_media_files: List[Dict[str, str]]
     downloads: Downloads
-    dedup_stats: Optional[Dict[str, int]] = None  # 新增：去重统计
+    dedup_stats: Optional[Dict[str, Any]] = None  # 新增：去重统计（含各噪声模式命中次数）
+    file_results: List[FileResult] = []  # 新增：从 since 开始新完成的单文件结果
+    next_since: int = 0  # 新增：下次轮询传入的 since
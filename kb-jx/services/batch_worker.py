@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量处理工作层 - 在进程池/线程池中执行文档检测与转换
+
+检测（python-docx / openpyxl / PyMuPDF）与转换（LibreOffice 子进程、文本管线）
+都是同步的 CPU/IO 密集操作，直接在事件循环中执行会阻塞所有请求。
+本模块把单个文件的 "检测 + 转换" 封装为可序列化的顶层函数，交给工作层执行，
+结果与管线统计以普通 dict 形式返回给批量任务。
+"""
+import asyncio
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from utils.logger import get_logger
+from utils.paragraph_memo import ParagraphMemo
+from utils.result_cache import build_cache_entry
+
+logger = get_logger("batch_worker")
+
+# 工作进程内的服务实例（由 init_worker 初始化）
+_detector = None
+_converter = None
+_result_cache = None
+_init_lock = threading.Lock()
+
+# 批量任务的段落指纹备忘（task_id -> ParagraphMemo）：线程模式下整批共享一份，
+# 进程模式下每个工作进程各持有一份，任务结束后经工作层释放（最多同时保留 MAX_MEMO_TASKS 个任务）
+_paragraph_memos: "OrderedDict[str, ParagraphMemo]" = OrderedDict()
+_memo_lock = threading.Lock()
+MAX_MEMO_TASKS = 4
+# 进程模式下记住的已结束任务数（随每次调用发给工作进程，释放其中残留的备忘）
+MAX_RELEASED_TASKS = 64
+
+# 旧格式 -> 新格式映射
+OLD_FORMAT_MAP = {
+    '.doc': '.docx',
+    '.xls': '.xlsx',
+    '.ppt': '.pptx'
+}
+
+
+def init_worker(detector=None, converter=None, result_cache=None):
+    """
+    工作进程/线程初始化
+    
+    进程模式下每个工作进程独立创建检测器、转换器与文本管线（连接同一个 Redis，
+    因此文档级去重在进程间共享）。去重存储为内存后端时 API 进程改用线程模式，
+    线程模式下直接复用主进程传入的实例。
+    
+    Args:
+        detector: 复用的 DocumentDetector 实例（可选）
+        converter: 复用的 DocumentConverter 实例（可选）
+        result_cache: 复用的 ConversionCache 实例（可选）
+    """
+    global _detector, _converter, _result_cache
+    
+    with _init_lock:
+        if _detector is not None and _converter is not None:
+            return
+        
+        if detector is not None and converter is not None:
+            _detector = detector
+            _converter = converter
+            _result_cache = result_cache
+            return
+        
+        from config import config
+        from services.detector import DocumentDetector
+        from services.converter import DocumentConverter
+        from services.text_pipeline import TextPipeline
+        from utils.dedup_store import DedupStore
+        from utils.result_cache import create_result_cache
+        
+        dedup_store = DedupStore(
+            backend="redis" if config.Redis.ENABLED else "memory",
+            redis_config=config.get_redis_config(),
+            simhash_max_distance=config.TextPipeline.SIMHASH_DISTANCE_THRESHOLD,
+            doc_ttl_days=config.Redis.DOC_TTL_DAYS,
+            para_ttl_days=config.Redis.PARA_TTL_DAYS,
+            max_memory_paras=config.Redis.MEMORY_MAX_PARAS,
+            sweep_interval=config.Redis.SWEEP_INTERVAL_SECONDS,
+            bloom_capacity=config.Redis.PARA_BLOOM_CAPACITY,
+            bloom_error_rate=config.Redis.PARA_BLOOM_ERROR_RATE,
+            bloom_refresh_interval=config.Redis.PARA_BLOOM_REFRESH_SECONDS,
+            hash_format=config.Redis.HASH_FORMAT,
+            namespace=config.Redis.NAMESPACE,
+            shard_count=config.Redis.SHARD_COUNT
+        )
+        if dedup_store.backend != "redis":
+            logger.error(f"工作进程 {os.getpid()} 无法连接 Redis，去重状态不与其他进程共享，文档去重可能遗漏")
+        text_pipeline = TextPipeline(
+            dedup_store=dedup_store,
+            min_paragraph_len=config.TextPipeline.MIN_PARAGRAPH_LEN,
+            simhash_distance_threshold=config.TextPipeline.SIMHASH_DISTANCE_THRESHOLD,
+            enable_near_duplicate=config.TextPipeline.ENABLE_NEAR_DUPLICATE,
+            custom_noise_patterns=config.TextPipeline.CUSTOM_NOISE_PATTERNS,
+            enable_cross_doc_dedup=False,
+            simhash_tokenizer=config.TextPipeline.SIMHASH_TOKENIZER,
+            simhash_ngram=config.TextPipeline.SIMHASH_NGRAM
+        )
+        
+        _detector = DocumentDetector()
+        _converter = DocumentConverter(text_pipeline=text_pipeline)
+        _result_cache = create_result_cache(text_pipeline)
+        logger.info(f"工作进程初始化完成: pid={os.getpid()}")
+
+
+def get_paragraph_memo(task_id: str) -> Optional[ParagraphMemo]:
+    """
+    获取（必要时创建）批量任务的段落指纹备忘
+    
+    Returns:
+        ParagraphMemo，BATCH_PARAGRAPH_MEMO_SIZE=0 时为 None
+    """
+    from config import config
+    
+    if config.BatchProcess.PARAGRAPH_MEMO_SIZE <= 0:
+        return None
+    with _memo_lock:
+        memo = _paragraph_memos.get(task_id)
+        if memo is None:
+            memo = ParagraphMemo(config.BatchProcess.PARAGRAPH_MEMO_SIZE)
+            _paragraph_memos[task_id] = memo
+            while len(_paragraph_memos) > MAX_MEMO_TASKS:
+                _paragraph_memos.popitem(last=False)
+        else:
+            _paragraph_memos.move_to_end(task_id)
+        return memo
+
+
+def release_paragraph_memo(task_id: str):
+    """任务结束后释放当前进程中的段落指纹备忘"""
+    release_paragraph_memos((task_id,))
+
+
+def release_paragraph_memos(task_ids: Iterable[str]):
+    """释放当前进程中多个任务的段落指纹备忘"""
+    with _memo_lock:
+        for task_id in task_ids:
+            _paragraph_memos.pop(task_id, None)
+
+
+def _run_in_worker(released_tasks: Tuple[str, ...], func: Callable, *args):
+    """工作进程中先释放已结束任务残留的段落指纹备忘，再执行 func"""
+    if released_tasks:
+        release_paragraph_memos(released_tasks)
+    return func(*args)
+
+
+def process_file(original_file: str, path_info: Dict, task_dir: str, task_id: str,
+                 file_hash: Optional[str] = None, namespace: Optional[str] = None) -> Dict:
+    """
+    处理单个文件：检测内容类型，按需转换格式并应用文本管线
+    
+    提供 file_hash 时先查询转换结果缓存，命中则跳过检测、转换与文本管线。
+    
+    Args:
+        original_file: 已保存的原始文件路径
+        path_info: 路径信息 {'full_path', 'directory', 'filename', 'stem', 'extension'}
+        task_dir: 任务工作目录
+        task_id: 任务 ID（用于日志）
+        file_hash: 原始文件 SHA-256（可选，用于结果缓存）
+        namespace: 去重命名空间（知识库标识，默认使用配置的命名空间）
+    
+    Returns:
+        处理结果 dict（与批量任务汇总逻辑约定的字段）
+    """
+    if _detector is None or _converter is None:
+        init_worker()
+    
+    filename = path_info['full_path']
+    task_dir = Path(task_dir)
+    paragraph_memo = get_paragraph_memo(task_id)
+    
+    # 查询转换结果缓存（扩展名影响转换策略，一并计入缓存键）
+    cache_key = None
+    cached = None
+    if file_hash and _result_cache is not None and _result_cache.enabled:
+        cache_key = _result_cache.make_key(file_hash, path_info['extension'].lower(), "batch")
+        cached = _result_cache.get(cache_key)
+    
+    source_paragraphs = None
+    if cached is not None:
+        is_pure_text, reason = cached['is_pure_text'], cached['reason']
+        logger.info(f"[任务 {task_id}] 缓存命中: {filename} -> 纯文本={is_pure_text}, {reason}")
+    else:
+        # 先检测原文件内容类型（docx 同时提取段落，转换时复用）
+        inspection = _detector.inspect(original_file)
+        is_pure_text, reason = inspection['is_pure_text'], inspection['reason']
+        source_paragraphs = inspection.get('paragraphs')
+        logger.info(f"[任务 {task_id}] 检测结果: {filename} -> 纯文本={is_pure_text}, {reason}")
+    
+    result = {
+        'path_info': path_info,
+        'original_file': original_file,
+        'filename': filename,
+        'is_pure_text': is_pure_text,
+        'reason': reason
+    }
+    
+    need_conversion = False
+    target_ext = path_info['extension']
+    
+    # 旧格式转换策略：根据是否纯文本决定目标格式
+    if path_info['extension'] in OLD_FORMAT_MAP:
+        need_conversion = True
+        if is_pure_text:
+            # 纯文本：统一转为 docx 并应用文本管线
+            target_ext = '.docx'
+            logger.info(f"[任务 {task_id}] 纯文本旧格式转为docx: {path_info['extension']} -> {target_ext}")
+        else:
+            # 富媒体：转为对应的新格式（保留富媒体内容）
+            target_ext = OLD_FORMAT_MAP[path_info['extension']]
+            logger.info(f"[任务 {task_id}] 富媒体旧格式转为新格式: {path_info['extension']} -> {target_ext}")
+    # 新格式文档转换策略
+    elif path_info['extension'] in ['.docx', '.xlsx', '.pptx']:
+        if is_pure_text:
+            # 纯文本：转为 docx 应用文本管线清洗
+            need_conversion = True
+            target_ext = '.docx'
+            logger.info(f"[任务 {task_id}] 纯文本文档转为docx清洗: {path_info['extension']} -> {target_ext}")
+        else:
+            # 富媒体：保持原格式，不转换
+            need_conversion = False
+            logger.info(f"[任务 {task_id}] 富媒体文档保持原格式: {path_info['extension']}")
+    
+    if not need_conversion:
+        if cache_key and cached is None:
+            _result_cache.put(cache_key, build_cache_entry(is_pure_text, reason))
+        return result
+    
+    # 执行格式转换
+    converted_dir = task_dir / "converted"
+    converted_dir.mkdir(exist_ok=True)
+    
+    if path_info['directory']:
+        converted_file_dir = converted_dir / path_info['directory']
+        converted_file_dir.mkdir(parents=True, exist_ok=True)
+        converted_file = converted_file_dir / f"{path_info['stem']}{target_ext}"
+        # Windows 路径转换为正斜杠，兼容 ZIP 归档
+        converted_path = str(Path(path_info['directory']) / f"{path_info['stem']}{target_ext}").replace('\\', '/')
+    else:
+        converted_file = converted_dir / f"{path_info['stem']}{target_ext}"
+        # 根目录文件，无前导分隔符
+        converted_path = f"{path_info['stem']}{target_ext}"
+    
+    if cached is not None and cached.get('convert') and _result_cache.restore_blob(cached, str(converted_file)):
+        # 缓存命中：直接复用转换结果，仅重新检查文档级去重
+        convert_result = _converter.replay_cached_result(cached['convert'], doc_name=filename, namespace=namespace)
+    else:
+        logger.debug(f"[任务 {task_id}] 开始转换: {filename} -> {converted_file.name}")
+        convert_result = _converter.convert_to_docx(
+            original_file,
+            str(converted_file),
+            doc_name=filename,
+            apply_pipeline=is_pure_text,  # 只有纯文本才应用文本管线
+            source_paragraphs=source_paragraphs,
+            namespace=namespace,
+            paragraph_memo=paragraph_memo
+        )
+        # 只缓存成功产出文件的结果（转换失败可能是暂时性的，如 LibreOffice 不可用）
+        if cache_key and (convert_result["success"] or convert_result.get("doc_duplicate")):
+            _result_cache.put(
+                cache_key, build_cache_entry(is_pure_text, reason, convert_result),
+                blob_file=str(converted_file)
+            )
+    
+    if convert_result["success"]:
+        logger.info(f"[任务 {task_id}] 转换成功: {filename} -> {converted_file.name}")
+        result['converted_file'] = str(converted_file)
+        result['converted_path'] = converted_path
+        result['content_hash'] = convert_result.get("content_hash")
+        
+        # 记录管线统计（仅纯文本docx有）
+        if "pipeline_stats" in convert_result:
+            pipeline_stats = convert_result["pipeline_stats"]
+            result['pipeline_stats'] = pipeline_stats
+            logger.debug(f"[任务 {task_id}] 管线统计: 段落去重={pipeline_stats.get('paragraphs_exact_dup', 0)+pipeline_stats.get('paragraphs_near_dup', 0)}, 噪声移除={pipeline_stats.get('noise_removed_count', 0)}")
+    elif convert_result.get("doc_duplicate"):
+        # 纯文本文档级去重命中（清洗后的文件已经被保存到 converted_file 路径）
+        logger.warning(f"[任务 {task_id}] 文档去重命中: {filename}")
+        result['doc_duplicate'] = True
+        result['converted_file'] = str(converted_file)
+        result['converted_path'] = converted_path
+        result['content_hash'] = convert_result.get("content_hash")
+    else:
+        # 转换失败，保留原文件信息
+        logger.error(f"[任务 {task_id}] 转换失败: {filename}, {convert_result.get('message')}")
+    
+    if paragraph_memo is not None:
+        # 备忘的累计命中（按工作进程汇总，批量任务取每个进程的最新值）
+        result['paragraph_memo'] = {'worker': os.getpid(), **paragraph_memo.get_stats()}
+    return result
+
+
+class BatchWorkerPool:
+    """批量处理工作层 - 进程池/线程池的懒加载封装"""
+    
+    def __init__(self, mode: str = "process", max_workers: int = 0,
+                 detector=None, converter=None, result_cache=None):
+        """
+        初始化工作层
+        
+        Args:
+            mode: "process"（进程池）或 "thread"（线程池）
+            max_workers: 工作进程/线程数（0 = 自动）
+            detector: 线程模式下复用的检测器实例
+            converter: 线程模式下复用的转换器实例
+            result_cache: 线程模式下复用的转换结果缓存实例
+        """
+        self.mode = mode
+        self.max_workers = max_workers or (os.cpu_count() or 1)
+        self._detector = detector
+        self._converter = converter
+        self._result_cache = result_cache
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        # 进程模式下最近结束的任务（工作进程中的段落指纹备忘待释放）
+        self._released_tasks: "deque[str]" = deque(maxlen=MAX_RELEASED_TASKS)
+    
+    def _get_executor(self) -> Executor:
+        """获取（必要时创建）执行器"""
+        with self._lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        initializer=init_worker
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="kbjx-worker",
+                        initializer=init_worker,
+                        initargs=(self._detector, self._converter, self._result_cache)
+                    )
+                logger.info(f"工作层已启动: 模式={self.mode}, 并发={self.max_workers}")
+            return self._executor
+    
+    async def run(self, func: Callable, *args):
+        """
+        在工作层中执行函数并等待结果
+        
+        进程池损坏（如工作进程因 PyMuPDF 崩溃退出）时重建执行器并抛出异常，
+        由调用方按单文件失败处理。
+        """
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            if self.mode == "process":
+                return await loop.run_in_executor(
+                    executor, _run_in_worker, tuple(self._released_tasks), func, *args
+                )
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            logger.error("工作进程池已损坏，重建执行器")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+    
+    def release_task(self, task_id: str):
+        """
+        任务结束：释放该任务的段落指纹备忘
+        
+        线程模式下备忘在当前进程中，直接释放。进程模式下无法指定由哪个工作进程执行，
+        因此向每个工作进程各提交一次释放调用（空闲的进程立即释放），
+        同时记住该任务，之后发给工作进程的每次调用都会先释放它，保证没领到释放调用的进程也会释放。
+        """
+        release_paragraph_memo(task_id)
+        if self.mode != "process":
+            return
+        self._released_tasks.append(task_id)
+        with self._lock:
+            executor = self._executor
+        if executor is None:
+            return
+        try:
+            for _ in range(self.max_workers):
+                executor.submit(release_paragraph_memos, (task_id,))
+        except Exception as e:
+            # 执行器已关闭或进程池已损坏：残留的备忘随下次调用释放
+            logger.debug(f"提交段落指纹备忘释放失败: {e}")
+    
+    def shutdown(self, wait: bool = True):
+        """关闭工作层"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+            logger.info("工作层已关闭")
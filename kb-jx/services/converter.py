@@ -1,15 +1,18 @@
 from pathlib import Path
+import asyncio
 import os
 import tempfile
-import subprocess
 import shutil
-import uuid
-from typing import Optional, Dict
-from datetime import datetime
+from typing import Optional, Dict, Iterator, List
 from docx import Document
 from openpyxl import load_workbook
 from pptx import Presentation
 from utils.logger import get_logger
+from services.ooxml_inspector import read_docx_paragraphs, compute_content_hash
+from services.libreoffice_pool import LibreOfficePool
+from services.docx_stream_writer import DocxStreamWriter
+from services import document_blocks
+from services.document_blocks import Block, blocks_to_text, render_docx
 
 # 安全导入 PyMuPDF（可选依赖）
 try:
@@ -19,6 +22,9 @@ except Exception:
 
 logger = get_logger("converter")
 
+# 直接提取文档块转换的格式（不经过中间 docx）
+BLOCK_EXTENSIONS = ('.xlsx', '.xls', '.pptx', '.ppt', '.pdf')
+
 
 class DocumentConverter:
     """文档转换器 - 将各种格式转换为 docx"""
@@ -41,14 +47,37 @@ class DocumentConverter:
         
         # 检测 LibreOffice
         self.libreoffice_path = self._detect_libreoffice()
+        self._libreoffice_pool = None
         if self.libreoffice_path:
             logger.info(f"LibreOffice 检测成功: {self.libreoffice_path}")
+            self._libreoffice_pool = self._create_libreoffice_pool()
         else:
             logger.warning("LibreOffice 未检测到，将使用 Word COM 作为后备")
         
         # 文本管线（可选）
         self.text_pipeline = text_pipeline
     
+    def _create_libreoffice_pool(self) -> LibreOfficePool:
+        """创建 LibreOffice 实例池（实例在首次转换时启动）"""
+        size, max_conversions, timeout, startup_timeout = 1, 200, 60, 30
+        try:
+            from config import config
+            size = config.Conversion.LIBREOFFICE_POOL_SIZE
+            max_conversions = config.Conversion.LIBREOFFICE_MAX_CONVERSIONS
+            timeout = config.Conversion.CONVERSION_TIMEOUT
+            startup_timeout = config.Conversion.LIBREOFFICE_STARTUP_TIMEOUT
+        except:
+            pass
+        
+        return LibreOfficePool(
+            self.libreoffice_path,
+            size=size,
+            max_conversions=max_conversions,
+            timeout=timeout,
+            startup_timeout=startup_timeout,
+            work_dir="storage/temp"
+        )
+    
     def _detect_libreoffice(self) -> Optional[str]:
         """检测 LibreOffice 安装路径"""
         try:
@@ -73,7 +102,9 @@ class DocumentConverter:
         except:
             return None
     
-    def convert_to_docx(self, input_file: str, output_file: str, doc_name: str = "unknown", apply_pipeline: bool = True) -> Dict:
+    def convert_to_docx(self, input_file: str, output_file: str, doc_name: str = "unknown",
+                        apply_pipeline: bool = True, source_paragraphs: Optional[List[str]] = None,
+                        namespace: Optional[str] = None, paragraph_memo=None) -> Dict:
         """
         将文件转换为目标格式（集成文本管线）
         
@@ -82,12 +113,16 @@ class DocumentConverter:
             output_file: 输出文件路径
             doc_name: 文档名称（用于日志）
             apply_pipeline: 是否应用文本管线（仅纯文本才应用）
+            source_paragraphs: 检测阶段已提取的 docx 段落（输入为 .docx 时复用，避免重复解析）
+            namespace: 去重命名空间（知识库标识，默认使用文本管线的命名空间）
+            paragraph_memo: 段落指纹备忘（ParagraphMemo，批量任务内共享）
         
         Returns:
             {
                 "success": bool,
                 "message": str,
-                "pipeline_stats": dict (如果使用了文本管线)
+                "pipeline_stats": dict (如果使用了文本管线),
+                "content_hash": str (如果写入了清洗后的文本，用于独一份去重)
             }
         """
         path = Path(input_file)
@@ -97,6 +132,9 @@ class DocumentConverter:
         try:
             # 先转换为中间格式或提取文本
             if extension in ['.txt', '.md']:
+                # 大文本文件：边读取边清洗，直接流式写入 docx
+                if self.text_pipeline and apply_pipeline and output_ext == '.docx' and self._use_text_streaming(input_file):
+                    return self._convert_text_streaming(input_file, output_file, doc_name, namespace, paragraph_memo)
                 success = self._txt_to_docx(input_file, output_file)
             elif extension == '.docx':
                 # docx 转 docx（复制后检测是否需要清洗）
@@ -107,58 +145,31 @@ class DocumentConverter:
             elif extension == '.doc':
                 # .doc 转 .docx
                 success = self._doc_to_docx(input_file, output_file)
+            elif extension in BLOCK_EXTENSIONS and (output_ext == '.docx' or extension == '.pdf'):
+                # xlsx/xls/pptx/ppt/pdf 直接提取文档块：应用管线时不写出中间 docx，否则一次写成最终 docx
+                blocks = self._extract_blocks(input_file, extension)
+                if blocks is None:
+                    return {"success": False, "message": "格式转换失败"}
+                if self.text_pipeline and apply_pipeline and output_ext == '.docx':
+                    logger.info(f"[{doc_name}] 应用文本管线进行清洗与去重")
+                    result = self.text_pipeline.process(
+                        blocks_to_text(blocks), doc_name, namespace=namespace, paragraph_memo=paragraph_memo
+                    )
+                    content_hash = self._save_pipeline_result(result, output_file, doc_name, blocks)
+                    return self._pipeline_result(result, content_hash, doc_name)
+                success = render_docx(blocks, output_file)
             elif extension == '.xlsx':
-                # xlsx 转为 docx（用于纯文本检测）或保持 xlsx
-                if output_ext == '.docx':
-                    success = self._xlsx_to_docx(input_file, output_file)
-                elif output_ext == '.xlsx':
-                    success = self._copy_file(input_file, output_file)
-                else:
-                    success = False
+                # 保持 xlsx
+                success = output_ext == '.xlsx' and self._copy_file(input_file, output_file)
             elif extension == '.xls':
-                # .xls 转 .xlsx 或 .docx
-                if output_ext == '.xlsx':
-                    success = self._xls_to_xlsx(input_file, output_file)
-                elif output_ext == '.docx':
-                    # 先转xlsx再转docx
-                    temp_xlsx = self._convert_old_to_new(input_file, 'xlsx')
-                    if temp_xlsx:
-                        success = self._xlsx_to_docx(temp_xlsx, output_file)
-                        try:
-                            os.remove(temp_xlsx)
-                        except:
-                            pass
-                    else:
-                        success = False
-                else:
-                    success = False
+                # .xls 转 .xlsx
+                success = output_ext == '.xlsx' and self._xls_to_xlsx(input_file, output_file)
             elif extension == '.pptx':
-                # pptx 转为 docx（用于纯文本检测）或保持 pptx
-                if output_ext == '.docx':
-                    success = self._pptx_to_docx(input_file, output_file)
-                elif output_ext == '.pptx':
-                    success = self._copy_file(input_file, output_file)
-                else:
-                    success = False
+                # 保持 pptx
+                success = output_ext == '.pptx' and self._copy_file(input_file, output_file)
             elif extension == '.ppt':
-                # .ppt 转 .pptx 或 .docx
-                if output_ext == '.pptx':
-                    success = self._ppt_to_pptx(input_file, output_file)
-                elif output_ext == '.docx':
-                    # 先转pptx再转docx
-                    temp_pptx = self._convert_old_to_new(input_file, 'pptx')
-                    if temp_pptx:
-                        success = self._pptx_to_docx(temp_pptx, output_file)
-                        try:
-                            os.remove(temp_pptx)
-                        except:
-                            pass
-                    else:
-                        success = False
-                else:
-                    success = False
-            elif extension == '.pdf':
-                success = self._pdf_to_docx(input_file, output_file)
+                # .ppt 转 .pptx
+                success = output_ext == '.pptx' and self._ppt_to_pptx(input_file, output_file)
             else:
                 return {"success": False, "message": f"不支持的格式: {extension}"}
             
@@ -168,35 +179,13 @@ class DocumentConverter:
             # 如果有文本管线且输出是 docx，且明确要求应用管线（仅纯文本）
             if self.text_pipeline and apply_pipeline and os.path.exists(output_file) and output_ext == '.docx':
                 logger.info(f"[{doc_name}] 应用文本管线进行清洗与去重")
-                
-                # 从生成的 docx 提取文本
-                text = self._extract_text_from_docx(output_file)
+                text = self._pipeline_input_text(output_file, extension, source_paragraphs)
                 
                 # 应用文本管线
-                result = self.text_pipeline.process(text, doc_name)
-                
-                # 无论是否去重，都要保存清洗后的文本
-                if result.get("cleaned_text"):
-                    cleaned_text = result["cleaned_text"]
-                    self._write_cleaned_text_to_docx(cleaned_text, output_file)
-                    logger.debug(f"[{doc_name}] 清洗后的文本已保存到: {output_file}")
+                result = self.text_pipeline.process(text, doc_name, namespace=namespace, paragraph_memo=paragraph_memo)
                 
-                if not result["success"]:
-                    # 文档级去重命中（但清洗后的文件已保存）
-                    return {
-                        "success": False,
-                        "message": result["message"],
-                        "pipeline_stats": result["stats"],
-                        "doc_duplicate": result.get("doc_duplicate", False)
-                    }
-                
-                logger.info(f"[{doc_name}] 文本管线处理完成: {result['stats']}")
-                
-                return {
-                    "success": True,
-                    "message": "转换与清洗成功",
-                    "pipeline_stats": result["stats"]
-                }
+                content_hash = self._save_pipeline_result(result, output_file, doc_name)
+                return self._pipeline_result(result, content_hash, doc_name)
             
             return {"success": True, "message": "转换成功"}
             
@@ -204,6 +193,223 @@ class DocumentConverter:
             logger.error(f"转换错误: {e}", exc_info=True)
             return {"success": False, "message": f"转换错误: {str(e)}"}
     
+    async def convert_to_docx_async(self, input_file: str, output_file: str, doc_name: str = "unknown",
+                                    apply_pipeline: bool = True, source_paragraphs: Optional[List[str]] = None,
+                                    namespace: Optional[str] = None) -> Dict:
+        """
+        convert_to_docx 的异步版本（供事件循环调用）
+        
+        格式转换、文本提取与写回在线程池执行，文本管线通过 process_async 访问去重存储，
+        Redis 延迟不会阻塞事件循环中的其他请求。大文本流式转换整体在线程池执行。
+        参数与返回值同 convert_to_docx。
+        """
+        extension = Path(input_file).suffix.lower()
+        output_ext = Path(output_file).suffix.lower()
+        if not (self.text_pipeline and apply_pipeline and output_ext == '.docx') or (
+                extension in ['.txt', '.md'] and self._use_text_streaming(input_file)):
+            return await asyncio.to_thread(
+                self.convert_to_docx, input_file, output_file, doc_name,
+                apply_pipeline, source_paragraphs, namespace
+            )
+        
+        try:
+            blocks = None
+            if extension in BLOCK_EXTENSIONS:
+                # 直接提取文档块作为管线输入（不写出中间 docx）
+                blocks = await asyncio.to_thread(self._extract_blocks, input_file, extension)
+                if blocks is None:
+                    return {"success": False, "message": "格式转换失败"}
+                logger.info(f"[{doc_name}] 应用文本管线进行清洗与去重")
+                text = blocks_to_text(blocks)
+            else:
+                # 先只做格式转换，再在事件循环中应用文本管线
+                result = await asyncio.to_thread(self.convert_to_docx, input_file, output_file, doc_name, False)
+                if not result["success"] or not os.path.exists(output_file):
+                    return result
+                
+                logger.info(f"[{doc_name}] 应用文本管线进行清洗与去重")
+                text = await asyncio.to_thread(self._pipeline_input_text, output_file, extension, source_paragraphs)
+            
+            result = await self.text_pipeline.process_async(text, doc_name, namespace=namespace)
+            content_hash = await asyncio.to_thread(self._save_pipeline_result, result, output_file, doc_name, blocks)
+            return self._pipeline_result(result, content_hash, doc_name)
+        except Exception as e:
+            logger.error(f"转换错误: {e}", exc_info=True)
+            return {"success": False, "message": f"转换错误: {str(e)}"}
+    
+    def _pipeline_input_text(self, output_file: str, extension: str,
+                             source_paragraphs: Optional[List[str]] = None) -> str:
+        """文本管线的输入：docx 直接复用检测阶段的段落，其他格式从生成的 docx 提取"""
+        if source_paragraphs is not None and extension == '.docx':
+            return '\n\n'.join(p.strip() for p in source_paragraphs)
+        return self._extract_text_from_docx(output_file)
+    
+    def _save_pipeline_result(self, result: Dict, output_file: str, doc_name: str,
+                              blocks: Optional[List[Block]] = None) -> Optional[str]:
+        """
+        清洗后的文本写回输出文件（无论是否去重都要保存）
+        
+        Args:
+            blocks: 直接提取的文档块（没有写出中间 docx）：清洗后没有文本或写入失败时，
+                    把文档块写成输出文件（与原先保留中间 docx 的结果一致）
+        
+        Returns:
+            写入内容的哈希（没有写入时为 None）
+        """
+        content_hash = None
+        written = None
+        if result.get("cleaned_text"):
+            written = self._write_cleaned_text_to_docx(result["cleaned_text"], output_file)
+            if written is not None:
+                content_hash = compute_content_hash(written)
+            logger.debug(f"[{doc_name}] 清洗后的文本已保存到: {output_file}")
+        if written is None and blocks is not None and not render_docx(blocks, output_file):
+            raise IOError(f"写入 DOCX 文件失败: {output_file}")
+        return content_hash
+    
+    def _pipeline_result(self, result: Dict, content_hash: Optional[str], doc_name: str) -> Dict:
+        """文本管线处理结果转换为 convert_to_docx 的返回值"""
+        if not result["success"]:
+            # 文档级去重命中（但清洗后的文件已保存）
+            return {
+                "success": False,
+                "message": result["message"],
+                "pipeline_stats": result["stats"],
+                "doc_duplicate": result.get("doc_duplicate", False),
+                "doc_hash": result.get("doc_hash"),
+                "content_hash": content_hash
+            }
+        
+        logger.info(f"[{doc_name}] 文本管线处理完成: {result['stats']}")
+        
+        return {
+            "success": True,
+            "message": "转换与清洗成功",
+            "pipeline_stats": result["stats"],
+            "doc_hash": result.get("doc_hash"),
+            "content_hash": content_hash
+        }
+    
+    def _use_text_streaming(self, input_file: str) -> bool:
+        """TXT/MD 文件是否超过流式处理阈值"""
+        threshold_mb = 20
+        try:
+            from config import config
+            threshold_mb = config.Conversion.TEXT_STREAM_THRESHOLD_MB
+        except:
+            pass
+        
+        return os.path.getsize(input_file) >= threshold_mb * 1024 * 1024
+    
+    def _convert_text_streaming(self, input_file: str, output_file: str, doc_name: str,
+                                namespace: Optional[str] = None, paragraph_memo=None) -> Dict:
+        """
+        TXT/MD 流式转换：逐块读取 -> 文本管线逐段清洗去重 -> 逐段写入 docx
+        
+        结果（段落、统计、文档哈希、内容哈希）与「TXT 转 docx -> 提取文本 -> 管线 -> 写回 docx」一致，
+        内存占用与文件大小无关。
+        """
+        logger.info(f"[{doc_name}] 流式应用文本管线进行清洗与去重")
+        
+        stream = self.text_pipeline.process_stream(
+            self._iter_text_file_paragraphs(input_file), doc_name, paragraphs=True, namespace=namespace,
+            paragraph_memo=paragraph_memo
+        )
+        with DocxStreamWriter(output_file) as writer:
+            for para_text in stream:
+                # 检查是否是 Markdown 标题
+                if para_text.startswith('#'):
+                    level = len(para_text) - len(para_text.lstrip('#'))
+                    writer.add_heading(para_text.lstrip('#').strip(), level=min(level, 3))
+                else:
+                    writer.add_paragraph(para_text)
+        
+        content_hash = writer.content_hash if writer.paragraph_count else None
+        logger.debug(f"[{doc_name}] 清洗后的文本已保存到: {output_file}")
+        
+        return self._pipeline_result(stream.result, content_hash, doc_name)
+    
+    def _iter_text_file_paragraphs(self, input_file: str, block_size: int = 1024 * 1024) -> Iterator[str]:
+        """
+        逐块读取 TXT/MD 文件并按双换行拆分段落
+        
+        与 _txt_to_docx 写入后再提取得到的非空段落一致（Markdown 标题去掉 # 前缀）。
+        超过 16 个读取块仍没有段落边界的文本直接作为一个段落输出。
+        """
+        with open(input_file, 'r', encoding='utf-8') as f:
+            carry = ''
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                
+                parts = (carry + block).split('\n\n')
+                carry = parts.pop()
+                if len(carry) > block_size * 16:
+                    parts.append(carry)
+                    carry = ''
+                for part in parts:
+                    text = self._text_part_paragraph(part)
+                    if text:
+                        yield text
+            
+            text = self._text_part_paragraph(carry)
+            if text:
+                yield text
+    
+    def _text_part_paragraph(self, part: str) -> str:
+        """TXT 中按双换行拆出的一段对应的 docx 段落文本（标题去掉 # 前缀）"""
+        text = part.strip()
+        if text.startswith('#'):
+            text = part.lstrip('#').strip()
+        return text
+    
+    def replay_cached_result(self, cached: Dict, doc_name: str = "unknown", namespace: Optional[str] = None) -> Dict:
+        """
+        根据缓存的转换结果生成与 convert_to_docx 相同结构的返回值
+        
+        缓存中只保存内容相关的结果；文档级去重依赖去重存储的当前状态，这里重新检查并标记。
+        
+        Args:
+            cached: 缓存的转换结果 {"message", "pipeline_stats", "doc_hash", "content_hash"}
+            doc_name: 文档名称（用于日志）
+            namespace: 去重命名空间
+        """
+        doc_hash = cached.get("doc_hash")
+        is_doc_duplicate = bool(
+            doc_hash and self.text_pipeline and self.text_pipeline.check_doc_duplicate(doc_hash, doc_name, namespace)
+        )
+        return self._replay_result(cached, is_doc_duplicate)
+    
+    async def replay_cached_result_async(self, cached: Dict, doc_name: str = "unknown",
+                                         namespace: Optional[str] = None) -> Dict:
+        """replay_cached_result 的异步版本（文档级去重通过异步去重存储检查）"""
+        doc_hash = cached.get("doc_hash")
+        is_doc_duplicate = bool(
+            doc_hash and self.text_pipeline
+            and await self.text_pipeline.check_doc_duplicate_async(doc_hash, doc_name, namespace)
+        )
+        return self._replay_result(cached, is_doc_duplicate)
+    
+    def _replay_result(self, cached: Dict, is_doc_duplicate: bool) -> Dict:
+        """缓存的转换结果 + 文档级去重结论 -> convert_to_docx 的返回值"""
+        if is_doc_duplicate:
+            return {
+                "success": False,
+                "message": "文档已存在（完全重复）但已清洗",
+                "pipeline_stats": cached.get("pipeline_stats"),
+                "doc_duplicate": True,
+                "doc_hash": cached.get("doc_hash"),
+                "content_hash": cached.get("content_hash")
+            }
+        
+        result = {"success": True, "message": cached.get("message", "转换成功")}
+        if cached.get("pipeline_stats") is not None:
+            result["pipeline_stats"] = cached["pipeline_stats"]
+        result["doc_hash"] = cached.get("doc_hash")
+        result["content_hash"] = cached.get("content_hash")
+        return result
+    
     def _convert_old_to_new(self, input_file: str, target_format: str) -> str | None:
         """
         使用 LibreOffice 或 COM 将旧格式转换为新格式
@@ -246,119 +452,19 @@ class DocumentConverter:
     
     def _convert_with_libreoffice(self, input_file: str, target_format: str) -> str | None:
         """
-        使用 LibreOffice 转换文档
+        使用 LibreOffice 转换文档（由常驻实例池执行）
         
         Args:
             input_file: 源文件路径
             target_format: 目标格式 ('docx', 'xlsx', 'pptx')
         
         Returns:
-            转换后的文件路径，失败返回None
-        
-        修复:
-        1. 使用 UUID 生成临时文件名，避免中文路径问题
-        2. 使用项目内临时目录，避免系统临时目录权限问题
+            转换后的文件路径（storage/temp 下的 UUID 文件名），失败返回None
         """
-        if not self.libreoffice_path:
-            return None
-        
-        input_file = os.path.abspath(input_file)
-        
-        # 修复：使用项目内的临时目录，避免系统临时目录权限问题
-        project_temp_dir = Path("storage/temp")
-        project_temp_dir.mkdir(parents=True, exist_ok=True)
-        temp_dir = str(project_temp_dir.absolute())
-        
-        # 修复：使用 UUID 作为临时文件名，避免中文路径问题
-        import uuid
-        temp_filename = f"temp_{uuid.uuid4().hex[:12]}.{target_format}"
-        expected_output = os.path.join(temp_dir, temp_filename)
-        
-        # 映射格式到 LibreOffice 过滤器
-        format_map = {
-            'docx': 'MS Word 2007 XML',
-            'xlsx': 'Calc MS Excel 2007 XML',
-            'pptx': 'Impress MS PowerPoint 2007 XML'
-        }
-        
-        filter_name = format_map.get(target_format)
-        if not filter_name:
+        if self._libreoffice_pool is None:
             return None
         
-        # 获取超时配置（移至 try 外）
-        timeout = 60  # 默认值
-        try:
-            from config import config
-            timeout = config.Conversion.CONVERSION_TIMEOUT
-        except:
-            pass
-        
-        try:
-            
-            # 构建命令
-            cmd = [
-                self.libreoffice_path,
-                '--headless',
-                '--nologo',
-                '--nolockcheck',
-                '--convert-to', f'{target_format}:"{filter_name}"',
-                '--outdir', temp_dir,
-                input_file
-            ]
-            
-            logger.debug(f"LibreOffice 转换命令: {' '.join(cmd)}")
-            logger.debug(f"预期输出文件: {expected_output}")
-            
-            # 执行转换
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            
-            # 修复：LibreOffice 实际输出文件名可能不同（使用原文件名）
-            # 需要查找实际生成的文件
-            base_name = Path(input_file).stem
-            actual_output = os.path.join(temp_dir, f"{base_name}.{target_format}")
-            
-            # 检查两种可能的输出文件
-            if os.path.exists(expected_output):
-                logger.debug(f"LibreOffice 转换成功（UUID文件名）: {expected_output}")
-                return expected_output
-            elif os.path.exists(actual_output):
-                # LibreOffice 使用了原始文件名，重命名为 UUID 文件名
-                logger.debug(f"LibreOffice 使用了原始文件名: {actual_output}，重命名为: {expected_output}")
-                try:
-                    shutil.move(actual_output, expected_output)
-                    return expected_output
-                except Exception as e:
-                    logger.warning(f"重命名文件失败: {e}，返回原文件")
-                    return actual_output
-            elif result.returncode == 0:
-                # 转换成功但文件名不匹配，搜索临时目录
-                logger.warning(f"LibreOffice 转换成功但找不到预期文件，搜索临时目录")
-                for file in Path(temp_dir).glob(f"*.{target_format}"):
-                    if file.stat().st_mtime > (datetime.now().timestamp() - 10):  # 10秒内创建的文件
-                        logger.info(f"找到最近创建的文件: {file}")
-                        try:
-                            shutil.move(str(file), expected_output)
-                            return expected_output
-                        except:
-                            return str(file)
-                logger.error(f"LibreOffice 转换成功但找不到输出文件")
-                return None
-            else:
-                logger.warning(f"LibreOffice 转换失败: {result.stderr}")
-                return None
-                
-        except subprocess.TimeoutExpired:
-            logger.error(f"LibreOffice 转换超时（{timeout}秒）")
-            return None
-        except Exception as e:
-            logger.debug(f"LibreOffice 转换异常: {e}")
-            return None
+        return self._libreoffice_pool.convert(os.path.abspath(input_file), target_format)
     
     def _convert_with_word_com(self, input_file: str, target_format: str) -> str | None:
         """
@@ -577,40 +683,75 @@ class DocumentConverter:
             return False
     
     def _xlsx_to_docx(self, input_file: str, output_file: str) -> bool:
-        """XLSX 转 DOCX - 增强异常处理"""
+        """XLSX 转 DOCX"""
+        blocks = self._xlsx_blocks(input_file)
+        return blocks is not None and render_docx(blocks, output_file)
+    
+    def _pptx_to_docx(self, input_file: str, output_file: str) -> bool:
+        """PPTX 转 DOCX"""
+        blocks = self._pptx_blocks(input_file)
+        return blocks is not None and render_docx(blocks, output_file)
+    
+    def _pdf_to_docx(self, input_file: str, output_file: str) -> bool:
+        """PDF 转 DOCX"""
+        blocks = self._pdf_blocks(input_file)
+        return blocks is not None and render_docx(blocks, output_file)
+    
+    def _extract_blocks(self, input_file: str, extension: str) -> Optional[List[Block]]:
+        """
+        提取 xlsx/xls/pptx/ppt/pdf 的文档块（旧格式先转为新格式）
+        
+        Returns:
+            文档块列表，失败返回 None
+        """
+        if extension in ('.xls', '.ppt'):
+            new_extension = '.xlsx' if extension == '.xls' else '.pptx'
+            temp_file = self._convert_old_to_new(input_file, new_extension[1:])
+            if not temp_file:
+                return None
+            try:
+                return self._extract_blocks(temp_file, new_extension)
+            finally:
+                try:
+                    os.remove(temp_file)
+                except:
+                    pass
+        
+        if extension == '.xlsx':
+            return self._xlsx_blocks(input_file)
+        if extension == '.pptx':
+            return self._pptx_blocks(input_file)
+        if extension == '.pdf':
+            return self._pdf_blocks(input_file)
+        return None
+    
+    def _xlsx_blocks(self, input_file: str) -> Optional[List[Block]]:
+        """XLSX 提取文档块 - 每个工作表一个标题 + 表格"""
         wb = None
         try:
             wb = load_workbook(input_file, data_only=True)
-            doc = Document()
+            blocks = []
             
             for sheet in wb.worksheets:
                 # 添加工作表标题
-                doc.add_heading(sheet.title, level=1)
+                blocks.append(document_blocks.heading(sheet.title, level=1))
                 
                 # 获取所有行
-                rows = list(sheet.iter_rows(values_only=True))
+                rows = [
+                    [None if value is None else str(value) for value in row]
+                    for row in sheet.iter_rows(values_only=True)
+                ]
                 if not rows:
                     continue
                 
-                # 创建表格
-                max_cols = max(len(row) for row in rows)
-                table = doc.add_table(rows=len(rows), cols=max_cols)
-                table.style = 'Light Grid Accent 1'
-                
-                # 填充数据
-                for i, row in enumerate(rows):
-                    for j, cell_value in enumerate(row):
-                        if cell_value is not None:
-                            table.rows[i].cells[j].text = str(cell_value)
-                
-                doc.add_paragraph()  # 添加空行
+                blocks.append(document_blocks.table(rows))
+                blocks.append(document_blocks.paragraph())  # 添加空行
             
-            doc.save(output_file)
-            return True
+            return blocks
             
         except Exception as e:
             print(f"XLSX 转换错误: {e}")
-            return False
+            return None
         finally:
             # 确保工作簿被关闭
             if wb is not None:
@@ -619,17 +760,16 @@ class DocumentConverter:
                 except:
                     pass
     
-    def _pptx_to_docx(self, input_file: str, output_file: str) -> bool:
-        """PPTX 转 DOCX - 增强异常处理"""
-        prs = None
+    def _pptx_blocks(self, input_file: str) -> Optional[List[Block]]:
+        """PPTX 提取文档块 - 每张幻灯片一个标题 + 文本框段落 + 表格"""
         try:
             # 打开 PPT 文件
             prs = Presentation(input_file)
-            doc = Document()
+            blocks = []
             
             for i, slide in enumerate(prs.slides):
                 # 添加幻灯片标题
-                doc.add_heading(f'Slide {i + 1}', level=1)
+                blocks.append(document_blocks.heading(f'Slide {i + 1}', level=1))
                 
                 # 提取文本
                 try:
@@ -641,9 +781,9 @@ class DocumentConverter:
                                 if text and text.strip():
                                     # 判断是否是标题
                                     if hasattr(shape, 'is_placeholder') and shape.is_placeholder:
-                                        doc.add_heading(text, level=2)
+                                        blocks.append(document_blocks.heading(text, level=2))
                                     else:
-                                        doc.add_paragraph(text)
+                                        blocks.append(document_blocks.paragraph(text))
                         except Exception:
                             # 单个 shape 处理失败，继续下一个
                             continue
@@ -651,13 +791,8 @@ class DocumentConverter:
                         # 处理表格
                         try:
                             if hasattr(shape, 'has_table') and shape.has_table:
-                                table = shape.table
-                                doc_table = doc.add_table(rows=len(table.rows), cols=len(table.columns))
-                                doc_table.style = 'Light Grid Accent 1'
-                                
-                                for row_idx, row in enumerate(table.rows):
-                                    for col_idx, cell in enumerate(row.cells):
-                                        doc_table.rows[row_idx].cells[col_idx].text = cell.text
+                                rows = [[cell.text for cell in row.cells] for row in shape.table.rows]
+                                blocks.append(document_blocks.table(rows))
                         except Exception:
                             # 表格处理失败，继续
                             continue
@@ -665,56 +800,43 @@ class DocumentConverter:
                     # 整个幻灯片处理失败，继续下一张
                     pass
                 
-                doc.add_paragraph()  # 幻灯片间添加空行
+                blocks.append(document_blocks.paragraph())  # 幻灯片间添加空行
             
-            doc.save(output_file)
-            return True
+            return blocks
             
         except Exception as e:
             print(f"PPTX 转换错误: {e}")
-            return False
-        finally:
-            # 确保文件被关闭
-            if prs is not None:
-                try:
-                    del prs
-                except:
-                    pass
+            return None
     
-    def _pdf_to_docx(self, input_file: str, output_file: str) -> bool:
-        """PDF 转 DOCX - 增强异常处理"""
+    def _pdf_blocks(self, input_file: str) -> Optional[List[Block]]:
+        """PDF 提取文档块 - 每页一个标题 + 按双换行拆分的段落，页间分页"""
         if fitz is None:
             print("未安装 PyMuPDF，无法将 PDF 转为 DOCX")
-            return False
+            return None
         
         pdf_doc = None
         try:
             pdf_doc = fitz.open(input_file)
-            doc = Document()
+            blocks = []
             
             for page_num in range(len(pdf_doc)):
                 page = pdf_doc[page_num]
                 
                 # 添加页面标题
                 if page_num > 0:
-                    doc.add_page_break()
-                doc.add_heading(f'Page {page_num + 1}', level=1)
-                
-                # 提取文本
-                text = page.get_text()
+                    blocks.append(document_blocks.page_break())
+                blocks.append(document_blocks.heading(f'Page {page_num + 1}', level=1))
                 
-                # 按段落分割
-                paragraphs = text.split('\n\n')
-                for paragraph in paragraphs:
+                # 提取文本，按段落分割
+                for paragraph in page.get_text().split('\n\n'):
                     if paragraph.strip():
-                        doc.add_paragraph(paragraph.strip())
+                        blocks.append(document_blocks.paragraph(paragraph.strip()))
             
-            doc.save(output_file)
-            return True
+            return blocks
             
         except Exception as e:
             print(f"PDF 转换错误: {e}")
-            return False
+            return None
         finally:
             # 确保 PDF 文档被关闭
             if pdf_doc is not None:
@@ -734,21 +856,15 @@ class DocumentConverter:
             提取的文本
         """
         try:
-            doc = Document(docx_file)
-            paragraphs = []
-            
-            for para in doc.paragraphs:
-                text = para.text.strip()
-                if text:
-                    paragraphs.append(text)
-            
-            return '\n\n'.join(paragraphs)
+            # 流式解析压缩包内的主文档，无需构建完整的 python-docx 对象
+            paragraphs = read_docx_paragraphs(docx_file)
+            return '\n\n'.join(p.strip() for p in paragraphs)
             
         except Exception as e:
             logger.error(f"提取 DOCX 文本失败: {e}")
             return ""
     
-    def _write_cleaned_text_to_docx(self, text: str, output_file: str) -> bool:
+    def _write_cleaned_text_to_docx(self, text: str, output_file: str) -> Optional[List[str]]:
         """
         将清洗后的文本写入 DOCX 文件
         
@@ -757,10 +873,11 @@ class DocumentConverter:
             output_file: 输出文件路径
         
         Returns:
-            是否成功
+            写入的非空段落文本（与读回 docx 得到的段落一致，用于内容哈希），失败返回 None
         """
         try:
             doc = Document()
+            written = []
             
             # 按双换行拆分段落
             paragraphs = text.split('\n\n')
@@ -771,7 +888,7 @@ class DocumentConverter:
                     if para_text.strip().startswith('#'):
                         level = len(para_text) - len(para_text.lstrip('#'))
                         heading_text = para_text.lstrip('#').strip()
-                        doc.add_heading(heading_text, level=min(level, 3))
+                        para = doc.add_heading(heading_text, level=min(level, 3))
                     else:
                         # 处理单行换行（保留段内换行）
                         lines = para_text.split('\n')
@@ -780,10 +897,12 @@ class DocumentConverter:
                             if i > 0:
                                 para.add_run('\n')
                             para.add_run(line)
+                    if para.text.strip():
+                        written.append(para.text)
             
             doc.save(output_file)
-            return True
+            return written
             
         except Exception as e:
             logger.error(f"写入 DOCX 文件失败: {e}")
-            return False
+            return None
@@ -1,11 +1,11 @@
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 import re
 import os
 import tempfile
-from docx import Document
 from openpyxl import load_workbook
 from pptx import Presentation
+from services.ooxml_inspector import inspect_docx
 
 # 安全导入 PyMuPDF（可选依赖）
 try:
@@ -16,10 +16,28 @@ except Exception:
     HAS_PYMUPDF = False
 
 
+# PDF 检测策略名称（写入检测原因，便于排查判定来源）
+PDF_STRATEGY_LABELS = {
+    'resource_prepass': '资源预检',
+    'page_scan': '逐页扫描',
+    'sampled_scan': '抽样扫描'
+}
+
+
 class DocumentDetector:
     """文档检测器 - 检测文档是否为纯文本"""
     
-    def __init__(self):
+    def __init__(self, pdf_image_prepass: Optional[bool] = None,
+                 pdf_sample_threshold: Optional[int] = None,
+                 pdf_sample_pages: Optional[int] = None):
+        """
+        初始化检测器
+        
+        Args:
+            pdf_image_prepass: 是否启用 PDF 图片预检（默认读取配置）
+            pdf_sample_threshold: 超过该页数的 PDF 抽样检测，0 = 不抽样（默认读取配置）
+            pdf_sample_pages: 抽样页数（默认读取配置）
+        """
         # 检测是否有 Office COM 支持（仅 Windows）
         self._has_office_com = False
         if os.name == 'nt':
@@ -28,6 +46,35 @@ class DocumentDetector:
                 self._has_office_com = True
             except ImportError:
                 pass
+        
+        # PDF 检测参数（未指定时从配置读取）
+        try:
+            from config import config
+            detection = config.Detection
+            defaults = (detection.PDF_IMAGE_PREPASS, detection.PDF_SAMPLE_THRESHOLD, detection.PDF_SAMPLE_PAGES)
+        except Exception:
+            defaults = (True, 0, 50)
+        
+        self.pdf_image_prepass = defaults[0] if pdf_image_prepass is None else pdf_image_prepass
+        self.pdf_sample_threshold = defaults[1] if pdf_sample_threshold is None else pdf_sample_threshold
+        self.pdf_sample_pages = max(1, defaults[2] if pdf_sample_pages is None else pdf_sample_pages)
+    
+    def inspect(self, file_path: str) -> Dict:
+        """
+        检测文件并返回结构化结果
+        
+        返回: {'is_pure_text': bool, 'reason': str, 'paragraphs': List[str] | None}
+        docx 附带检测时提取的段落文本，供转换与内容哈希复用，避免重复解析；
+        pdf 附带判定所用的检测策略 'strategy'
+        """
+        extension = Path(file_path).suffix.lower()
+        if extension == '.docx':
+            return inspect_docx(file_path)
+        if extension == '.pdf':
+            return self._inspect_pdf(file_path)
+        
+        is_pure_text, reason = self.detect(file_path)
+        return {'is_pure_text': is_pure_text, 'reason': reason, 'paragraphs': None}
     
     def detect(self, file_path: str) -> Tuple[bool, str]:
         """
@@ -205,93 +252,9 @@ class DocumentDetector:
             return False, f"读取文件错误: {str(e)}"
     
     def _detect_docx(self, file_path: str) -> Tuple[bool, str]:
-        """检测 docx 文件 - 严格模式：只有纯文字才算纯文本"""
-        doc = None
-        try:
-            # 打开 Word 文档
-            doc = Document(file_path)
-            
-            # ========== 第1步：检查是否有表格 ==========
-            # 只要有表格，就不是纯文本
-            try:
-                table_count = len(doc.tables)
-                if table_count > 0:
-                    return False, f"包含表格 ({table_count}个)"
-            except Exception:
-                # 访问表格失败，跳过
-                pass
-            
-            # ========== 第2步：检查内嵌图片 ==========
-            image_count = 0
-            try:
-                for rel in doc.part.rels.values():
-                    try:
-                        if "image" in rel.target_ref:
-                            image_count += 1
-                    except Exception:
-                        continue
-            except Exception:
-                # 访问 relationships 失败
-                pass
-            
-            if image_count > 0:
-                return False, f"包含图片 ({image_count}个)"
-            
-            # ========== 第3步：检查嵌入对象（图表、形状等）==========
-            embedded_count = 0
-            try:
-                for paragraph in doc.paragraphs:
-                    try:
-                        if hasattr(paragraph, '_element'):
-                            for run in paragraph.runs:
-                                try:
-                                    if hasattr(run, '_element'):
-                                        # 检查图片、图表等对象
-                                        blips = run._element.xpath('.//a:blip')
-                                        if blips:
-                                            embedded_count += len(blips)
-                                except Exception:
-                                    continue
-                    except Exception:
-                        continue
-            except Exception:
-                # 遍历段落失败
-                pass
-            
-            if embedded_count > 0:
-                return False, f"包含嵌入对象 ({embedded_count}个)"
-            
-            # ========== 第4步：检查是否有文本内容 ==========
-            has_text = False
-            paragraph_count = 0
-            try:
-                for p in doc.paragraphs:
-                    try:
-                        if p.text and p.text.strip():
-                            has_text = True
-                            paragraph_count += 1
-                    except Exception:
-                        continue
-            except Exception:
-                pass
-            
-            if not has_text:
-                return False, "文档无有效文本内容"
-            
-            # ========== 全部检查通过：纯文本文档 ==========
-            return True, f"纯文本文档 ({paragraph_count}个段落)"
-            
-        except Exception as e:
-            return False, f"处理 docx 错误: {str(e)}"
-        finally:
-            # 确保文档对象被释放
-            if doc is not None:
-                try:
-                    # python-docx 的 Document 对象没有显式的 close 方法
-                    # 但会在对象销毁时自动关闭
-                    del doc
-                except:
-                    pass
+        """检测 docx 文件 - 严格模式：只有纯文字才算纯文本（单次流式解析）"""
+        result = inspect_docx(file_path)
+        return result['is_pure_text'], result['reason']
     
     def _detect_xlsx(self, file_path: str) -> Tuple[bool, str]:
         """检测 xlsx 文件 - Excel本身就是表格格式，始终为富媒体"""
@@ -407,53 +370,101 @@ class DocumentDetector:
     
     def _detect_pdf(self, file_path: str) -> Tuple[bool, str]:
         """检测 pdf 文件 - 严格检测所有非文本元素"""
+        result = self._inspect_pdf(file_path)
+        return result['is_pure_text'], result['reason']
+    
+    def _sample_pdf_pages(self, page_count: int) -> List[int]:
+        """计算需要检测的页码：未超过抽样阈值时逐页检测，否则均匀抽样（含首页和末页）"""
+        if not self.pdf_sample_threshold or page_count <= self.pdf_sample_threshold:
+            return list(range(page_count))
+        
+        sample_size = min(self.pdf_sample_pages, page_count)
+        if sample_size == 1:
+            return [0]
+        step = (page_count - 1) / (sample_size - 1)
+        return sorted({round(i * step) for i in range(sample_size)})
+    
+    def _pdf_has_image_xobjects(self, doc) -> bool:
+        """扫描 xref 表，判断文件中是否存在 /Image XObject（不解析页面内容）"""
+        for xref in range(1, doc.xref_length()):
+            try:
+                if doc.xref_get_key(xref, "Subtype") == ('name', '/Image'):
+                    return True
+            except Exception:
+                continue
+        return False
+    
+    def _inspect_pdf(self, file_path: str) -> Dict:
+        """
+        检测 pdf 文件 - 严格检测所有非文本元素，遇到第一个非文本元素即返回
+        
+        1. 图片预检（可选）：xref 表中没有 /Image 对象时跳过逐页图片检查；
+           有则先按页面资源查找图片，命中即判定为富媒体
+        2. 逐页（或抽样）扫描：检查图片与矢量图形（get_drawings 开销最大，放在最后）
+        """
         if not HAS_PYMUPDF:
-            return False, "PDF 检测未启用（未安装 PyMuPDF）"
+            return {'is_pure_text': False, 'reason': "PDF 检测未启用（未安装 PyMuPDF）", 'paragraphs': None}
+        
+        def verdict(is_pure_text: bool, reason: str, strategy: str) -> Dict:
+            return {
+                'is_pure_text': is_pure_text,
+                'reason': f"{reason} [{PDF_STRATEGY_LABELS[strategy]}]",
+                'paragraphs': None,
+                'strategy': strategy
+            }
         
         doc = None
         try:
             doc = fitz.open(file_path)
             page_count = len(doc)
-            
-            total_images = 0
-            total_drawings = 0
-            has_tables = False
-            
-            for page_num in range(page_count):
+            page_numbers = self._sample_pdf_pages(page_count)
+            scan_strategy = 'sampled_scan' if len(page_numbers) < page_count else 'page_scan'
+            
+            # ========== 图片预检 ==========
+            check_page_images = True
+            if self.pdf_image_prepass:
+                if not self._pdf_has_image_xobjects(doc):
+                    # 文件中没有任何图片对象，逐页扫描时无需再查图片
+                    check_page_images = False
+                else:
+                    # 页面资源查找比矢量图形提取便宜得多，先对所有页面检查
+                    for page_num in range(page_count):
+                        image_list = doc[page_num].get_images(full=True)
+                        if image_list:
+                            return verdict(False, f"包含图片 (第{page_num + 1}页, {len(image_list)}个)", 'resource_prepass')
+                    check_page_images = False
+            
+            # ========== 逐页扫描：遇到第一个非文本元素即返回 ==========
+            for page_num in page_numbers:
                 page = doc[page_num]
                 
-                # ========== 检查图片 ==========
-                image_list = page.get_images(full=True)
-                total_images += len(image_list)
+                # 检查图片
+                if check_page_images:
+                    image_list = page.get_images(full=True)
+                    if image_list:
+                        return verdict(False, f"包含图片 (第{page_num + 1}页, {len(image_list)}个)", scan_strategy)
                 
-                # ========== 检查矢量图形和表格 ==========
+                # 检查矢量图形和表格
                 drawings = page.get_drawings()
-                if drawings and len(drawings) > 0:
+                if drawings:
                     # PDF中的表格通常用线条绘制
                     # 如果有大量线条，很可能是表格
                     line_count = len([d for d in drawings if d.get('type') in ['l', 're']])
                     if line_count > 10:  # 超过10条线，可能是表格
-                        has_tables = True
+                        return verdict(False, f"包含表格结构 (第{page_num + 1}页)", scan_strategy)
                     
                     # 复杂图形（非简单线条）
-                    complex_drawings = [d for d in drawings if d.get('type') not in ['l', 're']]
-                    total_drawings += len(complex_drawings)
-            
-            # ========== 判定逻辑 ==========
-            if total_images > 0:
-                return False, f"包含图片 ({total_images}个)"
-            
-            if has_tables:
-                return False, "包含表格结构"
-            
-            if total_drawings > 0:
-                return False, f"包含矢量图形 ({total_drawings}个)"
+                    complex_count = len([d for d in drawings if d.get('type') not in ['l', 're']])
+                    if complex_count > 0:
+                        return verdict(False, f"包含矢量图形 (第{page_num + 1}页, {complex_count}个)", scan_strategy)
             
             # 全部检查通过：纯文本PDF
-            return True, f"纯文本PDF ({page_count}页)"
+            if scan_strategy == 'sampled_scan':
+                return verdict(True, f"纯文本PDF ({page_count}页, 抽样{len(page_numbers)}页)", scan_strategy)
+            return verdict(True, f"纯文本PDF ({page_count}页)", scan_strategy)
             
         except Exception as e:
-            return False, f"处理 PDF 错误: {str(e)}"
+            return {'is_pure_text': False, 'reason': f"处理 PDF 错误: {str(e)}", 'paragraphs': None}
         finally:
             # 确保 PDF 文档被关闭
             if doc is not None:
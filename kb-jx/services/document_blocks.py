@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档块 - 与格式无关的结构化文本中间表示
+
+xlsx/pptx/pdf 的提取器直接输出文档块列表（标题、段落、表格、分页符），不再先写出中间 docx：
+- 应用文本管线时，块列表直接拼接为管线输入文本（与「写出 docx -> 读回正文段落」得到的文本一致）
+- 不应用文本管线时，render_docx 把块列表一次性写成最终 docx（与原 python-docx 转换结果一致）
+"""
+from typing import Iterable, List, NamedTuple, Optional
+
+from docx import Document
+
+from utils.logger import get_logger
+
+logger = get_logger("document_blocks")
+
+HEADING = "heading"
+PARAGRAPH = "paragraph"
+TABLE = "table"
+PAGE_BREAK = "page_break"
+
+# 表格样式（与原转换结果一致）
+TABLE_STYLE = 'Light Grid Accent 1'
+
+
+class Block(NamedTuple):
+    """文档块（kind 决定使用哪些字段）"""
+    kind: str
+    text: str = ""
+    level: int = 0
+    # 表格行（单元格为 None 表示空单元格，不写入文本）
+    rows: Optional[List[List[Optional[str]]]] = None
+
+
+def heading(text: str, level: int = 1) -> Block:
+    """标题块"""
+    return Block(HEADING, text, level)
+
+
+def paragraph(text: str = "") -> Block:
+    """段落块（空文本为空行）"""
+    return Block(PARAGRAPH, text)
+
+
+def table(rows: List[List[Optional[str]]]) -> Block:
+    """表格块"""
+    return Block(TABLE, rows=rows)
+
+
+def page_break() -> Block:
+    """分页符块"""
+    return Block(PAGE_BREAK)
+
+
+def blocks_to_text(blocks: Iterable[Block]) -> str:
+    """
+    文本管线的输入文本
+    
+    与写出的 docx 读回的正文顶层非空段落一致：标题与段落按双换行连接，
+    表格（单元格不属于正文顶层段落）与分页符不计入。
+    """
+    return '\n\n'.join(
+        block.text.strip() for block in blocks
+        if block.kind in (HEADING, PARAGRAPH) and block.text.strip()
+    )
+
+
+def render_docx(blocks: Iterable[Block], output_file: str) -> bool:
+    """
+    将文档块写成 docx
+    
+    单个块写入失败（如文本包含 XML 不允许的控制字符）时跳过该块，其余内容照常写入。
+    
+    Returns:
+        是否写入成功
+    """
+    try:
+        doc = Document()
+        for block in blocks:
+            try:
+                _render_block(doc, block)
+            except ValueError as e:
+                logger.debug(f"跳过无法写入的{block.kind}块: {e}")
+        doc.save(output_file)
+        return True
+    except Exception as e:
+        logger.error(f"写入 DOCX 文件失败: {e}")
+        return False
+
+
+def _render_block(doc, block: Block):
+    """写入单个文档块"""
+    if block.kind == HEADING:
+        doc.add_heading(block.text, level=block.level)
+    elif block.kind == PARAGRAPH:
+        doc.add_paragraph(block.text)
+    elif block.kind == PAGE_BREAK:
+        doc.add_page_break()
+    elif block.kind == TABLE:
+        if not block.rows:
+            return
+        doc_table = doc.add_table(rows=len(block.rows), cols=max(len(row) for row in block.rows))
+        doc_table.style = TABLE_STYLE
+        for i, row in enumerate(block.rows):
+            for j, cell_text in enumerate(row):
+                if cell_text is not None:
+                    doc_table.rows[i].cells[j].text = cell_text
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+DOCX 流式写入器 - 逐段写入 word/document.xml
+
+python-docx 需要在内存中构建完整的文档对象树再一次性保存，超大文本的内存占用与文档大小成正比。
+本写入器以 python-docx 自带的默认模板为基础：除主文档外的部件（样式、主题、设置等）原样复制，
+主文档按「模板开头 -> 逐段写入的段落 -> 模板的 sectPr 与结尾」流式写入压缩包。
+
+段落 XML 与 python-docx 生成的一致（制表符写为 <w:tab/>，换行写为 <w:br/>），
+读回的段落文本与 python-docx 写入的文件相同。
+"""
+import hashlib
+import os
+import zipfile
+from typing import Optional
+from xml.sax.saxutils import escape
+
+import docx
+
+MAIN_DOCUMENT = "word/document.xml"
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(docx.__file__), "templates", "default.docx")
+
+
+def _run_xml(text: str) -> str:
+    """一段文本生成 run XML（制表符、换行转换为对应元素）"""
+    parts = []
+    for line_index, line in enumerate(text.split('\n')):
+        if line_index > 0:
+            parts.append('<w:br/>')
+        for tab_index, piece in enumerate(line.split('\t')):
+            if tab_index > 0:
+                parts.append('<w:tab/>')
+            if piece:
+                parts.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return f"<w:r>{''.join(parts)}</w:r>" if parts else ""
+
+
+class DocxStreamWriter:
+    """流式 DOCX 写入器（with 语句中使用，异常退出时删除未写完的文件）"""
+    
+    def __init__(self, output_file: str, template: str = DEFAULT_TEMPLATE):
+        """
+        Args:
+            output_file: 输出文件路径
+            template: 模板 docx（默认使用 python-docx 自带模板）
+        """
+        self.output_file = output_file
+        self.paragraph_count = 0
+        self._content_hasher = hashlib.sha256()
+        self._written = 0
+        
+        with zipfile.ZipFile(template) as src:
+            document_xml = src.read(MAIN_DOCUMENT).decode('utf-8')
+            # 模板正文只有 sectPr：段落写在它之前
+            split_at = document_xml.rindex('<w:sectPr')
+            self._prefix = document_xml[:split_at]
+            self._suffix = document_xml[split_at:]
+            
+            self._zip = zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED)
+            try:
+                for info in src.infolist():
+                    if info.filename != MAIN_DOCUMENT:
+                        self._zip.writestr(info, src.read(info.filename), compress_type=zipfile.ZIP_DEFLATED)
+                self._stream = self._zip.open(MAIN_DOCUMENT, 'w', force_zip64=True)
+                self._stream.write(self._prefix.encode('utf-8'))
+            except Exception:
+                self._zip.close()
+                raise
+    
+    def add_paragraph(self, text: str, style: Optional[str] = None):
+        """
+        写入一个段落
+        
+        Args:
+            text: 段落文本（可包含换行与制表符）
+            style: 段落样式 ID（如 Heading1），默认正文样式
+        """
+        properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+        self._stream.write(f'<w:p>{properties}{_run_xml(text)}</w:p>'.encode('utf-8'))
+        self.paragraph_count += 1
+        
+        # 内容哈希与读回的非空段落一致（compute_content_hash）
+        if text.strip():
+            if self._written:
+                self._content_hasher.update(b'\n')
+            self._content_hasher.update(text.encode('utf-8'))
+            self._written += 1
+    
+    def add_heading(self, text: str, level: int = 1):
+        """写入标题段落（level=0 为 Title 样式，与 python-docx add_heading 一致）"""
+        self.add_paragraph(text, "Title" if level == 0 else f"Heading{level}")
+    
+    @property
+    def content_hash(self) -> str:
+        """已写入非空段落的内容哈希"""
+        return self._content_hasher.hexdigest()
+    
+    def close(self):
+        """写入文档结尾并关闭压缩包"""
+        if self._stream is None:
+            return
+        try:
+            self._stream.write(self._suffix.encode('utf-8'))
+            self._stream.close()
+        finally:
+            self._stream = None
+            self._zip.close()
+    
+    def abort(self):
+        """放弃写入并删除未完成的文件"""
+        try:
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+            self._zip.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self.output_file)
+        except OSError:
+            pass
+    
+    def __enter__(self) -> "DocxStreamWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
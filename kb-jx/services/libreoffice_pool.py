@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LibreOffice 转换进程池 - 常驻 headless 实例转换旧格式文档（.doc/.xls/.ppt）
+
+每个实例使用独立的用户配置目录（避免配置锁冲突），通过本地 UNO 管道接收转换请求：
+- 空闲实例放在队列中，请求按先到先得分配，吞吐量随池大小线性扩展
+- 每次转换前做健康检查，异常或超时的实例被终止并在下次使用时重启
+- 每个实例转换 N 次后回收重启，避免 LibreOffice 长时间运行的内存增长
+- 每次转换使用独立的工作目录和固定文件名，输出路径确定，不再扫描共享临时目录
+
+未安装 UNO Python 绑定（uno 模块）时退化为命令行模式：每次转换启动一次 soffice，
+但仍使用实例独立的配置目录与独立工作目录，并发数受池大小限制。
+"""
+import atexit
+import multiprocessing.util
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils.logger import get_logger
+
+# 安全导入 UNO（可选依赖，随 LibreOffice 提供）
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    HAS_UNO = True
+except ImportError:
+    HAS_UNO = False
+
+logger = get_logger("libreoffice_pool")
+
+# 目标格式 -> LibreOffice 导出过滤器
+FILTER_MAP = {
+    'docx': 'MS Word 2007 XML',
+    'xlsx': 'Calc MS Excel 2007 XML',
+    'pptx': 'Impress MS PowerPoint 2007 XML'
+}
+
+
+def _uno_property(name: str, value) -> "PropertyValue":
+    """构造 UNO PropertyValue"""
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class LibreOfficeInstance:
+    """单个 LibreOffice 实例（独立配置目录 + UNO 管道）"""
+    
+    def __init__(self, soffice_path: str, name: str, profile_dir: Path,
+                 use_uno: bool = True, startup_timeout: int = 30):
+        """
+        Args:
+            soffice_path: soffice 可执行文件路径
+            name: 实例名称（同时作为 UNO 管道名）
+            profile_dir: 实例专属的用户配置目录
+            use_uno: 是否以常驻 UNO 模式运行
+            startup_timeout: 启动并建立 UNO 连接的超时时间（秒）
+        """
+        self.soffice_path = soffice_path
+        self.name = name
+        self.profile_dir = profile_dir
+        self.use_uno = use_uno
+        self.startup_timeout = startup_timeout
+        self.conversions = 0
+        self.restarts = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._desktop = None
+    
+    @property
+    def profile_url(self) -> str:
+        """用户配置目录的 file URL"""
+        return self.profile_dir.absolute().as_uri()
+    
+    def _base_args(self) -> list:
+        return [
+            self.soffice_path,
+            '--headless',
+            '--invisible',
+            '--nologo',
+            '--nodefault',
+            '--norestore',
+            '--nolockcheck',
+            f'-env:UserInstallation={self.profile_url}'
+        ]
+    
+    # ========== 常驻模式 ==========
+    
+    def start(self) -> bool:
+        """启动实例并建立 UNO 连接"""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        cmd = self._base_args() + [f'--accept=pipe,name={self.name};urp;StarOffice.ComponentContext']
+        
+        try:
+            self._process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        except Exception as e:
+            logger.error(f"[{self.name}] 启动 LibreOffice 失败: {e}")
+            return False
+        
+        # 等待管道就绪（新配置目录首次启动需要初始化，耗时较长）
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                logger.error(f"[{self.name}] LibreOffice 进程启动后退出: code={self._process.returncode}")
+                self._process = None
+                return False
+            try:
+                ctx = resolver.resolve(f"uno:pipe,name={self.name};urp;StarOffice.ComponentContext")
+                self._desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+                logger.info(f"[{self.name}] LibreOffice 实例已启动: pid={self._process.pid}")
+                return True
+            except Exception:
+                time.sleep(0.5)
+        
+        logger.error(f"[{self.name}] LibreOffice 启动超时（{self.startup_timeout}秒）")
+        self.stop()
+        return False
+    
+    def is_healthy(self) -> bool:
+        """健康检查：进程存活且 UNO 连接可用"""
+        if self._process is None or self._process.poll() is not None or self._desktop is None:
+            return False
+        try:
+            self._desktop.getComponents()
+            return True
+        except Exception:
+            return False
+    
+    def stop(self):
+        """终止实例（下次使用时重新启动）"""
+        desktop, self._desktop = self._desktop, None
+        process, self._process = self._process, None
+        
+        if desktop is not None:
+            try:
+                desktop.terminate()
+            except Exception:
+                pass
+        
+        if process is not None:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    pass
+            except Exception:
+                pass
+        self.conversions = 0
+    
+    def _kill(self):
+        """超时看门狗：强制结束进程，使阻塞中的 UNO 调用失败返回"""
+        process = self._process
+        if process is not None and process.poll() is None:
+            logger.error(f"[{self.name}] 转换超时，强制结束 LibreOffice 进程")
+            process.kill()
+    
+    def _convert_uno(self, input_path: Path, output_path: Path, filter_name: str, timeout: int) -> bool:
+        """通过 UNO 在常驻实例中转换"""
+        if not self.is_healthy():
+            if self._process is not None:
+                logger.warning(f"[{self.name}] 健康检查失败，重启实例")
+                self.stop()
+                self.restarts += 1
+            if not self.start():
+                return False
+        
+        watchdog = threading.Timer(timeout, self._kill)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            document = self._desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(str(input_path.absolute())), "_blank", 0,
+                (_uno_property("Hidden", True), _uno_property("ReadOnly", True))
+            )
+            if document is None:
+                logger.warning(f"[{self.name}] LibreOffice 无法打开文件: {input_path.name}")
+                return False
+            try:
+                document.storeToURL(
+                    uno.systemPathToFileUrl(str(output_path.absolute())),
+                    (_uno_property("FilterName", filter_name), _uno_property("Overwrite", True))
+                )
+            finally:
+                document.close(True)
+            return True
+        except Exception as e:
+            logger.warning(f"[{self.name}] UNO 转换失败: {e}")
+            if not self.is_healthy():
+                self.stop()
+                self.restarts += 1
+            return False
+        finally:
+            watchdog.cancel()
+    
+    # ========== 命令行模式 ==========
+    
+    def _convert_cli(self, input_path: Path, output_dir: Path, target_format: str,
+                     filter_name: str, timeout: int) -> bool:
+        """启动一次 soffice 转换（使用实例专属配置目录）"""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        cmd = self._base_args() + [
+            '--convert-to', f'{target_format}:{filter_name}',
+            '--outdir', str(output_dir),
+            str(input_path)
+        ]
+        logger.debug(f"[{self.name}] LibreOffice 转换命令: {' '.join(cmd)}")
+        
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        except subprocess.TimeoutExpired:
+            logger.error(f"[{self.name}] LibreOffice 转换超时（{timeout}秒）")
+            return False
+        
+        if result.returncode != 0:
+            logger.warning(f"[{self.name}] LibreOffice 转换失败: {result.stderr}")
+            return False
+        return True
+    
+    def convert(self, input_path: Path, output_path: Path, target_format: str,
+                filter_name: str, timeout: int) -> bool:
+        """
+        转换文件（输出文件名由调用方确定）
+        
+        Args:
+            input_path: 输入文件
+            output_path: 输出文件（与输入文件位于同一工作目录，主文件名相同）
+            target_format: 目标格式
+            filter_name: LibreOffice 导出过滤器
+            timeout: 超时时间（秒）
+        """
+        if self.use_uno:
+            success = self._convert_uno(input_path, output_path, filter_name, timeout)
+        else:
+            success = self._convert_cli(input_path, output_path.parent, target_format, filter_name, timeout)
+        self.conversions += 1
+        return success and output_path.exists()
+    
+    def close(self):
+        """关闭实例并删除配置目录"""
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class LibreOfficePool:
+    """LibreOffice 实例池"""
+    
+    def __init__(self, soffice_path: str, size: int = 2, max_conversions: int = 200,
+                 timeout: int = 60, startup_timeout: int = 30, work_dir: str = "storage/temp"):
+        """
+        初始化实例池（实例在首次使用时启动）
+        
+        Args:
+            soffice_path: soffice 可执行文件路径
+            size: 实例数量（同时进行的转换数）
+            max_conversions: 单个实例转换多少次后回收重启（0 = 不回收）
+            timeout: 单次转换超时时间（秒）
+            startup_timeout: 实例启动超时时间（秒）
+            work_dir: 转换工作目录
+        """
+        self.size = max(1, size)
+        self.max_conversions = max_conversions
+        self.timeout = timeout
+        self.work_dir = Path(work_dir).absolute()
+        self.mode = "uno" if HAS_UNO else "cli"
+        self._instances = []
+        self._idle: "queue.Queue[LibreOfficeInstance]" = queue.Queue()
+        self._closed = False
+        
+        # 配置目录按进程区分：多个工作进程各自持有实例，互不争用配置锁
+        profile_root = self.work_dir / "lo_profiles"
+        for index in range(self.size):
+            name = f"kbjx_lo_{os.getpid()}_{index}"
+            instance = LibreOfficeInstance(
+                soffice_path, name, profile_root / name,
+                use_uno=HAS_UNO, startup_timeout=startup_timeout
+            )
+            self._instances.append(instance)
+            self._idle.put(instance)
+        
+        # 进程退出时关闭实例（multiprocessing 工作进程退出时不执行 atexit，需单独注册）
+        atexit.register(self.shutdown)
+        multiprocessing.util.Finalize(None, self.shutdown, exitpriority=10)
+        logger.info(f"LibreOffice 实例池: 模式={self.mode}, 实例数={self.size}, 回收阈值={max_conversions}")
+        if not HAS_UNO:
+            logger.warning("未找到 UNO 绑定（uno 模块），LibreOffice 以命令行模式运行，每次转换冷启动")
+    
+    def convert(self, input_file: str, target_format: str) -> Optional[str]:
+        """
+        转换文件为目标格式
+        
+        Args:
+            input_file: 源文件路径
+            target_format: 目标格式 ('docx', 'xlsx', 'pptx')
+        
+        Returns:
+            转换后的文件路径（storage/temp 下的唯一文件名），失败返回 None
+        """
+        filter_name = FILTER_MAP.get(target_format)
+        if not filter_name or self._closed:
+            return None
+        
+        try:
+            instance = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            logger.error(f"等待 LibreOffice 实例超时（{self.timeout}秒）")
+            return None
+        
+        # 每次转换独立的工作目录 + 固定的 ASCII 文件名：避免中文路径问题与并发串文件
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self.work_dir / f"lo_job_{job_id}"
+        try:
+            job_dir.mkdir(parents=True, exist_ok=True)
+            source = job_dir / f"source{Path(input_file).suffix.lower()}"
+            output = job_dir / f"source.{target_format}"
+            shutil.copyfile(input_file, source)
+            
+            started = time.perf_counter()
+            if not instance.convert(source, output, target_format, filter_name, self.timeout):
+                return None
+            
+            final_output = self.work_dir / f"temp_{job_id}.{target_format}"
+            shutil.move(str(output), final_output)
+            logger.debug(f"[{instance.name}] 转换完成: {Path(input_file).name} -> {final_output.name} ({time.perf_counter() - started:.2f}s)")
+            return str(final_output)
+        except Exception as e:
+            logger.error(f"[{instance.name}] LibreOffice 转换异常: {e}")
+            return None
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            if self.max_conversions and instance.conversions >= self.max_conversions:
+                logger.info(f"[{instance.name}] 已转换 {instance.conversions} 次，回收重启")
+                instance.stop()
+                instance.restarts += 1
+            self._idle.put(instance)
+    
+    def get_stats(self) -> Dict:
+        """获取实例池统计信息"""
+        return {
+            "mode": self.mode,
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "running": sum(1 for i in self._instances if i._process is not None and i._process.poll() is None),
+            "restarts": sum(i.restarts for i in self._instances)
+        }
+    
+    def shutdown(self):
+        """关闭所有实例"""
+        if self._closed:
+            return
+        self._closed = True
+        for instance in self._instances:
+            instance.close()
+        logger.info("LibreOffice 实例池已关闭")
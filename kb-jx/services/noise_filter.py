@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+噪声过滤引擎 - 预编译的噪声模式过滤
+
+噪声模式在初始化时编译一次，过滤时每个模式只用 subn 扫描一遍：
+替换与计数来自同一次匹配，不再先 findall 统计再 sub 替换。
+
+没有把所有模式合并成一个交替正则（(?P<_n0>...)|(?P<_n1>...)）：
+re 模块对单个模式有字面前缀、字符集前缀等快速跳过路径，合并后每个位置都要逐个尝试所有分支，
+实测在干净文本和噪声密集文本上都比逐个模式扫描慢 2~3 倍。
+"""
+import re
+from typing import Dict, List, Tuple
+from utils.logger import get_logger
+
+logger = get_logger("noise_filter")
+
+
+class NoiseFilter:
+    """预编译的噪声过滤引擎"""
+    
+    def __init__(self, patterns: List[str]):
+        """
+        编译噪声模式
+        
+        Args:
+            patterns: 噪声正则模式列表（无效的模式记录错误后跳过）
+        """
+        self.patterns: List[str] = []
+        self._compiled: List[re.Pattern] = []
+        for pattern in patterns:
+            try:
+                self._compiled.append(re.compile(pattern))
+                self.patterns.append(pattern)
+            except re.error as e:
+                logger.error(f"噪声模式无效，已跳过: '{pattern}' ({e})")
+        
+        logger.debug(f"噪声过滤引擎: 已编译 {len(self._compiled)} 个模式")
+    
+    def filter(self, text: str) -> Tuple[str, Dict[str, int]]:
+        """
+        按配置顺序依次移除噪声
+        
+        Returns:
+            (清洗后文本, {模式: 移除次数})，只包含命中过的模式
+        """
+        hits = {}
+        for pattern, regex in zip(self.patterns, self._compiled):
+            text, count = regex.subn('', text)
+            if count:
+                hits[pattern] = count
+        return text, hits
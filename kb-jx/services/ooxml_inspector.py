@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+OOXML 轻量检查器 - 单次流式解析 docx 压缩包
+
+不构建 python-docx 的完整对象树，直接读取压缩包：
+- [Content_Types].xml 定位主文档部件
+- 主文档的 rels 统计图片关系
+- iterparse 主文档 XML，统计表格、嵌入对象并提取段落文本
+
+检测、转换（文本提取）与批量汇总的内容哈希共用同一份检查结果。
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, List
+
+from utils.dedup_store import compute_sha256
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+W_P = f"{{{W_NS}}}p"
+W_R = f"{{{W_NS}}}r"
+W_TBL = f"{{{W_NS}}}tbl"
+W_HYPERLINK = f"{{{W_NS}}}hyperlink"
+W_T = f"{{{W_NS}}}t"
+W_TAB = f"{{{W_NS}}}tab"
+W_PTAB = f"{{{W_NS}}}ptab"
+W_BR = f"{{{W_NS}}}br"
+W_CR = f"{{{W_NS}}}cr"
+W_NO_BREAK_HYPHEN = f"{{{W_NS}}}noBreakHyphen"
+W_TYPE = f"{{{W_NS}}}type"
+A_BLIP = f"{{{A_NS}}}blip"
+
+# 主文档部件的内容类型后缀（docx / docm / dotx 等）
+MAIN_DOCUMENT_CONTENT_TYPE = "wordprocessingml"
+DEFAULT_MAIN_DOCUMENT = "word/document.xml"
+
+
+def _find_main_document(zf: zipfile.ZipFile) -> str:
+    """从 [Content_Types].xml 中找到主文档部件路径"""
+    try:
+        root = ET.fromstring(zf.read("[Content_Types].xml"))
+    except KeyError:
+        return DEFAULT_MAIN_DOCUMENT
+    
+    for override in root.iter(f"{{{CT_NS}}}Override"):
+        content_type = override.get("ContentType", "")
+        if MAIN_DOCUMENT_CONTENT_TYPE in content_type and content_type.endswith(".main+xml"):
+            return override.get("PartName", "").lstrip("/")
+    return DEFAULT_MAIN_DOCUMENT
+
+
+def _count_image_rels(zf: zipfile.ZipFile, part_name: str) -> int:
+    """统计主文档关系中指向图片的关系数量"""
+    directory, filename = posixpath.split(part_name)
+    rels_name = posixpath.join(directory, "_rels", f"{filename}.rels")
+    try:
+        root = ET.fromstring(zf.read(rels_name))
+    except KeyError:
+        return 0
+    
+    return sum(1 for rel in root.iter(f"{{{REL_NS}}}Relationship") if "image" in rel.get("Target", ""))
+
+
+def _run_text(run: ET.Element) -> str:
+    """提取 run 文本（与 python-docx Run.text 规则一致）"""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag in (W_TAB, W_PTAB):
+            parts.append("\t")
+        elif tag == W_BR:
+            if child.get(W_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag == W_CR:
+            parts.append("\n")
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    """提取段落文本（run 与超链接内的 run）"""
+    parts = []
+    for child in paragraph:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child.findall(W_R))
+    return "".join(parts)
+
+
+def _parse_docx(file_path: str) -> Dict:
+    """
+    单次解析 docx，统计结构信息并提取正文段落
+    
+    Returns:
+        {'table_count', 'image_count', 'embedded_count', 'paragraphs'}
+        paragraphs 为正文顶层段落中非空段落的原始文本
+    """
+    table_count = 0
+    embedded_count = 0
+    paragraphs: List[str] = []
+    
+    with zipfile.ZipFile(file_path) as zf:
+        part_name = _find_main_document(zf)
+        image_count = _count_image_rels(zf, part_name)
+        
+        with zf.open(part_name) as f:
+            # 深度：document=1, body=2, 正文顶层元素=3
+            depth = 0
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    continue
+                
+                if depth == 3:
+                    if elem.tag == W_P:
+                        for run in elem.findall(W_R):
+                            embedded_count += sum(1 for _ in run.iter(A_BLIP))
+                        text = _paragraph_text(elem)
+                        if text.strip():
+                            paragraphs.append(text)
+                    elif elem.tag == W_TBL:
+                        table_count += 1
+                    # 顶层元素处理完即释放，内存占用与文档大小无关
+                    elem.clear()
+                depth -= 1
+    
+    return {
+        'table_count': table_count,
+        'image_count': image_count,
+        'embedded_count': embedded_count,
+        'paragraphs': paragraphs
+    }
+
+
+def read_docx_paragraphs(file_path: str) -> List[str]:
+    """
+    读取 docx 正文的非空段落文本
+    
+    Raises:
+        解析失败时抛出异常（zipfile.BadZipFile、KeyError、ET.ParseError 等）
+    """
+    return _parse_docx(file_path)['paragraphs']
+
+
+def inspect_docx(file_path: str) -> Dict:
+    """
+    检查 docx 文件 - 严格模式：只有纯文字才算纯文本
+    
+    判定顺序与原 python-docx 实现一致：表格 > 图片 > 嵌入对象 > 无文本
+    
+    Returns:
+        {
+            'is_pure_text': bool,
+            'reason': str,
+            'paragraphs': List[str],  # 非空段落原始文本（解析失败时为空列表）
+            'table_count': int,
+            'image_count': int,
+            'embedded_count': int
+        }
+    """
+    try:
+        result = _parse_docx(file_path)
+    except Exception as e:
+        return {
+            'is_pure_text': False,
+            'reason': f"处理 docx 错误: {str(e)}",
+            'paragraphs': [],
+            'table_count': 0,
+            'image_count': 0,
+            'embedded_count': 0
+        }
+    
+    if result['table_count'] > 0:
+        is_pure_text, reason = False, f"包含表格 ({result['table_count']}个)"
+    elif result['image_count'] > 0:
+        is_pure_text, reason = False, f"包含图片 ({result['image_count']}个)"
+    elif result['embedded_count'] > 0:
+        is_pure_text, reason = False, f"包含嵌入对象 ({result['embedded_count']}个)"
+    elif not result['paragraphs']:
+        is_pure_text, reason = False, "文档无有效文本内容"
+    else:
+        is_pure_text, reason = True, f"纯文本文档 ({len(result['paragraphs'])}个段落)"
+    
+    result['is_pure_text'] = is_pure_text
+    result['reason'] = reason
+    return result
+
+
+def compute_content_hash(paragraphs: List[str]) -> str:
+    """基于段落文本计算内容哈希（用于批量任务的纯文本独一份去重）"""
+    return compute_sha256('\n'.join(paragraphs))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文本规范化引擎 - 干净文本跳过 ftfy 的快速路径
+
+ftfy.fix_text 对每一行都要做乱码检测与多轮修复，在干净的 UTF-8 语料上占管线 CPU 的一半以上。
+本引擎先用一个预编译的字符类正则判断文本是否只包含「安全字符」：
+- ASCII 可打印字符（& 除外，可能是 HTML 实体）、换行与制表符
+- 中日韩统一表意文字、假名、中文标点
+- 全角字母数字与标点、弯引号等 ftfy 只做逐字符替换的字符
+
+这些字符不可能组成 ftfy 能修复的乱码（在 ftfy 尝试的单字节编码中凑不出合法的 UTF-8 序列），
+ftfy 对它们只做逐字符替换（全角转半角、弯引号转直引号），替换表在首次使用时由 ftfy 本身生成。
+只有包含其他字符的段落才调用 ftfy；零宽字符、控制字符、制表符的处理与 ftfy 的逐字符替换合并为一次 str.translate。
+
+结果与「ftfy.fix_text -> 逐项清理」的原实现一致。
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# 安全导入 ftfy
+try:
+    import ftfy
+    HAS_FTFY = True
+except ImportError:
+    HAS_FTFY = False
+
+# 逐字符判定为快速路径候选的区间（ftfy 对其中的字符只做逐字符替换或不处理）
+_FAST_RANGES = (
+    (0x3000, 0x30ff),  # 中文标点、假名
+    (0xff01, 0xff60),  # 全角字母数字与标点
+    (0xffe0, 0xffe6),  # 全角符号
+    (0x2013, 0x2014),  # 连接号、破折号
+    (0x2018, 0x201f),  # 弯引号
+    (0x2026, 0x2026),  # 省略号
+    (0x00b7, 0x00b7),  # 间隔号
+)
+# ftfy 不做任何处理的区间（中日韩统一表意文字）
+_IDEOGRAPH_RANGES = ((0x3400, 0x4dbf), (0x4e00, 0x9fff))
+
+
+class _CleanTable(dict):
+    """str.translate 映射表：首次遇到的字符按 isprintable 判定后缓存（控制字符、零宽字符、BOM 删除）"""
+    
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        char = chr(codepoint)
+        value = codepoint if char.isprintable() or char in '\n\r ' else None
+        self[codepoint] = value
+        return value
+
+
+def _char_class(codepoints) -> str:
+    """码点集合转换为正则字符类内容（合并连续区间）"""
+    parts = []
+    codepoints = sorted(codepoints)
+    start = prev = codepoints[0]
+    for codepoint in codepoints[1:] + [None]:
+        if codepoint is not None and codepoint == prev + 1:
+            prev = codepoint
+            continue
+        parts.append(re.escape(chr(start)) if start == prev else f"{re.escape(chr(start))}-{re.escape(chr(prev))}")
+        if codepoint is not None:
+            start = prev = codepoint
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=1)
+def _ftfy_fast_path() -> Tuple[Dict[int, str], "re.Pattern"]:
+    """
+    生成快速路径的逐字符替换表与「需要 ftfy」检测正则
+    
+    候选字符逐个放在表意文字之间交给 ftfy 处理：结果仍是单个字符的进入快速路径，
+    组合字符、NFC 不稳定或被替换为多个字符的仍走 ftfy。
+    """
+    replacements: Dict[int, str] = {}
+    safe = [ord(c) for c in '\n\t'] + [c for c in range(0x20, 0x7f) if c != ord('&')]
+    for low, high in _FAST_RANGES:
+        for codepoint in range(low, high + 1):
+            char = chr(codepoint)
+            if unicodedata.category(char).startswith(('M', 'C')) or unicodedata.normalize('NFC', char) != char:
+                continue
+            fixed = ftfy.fix_text(f"文{char}文")
+            if len(fixed) != 3 or fixed[0] != '文' or fixed[2] != '文':
+                continue
+            safe.append(codepoint)
+            if fixed[1] != char:
+                replacements[codepoint] = fixed[1]
+    for low, high in _IDEOGRAPH_RANGES:
+        safe.extend(range(low, high + 1))
+    
+    return replacements, re.compile(f"[^{_char_class(safe)}]")
+
+
+class TextNormalizer:
+    """文本规范化引擎（只对需要的段落调用 ftfy）"""
+    
+    def __init__(self, use_ftfy: bool = True):
+        """
+        Args:
+            use_ftfy: 是否使用 ftfy 修复 Unicode（未安装 ftfy 时自动关闭）
+        """
+        self.use_ftfy = use_ftfy and HAS_FTFY
+        self._table = _CleanTable()
+        self._table[ord('\t')] = '    '
+        self._needs_ftfy = None
+        if self.use_ftfy:
+            replacements, self._needs_ftfy = _ftfy_fast_path()
+            self._table.update(replacements)
+    
+    def normalize(self, text: str) -> Tuple[str, int]:
+        """
+        文本规范化
+        - 修复 Unicode 错误（ftfy，只处理包含非安全字符的段落）
+        - 去除 BOM、零宽字符与不可见控制字符（保留换行、制表符）
+        - 制表符转空格
+        - 统一换行符
+        - 折叠连续空格、连续空行（保留双换行作为段落分隔）
+        
+        Returns:
+            (规范化后文本, 走 ftfy 慢速路径的段落数)
+        """
+        slow_count = 0
+        if self.use_ftfy:
+            # \r\n 先统一为 \n（ftfy 同样会统一，分行位置不变），段落才能按双换行切分
+            folded = text.replace('\r\n', '\n') if '\r' in text else text
+            if '\r' in folded:
+                # 单独的 \r（旧 Mac 换行）：ftfy 把前后几行当作同一行判断乱码，整篇交给 ftfy
+                text = ftfy.fix_text(text)
+                slow_count = text.count('\n\n') + 1
+            else:
+                text, slow_count = self._fix_paragraphs(text, folded)
+        
+        # 删除不可见字符、制表符转空格、ftfy 的逐字符替换：一次 translate
+        text = text.translate(self._table)
+        
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if '  ' in text:
+            text = re.sub(r' {2,}', ' ', text)
+        if '\n\n\n\n' in text:
+            text = re.sub(r'\n{4,}', '\n\n\n', text)
+        return text, slow_count
+    
+    def _fix_paragraphs(self, text: str, folded: str) -> Tuple[str, int]:
+        """
+        只对包含非安全字符的段落调用 ftfy
+        
+        段落连同其后的双换行一起交给 ftfy（ftfy 按行分段处理，结果与整篇处理一致）；
+        ftfy 遇到含 '<' 的行后不再反转义 HTML 实体，这一状态按原文位置传递给后续段落。
+        
+        Args:
+            text: 原始文本
+            folded: \r\n 统一为 \n 后的文本（ftfy 同样会统一，分行位置不变）
+        
+        Returns:
+            (处理后文本, 走 ftfy 的段落数)
+        """
+        if not self._needs_ftfy.search(folded):
+            return folded, 0
+        
+        # 含 '<' 的行的起点（换算到 folded 中的位置）
+        first_lt = text.find('<')
+        html_off_from = -1
+        if first_lt >= 0:
+            html_off_from = text.rfind('\n', 0, first_lt) + 1
+            html_off_from -= text.count('\r\n', 0, html_off_from)
+        
+        pieces = folded.split('\n\n')
+        last = len(pieces) - 1
+        out = []
+        offset = 0
+        slow_count = 0
+        for index, piece in enumerate(pieces):
+            segment = piece if index == last else piece + '\n\n'
+            if self._needs_ftfy.search(piece):
+                cut = html_off_from - offset if html_off_from >= 0 else len(segment)
+                if cut <= 0:
+                    segment = ftfy.fix_text(segment, unescape_html=False)
+                elif cut >= len(segment):
+                    segment = ftfy.fix_text(segment)
+                else:
+                    segment = ftfy.fix_text(segment[:cut]) + ftfy.fix_text(segment[cut:], unescape_html=False)
+                slow_count += 1
+            out.append(segment)
+            offset += len(piece) + 2
+        return ''.join(out), slow_count
@@ -3,24 +3,17 @@
 """
 文本清洗与去重管线 - 完整处理流程
 """
+import asyncio
+import hashlib
+import json
 import re
-from typing import List, Dict, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from utils.logger import get_logger
-from utils.dedup_store import DedupStore, compute_sha256
-
-# 安全导入 ftfy
-try:
-    import ftfy
-    HAS_FTFY = True
-except ImportError:
-    HAS_FTFY = False
-
-# 安全导入 simhash
-try:
-    from simhash import Simhash
-    HAS_SIMHASH = True
-except ImportError:
-    HAS_SIMHASH = False
+from utils.dedup_store import DedupStore, compute_sha256, hamming_distance
+from utils.paragraph_memo import ParagraphMemo
+from services.noise_filter import NoiseFilter
+from services.text_normalizer import TextNormalizer, HAS_FTFY
+from utils.simhash_engine import SimhashEngine
 
 logger = get_logger("text_pipeline")
 
@@ -36,7 +29,10 @@ class TextPipeline:
         enable_near_duplicate: bool = True,
         noise_patterns: Optional[List[str]] = None,
         custom_noise_patterns: Optional[List[str]] = None,
-        enable_cross_doc_dedup: bool = False
+        enable_cross_doc_dedup: bool = False,
+        simhash_tokenizer: str = "legacy",
+        simhash_ngram: int = 2,
+        async_dedup_store=None
     ):
         """
         初始化文本管线
@@ -49,11 +45,16 @@ class TextPipeline:
             noise_patterns: 自定义噪声正则模式列表
             custom_noise_patterns: 额外的自定义噪声模式（会追加到 noise_patterns 后）
             enable_cross_doc_dedup: 是否启用跨文档段落去重（默认False）
+            simhash_tokenizer: SimHash 分词策略（cjk / char / legacy）
+            simhash_ngram: SimHash shingle 包含的 token 数
+            async_dedup_store: 异步去重存储（AsyncDedupStore，包装同一个 dedup_store，供 process_async 使用）
         """
         self.dedup_store = dedup_store
+        self.async_dedup_store = async_dedup_store
         self.min_paragraph_len = min_paragraph_len
         self.simhash_distance_threshold = simhash_distance_threshold
-        self.enable_near_duplicate = enable_near_duplicate and HAS_SIMHASH
+        self.simhash_engine = SimhashEngine(tokenizer=simhash_tokenizer, ngram=simhash_ngram)
+        self.enable_near_duplicate = enable_near_duplicate and self.simhash_engine.available
         self.enable_cross_doc_dedup = enable_cross_doc_dedup
         
         # 噪声过滤模式（默认）
@@ -75,19 +76,79 @@ class TextPipeline:
         if custom_noise_patterns:
             self.noise_patterns.extend(custom_noise_patterns)
         
+        # 噪声模式只编译一次
+        self.noise_filter = NoiseFilter(self.noise_patterns)
+        # 规范化：干净段落跳过 ftfy
+        self.normalizer = TextNormalizer()
+        
         if not HAS_FTFY:
             logger.warning("ftfy 未安装，Unicode 修复功能不可用")
-        if not HAS_SIMHASH:
-            logger.warning("simhash 未安装，近重复检测功能不可用")
-            self.enable_near_duplicate = False
+        if not self.simhash_engine.available:
+            logger.warning("numpy / simhash 未安装，近重复检测功能不可用")
+    
+    def config_fingerprint(self) -> str:
+        """
+        管线配置指纹：影响清洗结果的参数变化时指纹随之变化（用于结果缓存失效）
+        """
+        params = {
+            "min_paragraph_len": self.min_paragraph_len,
+            "simhash_distance_threshold": self.simhash_distance_threshold,
+            "enable_near_duplicate": self.enable_near_duplicate,
+            "enable_cross_doc_dedup": self.enable_cross_doc_dedup,
+            "noise_patterns": self.noise_patterns,
+            "simhash_engine": self.simhash_engine.describe(),
+            "has_ftfy": HAS_FTFY
+        }
+        raw = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+    
+    def check_doc_duplicate(self, doc_hash: str, doc_name: str = "unknown",
+                            namespace: Optional[str] = None) -> bool:
+        """
+        文档级去重检查并标记（复用缓存结果时代替完整管线）
+        
+        Args:
+            doc_hash: 文档 SHA256 哈希
+            doc_name: 文档名称（用于日志）
+            namespace: 去重命名空间（默认使用 dedup_store 的命名空间）
+        
+        Returns:
+            是否为重复文档
+        """
+        dedup_store = self.dedup_store.for_namespace(namespace)
+        if dedup_store.is_doc_seen(doc_hash):
+            logger.info(f"[{doc_name}] 文档级去重命中: {doc_hash[:16]}...")
+            return True
+        dedup_store.mark_doc(doc_hash)
+        return False
     
-    def process(self, text: str, doc_name: str = "unknown") -> Dict:
+    async def check_doc_duplicate_async(self, doc_hash: str, doc_name: str = "unknown",
+                                        namespace: Optional[str] = None) -> bool:
+        """
+        check_doc_duplicate 的异步版本（事件循环中调用，Redis 访问不阻塞其他请求）
+        
+        Raises:
+            ValueError: 无效的命名空间
+        """
+        if not self._has_async_store():
+            return await asyncio.to_thread(self.check_doc_duplicate, doc_hash, doc_name, namespace)
+        async_store = self.async_dedup_store.for_namespace(namespace)
+        if await async_store.is_doc_seen(doc_hash):
+            logger.info(f"[{doc_name}] 文档级去重命中: {doc_hash[:16]}...")
+            return True
+        await async_store.mark_doc(doc_hash)
+        return False
+    
+    def process(self, text: str, doc_name: str = "unknown", namespace: Optional[str] = None,
+                paragraph_memo: Optional[ParagraphMemo] = None) -> Dict:
         """
         完整处理流程
         
         Args:
             text: 原始文本
             doc_name: 文档名称（用于日志）
+            namespace: 去重命名空间（默认使用 dedup_store 的命名空间）
+            paragraph_memo: 段落指纹备忘（批量任务内共享，复用重复段落的哈希与指纹）
         
         Returns:
             {
@@ -96,7 +157,9 @@ class TextPipeline:
                 "stats": {
                     "original_length": int,
                     "normalized_length": int,
+                    "normalize_slow_paragraphs": int,
                     "noise_removed_count": int,
+                    "noise_pattern_hits": {pattern: int},
                     "paragraphs_original": int,
                     "paragraphs_after_dedup": int,
                     "paragraphs_exact_dup": int,
@@ -105,143 +168,85 @@ class TextPipeline:
                     "final_length": int
                 },
                 "doc_duplicate": bool,
+                "doc_hash": str,
                 "message": str
             }
         """
-        logger.info(f"[{doc_name}] 开始文本清洗与去重管线")
+        stream = self.process_stream([text], doc_name, namespace=namespace, paragraph_memo=paragraph_memo)
+        paragraphs = list(stream)
         
-        stats = {
-            "original_length": len(text),
-            "normalized_length": 0,
-            "noise_removed_count": 0,
-            "paragraphs_original": 0,
-            "paragraphs_after_dedup": 0,
-            "paragraphs_exact_dup": 0,
-            "paragraphs_near_dup": 0,
-            "paragraphs_too_short": 0,
-            "final_length": 0
-        }
-        
-        # 步骤1: 文档级去重检查（先检查，但不影响清洗流程）
-        doc_hash = compute_sha256(text)
-        is_doc_duplicate = self.dedup_store.is_doc_seen(doc_hash)
-        
-        if is_doc_duplicate:
-            logger.info(f"[{doc_name}] 文档级去重命中: {doc_hash[:16]}...，但仍执行清洗流程以便后续使用")
-        
-        # 步骤2: 文本规范化
-        normalized = self._normalize_text(text)
-        stats["normalized_length"] = len(normalized)
-        logger.debug(f"[{doc_name}] 规范化完成: {stats['original_length']} -> {stats['normalized_length']} 字符")
+        # 步骤7: 组装最终文本
+        result = stream.result
+        result["cleaned_text"] = self._assemble(paragraphs)
+        return result
+    
+    def process_stream(self, chunks: Iterable[str], doc_name: str = "unknown",
+                       paragraphs: bool = False, namespace: Optional[str] = None,
+                       paragraph_memo: Optional[ParagraphMemo] = None) -> "PipelineStream":
+        """
+        流式处理：逐块读取文本，清洗去重后逐段输出（大文件不需要整篇载入内存）
         
-        # 步骤3: 噪声过滤
-        cleaned, noise_count = self._noise_filter(normalized)
-        stats["noise_removed_count"] = noise_count
-        logger.debug(f"[{doc_name}] 噪声过滤完成: 移除 {noise_count} 处噪声")
+        Args:
+            chunks: 文本块迭代器（任意位置切分的原始文本，或 paragraphs=True 时的段落）
+            doc_name: 文档名称（用于日志）
+            paragraphs: chunks 是否为段落（段落之间按双换行连接，文档哈希与整篇处理一致）
+            namespace: 去重命名空间（默认使用 dedup_store 的命名空间）
+            paragraph_memo: 段落指纹备忘（批量任务内共享）
         
-        # 步骤4: 段落拆分
-        paragraphs = self._split_paragraphs(cleaned)
-        stats["paragraphs_original"] = len(paragraphs)
-        logger.debug(f"[{doc_name}] 段落拆分完成: {len(paragraphs)} 个段落")
+        Returns:
+            PipelineStream：迭代得到清洗后的段落，迭代结束后 result 为处理结果
+            （与 process() 相同，但不包含 cleaned_text）
+        """
+        return PipelineStream(
+            self, chunks, doc_name, paragraphs, self.dedup_store.for_namespace(namespace), paragraph_memo
+        )
+    
+    async def process_async(self, text: str, doc_name: str = "unknown", namespace: Optional[str] = None) -> Dict:
+        """
+        process() 的异步版本：规范化、噪声过滤、指纹计算等 CPU 步骤在线程池执行，
+        去重存储通过异步客户端访问（Redis 延迟不占用事件循环与线程池）
         
-        # 步骤5: 段落去重（精确 + 近重复）
-        deduped_paras, exact_dup, near_dup, too_short = self._dedup_paragraphs(paragraphs, doc_name)
-        stats["paragraphs_after_dedup"] = len(deduped_paras)
-        stats["paragraphs_exact_dup"] = exact_dup
-        stats["paragraphs_near_dup"] = near_dup
-        stats["paragraphs_too_short"] = too_short
-        logger.info(f"[{doc_name}] 段落去重完成: {len(paragraphs)} -> {len(deduped_paras)} (精确重复:{exact_dup}, 近重复:{near_dup}, 过短:{too_short})")
+        没有可用的异步去重存储时，整个管线在线程池中执行。结果与 process() 完全一致。
+        """
+        if not self._has_async_store():
+            return await asyncio.to_thread(self.process, text, doc_name, namespace)
         
-        # 步骤6: 格式标准化
-        standardized_paras = self._format_standardize(deduped_paras)
+        async_store = self.async_dedup_store.for_namespace(namespace)
+        stream = PipelineStream(self, [text], doc_name, dedup_store=async_store.store)
+        paragraphs = await stream.run_async(async_store)
         
         # 步骤7: 组装最终文本
-        final_text = self._assemble(standardized_paras)
-        stats["final_length"] = len(final_text)
-        
-        # 标记文档已处理（避免后续重复）
-        if not is_doc_duplicate:
-            self.dedup_store.mark_doc(doc_hash)
-        
-        logger.info(f"[{doc_name}] 管线完成: {stats['original_length']} -> {stats['final_length']} 字符, {stats['paragraphs_after_dedup']} 段落")
-        
-        # 如果是去重文档，success=False 但返回清洗后的文本
-        if is_doc_duplicate:
-            return {
-                "success": False,
-                "cleaned_text": final_text,
-                "stats": stats,
-                "doc_duplicate": True,
-                "message": "文档已存在（完全重复）但已清洗"
-            }
-        
-        return {
-            "success": True,
-            "cleaned_text": final_text,
-            "stats": stats,
-            "doc_duplicate": False,
-            "message": "处理成功"
-        }
+        result = stream.result
+        result["cleaned_text"] = self._assemble(paragraphs)
+        return result
     
-    def _normalize_text(self, text: str) -> str:
+    def _has_async_store(self) -> bool:
+        """是否配置了可直接在事件循环中使用的异步去重存储"""
+        return self.async_dedup_store is not None and self.async_dedup_store.available
+    
+    def _normalize_text(self, text: str) -> Tuple[str, int]:
         """
         文本规范化
-        - 修复 Unicode 错误
-        - 去除 BOM
-        - 去除零宽字符
-        - 标准化空白（制表符转空格、连续空格折叠）
-        """
-        # 1. 使用 ftfy 修复 Unicode
-        if HAS_FTFY:
-            text = ftfy.fix_text(text)
-        
-        # 2. 去除 BOM
-        text = text.replace('\ufeff', '')
-        
-        # 3. 去除零宽字符
-        zero_width_chars = [
-            '\u200b',  # 零宽空格
-            '\u200c',  # 零宽非连接符
-            '\u200d',  # 零宽连接符
-            '\ufeff',  # 零宽非断空格
-        ]
-        for char in zero_width_chars:
-            text = text.replace(char, '')
-        
-        # 4. 去除不可见控制字符（保留换行、制表符）
-        text = ''.join(c for c in text if c.isprintable() or c in '\n\r\t ')
+        - 修复 Unicode 错误（ftfy，只处理包含非安全字符的段落）
+        - 去除 BOM、零宽字符与不可见控制字符
+        - 标准化空白（制表符转空格、统一换行、连续空格折叠）
         
-        # 5. 制表符转空格
-        text = text.replace('\t', '    ')
-        
-        # 6. 统一换行符
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
-        
-        # 7. 折叠连续空格（保留换行）
-        text = re.sub(r' {2,}', ' ', text)
-        
-        # 8. 折叠连续空行（保留双换行作为段落分隔）
-        text = re.sub(r'\n{4,}', '\n\n\n', text)
-        
-        return text
+        Returns:
+            (规范化后文本, 走 ftfy 慢速路径的段落数)
+        """
+        return self.normalizer.normalize(text)
     
-    def _noise_filter(self, text: str) -> Tuple[str, int]:
+    def _noise_filter(self, text: str) -> Tuple[str, Dict[str, int]]:
         """
-        噪声过滤
+        噪声过滤（预编译模式，每个模式扫描一遍）
         
         Returns:
-            (清洗后文本, 移除次数)
+            (清洗后文本, {模式: 移除次数})
         """
-        removed_count = 0
-        
-        for pattern in self.noise_patterns:
-            matches = re.findall(pattern, text)
-            if matches:
-                removed_count += len(matches)
-                text = re.sub(pattern, '', text)
-                logger.debug(f"噪声模式 '{pattern[:30]}...' 移除 {len(matches)} 处")
-        
-        return text, removed_count
+        text, hits = self.noise_filter.filter(text)
+        for pattern, count in hits.items():
+            logger.debug(f"噪声模式 '{pattern[:30]}...' 移除 {count} 处")
+        return text, hits
     
     def _split_paragraphs(self, text: str) -> List[str]:
         """
@@ -269,88 +274,14 @@ class TextPipeline:
         Returns:
             (去重后段落, 精确重复数, 近重复数, 过短数)
         """
-        result = []
-        exact_dup_count = 0
-        near_dup_count = 0
-        too_short_count = 0
-        
-        # 获取已存在的 SimHash（用于跨文档去重）
-        if self.enable_cross_doc_dedup:
-            # 启用跨文档去重：从全局存储获取
-            existing_simhash = self.dedup_store.get_all_para_simhash() if self.enable_near_duplicate else {}
-        else:
-            # 禁用跨文档去重：只在本文档内去重
-            existing_simhash = {}
-        
-        # 本文档内的段落哈希（用于文档内去重）
-        local_para_hashes = set()
-        
-        for i, para in enumerate(paragraphs):
-            # 过滤过短段落
-            if len(para) < self.min_paragraph_len:
-                too_short_count += 1
-                logger.debug(f"[{doc_name}] 段落 {i+1} 过短({len(para)}字符)，跳过")
-                continue
-            
-            # 精确去重（SHA256）
-            para_hash = compute_sha256(para)
-            
-            # 文档内精确去重（必须）
-            if para_hash in local_para_hashes:
-                exact_dup_count += 1
-                logger.debug(f"[{doc_name}] 段落 {i+1} 文档内精确重复，跳过")
-                continue
-            
-            # 跨文档精确去重（可选）
-            if self.enable_cross_doc_dedup and self.dedup_store.is_para_seen(para_hash):
-                exact_dup_count += 1
-                logger.debug(f"[{doc_name}] 段落 {i+1} 跨文档精确重复，跳过")
-                continue
-            
-            # 近重复检测（SimHash）
-            is_near_dup = False
-            para_simhash = None
-            
-            if self.enable_near_duplicate:
-                para_simhash = Simhash(para).value
-                
-                # 与已存在的段落比对（只在启用跨文档去重时）
-                if self.enable_cross_doc_dedup:
-                    for existing_hash, existing_sim in existing_simhash.items():
-                        distance = self._hamming_distance(para_simhash, existing_sim)
-                        if distance <= self.simhash_distance_threshold:
-                            near_dup_count += 1
-                            is_near_dup = True
-                            logger.debug(f"[{doc_name}] 段落 {i+1} 跨文档近重复(距离={distance})，跳过")
-                            break
-            
-            if is_near_dup:
-                continue
-            
-            # 保留段落
-            result.append(para)
-            
-            # 记录到本地集合（文档内去重）
-            local_para_hashes.add(para_hash)
-            
-            # 记录到全局存储（只在启用跨文档去重时）
-            if self.enable_cross_doc_dedup:
-                self.dedup_store.mark_para(para_hash, para_simhash)
-            
-            # 更新本次处理的 simhash 集合（避免同文档内重复）
-            if para_simhash is not None and self.enable_cross_doc_dedup:
-                existing_simhash[para_hash] = para_simhash
-        
-        return result, exact_dup_count, near_dup_count, too_short_count
+        deduper = _ParagraphDeduper(self, doc_name, self.dedup_store)
+        result = deduper.feed(paragraphs)
+        deduper.flush()
+        return result, deduper.exact_dup_count, deduper.near_dup_count, deduper.too_short_count
     
     def _hamming_distance(self, hash1: int, hash2: int) -> int:
         """计算两个整数的汉明距离（二进制位不同的个数）"""
-        x = hash1 ^ hash2
-        distance = 0
-        while x:
-            distance += 1
-            x &= x - 1  # 清除最右边的 1
-        return distance
+        return hamming_distance(hash1, hash2)
     
     def _format_standardize(self, paragraphs: List[str]) -> List[str]:
         """
@@ -381,3 +312,426 @@ class TextPipeline:
         - 段落间用双换行分隔
         """
         return '\n\n'.join(paragraphs)
+
+
+class _ParagraphDeduper:
+    """
+    段落去重状态（精确 + 近重复）
+    
+    段落可以分多批送入（流式处理），文档内去重状态跨批次保留；
+    保留的段落在 flush() 时一次性写入全局存储，同一文档的段落不会互相命中跨文档去重。
+    """
+    
+    def __init__(self, pipeline: TextPipeline, doc_name: str, dedup_store: DedupStore,
+                 paragraph_memo: Optional[ParagraphMemo] = None):
+        self.pipeline = pipeline
+        self.doc_name = doc_name
+        # 全局去重存储（请求的命名空间）
+        self.dedup_store = dedup_store
+        # 批量任务内共享的段落指纹备忘（可选）
+        self.paragraph_memo = paragraph_memo
+        self.exact_dup_count = 0
+        self.near_dup_count = 0
+        self.too_short_count = 0
+        # 已送入的段落数（日志中的段落序号）
+        self._para_count = 0
+        # 本文档内的段落哈希（用于文档内去重）
+        self._local_para_hashes: Set[str] = set()
+        # 本文档已保留段落的指纹索引（避免同文档内近重复）
+        self._local_index: Optional[DedupStore] = None
+        if pipeline.enable_cross_doc_dedup and pipeline.enable_near_duplicate:
+            self._local_index = DedupStore(backend="memory", simhash_max_distance=pipeline.simhash_distance_threshold)
+        # 待写入全局存储的段落（文档处理完后一次性写入）
+        self._pending_marks: List[Tuple[str, Optional[int]]] = []
+    
+    def feed(self, paragraphs: List[str]) -> List[str]:
+        """
+        对一批段落去重
+        
+        Returns:
+            保留的段落
+        """
+        para_hashes, para_simhashes = self._fingerprint(paragraphs)
+        
+        # 跨文档去重：整批段落批量查询全局存储（精确 + 近重复各一次往返）
+        seen_hashes: Set[str] = set()
+        store_near_matches: Dict[str, Tuple[str, int]] = {}
+        if self.pipeline.enable_cross_doc_dedup:
+            unique_hashes = list(dict.fromkeys(para_hashes.values()))
+            seen_flags = self.dedup_store.are_paras_seen(unique_hashes)
+            seen_hashes = {h for h, seen in zip(unique_hashes, seen_flags) if seen}
+            
+            if self.pipeline.enable_near_duplicate:
+                query_hashes = [h for h in unique_hashes if h not in seen_hashes]
+                matches = self.dedup_store.find_near_duplicates(
+                    [para_simhashes[h] for h in query_hashes], self.pipeline.simhash_distance_threshold
+                )
+                store_near_matches = {h: m for h, m in zip(query_hashes, matches) if m is not None}
+        
+        return self._select(paragraphs, para_hashes, para_simhashes, seen_hashes, store_near_matches)
+    
+    async def feed_async(self, paragraphs: List[str], async_store) -> List[str]:
+        """
+        feed() 的异步版本：哈希、指纹与文档内去重在线程池执行，全局存储通过异步客户端批量查询
+        
+        Args:
+            paragraphs: 段落列表
+            async_store: 包装 self.dedup_store 的 AsyncDedupStore
+        """
+        para_hashes, para_simhashes = await asyncio.to_thread(self._fingerprint, paragraphs)
+        
+        seen_hashes: Set[str] = set()
+        store_near_matches: Dict[str, Tuple[str, int]] = {}
+        if self.pipeline.enable_cross_doc_dedup:
+            unique_hashes = list(dict.fromkeys(para_hashes.values()))
+            seen_flags = await async_store.are_paras_seen(unique_hashes)
+            seen_hashes = {h for h, seen in zip(unique_hashes, seen_flags) if seen}
+            
+            if self.pipeline.enable_near_duplicate:
+                query_hashes = [h for h in unique_hashes if h not in seen_hashes]
+                matches = await async_store.find_near_duplicates(
+                    [para_simhashes[h] for h in query_hashes], self.pipeline.simhash_distance_threshold
+                )
+                store_near_matches = {h: m for h, m in zip(query_hashes, matches) if m is not None}
+        
+        return await asyncio.to_thread(
+            self._select, paragraphs, para_hashes, para_simhashes, seen_hashes, store_near_matches
+        )
+    
+    def _fingerprint(self, paragraphs: List[str]) -> Tuple[Dict[int, str], Dict[str, int]]:
+        """
+        预先计算哈希与指纹（同一内容只计算一次，过短段落不计算；备忘中已有的段落直接复用）
+        
+        Returns:
+            ({段落下标: SHA256}, {SHA256: SimHash})
+        """
+        pipeline = self.pipeline
+        memo = self.paragraph_memo
+        memoized: Dict[str, Tuple[str, Optional[int]]] = {}
+        if memo is not None:
+            memoized = memo.get_many(dict.fromkeys(
+                para for para in paragraphs if len(para) >= pipeline.min_paragraph_len
+            ))
+        
+        para_hashes: Dict[int, str] = {}
+        para_simhashes: Dict[str, int] = {}
+        pending_simhash: Dict[str, str] = {}
+        computed: Dict[str, str] = {}
+        for i, para in enumerate(paragraphs):
+            if len(para) < pipeline.min_paragraph_len:
+                continue
+            entry = memoized.get(para)
+            if entry is not None and (entry[1] is not None or not pipeline.enable_near_duplicate):
+                para_hashes[i] = entry[0]
+                if entry[1] is not None:
+                    para_simhashes[entry[0]] = entry[1]
+                continue
+            para_hash = computed.get(para) or compute_sha256(para)
+            computed[para] = para_hash
+            para_hashes[i] = para_hash
+            if pipeline.enable_near_duplicate:
+                pending_simhash.setdefault(para_hash, para)
+        
+        # 整批段落指纹一次批量计算
+        if pending_simhash:
+            para_simhashes.update(zip(
+                pending_simhash.keys(), pipeline.simhash_engine.fingerprints(list(pending_simhash.values()))
+            ))
+        if memo is not None and computed:
+            memo.put_many({para: (para_hash, para_simhashes.get(para_hash)) for para, para_hash in computed.items()})
+        return para_hashes, para_simhashes
+    
+    def _select(self, paragraphs: List[str], para_hashes: Dict[int, str], para_simhashes: Dict[str, int],
+                seen_hashes: Set[str], store_near_matches: Dict[str, Tuple[str, int]]) -> List[str]:
+        """
+        根据全局存储的查询结果与文档内状态选出保留的段落
+        
+        Returns:
+            保留的段落
+        """
+        pipeline = self.pipeline
+        doc_name = self.doc_name
+        base = self._para_count
+        self._para_count += len(paragraphs)
+        result = []
+        
+        for i, para in enumerate(paragraphs):
+            # 过滤过短段落
+            if i not in para_hashes:
+                self.too_short_count += 1
+                logger.debug(f"[{doc_name}] 段落 {base+i+1} 过短({len(para)}字符)，跳过")
+                continue
+            
+            # 精确去重（SHA256）
+            para_hash = para_hashes[i]
+            
+            # 文档内精确去重（必须）
+            if para_hash in self._local_para_hashes:
+                self.exact_dup_count += 1
+                logger.debug(f"[{doc_name}] 段落 {base+i+1} 文档内精确重复，跳过")
+                continue
+            
+            # 跨文档精确去重（可选）
+            if para_hash in seen_hashes:
+                self.exact_dup_count += 1
+                logger.debug(f"[{doc_name}] 段落 {base+i+1} 跨文档精确重复，跳过")
+                continue
+            
+            # 近重复检测（SimHash）
+            para_simhash = para_simhashes.get(para_hash)
+            
+            # 与已存在的段落比对（只在启用跨文档去重时，通过分块索引只访问候选桶）
+            if para_simhash is not None and pipeline.enable_cross_doc_dedup:
+                match = store_near_matches.get(para_hash) or self._local_index.find_near_duplicate(para_simhash)
+                if match is not None:
+                    self.near_dup_count += 1
+                    logger.debug(f"[{doc_name}] 段落 {base+i+1} 跨文档近重复(距离={match[1]})，跳过")
+                    continue
+            
+            # 保留段落
+            result.append(para)
+            
+            # 记录到本地集合（文档内去重）
+            self._local_para_hashes.add(para_hash)
+            
+            # 记录到全局存储（只在启用跨文档去重时）
+            if pipeline.enable_cross_doc_dedup:
+                self._pending_marks.append((para_hash, para_simhash))
+                if self._local_index is not None and para_simhash is not None:
+                    self._local_index.mark_para(para_hash, para_simhash)
+        
+        return result
+    
+    def flush(self):
+        """保留的段落写入全局存储"""
+        if self._pending_marks:
+            self.dedup_store.mark_paras(self._pending_marks)
+            self._pending_marks = []
+    
+    async def flush_async(self, async_store):
+        """flush() 的异步版本"""
+        if self._pending_marks:
+            await async_store.mark_paras(self._pending_marks)
+            self._pending_marks = []
+
+
+class PipelineStream:
+    """
+    流式管线：迭代得到清洗去重后的段落
+    
+    原始文本累计到 SEGMENT_CHARS 后在最后一个换行处切分并规范化，再在最后一个段落边界（双换行）处切出一段，
+    依次做噪声过滤、段落拆分、去重和格式标准化；边界之后的文本留到下一段。
+    不足 SEGMENT_CHARS 的文档只在结束时处理一次，结果与整篇处理完全一致；
+    更大的文档中，噪声模式不会跨越切段处的段落边界匹配。
+    文档 SHA-256 随原始文本块增量计算，迭代结束后填充 result。
+    """
+    
+    # 累计到该字符数后开始按段落边界切段处理
+    SEGMENT_CHARS = 1024 * 1024
+    # 超过该字符数仍没有段落边界时，退回在行边界（没有换行则直接）切段
+    MAX_SEGMENT_CHARS = 4 * 1024 * 1024
+    
+    def __init__(self, pipeline: TextPipeline, chunks: Iterable[str], doc_name: str = "unknown",
+                 paragraphs: bool = False, dedup_store: Optional[DedupStore] = None,
+                 paragraph_memo: Optional[ParagraphMemo] = None):
+        self.pipeline = pipeline
+        self.chunks = chunks
+        self.doc_name = doc_name
+        self.paragraphs = paragraphs
+        self.dedup_store = dedup_store or pipeline.dedup_store
+        self.stats = {
+            "original_length": 0,
+            "normalized_length": 0,
+            "normalize_slow_paragraphs": 0,
+            "noise_removed_count": 0,
+            "noise_pattern_hits": {},
+            "paragraphs_original": 0,
+            "paragraphs_after_dedup": 0,
+            "paragraphs_exact_dup": 0,
+            "paragraphs_near_dup": 0,
+            "paragraphs_too_short": 0,
+            "final_length": 0
+        }
+        # 迭代结束后填充
+        self.result: Optional[Dict] = None
+        self._deduper = _ParagraphDeduper(pipeline, doc_name, self.dedup_store, paragraph_memo)
+    
+    def __iter__(self) -> Iterator[str]:
+        return self._run()
+    
+    def _run(self) -> Iterator[str]:
+        for segment in self._iter_segments():
+            yield from self._emit(self._deduper.feed(self._split_segment(segment)))
+        
+        self._deduper.flush()
+        self._finish(self._doc_hash)
+    
+    async def run_async(self, async_store) -> List[str]:
+        """
+        异步执行管线（用于事件循环）：CPU 步骤在线程池执行，去重存储通过异步客户端访问
+        
+        切段与去重顺序和同步迭代完全一致，结果相同。
+        
+        Args:
+            async_store: 包装 self.dedup_store 的 AsyncDedupStore
+        
+        Returns:
+            清洗后的段落（result 同时填充）
+        """
+        segments = self._iter_segments()
+        output: List[str] = []
+        while True:
+            paragraphs = await asyncio.to_thread(self._next_segment_paragraphs, segments)
+            if paragraphs is None:
+                break
+            kept = await self._deduper.feed_async(paragraphs, async_store)
+            output.extend(self._emit(kept))
+        
+        await self._deduper.flush_async(async_store)
+        await self._finish_async(self._doc_hash, async_store)
+        return output
+    
+    def _next_segment_paragraphs(self, segments: Iterator[str]) -> Optional[List[str]]:
+        """读取并拆分下一段（没有更多文本时返回 None）"""
+        segment = next(segments, None)
+        return None if segment is None else self._split_segment(segment)
+    
+    def _iter_segments(self) -> Iterator[str]:
+        """逐段输出已规范化的文本（迭代结束后 _doc_hash 为原始文本的 SHA-256）"""
+        stats = self.stats
+        logger.info(f"[{self.doc_name}] 开始文本清洗与去重管线")
+        
+        hasher = hashlib.sha256()
+        pending_parts: List[str] = []  # 尚未规范化的原始文本块
+        pending_length = 0
+        buffer = ''  # 已规范化、尚未处理的文本
+        
+        for index, chunk in enumerate(self.chunks):
+            if self.paragraphs and index > 0:
+                chunk = '\n\n' + chunk
+            hasher.update(chunk.encode('utf-8'))
+            stats["original_length"] += len(chunk)
+            pending_parts.append(chunk)
+            pending_length += len(chunk)
+            if pending_length < self.SEGMENT_CHARS:
+                continue
+            
+            # 步骤2: 文本规范化（在最后一个换行处切分，\r\n 与连续空格不会被拆开）
+            pending = ''.join(pending_parts)
+            cut = pending.rfind('\n') + 1
+            if cut == 0:
+                # 没有换行的超长文本：直接切分（保留末尾的 \r 与下一块的 \n 一起处理）
+                cut = len(pending) - 1 if pending.endswith('\r') else len(pending)
+            buffer += self._normalize(pending[:cut])
+            pending_parts = [pending[cut:]]
+            pending_length = len(pending_parts[0])
+            
+            # 在最后一个段落边界处切段（没有段落边界时累计到 MAX_SEGMENT_CHARS 再按行切）
+            boundary = buffer.rfind('\n\n')
+            if boundary <= 0:
+                if len(buffer) < self.MAX_SEGMENT_CHARS:
+                    continue
+                boundary = buffer.rfind('\n')
+                if boundary <= 0:
+                    boundary = len(buffer)
+            segment, buffer = buffer[:boundary], buffer[boundary:]
+            yield segment
+        
+        if pending_length:
+            buffer += self._normalize(''.join(pending_parts))
+        if buffer:
+            yield buffer
+        self._doc_hash = hasher.hexdigest()
+    
+    def _normalize(self, text: str) -> str:
+        normalized, slow_count = self.pipeline._normalize_text(text)
+        self.stats["normalized_length"] += len(normalized)
+        self.stats["normalize_slow_paragraphs"] += slow_count
+        return normalized
+    
+    def _split_segment(self, segment: str) -> List[str]:
+        """一段已规范化的文本：噪声过滤 -> 段落拆分"""
+        pipeline = self.pipeline
+        stats = self.stats
+        
+        # 步骤3: 噪声过滤
+        cleaned, noise_hits = pipeline._noise_filter(segment)
+        stats["noise_removed_count"] += sum(noise_hits.values())
+        pattern_hits = stats["noise_pattern_hits"]
+        for pattern, count in noise_hits.items():
+            pattern_hits[pattern] = pattern_hits.get(pattern, 0) + count
+        
+        # 步骤4: 段落拆分
+        paragraphs = pipeline._split_paragraphs(cleaned)
+        stats["paragraphs_original"] += len(paragraphs)
+        return paragraphs
+    
+    def _emit(self, kept: List[str]) -> List[str]:
+        """步骤5~6: 去重后保留的段落做格式标准化并累计统计"""
+        stats = self.stats
+        paragraphs = self.pipeline._format_standardize(kept)
+        for para in paragraphs:
+            # 最终文本按双换行连接
+            stats["final_length"] += len(para) + (2 if stats["paragraphs_after_dedup"] else 0)
+            stats["paragraphs_after_dedup"] += 1
+        return paragraphs
+    
+    def _finish(self, doc_hash: str):
+        """汇总统计并做文档级去重"""
+        self._summarize()
+        
+        # 步骤1: 文档级去重（文档哈希在读取完成后才能得到，不影响清洗流程）
+        is_doc_duplicate = self.dedup_store.is_doc_seen(doc_hash)
+        if not is_doc_duplicate:
+            # 标记文档已处理（避免后续重复）
+            self.dedup_store.mark_doc(doc_hash)
+        self._set_result(doc_hash, is_doc_duplicate)
+    
+    async def _finish_async(self, doc_hash: str, async_store):
+        """_finish() 的异步版本"""
+        self._summarize()
+        is_doc_duplicate = await async_store.is_doc_seen(doc_hash)
+        if not is_doc_duplicate:
+            await async_store.mark_doc(doc_hash)
+        self._set_result(doc_hash, is_doc_duplicate)
+    
+    def _summarize(self):
+        """汇总段落去重统计"""
+        doc_name = self.doc_name
+        stats = self.stats
+        deduper = self._deduper
+        stats["paragraphs_exact_dup"] = deduper.exact_dup_count
+        stats["paragraphs_near_dup"] = deduper.near_dup_count
+        stats["paragraphs_too_short"] = deduper.too_short_count
+        logger.debug(f"[{doc_name}] 噪声过滤: 移除 {stats['noise_removed_count']} 处噪声")
+        logger.info(
+            f"[{doc_name}] 段落去重完成: {stats['paragraphs_original']} -> {stats['paragraphs_after_dedup']} "
+            f"(精确重复:{deduper.exact_dup_count}, 近重复:{deduper.near_dup_count}, 过短:{deduper.too_short_count})"
+        )
+    
+    def _set_result(self, doc_hash: str, is_doc_duplicate: bool):
+        """根据文档级去重结论填充 result"""
+        doc_name = self.doc_name
+        stats = self.stats
+        if is_doc_duplicate:
+            logger.info(f"[{doc_name}] 文档级去重命中: {doc_hash[:16]}...，已完成清洗以便后续使用")
+        
+        logger.info(f"[{doc_name}] 管线完成: {stats['original_length']} -> {stats['final_length']} 字符, {stats['paragraphs_after_dedup']} 段落")
+        
+        # 如果是去重文档，success=False 但仍返回清洗结果
+        if is_doc_duplicate:
+            self.result = {
+                "success": False,
+                "stats": stats,
+                "doc_duplicate": True,
+                "doc_hash": doc_hash,
+                "message": "文档已存在（完全重复）但已清洗"
+            }
+        else:
+            self.result = {
+                "success": True,
+                "stats": stats,
+                "doc_duplicate": False,
+                "doc_hash": doc_hash,
+                "message": "处理成功"
+            }
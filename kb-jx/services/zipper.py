@@ -1,142 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ZIP 打包服务 - 保留目录结构
+
+批量任务需要生成多个互相重叠的 ZIP 包（纯文本、富媒体、综合、独一份、重复、失败、临时文件），
+同一个源文件会出现在多个包中。打包分两步：
+1. 每个源文件只压缩一次，多个文件在线程池中并行压缩（zlib 压缩时释放 GIL）；
+   docx/xlsx/pptx/pdf/图片等本身已压缩的格式直接存储，不再重复压缩
+2. 压缩结果原样拼接到每个需要它的 ZIP 包中（只做文件复制）
+
+按需下载模式（ZIP_DOWNLOAD_MODE=stream）下任务结束时只保存各 ZIP 包的条目清单，
+下载时按清单边压缩边输出（本地文件头 + 数据描述符，支持 ZIP64），磁盘上不保存 ZIP 文件。
+"""
+import json
+import os
+import shutil
+import uuid
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
+from utils.logger import get_logger
 
+logger = get_logger("zipper")
 
-class ZipperService:
-    """ZIP 打包服务 - 保留目录结构"""
+# 本身已压缩的格式：直接存储（再次 DEFLATE 几乎不减小体积，只消耗 CPU）
+STORED_EXTENSIONS = {
+    '.docx', '.xlsx', '.pptx', '.pdf', '.png', '.jpg', '.jpeg', '.gif', '.webp',
+    '.zip', '.gz', '.7z', '.rar', '.mp3', '.mp4'
+}
+
+# 读取/压缩的分块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 按需下载模式的条目清单文件（与 ZIP 包位于同一目录）
+MANIFEST_NAME = "manifest.json"
+
+# (源文件路径, 归档路径)
+ZipEntry = Tuple[str, str]
+
+
+class _StreamBuffer:
+    """只写缓冲区：没有 tell/seek，zipfile 据此改用数据描述符，写入内容由生成器分块取走"""
     
     def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
         pass
     
-    def create_structured_zip(self, files: List[Dict], file_type: str, 
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipperService:
+    """ZIP 打包服务 - 保留目录结构"""
+    
+    def __init__(self, max_workers: int = 0, compress_level: int = zlib.Z_DEFAULT_COMPRESSION):
+        """
+        Args:
+            max_workers: 并行压缩/写入的线程数（0 = CPU 核数）
+            compress_level: DEFLATE 压缩级别
+        """
+        self.max_workers = max_workers or (os.cpu_count() or 1)
+        self.compress_level = compress_level
+    
+    def create_structured_zip(self, files: List[Dict], file_type: str,
                               task_id: str, output_dir: str) -> str:
         """
         创建保留目录结构的 ZIP 包
         file_type: 'converted' 或 'original'
-        
-        修复:
-        1. 归一化 ZIP 归档路径，统一使用正斜杠
-        2. 移除前导分隔符
         """
         zip_filename = f'{file_type}_{task_id}.zip'
-        zip_path = Path(output_dir) / zip_filename
+        return self.build_archives({zip_filename: self.structured_entries(files, file_type)}, output_dir)[zip_filename]
+    
+    def create_combined_zip(self, pure_files: List[Dict], rich_files: List[Dict],
+                           task_id: str, output_dir: str) -> str:
+        """创建包含所有文件的综合 ZIP 包（纯文本为转换后文件，富媒体为原文件）"""
+        zip_filename = f'all_{task_id}.zip'
+        return self.build_archives({zip_filename: self.combined_entries(pure_files, rich_files)}, output_dir)[zip_filename]
+    
+    def structured_entries(self, files: List[Dict], file_type: str) -> List[ZipEntry]:
+        """
+        文件信息列表 -> ZIP 条目
         
+        Args:
+            files: 文件信息（converted 使用 converted_file/converted_path，original 使用 original_file/path）
+            file_type: 'converted' 或 'original'
+        """
+        entries = []
+        for file_info in files:
+            if file_type == 'converted':
+                # 纯文字文档：使用转换后的路径
+                entry = self._make_entry(file_info.get('converted_file', ''), file_info.get('converted_path', ''))
+            else:
+                # 富媒体文档：使用原始路径
+                entry = self._make_entry(file_info.get('original_file', ''), file_info.get('path', ''))
+            if entry is None:
+                logger.warning(f"文件信息不完整，跳过: {file_info}")
+                continue
+            entries.append(entry)
+        return entries
+    
+    def combined_entries(self, pure_files: List[Dict], rich_files: List[Dict]) -> List[ZipEntry]:
+        """综合 ZIP 的条目：纯文字文档（转换后）+ 富媒体文档（原文件）"""
+        return self.structured_entries(pure_files, 'converted') + self.structured_entries(rich_files, 'original')
+    
+    @staticmethod
+    def _make_entry(source_file: str, arcname: str) -> Optional[ZipEntry]:
+        """归一化归档路径（Windows 反斜杠转正斜杠，移除前导斜杠）"""
+        if not source_file or not arcname:
+            return None
+        return str(source_file), arcname.replace('\\', '/').lstrip('/')
+    
+    def build_archives(self, archives: Dict[str, List[ZipEntry]], output_dir: str) -> Dict[str, str]:
+        """
+        一次生成多个 ZIP 包：每个源文件只压缩一次，结果拼接到所有包含它的 ZIP 包
+        
+        Args:
+            archives: {ZIP 文件名: [(源文件路径, 归档路径), ...]}
+            output_dir: 输出目录
+        
+        Returns:
+            {ZIP 文件名: ZIP 路径}（生成失败的包不包含在内）
+        
+        Raises:
+            Exception: 只请求了一个 ZIP 包且生成失败时抛出
+        """
+        output_dir = Path(output_dir)
+        member_dir = output_dir / f".members-{uuid.uuid4().hex}"
+        member_dir.mkdir(parents=True, exist_ok=True)
+        
+        sources = list(dict.fromkeys(source for entries in archives.values() for source, _ in entries))
+        results: Dict[str, str] = {}
+        errors: Dict[str, Exception] = {}
         try:
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for file_info in files:
-                    source_file = ''  # 初始化变量
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="kbjx-zip") as executor:
+                # 步骤1: 每个源文件压缩一次（并行）
+                packed = executor.map(
+                    lambda item: self._pack_member(item[1], member_dir / f"{item[0]}.bin"), enumerate(sources)
+                )
+                members = {source: member for source, member in zip(sources, packed) if member is not None}
+                
+                # 步骤2: 拼接各个 ZIP 包（并行，只做文件复制）
+                futures = {
+                    name: executor.submit(self._write_archive, output_dir / name, entries, members)
+                    for name, entries in archives.items()
+                }
+                for name, future in futures.items():
                     try:
-                        if file_type == 'converted':
-                            # 纯文字文档：使用转换后的路径
-                            source_file = file_info.get('converted_file', '')
-                            arcname = file_info.get('converted_path', '')
-                        else:
-                            # 富媒体文档：使用原始路径
-                            source_file = file_info.get('original_file', '')
-                            arcname = file_info.get('path', '')
-                        
-                        # 检查路径是否有效
-                        if not source_file or not arcname:
-                            print(f"警告: 文件信息不完整，跳过: {file_info}")
-                            continue
-                        
-                        # 修复：归一化路径（Windows 路径转为正斜杠，移除前导分隔符）
-                        arcname = arcname.replace('\\', '/')  # Windows 反斜杠转正斜杠
-                        if arcname.startswith('/'):
-                            arcname = arcname[1:]  # 移除前导斜杠
-                        
-                        # 添加文件到 ZIP
-                        if Path(source_file).exists():
-                            zf.write(source_file, arcname=arcname)
-                        else:
-                            print(f"警告: 文件不存在，跳过: {source_file}")
+                        results[name] = future.result()
                     except Exception as e:
-                        print(f"添加文件到 ZIP 失败: {source_file}, 错误: {e}")
-                        continue
-            
-            return str(zip_path)
+                        logger.error(f"创建 ZIP 文件失败: {name}, 错误: {e}")
+                        errors[name] = e
+        finally:
+            shutil.rmtree(member_dir, ignore_errors=True)
+        
+        if errors and len(archives) == 1:
+            raise next(iter(errors.values()))
+        return results
+    
+    def _pack_member(self, source_file: str, member_path: Path) -> Optional[Dict]:
+        """
+        压缩单个源文件（已压缩格式或压缩后没有变小时直接存储源文件）
+        
+        Returns:
+            {"path": 数据文件, "compress_type", "CRC", "file_size", "compress_size"}，源文件不存在时为 None
+        """
+        if not Path(source_file).is_file():
+            logger.warning(f"文件不存在，跳过: {source_file}")
+            return None
+        
+        try:
+            if Path(source_file).suffix.lower() not in STORED_EXTENSIONS:
+                crc, file_size = 0, 0
+                compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+                with open(source_file, 'rb') as src, open(member_path, 'wb') as dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        crc = zlib.crc32(chunk, crc)
+                        file_size += len(chunk)
+                        dst.write(compressor.compress(chunk))
+                    dst.write(compressor.flush())
+                compress_size = member_path.stat().st_size
+                if compress_size < file_size:
+                    return {
+                        "path": str(member_path), "compress_type": zipfile.ZIP_DEFLATED,
+                        "CRC": crc, "file_size": file_size, "compress_size": compress_size
+                    }
+                member_path.unlink()
             
+            crc, file_size = 0, 0
+            with open(source_file, 'rb') as src:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    file_size += len(chunk)
+            return {
+                "path": source_file, "compress_type": zipfile.ZIP_STORED,
+                "CRC": crc, "file_size": file_size, "compress_size": file_size
+            }
         except Exception as e:
-            print(f"创建 ZIP 文件失败: {e}")
-            # 清理部分创建的 ZIP 文件
-            if zip_path.exists():
-                try:
-                    zip_path.unlink()
-                except:
-                    pass
+            logger.error(f"压缩文件失败，跳过: {source_file}, 错误: {e}")
+            return None
+    
+    def _write_archive(self, zip_path: Path, entries: List[ZipEntry], members: Dict[str, Dict]) -> str:
+        """把已压缩的条目拼接为 ZIP 包（先写临时文件再原子替换）"""
+        tmp_path = zip_path.with_name(f".{zip_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with zipfile.ZipFile(tmp_path, 'w') as zf:
+                for source_file, arcname in entries:
+                    member = members.get(source_file)
+                    if member is None:
+                        continue
+                    zinfo = zipfile.ZipInfo.from_file(source_file, arcname)
+                    zinfo.compress_type = member["compress_type"]
+                    zinfo.CRC = member["CRC"]
+                    zinfo.file_size = member["file_size"]
+                    zinfo.compress_size = member["compress_size"]
+                    self._splice_member(zf, zinfo, member["path"])
+            os.replace(tmp_path, zip_path)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
             raise
+        return str(zip_path)
     
-    def create_combined_zip(self, pure_files: List[Dict], rich_files: List[Dict],
-                           task_id: str, output_dir: str) -> str:
+    @staticmethod
+    def _splice_member(zf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, data_path: str):
         """
-        创建包含所有文件的综合 ZIP 包
+        写入 CRC 与大小已知、数据已压缩的条目
         
-        修复:
-        1. 归一化 ZIP 归档路径，统一使用正斜杠
-        2. 移除前导分隔符
+        zipfile 没有写入预压缩数据的公开接口：这里按 ZipFile._open_to_write 的方式写本地文件头，
+        原样复制数据后登记条目，中央目录（含 ZIP64）仍由 ZipFile.close() 生成。
         """
-        zip_filename = f'all_{task_id}.zip'
-        zip_path = Path(output_dir) / zip_filename
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader())
+        with open(data_path, 'rb') as src:
+            shutil.copyfileobj(src, zf.fp, CHUNK_SIZE)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+    
+    def write_manifest(self, archives: Dict[str, List[ZipEntry]], output_dir: str) -> Dict[str, str]:
+        """
+        按需下载模式：只保存每个 ZIP 包的条目清单，不生成 ZIP 文件
+        
+        Args:
+            archives: {ZIP 文件名: [(源文件路径, 归档路径), ...]}
+            output_dir: 输出目录
         
+        Returns:
+            {ZIP 文件名: ZIP 路径}（路径上没有文件，下载时按清单流式生成）
+        """
+        output_dir = Path(output_dir)
+        manifest_path = output_dir / MANIFEST_NAME
+        tmp_path = manifest_path.with_name(f".{MANIFEST_NAME}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({name: [list(entry) for entry in entries] for name, entries in archives.items()},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+        return {name: str(output_dir / name) for name in archives}
+    
+    @staticmethod
+    def load_manifest_entries(zip_path: str) -> Optional[List[ZipEntry]]:
+        """
+        读取按需下载 ZIP 包的条目
+        
+        Returns:
+            [(源文件路径, 归档路径), ...]，没有清单或清单中没有该 ZIP 包时为 None
+        """
+        manifest_path = Path(zip_path).with_name(MANIFEST_NAME)
         try:
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                # 添加纯文字文档（转换后）
-                for file_info in pure_files:
-                    source_file = ''  # 初始化变量
-                    try:
-                        source_file = file_info.get('converted_file', '')
-                        arcname = file_info.get('converted_path', '')
-                        
-                        if not source_file or not arcname:
-                            print(f"警告: 纯文本文件信息不完整，跳过: {file_info}")
-                            continue
-                        
-                        # 修复：归一化路径
-                        arcname = arcname.replace('\\', '/')  # Windows 反斜杠转正斜杠
-                        if arcname.startswith('/'):
-                            arcname = arcname[1:]  # 移除前导斜杠
-                        
-                        if Path(source_file).exists():
-                            zf.write(source_file, arcname=arcname)
-                        else:
-                            print(f"警告: 文件不存在，跳过: {source_file}")
-                    except Exception as e:
-                        print(f"添加纯文本文件失败: {source_file}, 错误: {e}")
-                        continue
-                
-                # 添加富媒体文档（原文件）
-                for file_info in rich_files:
-                    source_file = ''  # 初始化变量
-                    try:
-                        source_file = file_info.get('original_file', '')
-                        arcname = file_info.get('path', '')
-                        
-                        if not source_file or not arcname:
-                            print(f"警告: 富媒体文件信息不完整，跳过: {file_info}")
-                            continue
-                        
-                        # 修复：归一化路径
-                        arcname = arcname.replace('\\', '/')  # Windows 反斜杠转正斜杠
-                        if arcname.startswith('/'):
-                            arcname = arcname[1:]  # 移除前导斜杠
-                        
-                        if Path(source_file).exists():
-                            zf.write(source_file, arcname=arcname)
-                        else:
-                            print(f"警告: 文件不存在，跳过: {source_file}")
-                    except Exception as e:
-                        print(f"添加富媒体文件失败: {source_file}, 错误: {e}")
-                        continue
-            
-            return str(zip_path)
-            
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
         except Exception as e:
-            print(f"创建综合 ZIP 文件失败: {e}")
-            # 清理部分创建的 ZIP 文件
-            if zip_path.exists():
+            logger.error(f"读取 ZIP 清单失败: {manifest_path}, 错误: {e}")
+            return None
+        entries = manifest.get(Path(zip_path).name)
+        return None if entries is None else [(source, arcname) for source, arcname in entries]
+    
+    def stream_archive(self, entries: List[ZipEntry]) -> Iterator[bytes]:
+        """
+        边压缩边输出 ZIP 包（本地文件头 + 数据 + 数据描述符，最后输出中央目录）
+        
+        每个条目写完文件头就输出，首字节时间与包大小无关；大文件与大包自动使用 ZIP64。
+        
+        Args:
+            entries: [(源文件路径, 归档路径), ...]
+        
+        Yields:
+            ZIP 数据块
+        """
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for source_file, arcname in entries:
                 try:
-                    zip_path.unlink()
-                except:
-                    pass
-            raise
+                    src = open(source_file, 'rb')
+                    zinfo = zipfile.ZipInfo.from_file(source_file, arcname)
+                except OSError as e:
+                    logger.warning(f"文件不存在，跳过: {source_file}, 错误: {e}")
+                    continue
+                if Path(source_file).suffix.lower() in STORED_EXTENSIONS:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                
+                with src, zf.open(zinfo, 'w') as dst:
+                    # 本地文件头（大小与 CRC 写在数据之后的数据描述符中）
+                    yield buffer.drain()
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                # 剩余压缩数据 + 数据描述符
+                yield buffer.drain()
+        # 中央目录（条目数或偏移超限时含 ZIP64 记录）
+        yield buffer.drain()
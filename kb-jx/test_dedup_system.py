@@ -4,12 +4,16 @@
 测试去重与清洗系统
 """
 import sys
+import asyncio
 from pathlib import Path
 
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.dedup_store import DedupStore, compute_sha256
+from utils.async_dedup_store import AsyncDedupStore
+from utils.paragraph_memo import ParagraphMemo
+from utils.bloom_filter import BloomFilter
 from services.text_pipeline import TextPipeline
 from utils.logger import setup_logger
 
@@ -127,6 +131,451 @@ def test_dedup_store_stats(dedup_store):
     print(f"  SimHash 数: {stats['simhash_count']}")
 
 
+def test_simhash_index():
+    """测试 SimHash 分块索引（内存后端）"""
+    print("\n" + "=" * 60)
+    print("测试: SimHash 分块索引")
+    print("=" * 60)
+    
+    store = DedupStore(backend="memory", simhash_max_distance=3)
+    base = 0x0123456789ABCDEF
+    store.mark_para("p1", base)
+    store.mark_para("p2", base ^ 0xFFFF0000FFFF0000)
+    
+    # 距离 3：翻转不同块中的 3 位，仍应命中
+    match = store.find_near_duplicate(base ^ (1 | (1 << 20) | (1 << 40)))
+    print(f"  距离3查询: {match}")
+    assert match == ("p1", 3)
+    
+    # 距离 4：超过阈值，不应命中
+    match = store.find_near_duplicate(base ^ (1 | (1 << 20) | (1 << 40) | (1 << 60)))
+    print(f"  距离4查询: {match}")
+    assert match is None
+    
+    # 结果与全量扫描一致
+    assert store.find_near_duplicate(base ^ 0xFFFF0000FFFF0000) == ("p2", 0)
+    print("✓ 分块索引查询正确")
+
+
+def test_memory_retention():
+    """测试内存后端的过期清理与 LRU 容量上限"""
+    print("\n" + "=" * 60)
+    print("测试: 去重数据过期与容量上限")
+    print("=" * 60)
+    
+    store = DedupStore(backend="memory", simhash_max_distance=3, para_ttl_days=90, max_memory_paras=2)
+    store.mark_paras([("p1", 0x1111), ("p2", 0x2222)])
+    assert store.is_para_seen("p1")  # p1 变为最近使用
+    store.mark_para("p3", 0x3333)
+    
+    # 超过上限：淘汰最久未使用的 p2，其指纹不再参与近重复比对
+    assert store.are_paras_seen(["p1", "p2", "p3"]) == [True, False, True]
+    assert store.find_near_duplicate(0x2222) is None
+    assert store.find_near_duplicate(0x3333) == ("p3", 0)
+    print("✓ LRU 淘汰正确")
+    
+    # 过期：清理后哈希、指纹与索引一并删除
+    store._memory_para_hashes["p1"] = 0
+    assert store.purge_expired() == 1
+    assert not store.is_para_seen("p1")
+    assert store.find_near_duplicate(0x1111) is None
+    stats = store.get_stats()
+    assert stats["para_count"] == 1 and stats["simhash_count"] == 1
+    print(f"  统计: {stats}")
+    print("✓ 过期清理正确")
+
+
+def test_namespaces():
+    """测试去重命名空间隔离与分片键名"""
+    print("\n" + "=" * 60)
+    print("测试: 去重命名空间与分片")
+    print("=" * 60)
+    
+    store = DedupStore(backend="memory", simhash_max_distance=3)
+    kb = store.for_namespace("kb1")
+    assert store.for_namespace("") is store and store.for_namespace("kb1") is kb
+    
+    # 不同命名空间互不去重
+    doc_hash = compute_sha256("知识库文档")
+    store.mark_doc(doc_hash)
+    store.mark_para("p1", 0x1111)
+    assert not kb.is_doc_seen(doc_hash) and not kb.is_para_seen("p1")
+    assert kb.find_near_duplicate(0x1111) is None
+    kb.mark_doc(doc_hash)
+    assert kb.is_doc_seen(doc_hash) and store.known_namespaces() == ["kb1"]
+    print("✓ 命名空间隔离正确")
+    
+    # 键名：默认命名空间与不分片时沿用原键名
+    assert store._get_para_key() == "kbjx:para:hashes"
+    sharded = DedupStore(backend="memory", hash_format="binary", namespace="kb1", shard_count=4)
+    assert sharded._get_para_key(3) == "kbjx:kb1:para:hashes:bin:4:3"
+    assert sharded._get_bloom_key() == "kbjx:kb1:para:bloom:bin"
+    shards = {sharded._shard_of(sharded.codec.pack_hash(compute_sha256(str(i)))) for i in range(100)}
+    assert shards == {0, 1, 2, 3}
+    
+    try:
+        store.for_namespace("kb 1")
+        assert False, "无效命名空间应抛出 ValueError"
+    except ValueError:
+        pass
+    print("✓ 分片键名正确")
+
+
+def test_async_pipeline():
+    """测试异步管线：结果与同步管线一致"""
+    print("\n" + "=" * 60)
+    print("测试: 异步去重管线")
+    print("=" * 60)
+    
+    text = "\n\n".join(f"第{i % 7}段：异步管线与同步管线的结果必须完全一致。" for i in range(30))
+    
+    def make_pipeline():
+        store = DedupStore(backend="memory", simhash_max_distance=3)
+        return TextPipeline(store, enable_cross_doc_dedup=True, async_dedup_store=AsyncDedupStore(store))
+    
+    sync_pipeline = make_pipeline()
+    expected = [sync_pipeline.process(text, "doc"), sync_pipeline.process(text, "doc")]
+    
+    async_pipeline = make_pipeline()
+    
+    async def run():
+        return [await async_pipeline.process_async(text, "doc"), await async_pipeline.process_async(text, "doc")]
+    
+    results = asyncio.run(run())
+    assert results == expected
+    assert results[0]["stats"]["paragraphs_after_dedup"] == 7 and results[1]["doc_duplicate"]
+    print("✓ 异步管线结果与同步管线一致")
+
+
+def test_paragraph_memo():
+    """测试批量任务内的段落指纹备忘：复用结果与重新计算一致"""
+    print("\n" + "=" * 60)
+    print("测试: 段落指纹备忘")
+    print("=" * 60)
+    
+    boilerplate = "免责声明：本文件仅供内部参考，未经许可不得外传。"
+    docs = [f"{boilerplate}\n\n第{i}份文档的正文内容，各不相同。\n\n{boilerplate}" for i in range(5)]
+    
+    plain = TextPipeline(DedupStore(backend="memory", simhash_max_distance=3))
+    memoized = TextPipeline(DedupStore(backend="memory", simhash_max_distance=3))
+    memo = ParagraphMemo(max_entries=100)
+    assert [memoized.process(doc, "doc", paragraph_memo=memo) for doc in docs] == [plain.process(doc, "doc") for doc in docs]
+    
+    # 每份文档查询 2 个不同段落，样板段落从第二份文档起命中
+    stats = memo.get_stats()
+    assert stats["lookups"] == 10 and stats["hits"] == 4, stats
+    print(f"✓ 备忘命中率: {stats['hit_rate']:.0%}")
+    
+    # 容量上限：按最近使用时间淘汰
+    small = ParagraphMemo(max_entries=2)
+    small.put_many({"a": ("ha", 1), "b": ("hb", 2)})
+    small.get_many(["a"])
+    small.put_many({"c": ("hc", 3)})
+    assert small.get_many(["a", "b", "c"]).keys() == {"a", "c"}
+    print("✓ 备忘 LRU 淘汰正确")
+
+
+def test_bloom_filter():
+    """测试段落布隆过滤器"""
+    print("\n" + "=" * 60)
+    print("测试: 布隆过滤器")
+    print("=" * 60)
+    
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [compute_sha256(f"段落{i}") for i in range(1000)]
+    bloom.add_many(added)
+    
+    # 已加入的元素一定命中
+    assert all(para_hash in bloom for para_hash in added)
+    
+    # 未加入的元素误判率接近目标值
+    false_positives = sum(compute_sha256(f"新段落{i}") in bloom for i in range(10000))
+    print(f"  误判: {false_positives}/10000, 估算误判率: {bloom.estimated_fpr:.4f}, 内存: {bloom.memory_bytes} 字节")
+    assert false_positives < 300
+    
+    # 位图可序列化后在其他进程载入
+    restored = BloomFilter(capacity=1000, error_rate=0.01)
+    restored.load(bloom.to_bytes())
+    assert all(para_hash in restored for para_hash in added)
+    print("✓ 布隆过滤器正确")
+
+
+def test_bloom_shared_rebuild():
+    """测试多进程共享布隆过滤器：其他进程重建（容量扩大）后不出现漏判"""
+    print("\n" + "=" * 60)
+    print("测试: 布隆过滤器跨进程重建")
+    print("=" * 60)
+    
+    try:
+        import fakeredis
+    except ImportError:
+        print("  未安装 fakeredis，跳过")
+        return
+    
+    server = fakeredis.FakeServer()
+    
+    def make_store():
+        return DedupStore(backend="redis", bloom_capacity=100, bloom_refresh_interval=3600,
+                          redis_client=fakeredis.FakeRedis(server=server))
+    
+    first, second = make_store(), make_store()
+    old_paras = [compute_sha256(f"旧段落{i}") for i in range(300)]
+    first.mark_paras([(para_hash, None) for para_hash in old_paras])
+    
+    # 第二个进程重建：容量扩大为段落数的 2 倍，位图换代
+    second._rebuild_para_bloom()
+    assert second._para_bloom.capacity == 600
+    
+    # 第一个进程仍持有旧代：写入时发现换代，切换到新位图并补写
+    new_paras = [compute_sha256(f"新段落{i}") for i in range(50)]
+    first.mark_paras([(para_hash, None) for para_hash in new_paras])
+    assert first._bloom_generation == second._bloom_generation
+    
+    second.refresh_para_bloom(0)
+    assert all(second.are_paras_seen(old_paras + new_paras))
+    assert all(first.are_paras_seen(old_paras + new_paras))
+    
+    # 刷新后新进程载入同一代位图
+    assert all(make_store().are_paras_seen(old_paras + new_paras))
+    print("✓ 重建后所有段落仍能命中")
+    
+    # 异步存储与同步存储共用刷新与补写逻辑
+    from fakeredis import aioredis as fake_aioredis
+    third = make_store()
+    async_store = AsyncDedupStore(third, _client=fake_aioredis.FakeRedis(server=server))
+    second._rebuild_para_bloom()
+    async_paras = [compute_sha256(f"异步段落{i}") for i in range(50)]
+    
+    async def run():
+        await async_store.mark_paras([(para_hash, None) for para_hash in async_paras])
+        third._next_bloom_refresh = 0
+        return await async_store.are_paras_seen(old_paras + new_paras + async_paras)
+    
+    assert all(asyncio.run(run())) and third._bloom_generation == second._bloom_generation
+    second.refresh_para_bloom(0)
+    assert all(second.are_paras_seen(async_paras))
+    print("✓ 异步存储重建后所有段落仍能命中")
+
+
+def test_task_queue():
+    """测试批量任务队列：领取、心跳、失效任务恢复与确认（SQLite / 内存 / Redis 5 兼容命令）"""
+    print("\n" + "=" * 60)
+    print("测试: 任务队列与心跳")
+    print("=" * 60)
+    
+    import tempfile
+    from utils.task_store import TaskStore
+    
+    def run(store: TaskStore, recovers: bool):
+        store.create_task("t1", {"status": "queued"})
+        assert store.enqueue("t1", {"files": []})
+        job = store.dequeue(timeout=1, worker="w1")
+        assert job["task_id"] == "t1" and job["payload"] == {"files": []}
+        
+        # 心跳刷新后未超时的任务不会被恢复
+        assert store.heartbeat(job, "w1")
+        assert store.recover_stale_jobs(3600) == 0
+        if not recovers:
+            assert store.ack(job) and store.dequeue(timeout=0, worker="w2") is None
+            return
+        
+        # 超时没有心跳：重新入队，原 worker 的心跳随即发现任务已不归自己；重复恢复不会重复入队
+        assert store.recover_stale_jobs(0) == 1
+        assert store.recover_stale_jobs(0) == 0
+        assert not store.heartbeat(job, "w1")
+        requeued = store.dequeue(timeout=1, worker="w2")
+        assert requeued["task_id"] == "t1"
+        assert store.heartbeat(requeued, "w2")
+        assert store.ack(requeued)
+        assert store.get_stats() == {"queued": 0, "processing": 0}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        run(TaskStore(backend="sqlite", sqlite_path=str(Path(tmp) / "tasks.db")), recovers=True)
+        print("✓ SQLite 队列正确")
+    run(TaskStore(backend="memory"), recovers=False)
+    print("✓ 内存队列正确")
+    
+    try:
+        import fakeredis
+        import redis
+    except ImportError:
+        print("  未安装 fakeredis，跳过 Redis 队列")
+        return
+    
+    class Redis5(fakeredis.FakeRedis):
+        """只支持 Redis 5.x 命令（部署清单使用 Redis 5.0.14）"""
+        
+        def blmove(self, *args, **kwargs):
+            raise redis.ResponseError("unknown command 'BLMOVE'")
+        
+        def lpos(self, *args, **kwargs):
+            raise redis.ResponseError("unknown command 'LPOS'")
+    
+    run(TaskStore(backend="redis", redis_client=Redis5(decode_responses=True)), recovers=True)
+    print("✓ Redis 队列正确（不依赖 Redis 6 命令）")
+
+
+def test_zip_archives():
+    """测试批量 ZIP 打包：拼接预压缩条目与流式生成的 ZIP 包可正常读回（含 ZIP64）"""
+    print("\n" + "=" * 60)
+    print("测试: ZIP 打包")
+    print("=" * 60)
+    
+    import io
+    import os
+    import struct
+    import tempfile
+    import zipfile
+    from unittest import mock
+    from services.zipper import ZipperService
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        # 可压缩文本、已压缩格式（直接存储）、中文路径；同一源文件出现在两个包中
+        sources = {
+            "text.txt": ("文本段落\n" * 5000).encode("utf-8"),
+            "scan.pdf": os.urandom(20000),
+            "目录/说明.md": "说明".encode("utf-8") * 100,
+        }
+        archives = {"a.zip": [], "b.zip": []}
+        for i, (arcname, data) in enumerate(sources.items()):
+            source = Path(tmp) / f"src{i}{Path(arcname).suffix}"
+            source.write_bytes(data)
+            archives["a.zip"].append((str(source), arcname))
+            if i != 1:
+                archives["b.zip"].append((str(source), f"b/{arcname}"))
+        
+        def check(zf: zipfile.ZipFile, prefix: str = ""):
+            assert zf.testzip() is None
+            for arcname, data in sources.items():
+                if f"{prefix}{arcname}" in zf.NameToInfo:
+                    assert zf.read(f"{prefix}{arcname}") == data
+        
+        zipper = ZipperService(max_workers=2)
+        out_dir = Path(tmp) / "out"
+        out_dir.mkdir()
+        paths = zipper.build_archives(archives, str(out_dir))
+        with zipfile.ZipFile(paths["a.zip"]) as zf:
+            assert zf.namelist() == list(sources)
+            assert zf.getinfo("text.txt").compress_type == zipfile.ZIP_DEFLATED
+            assert zf.getinfo("scan.pdf").compress_type == zipfile.ZIP_STORED
+            check(zf)
+        with zipfile.ZipFile(paths["b.zip"]) as zf:
+            assert len(zf.namelist()) == 2
+            check(zf, "b/")
+        with zipfile.ZipFile(io.BytesIO(b"".join(zipper.stream_archive(archives["a.zip"])))) as zf:
+            check(zf)
+        print("✓ 拼接与流式 ZIP 包读回一致")
+        
+        # ZIP64：调低 ZIP64 阈值，使条目大小与中央目录偏移都超过阈值，走与 4GB 以上文件相同的代码路径
+        with mock.patch.object(zipfile, "ZIP64_LIMIT", 1024):
+            paths = zipper.build_archives({"zip64.zip": archives["a.zip"]}, str(out_dir))
+            streamed = b"".join(zipper.stream_archive(archives["a.zip"]))
+        with open(paths["zip64.zip"], "rb") as f:
+            # 第一个条目的本地文件头：大小字段为 0xFFFFFFFF，实际大小在 ZIP64 扩展字段（0x0001）中
+            header = f.read(30)
+            compress_size, file_size, name_len, extra_len = struct.unpack("<II2H", header[18:30])
+            assert compress_size == file_size == 0xFFFFFFFF
+            f.seek(name_len, os.SEEK_CUR)
+            extra_id, _, zip64_size, zip64_compress = struct.unpack("<2HQQ", f.read(20))
+            assert extra_id == 0x0001 and zip64_size == len(sources["text.txt"]) and zip64_compress < zip64_size
+        with zipfile.ZipFile(paths["zip64.zip"]) as zf:
+            check(zf)
+        with zipfile.ZipFile(io.BytesIO(streamed)) as zf:
+            check(zf)
+        print("✓ ZIP64 文件头与中央目录可正常读回")
+
+
+def test_chunked_upload():
+    """测试可续传分块上传：偏移冲突与续传、分块/整文件校验、免传输命中与命名空间隔离"""
+    print("\n" + "=" * 60)
+    print("测试: 可续传分块上传")
+    print("=" * 60)
+    
+    import hashlib
+    import os
+    import tempfile
+    from unittest import mock
+    try:
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+    except ImportError:
+        print("  未安装 fastapi/httpx，跳过分块上传")
+        return
+    from api.v1 import endpoints
+    from utils.chunked_upload import ChunkedUploadStore
+    
+    data = os.urandom(30000)
+    sha = hashlib.sha256(data).hexdigest()
+    
+    async def broken_stream():
+        yield data[10000:15000]
+        raise ConnectionError("客户端断开")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ChunkedUploadStore(upload_dir=str(Path(tmp) / "uploads"))
+        app = FastAPI()
+        app.include_router(endpoints.router, prefix="/api/v1")
+        with mock.patch.object(endpoints, "upload_store", store), TestClient(app) as client:
+            upload_id = client.post("/api/v1/uploads", json={"filename": "dir/a.bin", "size": len(data)}).json()["upload_id"]
+            
+            # 分块校验失败回退到分块开始前，校验正确的分块才被接收
+            chunk = data[:10000]
+            r = client.patch(f"/api/v1/uploads/{upload_id}?offset=0", content=chunk, headers={"X-Chunk-SHA256": "0" * 64})
+            assert r.status_code == 400
+            assert client.get(f"/api/v1/uploads/{upload_id}").json()["offset"] == 0
+            r = client.patch(f"/api/v1/uploads/{upload_id}?offset=0", content=chunk,
+                             headers={"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest().upper()})
+            assert r.status_code == 200 and r.json()["offset"] == 10000
+            print("✓ X-Chunk-SHA256 校验失败返回 400 并回退")
+            
+            # 重传已接收的分块：409，detail.offset 为服务端偏移
+            r = client.patch(f"/api/v1/uploads/{upload_id}?offset=0", content=chunk)
+            assert r.status_code == 409 and r.json()["detail"]["offset"] == 10000
+            assert client.post(f"/api/v1/uploads/{upload_id}/analyze").status_code == 409
+            
+            # 接收中断：回退到分块开始前；另一个存储实例（其他进程/重启）从 .part 文件重建哈希后续传
+            try:
+                asyncio.run(store.write_chunk(upload_id, 10000, broken_stream()))
+                assert False, "接收中断应抛出异常"
+            except ConnectionError:
+                pass
+            assert store.get(upload_id)["offset"] == 10000
+            assert os.path.getsize(store._part_path(upload_id)) == 10000
+            store = ChunkedUploadStore(upload_dir=str(Path(tmp) / "uploads"))
+            endpoints.upload_store = store
+            r = client.patch(f"/api/v1/uploads/{upload_id}?offset=10000", content=data[10000:])
+            assert r.status_code == 200
+            assert r.json()["status"] == "complete" and r.json()["sha256"] == sha
+            print("✓ 偏移不一致返回 409，中断回退后可续传")
+            
+            # 声明的 SHA-256 与接收的数据不一致：400 并删除上传
+            other = client.post("/api/v1/uploads", json={"filename": "b.bin", "size": 100, "sha256": "1" * 64}).json()
+            r = client.patch(f"/api/v1/uploads/{other['upload_id']}?offset=0", content=os.urandom(100))
+            assert r.status_code == 400
+            assert client.get(f"/api/v1/uploads/{other['upload_id']}").status_code == 404
+            print("✓ 声明的 SHA-256 不一致返回 400 并删除上传")
+            
+            # 文件登记到命名空间 kbA 后，同一命名空间声明相同 SHA-256 直接完成，其他命名空间仍需上传
+            kept = Path(tmp) / "kept" / "a.bin"
+            store.claim(upload_id, kept, "kbA")
+            dup = client.post("/api/v1/uploads?namespace=kbA",
+                              json={"filename": "again/a.bin", "size": len(data), "sha256": sha.upper()}).json()
+            assert dup["duplicate"] and dup["status"] == "complete" and dup["offset"] == len(data)
+            fresh = client.post("/api/v1/uploads?namespace=kbB",
+                                json={"filename": "a.bin", "size": len(data), "sha256": sha}).json()
+            assert not fresh["duplicate"] and fresh["offset"] == 0
+            print("✓ 同一命名空间免传输命中，其他命名空间仍需上传")
+            
+            # 命中 kbA 文件的上传不能在其他命名空间使用
+            r = client.post(f"/api/v1/uploads/{dup['upload_id']}/analyze?namespace=kbB")
+            assert r.status_code == 403
+            r = client.post("/api/v1/documents/batch-from-uploads?namespace=kbB", json={"upload_ids": [dup["upload_id"]]})
+            assert r.status_code == 403
+            claimed = store.claim(dup["upload_id"], Path(tmp) / "kept" / "again.bin", "kbA")
+            assert Path(claimed["original_file"]).read_bytes() == data and claimed["sha256"] == sha
+            print("✓ 免传输命中的上传在其他命名空间使用返回 403")
+
+
 def test_dependencies():
     """测试依赖库"""
     print("\n" + "=" * 60)
@@ -165,6 +614,34 @@ def main():
     # 测试统计
     test_dedup_store_stats(dedup_store)
     
+    # 测试 SimHash 分块索引
+    test_simhash_index()
+    
+    # 测试过期与容量上限
+    test_memory_retention()
+    
+    # 测试布隆过滤器
+    test_bloom_filter()
+    test_bloom_shared_rebuild()
+    
+    # 测试命名空间与分片
+    test_namespaces()
+    
+    # 测试异步管线
+    test_async_pipeline()
+    
+    # 测试段落指纹备忘
+    test_paragraph_memo()
+    
+    # 测试 ZIP 打包
+    test_zip_archives()
+    
+    # 测试任务队列
+    test_task_queue()
+    
+    # 测试分块上传
+    test_chunked_upload()
+    
     print("\n" + "=" * 60)
     print("测试完成")
     print("=" * 60)
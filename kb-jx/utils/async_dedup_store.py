@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+异步去重存储 - 供 FastAPI 事件循环直接调用
+
+同步 DedupStore 使用阻塞的 redis.Redis 客户端，在 async 处理函数中调用时，Redis 延迟会卡住整个事件循环。
+AsyncDedupStore 使用 redis.asyncio 连接池访问同一份 Redis 数据：
+- 键空间（命名空间、存储格式、分片）、成员编码、过期规则与同步版本完全一致：
+  只通过 DedupStore 的 Redis 访问接口（doc_location、queue_mark_paras、bloom_prefilter 等）生成键名与解析结果
+- 段落布隆过滤器与同步版本共用（本地位数组 + Redis 位图）：位图刷新与换代后的补写很少发生，
+  直接在线程池中调用同步实现（容量变化时重新创建本地过滤器的逻辑只有一份）
+- 多个分片用 asyncio.gather 并发查询
+- 内存后端没有 IO，直接调用同步实现
+
+过期清理、索引重建、格式迁移等维护操作仍使用同步 DedupStore（CLI 工具与后台线程）。
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+from utils.logger import get_logger
+from utils.dedup_store import DedupStore
+
+# 安全导入 redis.asyncio（redis-py >= 4.2）
+try:
+    import redis.asyncio as aioredis
+    HAS_REDIS_ASYNCIO = True
+except ImportError:
+    HAS_REDIS_ASYNCIO = False
+
+logger = get_logger("async_dedup_store")
+
+
+class AsyncDedupStore:
+    """异步去重存储（包装同步 DedupStore，Redis 访问改为 redis.asyncio）"""
+    
+    def __init__(self, store: DedupStore, redis_config: Optional[Dict] = None, max_connections: int = 50,
+                 _client=None):
+        """
+        初始化异步去重存储
+        
+        Args:
+            store: 同步去重存储（提供键空间、编码、布隆过滤器与内存后端）
+            redis_config: Redis 配置 {"host": "127.0.0.1", "port": 6379, "db": 1, "password": "xxx"}
+            max_connections: 连接池最大连接数
+        """
+        self.store = store
+        self._redis = _client
+        self._namespace_stores: Dict[str, "AsyncDedupStore"] = {}
+        
+        if self._redis is None and store.backend == "redis":
+            if not HAS_REDIS_ASYNCIO:
+                logger.warning("redis.asyncio 不可用（需要 redis-py >= 4.2），异步去重存储不可用")
+                return
+            redis_config = redis_config or {}
+            pool = aioredis.ConnectionPool(
+                host=redis_config.get("host", "127.0.0.1"),
+                port=redis_config.get("port", 6379),
+                db=redis_config.get("db", 1),
+                password=redis_config.get("password"),
+                max_connections=max_connections,
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5
+            )
+            self._redis = aioredis.Redis(connection_pool=pool)
+            logger.info(f"异步去重存储已启用: 连接池上限 {max_connections}")
+    
+    @property
+    def available(self) -> bool:
+        """是否可以不经线程池直接在事件循环中使用（内存后端，或 Redis 后端且 redis.asyncio 可用）"""
+        return self.store.backend != "redis" or self._redis is not None
+    
+    @property
+    def _use_redis(self) -> bool:
+        return self.store.backend == "redis" and self._redis is not None
+    
+    def for_namespace(self, namespace: Optional[str]) -> "AsyncDedupStore":
+        """
+        获取指定命名空间的异步去重存储（共享连接池）
+        
+        Raises:
+            ValueError: 无效的命名空间
+        """
+        store = self.store.for_namespace(namespace)
+        if store is self.store:
+            return self
+        child = self._namespace_stores.get(store.namespace)
+        if child is None:
+            child = AsyncDedupStore(store, _client=self._redis)
+            self._namespace_stores[store.namespace] = child
+        return child
+    
+    async def is_doc_seen(self, doc_hash: str) -> bool:
+        """检查文档是否已存在（与 DedupStore.is_doc_seen 相同）"""
+        store = self.store
+        if not self._use_redis:
+            return store.is_doc_seen(doc_hash)
+        try:
+            key, member = store.doc_location(doc_hash)
+            expire_at = await self._redis.zscore(key, member)
+            return expire_at is not None and expire_at > time.time()
+        except Exception as e:
+            logger.error(f"Redis 查询失败: {e}")
+            return False
+    
+    async def mark_doc(self, doc_hash: str, ttl_days: Optional[int] = None) -> bool:
+        """标记文档已处理（与 DedupStore.mark_doc 相同）"""
+        store = self.store
+        if not self._use_redis:
+            return store.mark_doc(doc_hash, ttl_days)
+        expire_at = store.doc_expire_at(ttl_days)
+        try:
+            key, member = store.doc_location(doc_hash)
+            await self._redis.zadd(key, {member: expire_at})
+            return True
+        except Exception as e:
+            logger.error(f"Redis 写入失败: {e}")
+            return False
+    
+    async def are_paras_seen(self, para_hashes: List[str]) -> List[bool]:
+        """
+        批量检查段落是否已存在（布隆过滤器预过滤，多个分片并发查询）
+        
+        Returns:
+            与输入顺序一致的布尔列表
+        """
+        store = self.store
+        if not self._use_redis:
+            return store.are_paras_seen(para_hashes)
+        if not para_hashes:
+            return []
+        
+        now = time.time()
+        try:
+            members = [store.codec.pack_hash(para_hash) for para_hash in para_hashes]
+            if store.bloom_refresh_due(now):
+                await asyncio.to_thread(store.refresh_para_bloom, now)
+            prefiltered = store.bloom_prefilter(members)
+            if prefiltered is None:
+                return await self._redis_paras_seen(members, now)
+            
+            maybe, candidates = prefiltered
+            if not candidates:
+                return [False] * len(para_hashes)
+            return store.merge_bloom_results(maybe, await self._redis_paras_seen(candidates, now))
+        except Exception as e:
+            logger.error(f"Redis 批量查询失败: {e}")
+            return [False] * len(para_hashes)
+    
+    async def _redis_paras_seen(self, members: List[bytes], now: float) -> List[bool]:
+        """批量查询段落哈希是否存在且未过期（每个分片单次往返，分片之间并发）"""
+        groups = self.store.para_key_groups(members)
+        results = await asyncio.gather(*(self._zmscore(key, key_members) for key, key_members in groups.items()))
+        scores = {}
+        for key_members, key_scores in zip(groups.values(), results):
+            scores.update(zip(key_members, key_scores))
+        # 已过期但尚未清理的成员视为不存在
+        return [scores[member] is not None and scores[member] > now for member in members]
+    
+    async def _zmscore(self, key: str, members: List[bytes]) -> List[Optional[float]]:
+        """批量查询有序集合成员的分数（单次往返，旧版本 Redis 退化为管道 ZSCORE）"""
+        try:
+            return await self._redis.zmscore(key, members)
+        except Exception as e:
+            if "unknown command" not in str(e).lower():
+                raise
+            pipe = self._redis.pipeline(transaction=False)
+            for member in members:
+                pipe.zscore(key, member)
+            return await pipe.execute()
+    
+    async def mark_paras(self, items: List[Tuple[str, Optional[int]]]) -> bool:
+        """批量标记段落已处理（管道单次往返写入，与 DedupStore.mark_paras 相同）"""
+        store = self.store
+        if not self._use_redis:
+            return store.mark_paras(items)
+        if not items:
+            return True
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            bloom_write = store.queue_mark_paras(pipe, items)
+            results = await pipe.execute()
+            if bloom_write is not None and store.bloom_sync_stale(results[-1], bloom_write[1]):
+                # 其他进程重建了布隆过滤器：位图写到了旧代，载入新位图后补写
+                await asyncio.to_thread(store.confirm_bloom_sync, results[-1], *bloom_write)
+            return True
+        except Exception as e:
+            logger.error(f"Redis 写入失败: {e}")
+            return False
+    
+    async def find_near_duplicates(self, simhash_values: List[int],
+                                   max_distance: Optional[int] = None) -> List[Optional[Tuple[str, int]]]:
+        """
+        批量查找近重复段落（分块索引单次往返，与 DedupStore.find_near_duplicates 相同）
+        
+        Returns:
+            与输入顺序一致的 [(para_hash, 汉明距离) 或 None, ...]
+        """
+        store = self.store
+        if not self._use_redis:
+            return store.find_near_duplicates(simhash_values, max_distance)
+        if not simhash_values:
+            return []
+        if max_distance is None:
+            max_distance = store.simhash_max_distance
+        
+        try:
+            if max_distance > store.simhash_max_distance:
+                # 索引无法保证召回，退化为全量比对
+                logger.debug(f"查询距离 {max_distance} 超过索引上限 {store.simhash_max_distance}，使用全量扫描")
+                raw_shards = await asyncio.gather(*(self._redis.hgetall(key) for key in store.simhash_keys()))
+                unpack_simhash = store.codec.unpack_simhash
+                all_simhash = {member: unpack_simhash(value) for raw in raw_shards for member, value in raw.items()}
+                candidates_list = [all_simhash] * len(simhash_values)
+            else:
+                bucket_keys = store.simhash_bucket_keys(simhash_values)
+                pipe = self._redis.pipeline(transaction=False)
+                for key in bucket_keys:
+                    pipe.hgetall(key)
+                candidates_list = store.collect_simhash_candidates(simhash_values, bucket_keys, await pipe.execute())
+        except Exception as e:
+            logger.error(f"Redis 查询失败: {e}")
+            return [None] * len(simhash_values)
+        return store.best_matches(simhash_values, candidates_list, max_distance)
+    
+    async def get_stats(self) -> Dict:
+        """获取去重统计信息（与 DedupStore.get_stats 相同）"""
+        store = self.store
+        if not self._use_redis:
+            return store.get_stats()
+        doc_keys, para_keys, simhash_keys = store.stats_keys()
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for key in doc_keys:
+                pipe.zcard(key)
+            for key in para_keys:
+                pipe.zcard(key)
+            for key in simhash_keys:
+                pipe.hlen(key)
+            counts = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis 统计失败: {e}")
+            return {"doc_count": 0, "para_count": 0, "simhash_count": 0}
+        
+        para_end = len(doc_keys) + len(para_keys)
+        return store.redis_stats(sum(counts[:len(doc_keys)]), sum(counts[len(doc_keys):para_end]), sum(counts[para_end:]))
+    
+    async def close(self):
+        """关闭连接池（命名空间子存储共享同一个连接池）"""
+        if self._redis is not None:
+            await self._redis.aclose() if hasattr(self._redis, "aclose") else await self._redis.close()
+            self._redis = None
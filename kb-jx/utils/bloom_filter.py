@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+布隆过滤器 - 段落哈希的进程内预过滤
+
+位数组的字节与位顺序与 Redis 位图（SETBIT/GET）一致：第 n 位位于第 n // 8 个字节的高位起第 n % 8 位，
+同一位图可以直接在 Redis 中共享（写入方 SETBIT，其他进程 GET 后整体载入）。
+位置由键的 BLAKE2b 摘要做双重哈希得到，跨进程稳定。
+"""
+import hashlib
+import math
+from typing import Iterable, List, Tuple, Union
+
+
+class BloomFilter:
+    """布隆过滤器（只增不删，不存在的判断是确定的）"""
+    
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Args:
+            capacity: 预期元素数
+            error_rate: 元素数达到 capacity 时的目标误判率
+        """
+        self.capacity = max(1, capacity)
+        self.error_rate = min(max(error_rate, 1e-9), 0.5)
+        self.num_bits, self.num_hashes = self.optimal_params(self.capacity, self.error_rate)
+        self._bits = bytearray(self.num_bits // 8)
+    
+    @staticmethod
+    def optimal_params(capacity: int, error_rate: float) -> Tuple[int, int]:
+        """
+        计算位数组大小与哈希函数个数
+        
+        Returns:
+            (位数（8 的倍数）, 哈希函数个数)
+        """
+        num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        num_bits = max(64, (num_bits + 7) // 8 * 8)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return num_bits, num_hashes
+    
+    def positions(self, key: Union[str, bytes]) -> List[int]:
+        """键对应的位位置（字符串按 UTF-8 编码）"""
+        data = key if isinstance(key, bytes) else key.encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+    
+    def add(self, key: Union[str, bytes]) -> List[int]:
+        """
+        加入元素
+        
+        Returns:
+            置位的位置（用于同步到 Redis 位图）
+        """
+        positions = self.positions(key)
+        bits = self._bits
+        for position in positions:
+            bits[position >> 3] |= 0x80 >> (position & 7)
+        return positions
+    
+    def add_many(self, keys: Iterable[Union[str, bytes]]):
+        """批量加入元素"""
+        for key in keys:
+            self.add(key)
+    
+    def __contains__(self, key: Union[str, bytes]) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (0x80 >> (position & 7)) for position in self.positions(key))
+    
+    def to_bytes(self) -> bytes:
+        """位数组（与 Redis 位图格式一致）"""
+        return bytes(self._bits)
+    
+    def load(self, data: bytes):
+        """载入位数组（长度不足时补零：Redis 位图只保存到最高的置位字节）"""
+        size = self.num_bits // 8
+        self._bits = bytearray(data[:size].ljust(size, b'\x00'))
+    
+    @property
+    def memory_bytes(self) -> int:
+        """位数组占用的内存（字节）"""
+        return len(self._bits)
+    
+    @property
+    def fill_ratio(self) -> float:
+        """已置位的比例"""
+        return int.from_bytes(self._bits, 'big').bit_count() / self.num_bits
+    
+    @property
+    def estimated_fpr(self) -> float:
+        """按当前置位比例估算的误判率"""
+        return self.fill_ratio ** self.num_hashes
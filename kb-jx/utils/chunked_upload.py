@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+可续传分块上传 - 大文件按偏移分块上传，断线后从已接收的位置继续
+
+协议（与 tus 的偏移模型相同）：
+1. 创建上传：声明文件名、大小，可选声明整个文件的 SHA-256
+2. 按顺序上传分块：每块携带起始偏移，可选携带分块 SHA-256 校验；偏移不符时返回服务端当前偏移
+3. 断线后查询上传状态得到当前偏移，从该位置继续
+4. 接收完整后，文件移动到目标位置（单文件分析的 storage/original 或批量任务目录）
+
+数据边接收边写入 uploads 目录下的 .part 文件，同时增量计算整个文件的 SHA-256，完成时无需再读一遍。
+声明了 SHA-256 且同一命名空间中已有相同内容的文件（此前分块上传或批量上传保存过）时，
+上传直接完成，不再传输数据，使用时从已有文件硬链接/复制。
+免传输只凭客户端声明的哈希，知道某个文件 SHA-256 的人即可取得该文件的内容（转换结果），
+因此按命名空间隔离：文件只登记在使用它的命名空间下，命中的上传也只能在创建时的命名空间中使用。
+命名空间不是访问控制，上传方之间互不信任时应关闭免传输（dedup=False）。
+
+上传状态保存在 SQLite（同一存储目录下多进程共享），未完成的上传超过保留时间后清理。
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+from utils.logger import get_logger
+
+logger = get_logger("chunked_upload")
+
+# 分块写入中的上传超过该时长没有心跳视为写入中断（进程崩溃或连接停滞），允许重新写入
+WRITE_LOCK_SECONDS = 300
+# 写入期间刷新写入锁的间隔（远小于 WRITE_LOCK_SECONDS）
+WRITE_HEARTBEAT_SECONDS = 30
+# 接收的数据攒到该大小后在线程中写入 .part 文件
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+SESSION_FIELDS = (
+    "upload_id", "filename", "size", "offset", "sha256", "file_sha256",
+    "status", "duplicate_of", "namespace", "created_at", "updated_at"
+)
+
+
+class UploadOffsetMismatch(ValueError):
+    """分块起始偏移与服务端已接收的字节数不一致"""
+    
+    def __init__(self, expected: int, received: int):
+        super().__init__(f"分块偏移不匹配或该上传正在写入: 服务端已接收 {expected} 字节，分块偏移 {received}")
+        self.expected = expected
+
+
+class UploadNamespaceMismatch(ValueError):
+    """免传输命中的上传不在创建时的命名空间中使用"""
+
+
+class _ChunkWriter:
+    """分块写入中的 .part 文件与增量哈希（write 在线程中调用）"""
+    
+    def __init__(self, f, hasher: "hashlib._Hash"):
+        self.f = f
+        self.hasher = hasher
+        self.chunk_hasher = hashlib.sha256()
+    
+    def write(self, data: bytes):
+        """写入数据并更新整个文件与分块的哈希"""
+        if data:
+            self.f.write(data)
+            self.hasher.update(data)
+            self.chunk_hasher.update(data)
+    
+    def close(self):
+        """关闭文件（可重复调用）"""
+        self.f.close()
+
+
+class ChunkedUploadStore:
+    """可续传分块上传的状态与数据存储"""
+    
+    def __init__(self, upload_dir: str = "storage/uploads", max_chunk_size: int = 64 * 1024 * 1024,
+                 ttl_hours: int = 24, dedup: bool = True):
+        """
+        初始化上传存储
+        
+        Args:
+            upload_dir: 未完成上传的数据与状态数据库目录
+            max_chunk_size: 单个分块的最大字节数
+            ttl_hours: 未完成上传的保留时长（小时）
+            dedup: 声明的 SHA-256 命中同一命名空间已有文件时是否免传输
+        """
+        self.upload_dir = Path(upload_dir)
+        self.index_path = str(self.upload_dir / "uploads.db")
+        self.max_chunk_size = max_chunk_size
+        self.ttl_seconds = max(1, ttl_hours) * 3600
+        self.dedup = dedup
+        # {upload_id: (已哈希的字节数, 增量 SHA-256)}；多进程或重启后缺失时从 .part 文件重建
+        self._hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+        self._init_sqlite()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """创建 SQLite 连接（每次操作独立连接，线程/进程安全）"""
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def _init_sqlite(self):
+        """初始化 SQLite 表结构"""
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "upload_id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, "
+                "offset INTEGER NOT NULL DEFAULT 0, sha256 TEXT, file_sha256 TEXT, "
+                "status TEXT NOT NULL DEFAULT 'uploading', duplicate_of TEXT, "
+                "namespace TEXT NOT NULL DEFAULT '', "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, writer TEXT)"
+            )
+            # 旧版本创建的表没有写入锁标识与命名空间列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(uploads)")}
+            if "writer" not in columns:
+                conn.execute("ALTER TABLE uploads ADD COLUMN writer TEXT")
+            if "namespace" not in columns:
+                conn.execute("ALTER TABLE uploads ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+            # 旧版本的内容索引不区分命名空间，无法确定文件属于哪个命名空间：丢弃（只影响免传输）
+            file_columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+            if file_columns and "namespace" not in file_columns:
+                conn.execute("DROP TABLE files")
+                logger.info("上传内容索引已升级为按命名空间隔离，旧索引已丢弃")
+            # 已完成上传的内容索引：(命名空间, SHA-256) -> 文件最终位置（用于重复文件免传输）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "namespace TEXT NOT NULL, sha256 TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "registered_at REAL NOT NULL, PRIMARY KEY (namespace, sha256))"
+            )
+        finally:
+            conn.close()
+    
+    def _part_path(self, upload_id: str) -> Path:
+        """未完成上传的数据文件"""
+        return self.upload_dir / f"{upload_id}.part"
+    
+    # ========== 上传状态 ==========
+    
+    def create(self, filename: str, size: int, sha256: Optional[str] = None, namespace: str = "") -> Dict:
+        """
+        创建上传
+        
+        声明的 SHA-256 与同一命名空间的已有文件相同（且大小一致）时直接完成，不需要上传数据。
+        
+        Args:
+            filename: 文件名（可含相对路径）
+            size: 文件总字节数
+            sha256: 整个文件的 SHA-256（可选，十六进制）
+            namespace: 使用该上传的命名空间（免传输只匹配该命名空间登记的文件）
+        
+        Returns:
+            上传状态
+        
+        Raises:
+            ValueError: 参数无效
+        """
+        if size < 0:
+            raise ValueError(f"文件大小无效: {size}")
+        if sha256 is not None:
+            sha256 = sha256.lower()
+            if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+                raise ValueError(f"SHA-256 格式无效: {sha256}")
+        
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        status, offset, file_sha256, duplicate_of = "uploading", 0, None, None
+        
+        existing = self.find_file(sha256, size, namespace) if sha256 and self.dedup else None
+        if existing is not None:
+            status, offset, file_sha256, duplicate_of = "complete", size, sha256, existing
+            logger.info(f"上传命中已有文件，无需传输: {filename} -> {existing}")
+        elif size == 0:
+            status, file_sha256 = "complete", hashlib.sha256().hexdigest()
+        
+        if duplicate_of is None:
+            self._part_path(upload_id).touch()
+        
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO uploads (upload_id, filename, size, offset, sha256, file_sha256, status, "
+                "duplicate_of, namespace, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, filename, size, offset, sha256, file_sha256, status, duplicate_of, namespace, now, now)
+            )
+        finally:
+            conn.close()
+        
+        if file_sha256 and duplicate_of is None:
+            self._verify_declared_hash(upload_id, sha256, file_sha256)
+        return self.get(upload_id)
+    
+    def get(self, upload_id: str) -> Optional[Dict]:
+        """
+        获取上传状态
+        
+        Returns:
+            {"upload_id", "filename", "size", "offset", "sha256", "file_sha256", "status", "duplicate_of",
+             "namespace", ...}，
+            不存在返回 None
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(SESSION_FIELDS)} FROM uploads WHERE upload_id = ?", (upload_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(zip(SESSION_FIELDS, row)) if row else None
+    
+    def abort(self, upload_id: str) -> bool:
+        """
+        取消上传，删除已接收的数据
+        
+        Returns:
+            上传是否存在
+        """
+        conn = self._connect()
+        try:
+            deleted = conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,)).rowcount
+        finally:
+            conn.close()
+        self._part_path(upload_id).unlink(missing_ok=True)
+        self._hashers.pop(upload_id, None)
+        return deleted > 0
+    
+    # ========== 分块写入 ==========
+    
+    async def write_chunk(self, upload_id: str, offset: int, stream: AsyncIterator[bytes],
+                          chunk_sha256: Optional[str] = None) -> Dict:
+        """
+        接收一个分块（数据边接收边写入 .part 文件）
+        
+        SQLite、文件读写与哈希计算都在线程中执行，不阻塞事件循环；接收的数据攒到 WRITE_BUFFER_SIZE 再写入。
+        写入期间每隔 WRITE_HEARTBEAT_SECONDS 刷新写入锁，慢速连接上传大分块时锁不会过期；
+        锁因长时间收不到数据而过期并被其他请求接管后，本次写入停止且不再改动 .part 文件。
+        分块校验失败、超出声明大小或接收中断时回退到分块开始前的偏移，客户端可重传该分块。
+        
+        Args:
+            upload_id: 上传 ID
+            offset: 分块在文件中的起始偏移（必须等于服务端已接收的字节数）
+            stream: 分块数据（request.stream()）
+            chunk_sha256: 分块的 SHA-256（可选，十六进制）
+        
+        Returns:
+            写入后的上传状态（接收完整时 status 为 complete）
+        
+        Raises:
+            UploadOffsetMismatch: 偏移与已接收字节数不一致（或其他请求正在写入）
+            ValueError: 上传不存在、已完成、分块校验失败或超出大小
+        """
+        session, token = await asyncio.to_thread(self._claim_write, upload_id, offset)
+        writer = None
+        try:
+            writer = await asyncio.to_thread(self._open_writer, upload_id, offset)
+            buffer = bytearray()
+            written = 0
+            heartbeat_at = time.monotonic()
+            async for data in stream:
+                if not data:
+                    continue
+                written += len(data)
+                if written > self.max_chunk_size:
+                    raise ValueError(f"分块超过上限 {self.max_chunk_size} 字节")
+                if offset + written > session["size"]:
+                    raise ValueError(f"数据超过声明的文件大小 {session['size']} 字节")
+                buffer += data
+                if time.monotonic() - heartbeat_at >= WRITE_HEARTBEAT_SECONDS:
+                    # 先确认仍持有写入锁再写入（锁过期被接管后不能再写同一个 .part 文件）
+                    await asyncio.to_thread(self._refresh_write, upload_id, token, offset)
+                    heartbeat_at = time.monotonic()
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await asyncio.to_thread(writer.write, bytes(buffer))
+                    buffer.clear()
+            if time.monotonic() - heartbeat_at >= WRITE_HEARTBEAT_SECONDS:
+                await asyncio.to_thread(self._refresh_write, upload_id, token, offset)
+            await asyncio.to_thread(writer.write, bytes(buffer))
+            await asyncio.to_thread(writer.close)
+            
+            if chunk_sha256 and writer.chunk_hasher.hexdigest() != chunk_sha256.lower():
+                raise ValueError("分块 SHA-256 校验失败")
+        except BaseException:
+            await asyncio.to_thread(self._rollback_write, upload_id, token, offset, writer)
+            raise
+        
+        return await asyncio.to_thread(self._finish_write, session, token, offset + written, writer.hasher)
+    
+    def _claim_write(self, upload_id: str, offset: int) -> Tuple[Dict, str]:
+        """
+        标记上传为写入中（同一上传同一时刻只允许一个分块写入，跨进程有效）
+        
+        Returns:
+            (上传状态, 写入锁标识)
+        """
+        session = self.get(upload_id)
+        if session is None:
+            raise ValueError(f"上传不存在: {upload_id}")
+        if session["status"] == "complete":
+            raise ValueError("上传已完成")
+        
+        token = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            claimed = conn.execute(
+                "UPDATE uploads SET status = 'writing', writer = ?, updated_at = ? WHERE upload_id = ? AND offset = ? "
+                "AND (status = 'uploading' OR (status = 'writing' AND updated_at < ?))",
+                (token, now, upload_id, offset, now - WRITE_LOCK_SECONDS)
+            ).rowcount
+        finally:
+            conn.close()
+        if not claimed:
+            raise UploadOffsetMismatch(session["offset"], offset)
+        return session, token
+    
+    def _refresh_write(self, upload_id: str, token: str, offset: int):
+        """
+        刷新写入锁（心跳）
+        
+        Raises:
+            UploadOffsetMismatch: 写入锁已过期并被其他请求接管（或上传已被取消）
+        """
+        conn = self._connect()
+        try:
+            refreshed = conn.execute(
+                "UPDATE uploads SET updated_at = ? WHERE upload_id = ? AND status = 'writing' AND writer = ?",
+                (time.time(), upload_id, token)
+            ).rowcount
+        finally:
+            conn.close()
+        if not refreshed:
+            raise UploadOffsetMismatch(offset, offset)
+    
+    def _release_write(self, upload_id: str, token: str, offset: int, status: str = "uploading",
+                       file_sha256: Optional[str] = None) -> bool:
+        """
+        写入结束：记录新偏移与状态
+        
+        Returns:
+            是否仍持有写入锁（锁已被接管时不做任何修改）
+        """
+        conn = self._connect()
+        try:
+            released = conn.execute(
+                "UPDATE uploads SET offset = ?, status = ?, file_sha256 = ?, writer = NULL, updated_at = ? "
+                "WHERE upload_id = ? AND status = 'writing' AND writer = ?",
+                (offset, status, file_sha256, time.time(), upload_id, token)
+            ).rowcount
+        finally:
+            conn.close()
+        return released > 0
+    
+    def _open_writer(self, upload_id: str, offset: int) -> "_ChunkWriter":
+        """打开 .part 文件并截断到 offset（上次写入中断可能留下超出偏移的数据）"""
+        hasher = self._file_hasher(upload_id, offset)
+        f = open(self._part_path(upload_id), "r+b")
+        try:
+            f.truncate(offset)
+            f.seek(offset)
+        except BaseException:
+            f.close()
+            raise
+        return _ChunkWriter(f, hasher)
+    
+    def _rollback_write(self, upload_id: str, token: str, offset: int, writer: Optional["_ChunkWriter"]):
+        """分块写入失败：回退到分块开始前（增量哈希在分块成功后才保存，无需回退）"""
+        if writer is not None:
+            writer.close()
+        try:
+            # 写入锁已被接管时 .part 文件属于新的写入，不能截断
+            self._refresh_write(upload_id, token, offset)
+        except UploadOffsetMismatch:
+            logger.warning(f"分块写入锁已被接管，放弃回退: {upload_id}")
+            return
+        with open(self._part_path(upload_id), "r+b") as f:
+            f.truncate(offset)
+        self._release_write(upload_id, token, offset)
+    
+    def _finish_write(self, session: Dict, token: str, new_offset: int, hasher: "hashlib._Hash") -> Dict:
+        """分块写入成功：保存增量哈希与新偏移，接收完整时校验声明的 SHA-256"""
+        upload_id = session["upload_id"]
+        if new_offset < session["size"]:
+            if not self._release_write(upload_id, token, new_offset):
+                raise UploadOffsetMismatch(session["offset"], session["offset"])
+            self._hashers[upload_id] = (new_offset, hasher)
+            return self.get(upload_id)
+        
+        file_sha256 = hasher.hexdigest()
+        self._hashers.pop(upload_id, None)
+        if not self._release_write(upload_id, token, new_offset, status="complete", file_sha256=file_sha256):
+            raise UploadOffsetMismatch(session["offset"], session["offset"])
+        self._verify_declared_hash(upload_id, session["sha256"], file_sha256)
+        logger.info(f"分块上传完成: {session['filename']} ({new_offset} bytes, sha256={file_sha256[:16]}...)")
+        return self.get(upload_id)
+    
+    def _file_hasher(self, upload_id: str, offset: int) -> "hashlib._Hash":
+        """
+        offset 之前数据的增量 SHA-256（副本，分块成功后才替换）
+        
+        其他进程接收了之后的分块时，从本进程已哈希的位置补读新增的数据，
+        每个进程对每个字节最多读一次；缓存缺失（进程重启）时才从头重建。
+        """
+        cached = self._hashers.get(upload_id)
+        if cached is not None and cached[0] <= offset:
+            position, hasher = cached[0], cached[1].copy()
+        else:
+            position, hasher = 0, hashlib.sha256()
+        
+        remaining = offset - position
+        if remaining > 0:
+            with open(self._part_path(upload_id), "rb") as f:
+                f.seek(position)
+                while remaining > 0:
+                    data = f.read(min(remaining, 1024 * 1024))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    remaining -= len(data)
+        return hasher
+    
+    def _verify_declared_hash(self, upload_id: str, declared: Optional[str], actual: str):
+        """
+        校验声明的 SHA-256（不一致时删除上传）
+        
+        Raises:
+            ValueError: 声明的 SHA-256 与接收的数据不一致
+        """
+        if declared and declared != actual:
+            self.abort(upload_id)
+            raise ValueError(f"文件 SHA-256 与声明不一致: 声明 {declared[:16]}..., 实际 {actual[:16]}...")
+    
+    # ========== 完成后使用 ==========
+    
+    def claim(self, upload_id: str, destination: Path, namespace: str = "") -> Dict:
+        """
+        把已完成的上传移动到目标位置，并登记到命名空间的内容索引
+        
+        重复文件（创建时命中已有文件）从已有文件硬链接，跨文件系统时复制。
+        
+        Args:
+            upload_id: 上传 ID
+            destination: 目标文件路径
+            namespace: 使用该文件的命名空间
+        
+        Returns:
+            {"filename", "original_file", "sha256", "size"}
+        
+        Raises:
+            ValueError: 上传不存在、尚未完成，或重复文件不在创建时的命名空间中使用
+        """
+        session = self.get(upload_id)
+        if session is None:
+            raise ValueError(f"上传不存在: {upload_id}")
+        if session["status"] != "complete":
+            raise ValueError(f"上传未完成: {session['filename']} ({session['offset']}/{session['size']} bytes)")
+        check_upload_namespace(session, namespace)
+        
+        destination = Path(destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if session["duplicate_of"]:
+            try:
+                os.link(session["duplicate_of"], destination)
+            except OSError:
+                shutil.copyfile(session["duplicate_of"], destination)
+        else:
+            os.replace(self._part_path(upload_id), destination)
+        
+        self.register_files([(session["file_sha256"], str(destination), session["size"])], namespace)
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+        finally:
+            conn.close()
+        self._part_path(upload_id).unlink(missing_ok=True)
+        return {
+            "filename": session["filename"],
+            "original_file": str(destination),
+            "sha256": session["file_sha256"],
+            "size": session["size"]
+        }
+    
+    def register_files(self, files: Iterable[Tuple[str, str, int]], namespace: str = ""):
+        """
+        登记已保存的文件（之后同一命名空间中声明相同 SHA-256 的上传无需传输数据）
+        
+        Args:
+            files: [(SHA-256, 文件路径, 字节数), ...]
+            namespace: 使用这些文件的命名空间
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (namespace, sha256, path, size, registered_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, sha256, path, size, now) for sha256, path, size in files]
+            )
+        except Exception as e:
+            logger.error(f"登记上传文件失败: {e}")
+        finally:
+            conn.close()
+    
+    def find_file(self, sha256: str, size: int, namespace: str = "") -> Optional[str]:
+        """
+        按 SHA-256 查找命名空间中已保存的文件（文件已被清理或大小不符时删除索引）
+        
+        Returns:
+            文件路径，不存在返回 None
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT path, size FROM files WHERE namespace = ? AND sha256 = ?", (namespace, sha256)
+            ).fetchone()
+            if row is None:
+                return None
+            path, indexed_size = row
+            try:
+                if indexed_size == size and os.path.getsize(path) == size:
+                    return path
+            except OSError:
+                pass
+            conn.execute("DELETE FROM files WHERE namespace = ? AND sha256 = ?", (namespace, sha256))
+            return None
+        finally:
+            conn.close()
+    
+    def purge_expired(self) -> int:
+        """
+        清理超过保留时长仍未使用的上传
+        
+        Returns:
+            删除的上传数
+        """
+        cutoff = time.time() - self.ttl_seconds
+        conn = self._connect()
+        try:
+            expired = [row[0] for row in conn.execute(
+                "SELECT upload_id FROM uploads WHERE updated_at < ?", (cutoff,)
+            )]
+        except Exception as e:
+            logger.error(f"查询过期上传失败: {e}")
+            return 0
+        finally:
+            conn.close()
+        
+        for upload_id in expired:
+            self.abort(upload_id)
+        if expired:
+            logger.info(f"清理过期上传: {len(expired)} 个")
+        return len(expired)
+
+
+def check_upload_namespace(session: Dict, namespace: str):
+    """
+    校验上传可在该命名空间中使用
+    
+    免传输命中的上传只证明客户端知道文件的 SHA-256，不能用于其他命名空间，
+    否则知道哈希即可取得其他命名空间的文件。
+    
+    Raises:
+        UploadNamespaceMismatch: 重复文件上传不在创建时的命名空间中使用
+    """
+    if session["duplicate_of"] and session["namespace"] != namespace:
+        raise UploadNamespaceMismatch(
+            f"该上传命中的是命名空间 '{session['namespace']}' 中的已有文件，只能在该命名空间中使用"
+        )
+
+
+def create_upload_store() -> ChunkedUploadStore:
+    """根据全局配置创建分块上传存储"""
+    from config import config
+    
+    return ChunkedUploadStore(
+        upload_dir=config.ChunkedUpload.DIR,
+        max_chunk_size=config.ChunkedUpload.MAX_CHUNK_SIZE,
+        ttl_hours=config.ChunkedUpload.TTL_HOURS,
+        dedup=config.ChunkedUpload.DEDUP
+    )
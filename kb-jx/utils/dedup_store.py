@@ -2,10 +2,37 @@
 # -*- coding: utf-8 -*-
 """
 去重存储模块 - 支持内存与 Redis 双后端
+
+文档/段落哈希按「哈希 -> 过期时间戳」保存（Redis 为有序集合，不过期的成员分数为 +inf），
+查询时过期时间已到的成员视为不存在，purge_expired() 定期删除过期成员及其 SimHash 指纹与索引。
+内存后端另有段落数上限，超过后按最近使用时间（LRU）淘汰。
+
+Redis 后端可在进程内使用布隆过滤器预过滤段落查询：过滤器判定不存在的段落直接返回，
+只有可能存在的段落才访问 Redis。位图同时保存在 Redis 中（写入方同步置位），各进程定期重新载入。
+
+哈希存储格式（hash_format）：
+- hex: 64 位十六进制字符串与十进制 SimHash（原格式，默认）
+- binary: 哈希保存为 16 字节截断摘要，SimHash 保存为 8 字节大端整数（键名带 :bin 后缀，
+  已有 hex 数据需先用 migrate_dedup_store.py 迁移）
+内存后端的 SHA-256 哈希统一保存为 32 字节摘要。
+
+命名空间与分片（Redis 后端）：
+- 每个知识库使用独立的命名空间，键名为 kbjx:{命名空间}:para:hashes...（默认命名空间沿用原键名），互不去重
+- 文档/段落哈希与 SimHash 按成员哈希分散到 shard_count 个键（{键}:{分片数}:{分片}），单个键更小；
+  批量查询按分片并行执行。客户端为单机 redis.Redis，且跨分片键执行多键命令，不支持 Redis Cluster。分块索引与布隆过滤器按命名空间共享，不分片
 """
 import hashlib
-from typing import Optional, Dict, Set, Tuple
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Optional, Dict, Tuple, List, Iterable, Union
 from utils.logger import get_logger
+from utils.bloom_filter import BloomFilter
+from utils.simhash_matrix import FingerprintMatrix
 
 try:
     from config import config as app_config
@@ -15,25 +42,169 @@ except ImportError:
 
 logger = get_logger("dedup_store")
 
+# SimHash 指纹位数（simhash 库默认 64 位）
+SIMHASH_BITS = 64
+
+HASH_FORMATS = ("binary", "hex")
+# binary 格式保存的摘要字节数（SHA-256 截断为 128 位）
+DIGEST_BYTES = 16
+
+# 内存后端的哈希键：SHA-256 为 32 字节摘要，其他字符串原样保存
+MemoryKey = Union[bytes, str]
+
+# 命名空间（知识库标识）允许的字符
+_NAMESPACE_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+# 分片并行查询的最大线程数
+MAX_SHARD_WORKERS = 16
+
+
+class HexHashCodec:
+    """hex 格式：哈希为十六进制字符串，SimHash 为十进制字符串"""
+    name = "hex"
+    key_suffix = ""
+    
+    def pack_hash(self, hash_hex: str) -> bytes:
+        return hash_hex.encode('utf-8')
+    
+    def unpack_hash(self, raw: bytes) -> str:
+        return raw.decode('utf-8')
+    
+    def pack_simhash(self, simhash_value: int) -> bytes:
+        return str(simhash_value).encode('ascii')
+    
+    def unpack_simhash(self, raw: bytes) -> int:
+        return int(raw)
+
+
+class BinaryHashCodec:
+    """binary 格式：哈希为截断的原始摘要，SimHash 为 8 字节大端整数"""
+    name = "binary"
+    key_suffix = ":bin"
+    
+    def pack_hash(self, hash_hex: str) -> bytes:
+        if len(hash_hex) == 64:
+            try:
+                return bytes.fromhex(hash_hex)[:DIGEST_BYTES]
+            except ValueError:
+                pass
+        # 不是 SHA-256 十六进制串：保存其 SHA-256 摘要
+        return hashlib.sha256(hash_hex.encode('utf-8')).digest()[:DIGEST_BYTES]
+    
+    def unpack_hash(self, raw: bytes) -> str:
+        """截断摘要的十六进制（32 位，为原哈希的前缀）"""
+        return raw.hex()
+    
+    def pack_simhash(self, simhash_value: int) -> bytes:
+        return simhash_value.to_bytes(8, 'big')
+    
+    def unpack_simhash(self, raw: bytes) -> int:
+        return int.from_bytes(raw, 'big')
+
+
+def create_hash_codec(hash_format: str):
+    """
+    按名称创建哈希编码
+    
+    Raises:
+        ValueError: 未知的存储格式
+    """
+    if hash_format == "binary":
+        return BinaryHashCodec()
+    if hash_format == "hex":
+        return HexHashCodec()
+    raise ValueError(f"未知的去重哈希存储格式: {hash_format}（可选: {', '.join(HASH_FORMATS)}）")
+
+
+def normalize_namespace(namespace: Optional[str]) -> str:
+    """
+    校验并规范化命名空间（空值表示默认命名空间）
+    
+    Raises:
+        ValueError: 包含字母、数字、_ . - 以外的字符或超过 64 个字符
+    """
+    namespace = (namespace or "").strip()
+    if namespace and not _NAMESPACE_PATTERN.fullmatch(namespace):
+        raise ValueError(f"无效的去重命名空间: {namespace}（只允许字母、数字、_ . -，最长 64 个字符）")
+    return namespace
+
 
 class DedupStore:
     """去重存储抽象类"""
     
-    def __init__(self, backend: str = "memory", redis_config: Optional[Dict] = None):
+    def __init__(self, backend: str = "memory", redis_config: Optional[Dict] = None,
+                 simhash_max_distance: int = 3, doc_ttl_days: int = 0, para_ttl_days: int = 0,
+                 max_memory_paras: int = 0, sweep_interval: int = 3600,
+                 bloom_capacity: int = 0, bloom_error_rate: float = 0.01, bloom_refresh_interval: int = 60,
+                 hash_format: str = "hex", namespace: Optional[str] = None, shard_count: int = 1,
+                 redis_client=None):
         """
         初始化去重存储
         
         Args:
             backend: "memory" 或 "redis"
             redis_config: Redis 配置 {"host": "127.0.0.1", "port": 6379, "db": 1, "password": "xxx"}
+            simhash_max_distance: SimHash 索引支持的最大汉明距离 k（索引按 k+1 块切分指纹）
+            doc_ttl_days: 文档哈希过期天数（0 = 不过期）
+            para_ttl_days: 段落哈希与指纹过期天数（0 = 不过期）
+            max_memory_paras: 内存后端段落数上限（0 = 不限制），超过后按 LRU 淘汰
+            sweep_interval: 内存后端清理过期数据的最小间隔（秒）
+            bloom_capacity: Redis 后端段落布隆过滤器的初始容量（0 = 不启用）
+            bloom_error_rate: 布隆过滤器的目标误判率
+            bloom_refresh_interval: 从 Redis 重新载入布隆过滤器位图的间隔（秒）
+            hash_format: Redis 后端的哈希存储格式 binary / hex
+            namespace: 去重命名空间（知识库标识，空值为默认命名空间，沿用原键名）
+            shard_count: Redis 后端文档/段落哈希的分片数（1 = 不分片）
+            redis_client: 复用的 Redis 客户端（for_namespace 创建的子存储共享连接池）
+        
+        Raises:
+            ValueError: 未知的存储格式或无效的命名空间
         """
         self.backend = backend
         self._redis = None
-        self._memory_doc_hashes: Set[str] = set()
-        self._memory_para_hashes: Set[str] = set()
-        self._memory_para_simhash: Dict[str, int] = {}  # para_hash -> simhash_value
+        self.codec = create_hash_codec(hash_format)
+        self.namespace = normalize_namespace(namespace)
+        self.shard_count = max(1, shard_count)
+        # 其他命名空间的子存储（由 for_namespace 创建，共享 Redis 连接与分片查询线程池）
+        self._parent: Optional["DedupStore"] = None
+        self._namespace_stores: Dict[str, "DedupStore"] = {}
+        self._namespace_lock = threading.Lock()
+        self._shard_executor: Optional[ThreadPoolExecutor] = None
+        self.doc_ttl_days = max(0, doc_ttl_days)
+        self.para_ttl_days = max(0, para_ttl_days)
+        self.max_memory_paras = max(0, max_memory_paras)
+        self.sweep_interval = max(1, sweep_interval)
+        self._next_memory_sweep = time.time() + self.sweep_interval
+        self._expired_count = 0
+        self._evicted_count = 0
+        # 内存后端：哈希（32 字节摘要）-> 过期时间戳；段落按最近使用时间排序（末尾为最近使用）
+        self._memory_doc_hashes: Dict[MemoryKey, float] = {}
+        self._memory_para_hashes: "OrderedDict[MemoryKey, float]" = OrderedDict()
+        
+        # 段落布隆过滤器（仅 Redis 后端）
+        self.bloom_capacity = max(0, bloom_capacity)
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_refresh_interval = max(1, bloom_refresh_interval)
+        self._para_bloom: Optional[BloomFilter] = None
+        # 本地位数组对应的 Redis 位图代号（None = 尚未载入，不做预过滤）
+        self._bloom_generation: Optional[int] = None
+        self._next_bloom_refresh = 0.0
+        self._bloom_checks = 0
+        self._bloom_negatives = 0
+        self._bloom_false_positives = 0
+        # 内存指纹矩阵：para_hash -> 行号，指纹保存在连续 uint64 数组中（批量比对）
+        self._memory_para_simhash = FingerprintMatrix()
         
-        if backend == "redis":
+        # SimHash 多重索引：按鸽巢原理，汉明距离 <= k 的两个指纹切成 k+1 块后至少有一块完全相同
+        self.simhash_max_distance = max(0, min(simhash_max_distance, SIMHASH_BITS - 1))
+        self._simhash_layout = _build_block_layout(self.simhash_max_distance + 1)
+        # 内存索引：每块一张表 {块值: [指纹矩阵行号]}
+        self._memory_simhash_index: List[Dict[int, List[int]]] = [
+            {} for _ in self._simhash_layout
+        ]
+        
+        if backend == "redis" and redis_client is not None:
+            self._redis = redis_client
+        elif backend == "redis":
             try:
                 import redis
                 self._redis = redis.Redis(
@@ -41,7 +212,7 @@ class DedupStore:
                     port=redis_config.get("port", 6379),
                     db=redis_config.get("db", 1),
                     password=redis_config.get("password"),
-                    decode_responses=True,
+                    decode_responses=False,
                     socket_connect_timeout=5,
                     socket_timeout=5
                 )
@@ -53,24 +224,460 @@ class DedupStore:
                 logger.warning("!!! 重要提示: 当前使用内存模式，重启后去重数据将丢失 !!!")
                 self.backend = "memory"
                 self._redis = None
+        
+        if self.backend == "redis" and self._redis:
+            self._check_keyspace()
+            self._migrate_legacy_sets()
+            self._ensure_simhash_index()
+            if self.bloom_capacity:
+                self._init_para_bloom()
     
-    def _get_doc_key(self) -> str:
-        """文档级哈希集合键名"""
-        if HAS_CONFIG:
-            return app_config.Redis.DOC_HASHES_KEY
-        return "kbjx:doc:hashes"
+    def _redis_key(self, base: str, codec=None, shard: Optional[int] = None,
+                   shard_count: Optional[int] = None) -> str:
+        """
+        Redis 键名: {前缀}[:{命名空间}]:{键名其余部分}{格式后缀}[:{分片数}:{分片}]
+        
+        分片数计入键名，调整分片数后旧数据不会被错误的分片规则读取（用迁移脚本重新分布）。
+        """
+        if self.namespace:
+            prefix = (app_config.Redis.KEY_PREFIX if HAS_CONFIG else "kbjx") + ":"
+            rest = base[len(prefix):] if base.startswith(prefix) else base
+            base = f"{prefix}{self.namespace}:{rest}"
+        key = base + (codec or self.codec).key_suffix
+        shard_count = shard_count or self.shard_count
+        if shard is not None and shard_count > 1:
+            key = f"{key}:{shard_count}:{shard}"
+        return key
+    
+    def _get_doc_key(self, shard: int = 0, codec=None, shard_count: Optional[int] = None) -> str:
+        """文档级哈希集合键名（codec 默认为当前存储格式，shard_count 默认为当前分片数）"""
+        base = app_config.Redis.DOC_HASHES_KEY if HAS_CONFIG else "kbjx:doc:hashes"
+        return self._redis_key(base, codec, shard, shard_count)
     
-    def _get_para_key(self) -> str:
+    def _get_para_key(self, shard: int = 0, codec=None, shard_count: Optional[int] = None) -> str:
         """段落级哈希集合键名"""
-        if HAS_CONFIG:
-            return app_config.Redis.PARA_HASHES_KEY
-        return "kbjx:para:hashes"
+        base = app_config.Redis.PARA_HASHES_KEY if HAS_CONFIG else "kbjx:para:hashes"
+        return self._redis_key(base, codec, shard, shard_count)
     
-    def _get_simhash_key(self) -> str:
+    def _get_simhash_key(self, shard: int = 0, codec=None, shard_count: Optional[int] = None) -> str:
         """段落 SimHash 哈希表键名"""
-        if HAS_CONFIG:
-            return app_config.Redis.PARA_SIMHASH_KEY
-        return "kbjx:para:simhash"
+        base = app_config.Redis.PARA_SIMHASH_KEY if HAS_CONFIG else "kbjx:para:simhash"
+        return self._redis_key(base, codec, shard, shard_count)
+    
+    def _shard_keys(self, get_key, codec=None, shard_count: Optional[int] = None) -> List[str]:
+        """某类键的全部分片键名"""
+        shard_count = shard_count or self.shard_count
+        return [get_key(shard, codec, shard_count) for shard in range(shard_count)]
+    
+    def _get_bloom_key(self, codec=None) -> str:
+        """段落布隆过滤器键名前缀（按命名空间共享，不分片）"""
+        base = app_config.Redis.PARA_BLOOM_KEY if HAS_CONFIG else "kbjx:para:bloom"
+        return self._redis_key(base, codec)
+    
+    def _get_bloom_bitmap_key(self, generation: int, codec=None) -> str:
+        """布隆过滤器位图键名：每次重建使用新的代号（容量变化后旧位图不再被读写）"""
+        return f"{self._get_bloom_key(codec)}:{generation}"
+    
+    def _get_simhash_index_prefix(self, codec=None) -> str:
+        """SimHash 分块索引键前缀（包含块数，阈值变化时自动使用新索引）"""
+        base = app_config.Redis.PARA_SIMHASH_INDEX_KEY if HAS_CONFIG else "kbjx:para:simidx"
+        return f"{self._redis_key(base, codec)}:{len(self._simhash_layout)}"
+    
+    def _get_simhash_index_key(self, block_idx: int, block_value: int, codec=None) -> str:
+        """SimHash 分块索引桶键名: {前缀}:{块序号}:{块值}"""
+        return f"{self._get_simhash_index_prefix(codec)}:{block_idx}:{block_value:x}"
+    
+    def _shard_of(self, member: bytes, shard_count: Optional[int] = None) -> int:
+        """编码后的哈希所在分片（CRC32 取模，跨进程稳定）"""
+        shard_count = shard_count or self.shard_count
+        return zlib.crc32(member) % shard_count if shard_count > 1 else 0
+    
+    def _group_by_shard(self, members: Iterable[bytes], shard_count: Optional[int] = None) -> Dict[int, List[bytes]]:
+        """编码后的哈希按分片分组"""
+        groups: Dict[int, List[bytes]] = {}
+        for member in members:
+            groups.setdefault(self._shard_of(member, shard_count), []).append(member)
+        return groups
+    
+    def _get_shard_executor(self) -> ThreadPoolExecutor:
+        """分片并行查询的线程池（命名空间子存储共享根存储的线程池）"""
+        if self._parent is not None:
+            return self._parent._get_shard_executor()
+        with self._namespace_lock:
+            if self._shard_executor is None:
+                self._shard_executor = ThreadPoolExecutor(
+                    max_workers=min(self.shard_count, MAX_SHARD_WORKERS),
+                    thread_name_prefix="kbjx-dedup-shard"
+                )
+            return self._shard_executor
+    
+    def _map_shards(self, func, groups: Dict[int, List[bytes]]) -> Dict[int, List]:
+        """
+        对每个分片的成员执行 func(shard, members)，多个分片时在线程池中并行执行
+        
+        Returns:
+            {分片: func 的返回值}
+        """
+        if len(groups) <= 1:
+            return {shard: func(shard, members) for shard, members in groups.items()}
+        executor = self._get_shard_executor()
+        futures = {shard: executor.submit(func, shard, members) for shard, members in groups.items()}
+        return {shard: future.result() for shard, future in futures.items()}
+    
+    def for_namespace(self, namespace: Optional[str]) -> "DedupStore":
+        """
+        获取指定命名空间的去重存储（空值或与当前相同时返回自身）
+        
+        子存储使用相同的配置并共享 Redis 连接；Redis 后端同时登记命名空间，供后台清理遍历。
+        
+        Raises:
+            ValueError: 无效的命名空间
+        """
+        namespace = normalize_namespace(namespace)
+        if not namespace or namespace == self.namespace:
+            return self
+        root = self._parent or self
+        if namespace == root.namespace:
+            return root
+        
+        with root._namespace_lock:
+            store = root._namespace_stores.get(namespace)
+            if store is not None:
+                return store
+            store = DedupStore(
+                backend=root.backend,
+                simhash_max_distance=root.simhash_max_distance,
+                doc_ttl_days=root.doc_ttl_days,
+                para_ttl_days=root.para_ttl_days,
+                max_memory_paras=root.max_memory_paras,
+                sweep_interval=root.sweep_interval,
+                bloom_capacity=root.bloom_capacity,
+                bloom_error_rate=root.bloom_error_rate,
+                bloom_refresh_interval=root.bloom_refresh_interval,
+                hash_format=root.codec.name,
+                namespace=namespace,
+                shard_count=root.shard_count,
+                redis_client=root._redis
+            )
+            store._parent = root
+            root._namespace_stores[namespace] = store
+        
+        if store.backend == "redis" and store._redis:
+            try:
+                store._redis.sadd(self._get_namespaces_key(), namespace)
+            except Exception as e:
+                logger.error(f"登记去重命名空间失败: {namespace}, {e}")
+        logger.info(f"去重命名空间已启用: {namespace} (分片数 {store.shard_count})")
+        return store
+    
+    @staticmethod
+    def _get_namespaces_key() -> str:
+        """已登记命名空间集合的键名"""
+        return app_config.Redis.DEDUP_NAMESPACES_KEY if HAS_CONFIG else "kbjx:dedup:namespaces"
+    
+    def known_namespaces(self) -> List[str]:
+        """已使用的命名空间（Redis 后端包括其他进程登记的命名空间，不含默认命名空间）"""
+        root = self._parent or self
+        namespaces = set(root._namespace_stores)
+        if root.backend == "redis" and root._redis:
+            try:
+                namespaces.update(member.decode('utf-8') for member in root._redis.smembers(self._get_namespaces_key()))
+            except Exception as e:
+                logger.error(f"读取去重命名空间失败: {e}")
+        namespaces.discard(root.namespace)
+        return sorted(namespaces)
+    
+    def _simhash_blocks(self, simhash_value: int) -> List[int]:
+        """将 64 位指纹切分为 k+1 个块值"""
+        return [(simhash_value >> shift) & mask for shift, mask in self._simhash_layout]
+    
+    @staticmethod
+    def _expire_at(ttl_days: int, now: Optional[float] = None) -> float:
+        """过期时间戳（ttl_days 为 0 时不过期）"""
+        if not ttl_days:
+            return float("inf")
+        return (now if now is not None else time.time()) + ttl_days * 86400
+    
+    @staticmethod
+    def _memory_key(hash_hex: str) -> MemoryKey:
+        """内存后端的键：SHA-256 十六进制串保存为 32 字节摘要（其他字符串原样保存）"""
+        if len(hash_hex) == 64:
+            try:
+                return bytes.fromhex(hash_hex)
+            except ValueError:
+                pass
+        return hash_hex
+    
+    @staticmethod
+    def _memory_hash(key: MemoryKey) -> str:
+        """内存后端的键还原为哈希字符串"""
+        return key.hex() if isinstance(key, bytes) else key
+    
+    def _keyspace_exists(self, codec=None, shard_count: Optional[int] = None) -> bool:
+        """Redis 后端：指定存储格式与分片数下是否有文档/段落哈希"""
+        keys = self._shard_keys(self._get_doc_key, codec, shard_count) + self._shard_keys(self._get_para_key, codec, shard_count)
+        return self._redis.exists(*keys) > 0
+    
+    def _check_keyspace(self):
+        """Redis 后端：当前格式与分片数下没有数据而其他格式/分片数有数据时，提示运行迁移脚本"""
+        other = create_hash_codec("hex" if self.codec.name == "binary" else "binary")
+        layouts = [(other, self.shard_count)]
+        if self.shard_count > 1:
+            layouts += [(self.codec, 1), (other, 1)]
+        try:
+            if self._keyspace_exists():
+                return
+            for codec, shard_count in layouts:
+                if self._keyspace_exists(codec, shard_count):
+                    namespace_arg = f" --namespace={self.namespace}" if self.namespace else ""
+                    logger.warning(
+                        f"Redis 中的去重数据为 {codec.name} 格式 / {shard_count} 分片，"
+                        f"当前配置为 {self.codec.name} 格式 / {self.shard_count} 分片，请运行 "
+                        f"python migrate_dedup_store.py {self.codec.name} --from-format={codec.name} "
+                        f"--from-shards={shard_count}{namespace_arg} 迁移"
+                    )
+                    return
+        except Exception as e:
+            logger.error(f"去重数据格式检查失败: {e}")
+    
+    def _migrate_legacy_sets(self):
+        """Redis 后端：旧版本的文档/段落哈希集合（Set）原地转换为带过期时间的有序集合"""
+        keys = [(key, self.doc_ttl_days) for key in self._shard_keys(self._get_doc_key)]
+        keys += [(key, self.para_ttl_days) for key in self._shard_keys(self._get_para_key)]
+        for key, ttl_days in keys:
+            try:
+                if self._redis.type(key) != b"set":
+                    continue
+                # 旧数据没有写入时间，从迁移时刻开始计算过期
+                expire_at = self._expire_at(ttl_days)
+                tmp_key = f"{key}:migrating"
+                self._redis.delete(tmp_key)
+                count = 0
+                batch = []
+                for member in self._redis.sscan_iter(key, count=1000):
+                    batch.append(member)
+                    if len(batch) >= 1000:
+                        self._redis.zadd(tmp_key, dict.fromkeys(batch, expire_at))
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self._redis.zadd(tmp_key, dict.fromkeys(batch, expire_at))
+                    count += len(batch)
+                if count:
+                    self._redis.rename(tmp_key, key)
+                else:
+                    self._redis.delete(key)
+                logger.info(f"去重哈希集合已迁移为带过期时间的有序集合: {key} ({count} 条)")
+            except Exception as e:
+                logger.error(f"去重哈希集合迁移失败: {key}, {e}")
+    
+    def _memory_para_alive(self, key: MemoryKey, now: float) -> bool:
+        """内存后端：段落是否存在且未过期（命中时更新 LRU 顺序，过期时删除）"""
+        expire_at = self._memory_para_hashes.get(key)
+        if expire_at is None:
+            return False
+        if expire_at <= now:
+            self._remove_memory_para(key)
+            self._expired_count += 1
+            return False
+        self._memory_para_hashes.move_to_end(key)
+        return True
+    
+    def _remove_memory_para(self, key: MemoryKey):
+        """内存后端：删除段落哈希及其指纹、分块索引"""
+        self._memory_para_hashes.pop(key, None)
+        removed = self._memory_para_simhash.remove(key)
+        if removed is None:
+            return
+        row, simhash_value = removed
+        for table, block in zip(self._memory_simhash_index, self._simhash_blocks(simhash_value)):
+            rows = table.get(block)
+            if rows is None:
+                continue
+            rows.remove(row)
+            if not rows:
+                del table[block]
+    
+    def _init_para_bloom(self):
+        """Redis 后端：载入 Redis 中保存的布隆过滤器位图，不存在或参数不一致时从段落哈希重建"""
+        try:
+            params = self._parse_bloom_meta(self._redis.hgetall(f"{self._get_bloom_key()}:meta"))
+            if params is not None and params[2] == self.bloom_error_rate:
+                # 重建时容量可能已扩大，以 Redis 中的参数为准
+                self.refresh_para_bloom(time.time())
+                if self._bloom_ready:
+                    logger.info(f"段落布隆过滤器已载入: 容量 {self._para_bloom.capacity}, {self._para_bloom.memory_bytes} 字节")
+                    return
+            self._rebuild_para_bloom()
+        except Exception as e:
+            logger.error(f"段落布隆过滤器初始化失败，不使用预过滤: {e}")
+            self._para_bloom = None
+            self._bloom_generation = None
+    
+    @property
+    def _bloom_ready(self) -> bool:
+        """本地布隆过滤器是否已载入当前代的位图（可以做预过滤）"""
+        return self._para_bloom is not None and self._bloom_generation is not None
+    
+    @staticmethod
+    def _parse_bloom_meta(meta: Dict[bytes, bytes]) -> Optional[Tuple[int, int, float]]:
+        """
+        解析布隆过滤器元数据
+        
+        Returns:
+            (代号, 容量, 误判率)，元数据不存在或是旧版本（没有代号）时为 None
+        """
+        if not meta or b"generation" not in meta:
+            return None
+        return int(meta[b"generation"]), int(meta[b"capacity"]), float(meta[b"error_rate"])
+    
+    def _load_para_bloom(self, params: Optional[Tuple[int, int, float]], data: Optional[bytes]):
+        """
+        按 Redis 中的参数载入位图
+        
+        代号与元数据在同一事务中写入，同一代的容量与误判率不变；代号变化（其他进程重建，
+        容量可能已扩大）时按新参数重新创建本地过滤器，不会把新位图截断/补齐到旧的位数。
+        元数据不存在（尚未重建或已清空）时暂停预过滤，段落直接查询 Redis。
+        """
+        if params is None:
+            self._bloom_generation = None
+            return
+        generation, capacity, error_rate = params
+        if self._para_bloom is None or generation != self._bloom_generation:
+            self._para_bloom = BloomFilter(capacity, error_rate)
+        self._para_bloom.load(data or b"")
+        self._bloom_generation = generation
+    
+    def refresh_para_bloom(self, now: float):
+        """
+        重新载入 Redis 中的位图（包含其他进程写入的段落；其他进程重建后切换到新位图）
+        
+        使用同步客户端，AsyncDedupStore 在线程池中调用（每个刷新间隔一次）。
+        """
+        self._next_bloom_refresh = now + self.bloom_refresh_interval
+        meta_key = f"{self._get_bloom_key()}:meta"
+        generation = self._bloom_generation
+        if generation is None:
+            meta, data = self._redis.hgetall(meta_key), None
+        else:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.hgetall(meta_key)
+            pipe.get(self._get_bloom_bitmap_key(generation))
+            meta, data = pipe.execute()
+        params = self._parse_bloom_meta(meta)
+        if params is not None and params[0] != generation:
+            data = self._redis.get(self._get_bloom_bitmap_key(params[0]))
+        self._load_para_bloom(params, data)
+    
+    def _rebuild_para_bloom(self) -> int:
+        """
+        从未过期的段落哈希重建布隆过滤器并保存到 Redis（容量不足时扩大为段落数的 2 倍）
+        
+        新位图使用新的代号，与元数据在同一事务中切换；其他进程刷新或写入时发现代号变化即改用新位图。
+        切换前已写入段落哈希、但位图写到旧代的段落，在切换后重新扫描补写（与过期设置无关）。
+        
+        Returns:
+            加入过滤器的段落数
+        """
+        para_keys = self._shard_keys(self._get_para_key)
+        started = time.time()
+        capacity = max(self.bloom_capacity, sum(self._redis.zcard(key) for key in para_keys) * 2)
+        bloom = BloomFilter(capacity, self.bloom_error_rate)
+        count = 0
+        for para_key in para_keys:
+            for member, expire_at in self._redis.zscan_iter(para_key, count=1000):
+                if expire_at > started:
+                    bloom.add(member)
+                    count += 1
+        
+        bloom_key = self._get_bloom_key()
+        meta_key = f"{bloom_key}:meta"
+        generation = self._redis.incr(f"{bloom_key}:generation")
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hget(meta_key, "generation")
+        pipe.set(self._get_bloom_bitmap_key(generation), bloom.to_bytes())
+        # 旧版本未分代的位图
+        pipe.delete(bloom_key)
+        pipe.delete(meta_key)
+        pipe.hset(meta_key, mapping={
+            "generation": generation, "capacity": capacity, "error_rate": self.bloom_error_rate
+        })
+        previous = pipe.execute()[0]
+        if previous is not None and int(previous) != generation:
+            self._redis.delete(self._get_bloom_bitmap_key(int(previous)))
+        self._para_bloom = bloom
+        self._bloom_generation = generation
+        self._next_bloom_refresh = time.time() + self.bloom_refresh_interval
+        
+        # 切换前其他进程写入的段落：位图可能写到了旧代，按段落哈希补写（过滤器判定已存在的无需补写）
+        missed = [
+            member for para_key in para_keys
+            for member, expire_at in self._redis.zscan_iter(para_key, count=1000)
+            if expire_at > started and member not in bloom
+        ]
+        if missed:
+            pipe = self._redis.pipeline(transaction=False)
+            generation = self._queue_bloom_sync(pipe, missed)
+            self.confirm_bloom_sync(pipe.execute()[-1], missed, generation)
+        
+        logger.info(f"段落布隆过滤器已重建: {count + len(missed)} 条, 容量 {capacity}, {bloom.memory_bytes} 字节")
+        return count + len(missed)
+    
+    def _queue_bloom_sync(self, pipe, members: Iterable[bytes]) -> Optional[int]:
+        """
+        段落（编码后的成员）加入本地布隆过滤器，并通过管道在当前代的 Redis 位图中置位
+        
+        最后排入读取元数据代号的命令（必须排在段落哈希写入之后），
+        管道执行后把最后一个结果交给 confirm_bloom_sync 检查是否写到了旧位图。
+        
+        Returns:
+            写入的位图代号（未载入位图时为 None，只读取代号）
+        """
+        generation, bloom = self._bloom_generation, self._para_bloom
+        if generation is not None:
+            bitmap_key = self._get_bloom_bitmap_key(generation)
+            for member in members:
+                args = []
+                for position in bloom.add(member):
+                    args.extend(("SET", "u1", position, 1))
+                pipe.execute_command("BITFIELD", bitmap_key, *args)
+        pipe.hget(f"{self._get_bloom_key()}:meta", "generation")
+        return generation
+    
+    @staticmethod
+    def bloom_sync_stale(current: Optional[bytes], generation: Optional[int]) -> bool:
+        """位图写入后读到的元数据代号与写入时的代号不一致（其他进程在此期间重建或清空了过滤器）"""
+        return (None if current is None else int(current)) != generation
+    
+    def confirm_bloom_sync(self, current: Optional[bytes], members: List[bytes], generation: Optional[int]):
+        """
+        位图写到了旧代时，删除旧位图（可能被本次写入重新创建），载入新位图后补写
+        
+        段落哈希在位图之前写入，重建方切换后的重新扫描可能已经补写过，重复置位无害。
+        使用同步客户端，AsyncDedupStore 只在检测到换代时在线程池中调用。
+        """
+        for _ in range(3):
+            if not self.bloom_sync_stale(current, generation):
+                return
+            if generation is not None:
+                self._redis.delete(self._get_bloom_bitmap_key(generation))
+            self.refresh_para_bloom(time.time())
+            pipe = self._redis.pipeline(transaction=False)
+            generation = self._queue_bloom_sync(pipe, members)
+            current = pipe.execute()[-1]
+        if self.bloom_sync_stale(current, generation):
+            # 连续重建：暂停预过滤直到下次刷新（之前写入的段落由重建方重新扫描补写）
+            logger.warning("段落布隆过滤器在写入期间连续重建，暂停预过滤直到下次刷新")
+            self._bloom_generation = None
+    
+    def doc_location(self, doc_hash: str) -> Tuple[str, bytes]:
+        """Redis 后端：文档哈希所在的分片键与编码后的成员"""
+        member = self.codec.pack_hash(doc_hash)
+        return self._get_doc_key(self._shard_of(member)), member
+    
+    def doc_expire_at(self, ttl_days: Optional[int] = None) -> float:
+        """文档标记的过期时间戳（ttl_days 默认使用 doc_ttl_days）"""
+        return self._expire_at(self.doc_ttl_days if ttl_days is None else ttl_days)
     
     def is_doc_seen(self, doc_hash: str) -> bool:
         """
@@ -84,12 +691,15 @@ class DedupStore:
         """
         if self.backend == "redis" and self._redis:
             try:
-                return bool(self._redis.sismember(self._get_doc_key(), doc_hash))
+                key, member = self.doc_location(doc_hash)
+                expire_at = self._redis.zscore(key, member)
+                return expire_at is not None and expire_at > time.time()
             except Exception as e:
                 logger.error(f"Redis 查询失败: {e}")
                 return False
         else:
-            return doc_hash in self._memory_doc_hashes
+            expire_at = self._memory_doc_hashes.get(self._memory_key(doc_hash))
+            return expire_at is not None and expire_at > time.time()
     
     def mark_doc(self, doc_hash: str, ttl_days: Optional[int] = None) -> bool:
         """
@@ -97,24 +707,22 @@ class DedupStore:
         
         Args:
             doc_hash: 文档 SHA256 哈希
-            ttl_days: 过期天数（仅 Redis 支持）
+            ttl_days: 过期天数（默认使用 doc_ttl_days，0 = 不过期）
         
         Returns:
             是否成功
         """
+        expire_at = self.doc_expire_at(ttl_days)
         if self.backend == "redis" and self._redis:
             try:
-                self._redis.sadd(self._get_doc_key(), doc_hash)
-                if ttl_days:
-                    # 注意：Set 整体设置 TTL，不是单个成员
-                    # 如需单成员 TTL，应使用 String 键: kbjx:doc:{hash} with SETEX
-                    pass
+                key, member = self.doc_location(doc_hash)
+                self._redis.zadd(key, {member: expire_at})
                 return True
             except Exception as e:
                 logger.error(f"Redis 写入失败: {e}")
                 return False
         else:
-            self._memory_doc_hashes.add(doc_hash)
+            self._memory_doc_hashes[self._memory_key(doc_hash)] = expire_at
             return True
     
     def is_para_seen(self, para_hash: str) -> bool:
@@ -127,14 +735,104 @@ class DedupStore:
         Returns:
             是否已存在
         """
+        return self.are_paras_seen([para_hash])[0]
+    
+    def are_paras_seen(self, para_hashes: List[str]) -> List[bool]:
+        """
+        批量检查段落是否已存在（Redis 下每个分片单次往返，多个分片并行查询）
+        
+        Args:
+            para_hashes: 段落 SHA256 哈希列表
+        
+        Returns:
+            与输入顺序一致的布尔列表
+        """
+        if not para_hashes:
+            return []
+        
+        now = time.time()
         if self.backend == "redis" and self._redis:
             try:
-                return bool(self._redis.sismember(self._get_para_key(), para_hash))
+                members = [self.codec.pack_hash(para_hash) for para_hash in para_hashes]
+                if self.bloom_refresh_due(now):
+                    self.refresh_para_bloom(now)
+                prefiltered = self.bloom_prefilter(members)
+                if prefiltered is None:
+                    return self._redis_paras_seen(members, now)
+                
+                # 布隆过滤器判定不存在的段落不访问 Redis
+                maybe, candidates = prefiltered
+                if not candidates:
+                    return [False] * len(para_hashes)
+                return self.merge_bloom_results(maybe, self._redis_paras_seen(candidates, now))
             except Exception as e:
-                logger.error(f"Redis 查询失败: {e}")
-                return False
+                logger.error(f"Redis 批量查询失败: {e}")
+                return [False] * len(para_hashes)
         else:
-            return para_hash in self._memory_para_hashes
+            return [self._memory_para_alive(self._memory_key(para_hash), now) for para_hash in para_hashes]
+    
+    def bloom_refresh_due(self, now: float) -> bool:
+        """
+        是否需要重新载入布隆过滤器位图（返回 True 时即推迟下次刷新时间，并发调用只有一个需要刷新）
+        """
+        if self._para_bloom is None or now < self._next_bloom_refresh:
+            return False
+        self._next_bloom_refresh = now + self.bloom_refresh_interval
+        return True
+    
+    def bloom_prefilter(self, members: List[bytes]) -> Optional[Tuple[List[bool], List[bytes]]]:
+        """
+        本地布隆过滤器预过滤
+        
+        Returns:
+            (每个成员是否可能存在, 需要查询 Redis 的成员)；未启用或未载入当前代位图时为 None（全部查询 Redis）
+        """
+        if not self._bloom_ready:
+            return None
+        maybe = [member in self._para_bloom for member in members]
+        candidates = [member for member, flag in zip(members, maybe) if flag]
+        self._bloom_checks += len(members)
+        self._bloom_negatives += len(members) - len(candidates)
+        return maybe, candidates
+    
+    def merge_bloom_results(self, maybe: List[bool], seen: List[bool]) -> List[bool]:
+        """把候选成员的 Redis 查询结果合并回原顺序（并统计误判）"""
+        seen_iter = iter(seen)
+        flags = [next(seen_iter) if flag else False for flag in maybe]
+        self._bloom_false_positives += len(seen) - sum(flags)
+        return flags
+    
+    def para_key_groups(self, members: Iterable[bytes]) -> Dict[str, List[bytes]]:
+        """Redis 后端：编码后的段落成员按所在分片键分组"""
+        return {self._get_para_key(shard): shard_members for shard, shard_members in self._group_by_shard(members).items()}
+    
+    def _redis_paras_seen(self, members: List[bytes], now: float) -> List[bool]:
+        """Redis 后端：批量查询段落哈希（编码后的成员）是否存在且未过期（按分片并行，每个分片单次往返）"""
+        if self.shard_count == 1:
+            scores = self._zmscore(self._get_para_key(), members)
+        else:
+            groups = self._group_by_shard(members)
+            shard_scores = self._map_shards(
+                lambda shard, shard_members: dict(zip(shard_members, self._zmscore(self._get_para_key(shard), shard_members))),
+                groups
+            )
+            scores = [shard_scores[self._shard_of(member)][member] for member in members]
+        # 已过期但尚未清理的成员视为不存在
+        return [score is not None and score > now for score in scores]
+    
+    def _zmscore(self, key: str, members: List[bytes]) -> List[Optional[float]]:
+        """批量查询有序集合成员的分数（单次往返）"""
+        try:
+            # Redis >= 6.2：ZMSCORE 一条命令完成
+            return self._redis.zmscore(key, members)
+        except Exception as e:
+            if "unknown command" not in str(e).lower():
+                raise
+            # 旧版本 Redis：退化为管道批量 ZSCORE
+            pipe = self._redis.pipeline(transaction=False)
+            for member in members:
+                pipe.zscore(key, member)
+            return pipe.execute()
     
     def mark_para(self, para_hash: str, simhash_value: Optional[int] = None) -> bool:
         """
@@ -147,21 +845,472 @@ class DedupStore:
         Returns:
             是否成功
         """
+        return self.mark_paras([(para_hash, simhash_value)])
+    
+    def mark_paras(self, items: List[Tuple[str, Optional[int]]]) -> bool:
+        """
+        批量标记段落已处理（Redis 下通过管道单次往返写入）
+        
+        Args:
+            items: [(段落 SHA256 哈希, SimHash 值或 None), ...]
+        
+        Returns:
+            是否成功
+        """
+        if not items:
+            return True
+        
+        now = time.time()
+        expire_at = self._expire_at(self.para_ttl_days, now)
         if self.backend == "redis" and self._redis:
             try:
-                self._redis.sadd(self._get_para_key(), para_hash)
-                if simhash_value is not None:
-                    self._redis.hset(self._get_simhash_key(), para_hash, str(simhash_value))
+                pipe = self._redis.pipeline(transaction=False)
+                bloom_write = self.queue_mark_paras(pipe, items, expire_at)
+                results = pipe.execute()
+                if bloom_write is not None:
+                    self.confirm_bloom_sync(results[-1], *bloom_write)
                 return True
             except Exception as e:
                 logger.error(f"Redis 写入失败: {e}")
                 return False
         else:
-            self._memory_para_hashes.add(para_hash)
-            if simhash_value is not None:
-                self._memory_para_simhash[para_hash] = simhash_value
+            self._maybe_purge_memory(now)
+            for para_hash, simhash_value in items:
+                key = self._memory_key(para_hash)
+                self._memory_para_hashes[key] = expire_at
+                self._memory_para_hashes.move_to_end(key)
+                old_value = self._memory_para_simhash.get(key)
+                if simhash_value is not None and old_value != simhash_value:
+                    if old_value is not None:
+                        # 指纹变化（分词策略切换）：先移出旧指纹的索引桶
+                        self._remove_memory_para(key)
+                        self._memory_para_hashes[key] = expire_at
+                    row = self._memory_para_simhash.add(key, simhash_value)
+                    self._index_simhash_memory(row, simhash_value)
+            
+            # 超过容量上限：淘汰最久未使用的段落
+            if self.max_memory_paras:
+                while len(self._memory_para_hashes) > self.max_memory_paras:
+                    oldest = next(iter(self._memory_para_hashes))
+                    self._remove_memory_para(oldest)
+                    self._evicted_count += 1
             return True
     
+    def queue_mark_paras(self, pipe, items: List[Tuple[str, Optional[int]]],
+                         expire_at: Optional[float] = None) -> Optional[Tuple[List[bytes], Optional[int]]]:
+        """
+        Redis 后端：在管道中排入段落标记命令（哈希、指纹、分块索引与布隆过滤器位图）
+        
+        Args:
+            pipe: Redis 管道（同步或 redis.asyncio 管道）
+            items: [(段落 SHA256 哈希, SimHash 值或 None), ...]
+            expire_at: 过期时间戳（默认按 para_ttl_days 计算）
+        
+        Returns:
+            启用布隆过滤器时为 (编码后的段落成员, 写入的位图代号)，管道最后一个结果连同它们交给
+            confirm_bloom_sync 检查；未启用时为 None
+        """
+        if expire_at is None:
+            expire_at = self._expire_at(self.para_ttl_days)
+        codec = self.codec
+        members = {codec.pack_hash(para_hash): simhash_value for para_hash, simhash_value in items}
+        simhash_mapping = {
+            member: codec.pack_simhash(simhash_value)
+            for member, simhash_value in members.items() if simhash_value is not None
+        }
+        for shard, shard_members in self._group_by_shard(members).items():
+            # 重新标记的段落刷新过期时间
+            pipe.zadd(self._get_para_key(shard), dict.fromkeys(shard_members, expire_at))
+            shard_simhash = {member: simhash_mapping[member] for member in shard_members if member in simhash_mapping}
+            if shard_simhash:
+                pipe.hset(self._get_simhash_key(shard), mapping=shard_simhash)
+        for member, packed in simhash_mapping.items():
+            for idx, block in enumerate(self._simhash_blocks(members[member])):
+                pipe.hset(self._get_simhash_index_key(idx, block), member, packed)
+        if self._para_bloom is None:
+            return None
+        members = list(members)
+        return members, self._queue_bloom_sync(pipe, members)
+    
+    def _index_simhash_memory(self, row: int, simhash_value: int):
+        """将指纹矩阵行号写入内存分块索引"""
+        for table, block in zip(self._memory_simhash_index, self._simhash_blocks(simhash_value)):
+            table.setdefault(block, []).append(row)
+    
+    def _get_memory_candidate_rows(self, simhash_values: List[int]) -> List[Iterable[int]]:
+        """
+        内存后端：批量获取候选指纹的矩阵行号（与指纹至少有一块完全相同，可能重复）
+        
+        Returns:
+            与输入顺序一致的候选行号迭代器列表
+        """
+        return [
+            chain.from_iterable(
+                table.get(block, ())
+                for table, block in zip(self._memory_simhash_index, self._simhash_blocks(value))
+            )
+            for value in simhash_values
+        ]
+    
+    def _get_simhash_candidates(self, simhash_values: List[int]) -> List[Dict[bytes, int]]:
+        """
+        Redis 后端：批量获取候选段落：与指纹至少有一块完全相同（每个指纹仅访问 k+1 个桶，单次往返）
+        
+        Returns:
+            与输入顺序一致的 [{编码后的段落哈希: simhash_value}, ...]
+        """
+        try:
+            bucket_keys = self.simhash_bucket_keys(simhash_values)
+            pipe = self._redis.pipeline(transaction=False)
+            for key in bucket_keys:
+                pipe.hgetall(key)
+            return self.collect_simhash_candidates(simhash_values, bucket_keys, pipe.execute())
+        except Exception as e:
+            logger.error(f"Redis 查询失败: {e}")
+            return [{} for _ in simhash_values]
+    
+    def simhash_bucket_keys(self, simhash_values: List[int]) -> List[str]:
+        """指纹所在的分块索引桶键名（多个指纹可能落在同一个桶，去重后一次性拉取）"""
+        return list(dict.fromkeys(
+            self._get_simhash_index_key(idx, block)
+            for value in simhash_values
+            for idx, block in enumerate(self._simhash_blocks(value))
+        ))
+    
+    def collect_simhash_candidates(self, simhash_values: List[int], bucket_keys: List[str],
+                                   raw_buckets: List[Dict[bytes, bytes]]) -> List[Dict[bytes, int]]:
+        """按指纹汇总拉取到的索引桶，得到每个指纹的候选段落"""
+        unpack_simhash = self.codec.unpack_simhash
+        buckets = {
+            key: {member: unpack_simhash(value) for member, value in bucket.items()}
+            for key, bucket in zip(bucket_keys, raw_buckets)
+        }
+        results = []
+        for value in simhash_values:
+            candidates: Dict[bytes, int] = {}
+            for idx, block in enumerate(self._simhash_blocks(value)):
+                candidates.update(buckets.get(self._get_simhash_index_key(idx, block), {}))
+            results.append(candidates)
+        return results
+    
+    def find_near_duplicate(self, simhash_value: int,
+                            max_distance: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        查找近重复段落（基于 SimHash 分块索引）
+        
+        Args:
+            simhash_value: 待查询段落的 SimHash 值
+            max_distance: 汉明距离阈值（默认使用索引的 k；超过 k 时退化为全量扫描）
+        
+        Returns:
+            (para_hash, 汉明距离)，未命中返回 None
+        """
+        return self.find_near_duplicates([simhash_value], max_distance)[0]
+    
+    def find_near_duplicates(self, simhash_values: List[int],
+                             max_distance: Optional[int] = None) -> List[Optional[Tuple[str, int]]]:
+        """
+        批量查找近重复段落（Redis 下单次往返）
+        
+        Args:
+            simhash_values: 待查询段落的 SimHash 值列表
+            max_distance: 汉明距离阈值（默认使用索引的 k；超过 k 时退化为全量扫描）
+        
+        Returns:
+            与输入顺序一致的 [(para_hash, 汉明距离) 或 None, ...]
+        """
+        if not simhash_values:
+            return []
+        
+        if max_distance is None:
+            max_distance = self.simhash_max_distance
+        
+        if self.backend != "redis" or not self._redis:
+            # 内存后端：候选直接在指纹矩阵上批量比对
+            self._maybe_purge_memory(time.time())
+            if max_distance > self.simhash_max_distance:
+                logger.debug(f"查询距离 {max_distance} 超过索引上限 {self.simhash_max_distance}，使用全量扫描")
+                matches = self._memory_para_simhash.nearest_all(simhash_values, max_distance)
+            else:
+                matches = self._memory_para_simhash.nearest_in_rows(
+                    simhash_values, self._get_memory_candidate_rows(simhash_values), max_distance
+                )
+            # 命中的段落更新 LRU 顺序
+            for match in matches:
+                if match is not None and match[0] in self._memory_para_hashes:
+                    self._memory_para_hashes.move_to_end(match[0])
+            return [(self._memory_hash(match[0]), match[1]) if match else None for match in matches]
+        
+        if max_distance > self.simhash_max_distance:
+            # 索引无法保证召回，退化为全量比对
+            logger.debug(f"查询距离 {max_distance} 超过索引上限 {self.simhash_max_distance}，使用全量扫描")
+            all_simhash = self._get_all_para_simhash_raw()
+            candidates_list = [all_simhash] * len(simhash_values)
+        else:
+            candidates_list = self._get_simhash_candidates(simhash_values)
+        return self.best_matches(simhash_values, candidates_list, max_distance)
+    
+    def best_matches(self, simhash_values: List[int], candidates_list: List[Dict[bytes, int]],
+                     max_distance: int) -> List[Optional[Tuple[str, int]]]:
+        """Redis 后端：在候选段落中找出汉明距离最小且不超过阈值的段落"""
+        results: List[Optional[Tuple[str, int]]] = []
+        for simhash_value, candidates in zip(simhash_values, candidates_list):
+            best: Optional[Tuple[bytes, int]] = None
+            for member, candidate in candidates.items():
+                distance = hamming_distance(simhash_value, candidate)
+                if distance <= max_distance and (best is None or distance < best[1]):
+                    best = (member, distance)
+                    if distance == 0:
+                        break
+            results.append((self.codec.unpack_hash(best[0]), best[1]) if best else None)
+        
+        return results
+    
+    def _ensure_simhash_index(self):
+        """Redis 后端：当前块数的索引不存在时，从 SimHash 哈希表重建"""
+        meta_key = f"{self._get_simhash_index_prefix()}:built"
+        try:
+            if self._redis.exists(meta_key):
+                return
+            if self._redis.exists(*self._shard_keys(self._get_simhash_key)):
+                logger.info("SimHash 分块索引不存在，开始从已有指纹重建...")
+                self.rebuild_simhash_index()
+            self._redis.set(meta_key, "1")
+        except Exception as e:
+            logger.error(f"SimHash 索引检查失败: {e}")
+    
+    def rebuild_simhash_index(self, batch_size: int = 1000) -> int:
+        """
+        从全量 SimHash 数据重建分块索引（阈值变更或历史数据迁移时使用）
+        
+        Args:
+            batch_size: Redis 管道每批写入条数
+        
+        Returns:
+            索引的指纹数量
+        """
+        count = 0
+        if self.backend == "redis" and self._redis:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for simhash_key in self._shard_keys(self._get_simhash_key):
+                    for member, value in self._redis.hscan_iter(simhash_key, count=batch_size):
+                        simhash_value = self.codec.unpack_simhash(value)
+                        for idx, block in enumerate(self._simhash_blocks(simhash_value)):
+                            pipe.hset(self._get_simhash_index_key(idx, block), member, value)
+                        count += 1
+                        if count % batch_size == 0:
+                            pipe.execute()
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"SimHash 索引重建失败: {e}")
+                return count
+        else:
+            self._memory_simhash_index = [{} for _ in self._simhash_layout]
+            for row, key in enumerate(self._memory_para_simhash.keys):
+                if key is not None:
+                    self._index_simhash_memory(row, self._memory_para_simhash.get(key))
+                    count += 1
+        
+        logger.info(f"SimHash 分块索引重建完成: {count} 条指纹, {len(self._simhash_layout)} 块")
+        return count
+    
+    def migrate_hash_format(self, source_format: str, batch_size: int = 1000,
+                            delete_source: bool = False, source_shard_count: Optional[int] = None) -> Dict[str, int]:
+        """
+        Redis 后端：把另一种存储格式或分片数的文档/段落哈希与 SimHash 复制为当前格式与分片数
+        
+        复制完成后重建当前格式的分块索引与布隆过滤器；源数据默认保留（确认无误后再删除）。
+        
+        Args:
+            source_format: 源存储格式 binary / hex
+            batch_size: 每批读写条数
+            delete_source: 复制完成后是否删除源格式的键
+            source_shard_count: 源分片数（默认与当前分片数相同）
+        
+        Returns:
+            {"doc_count": 文档数, "para_count": 段落数, "simhash_count": 指纹数}
+        
+        Raises:
+            ValueError: 非 Redis 后端或源格式、分片数都与当前相同
+        """
+        if self.backend != "redis" or not self._redis:
+            raise ValueError("只有 Redis 后端需要迁移存储格式")
+        source = create_hash_codec(source_format)
+        source_shards = max(1, source_shard_count or self.shard_count)
+        if source.name == self.codec.name and source_shards == self.shard_count:
+            raise ValueError(f"源格式与分片数与当前相同: {source.name} / {source_shards} 分片")
+        
+        target = self.codec
+        counts = {"doc_count": 0, "para_count": 0, "simhash_count": 0}
+        if source.name == target.name:
+            # 只调整分片数：成员与指纹原样复制（binary 摘要无法还原为完整哈希再编码）
+            convert_hash = convert_simhash = lambda raw: raw
+        else:
+            convert_hash = lambda raw: target.pack_hash(source.unpack_hash(raw))
+            convert_simhash = lambda raw: target.pack_simhash(source.unpack_simhash(raw))
+        
+        def write_sorted_sets(get_key, batch: Dict[bytes, float]):
+            pipe = self._redis.pipeline(transaction=False)
+            for shard, members in self._group_by_shard(batch).items():
+                pipe.zadd(get_key(shard), {member: batch[member] for member in members})
+            pipe.execute()
+        
+        for name, get_key, ttl_days in (
+            ("doc_count", self._get_doc_key, self.doc_ttl_days),
+            ("para_count", self._get_para_key, self.para_ttl_days)
+        ):
+            for source_key in self._shard_keys(get_key, source, source_shards):
+                # 源数据可能还是旧版本的 Set（没有过期时间，从迁移时刻开始计算）
+                if self._redis.type(source_key) == b"set":
+                    default_expire_at = self._expire_at(ttl_days)
+                    entries = ((member, default_expire_at) for member in self._redis.sscan_iter(source_key, count=batch_size))
+                else:
+                    entries = self._redis.zscan_iter(source_key, count=batch_size)
+                batch = {}
+                for member, expire_at in entries:
+                    batch[convert_hash(member)] = expire_at
+                    if len(batch) >= batch_size:
+                        write_sorted_sets(get_key, batch)
+                        counts[name] += len(batch)
+                        batch = {}
+                if batch:
+                    write_sorted_sets(get_key, batch)
+                    counts[name] += len(batch)
+        
+        def write_simhash(batch: Dict[bytes, bytes]):
+            pipe = self._redis.pipeline(transaction=False)
+            for shard, members in self._group_by_shard(batch).items():
+                pipe.hset(self._get_simhash_key(shard), mapping={member: batch[member] for member in members})
+            pipe.execute()
+        
+        for source_key in self._shard_keys(self._get_simhash_key, source, source_shards):
+            batch = {}
+            for member, value in self._redis.hscan_iter(source_key, count=batch_size):
+                batch[convert_hash(member)] = convert_simhash(value)
+                if len(batch) >= batch_size:
+                    write_simhash(batch)
+                    counts["simhash_count"] += len(batch)
+                    batch = {}
+            if batch:
+                write_simhash(batch)
+                counts["simhash_count"] += len(batch)
+        
+        self.rebuild_simhash_index(batch_size)
+        self._redis.set(f"{self._get_simhash_index_prefix()}:built", "1")
+        if self.bloom_capacity:
+            self._rebuild_para_bloom()
+        logger.info(
+            f"去重数据已从 {source.name} 格式 / {source_shards} 分片迁移为 "
+            f"{target.name} 格式 / {self.shard_count} 分片: {counts}"
+        )
+        
+        if delete_source:
+            # 格式相同时分块索引与布隆过滤器由新旧分片共用，只删除分片键
+            self._delete_keys(source, source_shards, include_shared=source.name != target.name)
+            logger.info(f"已删除 {source.name} 格式 / {source_shards} 分片的去重数据")
+        return counts
+    
+    def _delete_keys(self, codec=None, shard_count: Optional[int] = None, include_shared: bool = True):
+        """
+        Redis 后端：删除指定存储格式与分片数的全部去重键
+        
+        Args:
+            codec: 存储格式（默认为当前格式）
+            shard_count: 分片数（默认为当前分片数）
+            include_shared: 是否同时删除同一格式共用的分块索引与布隆过滤器
+        """
+        keys = (self._shard_keys(self._get_doc_key, codec, shard_count)
+                + self._shard_keys(self._get_para_key, codec, shard_count)
+                + self._shard_keys(self._get_simhash_key, codec, shard_count))
+        if not include_shared:
+            self._redis.delete(*keys)
+            return
+        bloom_key = self._get_bloom_key(codec)
+        params = self._parse_bloom_meta(self._redis.hgetall(f"{bloom_key}:meta"))
+        if params is not None:
+            keys.append(self._get_bloom_bitmap_key(params[0], codec))
+        # 代号计数器保留：清空后重建的代号仍然递增，其他进程能发现位图已切换
+        self._redis.delete(*keys, bloom_key, f"{bloom_key}:meta")
+        index_keys = list(self._redis.scan_iter(match=f"{self._get_simhash_index_prefix(codec)}:*", count=1000))
+        for i in range(0, len(index_keys), 1000):
+            self._redis.delete(*index_keys[i:i + 1000])
+    
+    def _maybe_purge_memory(self, now: float):
+        """内存后端：距上次清理超过 sweep_interval 时清理过期数据"""
+        if now >= self._next_memory_sweep:
+            self.purge_expired()
+    
+    def purge_expired(self, batch_size: int = 1000) -> int:
+        """
+        删除过期的文档/段落哈希，以及过期段落的 SimHash 指纹与分块索引
+        
+        Args:
+            batch_size: Redis 每批处理的过期段落数
+        
+        Returns:
+            删除的段落数
+        """
+        now = time.time()
+        removed = 0
+        if self.backend == "redis" and self._redis:
+            try:
+                for doc_key in self._shard_keys(self._get_doc_key):
+                    self._redis.zremrangebyscore(doc_key, "-inf", now)
+                for shard in range(self.shard_count):
+                    para_key = self._get_para_key(shard)
+                    simhash_key = self._get_simhash_key(shard)
+                    while True:
+                        expired = self._redis.zrangebyscore(para_key, "-inf", now, start=0, num=batch_size)
+                        if not expired:
+                            break
+                        values = self._redis.hmget(simhash_key, expired)
+                        pipe = self._redis.pipeline(transaction=False)
+                        for member, value in zip(expired, values):
+                            if value is None:
+                                continue
+                            pipe.hdel(simhash_key, member)
+                            for idx, block in enumerate(self._simhash_blocks(self.codec.unpack_simhash(value))):
+                                pipe.hdel(self._get_simhash_index_key(idx, block), member)
+                        pipe.zrem(para_key, *expired)
+                        pipe.execute()
+                        removed += len(expired)
+                
+                # 布隆过滤器不能删除元素：误判率超过目标 2 倍时（过期段落残留或容量不足）重建
+                if self._para_bloom is not None and self._para_bloom.estimated_fpr > self.bloom_error_rate * 2:
+                    self._rebuild_para_bloom()
+            except Exception as e:
+                logger.error(f"Redis 过期去重数据清理失败: {e}")
+        else:
+            self._next_memory_sweep = now + self.sweep_interval
+            expired_docs = [h for h, expire_at in self._memory_doc_hashes.items() if expire_at <= now]
+            for doc_hash in expired_docs:
+                del self._memory_doc_hashes[doc_hash]
+            expired = [h for h, expire_at in self._memory_para_hashes.items() if expire_at <= now]
+            for para_hash in expired:
+                self._remove_memory_para(para_hash)
+            removed = len(expired)
+        
+        self._expired_count += removed
+        if removed:
+            namespace_label = f" [{self.namespace}]" if self.namespace else ""
+            logger.info(f"清理过期段落去重数据{namespace_label}: {removed} 条")
+        return removed
+    
+    def purge_all_namespaces(self, batch_size: int = 1000) -> int:
+        """
+        清理当前存储及所有已登记命名空间的过期去重数据
+        
+        Returns:
+            删除的段落总数
+        """
+        removed = self.purge_expired(batch_size)
+        for namespace in self.known_namespaces():
+            store = self.for_namespace(namespace)
+            if store is not self:
+                removed += store.purge_expired(batch_size)
+        return removed
+    
     def get_all_para_simhash(self) -> Dict[str, int]:
         """
         获取所有段落的 SimHash（用于近重复比对）
@@ -170,14 +1319,23 @@ class DedupStore:
             {para_hash: simhash_value}
         """
         if self.backend == "redis" and self._redis:
-            try:
-                raw = self._redis.hgetall(self._get_simhash_key())
-                return {k: int(v) for k, v in raw.items()}
-            except Exception as e:
-                logger.error(f"Redis 查询失败: {e}")
-                return {}
+            unpack_hash = self.codec.unpack_hash
+            return {unpack_hash(member): value for member, value in self._get_all_para_simhash_raw().items()}
         else:
-            return self._memory_para_simhash.copy()
+            return {self._memory_hash(key): value for key, value in self._memory_para_simhash.items()}
+    
+    def _get_all_para_simhash_raw(self) -> Dict[bytes, int]:
+        """Redis 后端：获取所有段落的 SimHash（键为编码后的段落哈希）"""
+        try:
+            unpack_simhash = self.codec.unpack_simhash
+            return {
+                member: unpack_simhash(value)
+                for simhash_key in self.simhash_keys()
+                for member, value in self._redis.hgetall(simhash_key).items()
+            }
+        except Exception as e:
+            logger.error(f"Redis 查询失败: {e}")
+            return {}
     
     def clear_all(self) -> bool:
         """
@@ -188,7 +1346,10 @@ class DedupStore:
         """
         if self.backend == "redis" and self._redis:
             try:
-                self._redis.delete(self._get_doc_key(), self._get_para_key(), self._get_simhash_key())
+                self._delete_keys()
+                if self._para_bloom is not None:
+                    self._rebuild_para_bloom()
+                self._redis.set(f"{self._get_simhash_index_prefix()}:built", "1")
                 logger.warning("Redis 去重数据已清空")
                 return True
             except Exception as e:
@@ -198,6 +1359,7 @@ class DedupStore:
             self._memory_doc_hashes.clear()
             self._memory_para_hashes.clear()
             self._memory_para_simhash.clear()
+            self._memory_simhash_index = [{} for _ in self._simhash_layout]
             logger.warning("内存去重数据已清空")
             return True
     
@@ -206,24 +1368,100 @@ class DedupStore:
         获取去重统计信息
         
         Returns:
-            {"doc_count": xxx, "para_count": xxx, "simhash_count": xxx}
+            {"doc_count": xxx, "para_count": xxx, "simhash_count": xxx, "simhash_index_blocks": xxx, ...}
         """
         if self.backend == "redis" and self._redis:
             try:
-                return {
-                    "doc_count": self._redis.scard(self._get_doc_key()),
-                    "para_count": self._redis.scard(self._get_para_key()),
-                    "simhash_count": self._redis.hlen(self._get_simhash_key())
-                }
+                doc_keys, para_keys, simhash_keys = self.stats_keys()
+                return self.redis_stats(
+                    sum(self._redis.zcard(key) for key in doc_keys),
+                    sum(self._redis.zcard(key) for key in para_keys),
+                    sum(self._redis.hlen(key) for key in simhash_keys)
+                )
             except Exception as e:
                 logger.error(f"Redis 统计失败: {e}")
                 return {"doc_count": 0, "para_count": 0, "simhash_count": 0}
         else:
             return {
+                "namespace": self.namespace,
                 "doc_count": len(self._memory_doc_hashes),
                 "para_count": len(self._memory_para_hashes),
-                "simhash_count": len(self._memory_para_simhash)
+                "simhash_count": len(self._memory_para_simhash),
+                "simhash_index_blocks": len(self._simhash_layout),
+                "simhash_kernel": self._memory_para_simhash.kernel,
+                "max_paras": self.max_memory_paras,
+                "evicted_count": self._evicted_count,
+                "doc_ttl_days": self.doc_ttl_days,
+                "para_ttl_days": self.para_ttl_days,
+                "expired_count": self._expired_count
             }
+    
+    def stats_keys(self) -> Tuple[List[str], List[str], List[str]]:
+        """Redis 后端：统计用的键（文档哈希有序集合、段落哈希有序集合、指纹哈希表的全部分片）"""
+        return self._shard_keys(self._get_doc_key), self._shard_keys(self._get_para_key), self.simhash_keys()
+    
+    def simhash_keys(self) -> List[str]:
+        """Redis 后端：段落指纹哈希表的全部分片键（全量比对时读取）"""
+        return self._shard_keys(self._get_simhash_key)
+    
+    def redis_stats(self, doc_count: int, para_count: int, simhash_count: int) -> Dict:
+        """Redis 后端：由 stats_keys 各类键的计数汇总统计信息"""
+        stats = {
+            "namespace": self.namespace,
+            "hash_format": self.codec.name,
+            "shard_count": self.shard_count,
+            "doc_count": doc_count,
+            "para_count": para_count,
+            "simhash_count": simhash_count,
+            "simhash_index_blocks": len(self._simhash_layout),
+            "doc_ttl_days": self.doc_ttl_days,
+            "para_ttl_days": self.para_ttl_days,
+            "expired_count": self._expired_count
+        }
+        if self._para_bloom is not None:
+            stats["bloom"] = self._get_bloom_stats()
+        return stats
+    
+    def _get_bloom_stats(self) -> Dict:
+        """布隆过滤器统计：内存占用、估算误判率与实际观察到的误判率（当前进程计数）"""
+        bloom = self._para_bloom
+        positives = self._bloom_checks - self._bloom_negatives
+        negatives_total = self._bloom_negatives + self._bloom_false_positives
+        return {
+            "capacity": bloom.capacity,
+            "num_hashes": bloom.num_hashes,
+            "memory_bytes": bloom.memory_bytes,
+            "fill_ratio": round(bloom.fill_ratio, 4),
+            "target_fpr": bloom.error_rate,
+            "estimated_fpr": round(bloom.estimated_fpr, 6),
+            "observed_fpr": round(self._bloom_false_positives / negatives_total, 6) if negatives_total else 0.0,
+            "checks": self._bloom_checks,
+            "local_negatives": self._bloom_negatives,
+            "redis_lookups": positives
+        }
+
+
+def _build_block_layout(num_blocks: int) -> List[Tuple[int, int]]:
+    """
+    计算 64 位指纹的分块布局（块宽尽量均分）
+    
+    Returns:
+        [(右移位数, 掩码), ...]
+    """
+    num_blocks = max(1, min(num_blocks, SIMHASH_BITS))
+    base, extra = divmod(SIMHASH_BITS, num_blocks)
+    layout = []
+    shift = 0
+    for i in range(num_blocks):
+        width = base + (1 if i < extra else 0)
+        layout.append((shift, (1 << width) - 1))
+        shift += width
+    return layout
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    """计算两个整数的汉明距离（二进制位不同的个数）"""
+    return (hash1 ^ hash2).bit_count()
 
 
 def compute_sha256(text: str) -> str:
@@ -1,15 +1,17 @@
+import hashlib
 import os
 import uuid
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Tuple
 from fastapi import UploadFile
 
 
 class FileHandler:
     """文件处理工具类"""
     
-    def __init__(self, base_dir: str = "storage"):
+    def __init__(self, base_dir: str = "storage", chunk_size: int = 1024 * 1024):
         self.base_dir = Path(base_dir)
+        self.chunk_size = chunk_size
         self.original_dir = self.base_dir / "original"
         self.converted_dir = self.base_dir / "converted"
         self.batch_dir = self.base_dir / "batch"
@@ -59,12 +61,30 @@ class FileHandler:
             unique_name = f"{uuid.uuid4()}_{upload_file.filename}"
             file_path = save_dir / unique_name
         
-        content = await upload_file.read()
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        await self.write_upload_file(upload_file, file_path)
         
         return str(file_path)
     
+    async def write_upload_file(self, upload_file: UploadFile, file_path: Path) -> Tuple[int, str]:
+        """
+        分块写入上传文件，同时增量计算 SHA-256
+        
+        Returns:
+            (写入字节数, SHA-256 十六进制字符串)
+        """
+        sha256_hash = hashlib.sha256()
+        size = 0
+        with open(file_path, 'wb') as f:
+            while True:
+                chunk = await upload_file.read(self.chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                sha256_hash.update(chunk)
+                size += len(chunk)
+        
+        return size, sha256_hash.hexdigest()
+    
     def get_batch_dir(self, task_id: str) -> Path:
         """获取批量任务的工作目录"""
         batch_task_dir = self.batch_dir / task_id
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+段落指纹备忘 - 批量任务内复用段落的 SHA-256 与 SimHash
+
+同一批文档中大量段落重复出现（免责声明、页眉、签名块等），即使不做跨文档去重，
+每个文档也要重新计算这些段落的哈希与指纹。备忘以段落文本为键缓存 (SHA-256, SimHash)，
+容量有界，超过后按最近使用时间（LRU）淘汰。
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+MemoEntry = Tuple[str, Optional[int]]
+
+
+class ParagraphMemo:
+    """段落文本 -> (SHA-256, SimHash) 的有界 LRU 备忘（线程安全）"""
+    
+    # 超过该长度的段落不缓存（样板段落通常很短，长段落只会占用内存）
+    MAX_TEXT_LEN = 4096
+    
+    def __init__(self, max_entries: int = 50000):
+        """
+        Args:
+            max_entries: 最多缓存的段落数
+        """
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, MemoEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.lookups = 0
+    
+    def get_many(self, paragraphs: Iterable[str]) -> Dict[str, MemoEntry]:
+        """
+        批量查询（命中的段落更新 LRU 顺序）
+        
+        Returns:
+            {段落文本: (SHA-256, SimHash 或 None)}，只包含命中的段落
+        """
+        found: Dict[str, MemoEntry] = {}
+        with self._lock:
+            entries = self._entries
+            for para in paragraphs:
+                self.lookups += 1
+                entry = entries.get(para)
+                if entry is not None:
+                    entries.move_to_end(para)
+                    found[para] = entry
+            self.hits += len(found)
+        return found
+    
+    def put_many(self, items: Dict[str, MemoEntry]):
+        """批量写入（超过容量时淘汰最久未使用的段落）"""
+        with self._lock:
+            entries = self._entries
+            for para, entry in items.items():
+                if len(para) <= self.MAX_TEXT_LEN:
+                    entries[para] = entry
+                    entries.move_to_end(para)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_stats(self) -> Dict:
+        """命中统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "lookups": self.lookups,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0
+            }
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+转换结果缓存模块 - 以原始文件 SHA-256 为内容地址的持久化缓存
+
+缓存键 = 文件哈希 + 处理模式 + 管线配置指纹，值包括：
+- 检测结论（是否纯文本、原因）
+- 转换结果（消息、管线统计、文档哈希）
+- 转换后的文件（blob，保存在缓存目录）
+
+索引保存在 SQLite（同一存储目录下多进程共享），blob 总大小超过上限时按最近访问时间（LRU）淘汰。
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+from utils.logger import get_logger
+
+logger = get_logger("result_cache")
+
+# 转换/检测逻辑变更时递增，使旧缓存自动失效
+CACHE_FORMAT_VERSION = 4
+
+
+class ConversionCache:
+    """内容寻址的转换结果缓存"""
+    
+    def __init__(self, cache_dir: str = "storage/cache", index_path: Optional[str] = None,
+                 max_size_mb: int = 1024, fingerprint: str = "", enabled: bool = True):
+        """
+        初始化缓存
+        
+        Args:
+            cache_dir: blob 保存目录
+            index_path: SQLite 索引路径（默认 cache_dir/index.db）
+            max_size_mb: blob 总大小上限（MB），超过后按 LRU 淘汰
+            fingerprint: 管线配置指纹（配置变化时缓存自动失效）
+            enabled: 是否启用缓存
+        """
+        self.enabled = enabled
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / "blobs"
+        self.index_path = index_path or str(self.cache_dir / "index.db")
+        self.max_bytes = max(0, max_size_mb) * 1024 * 1024
+        self.fingerprint = fingerprint
+        self._hits = 0
+        self._misses = 0
+        
+        if not self.enabled:
+            logger.info("转换结果缓存已禁用")
+            return
+        
+        try:
+            self._init_sqlite()
+            logger.info(f"转换结果缓存: {self.cache_dir} (上限 {max_size_mb} MB)")
+        except Exception as e:
+            logger.error(f"转换结果缓存初始化失败，已禁用: {e}")
+            self.enabled = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        """创建 SQLite 连接（每次操作独立连接，线程/进程安全）"""
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def _init_sqlite(self):
+        """初始化 SQLite 表结构"""
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "cache_key TEXT PRIMARY KEY, meta TEXT NOT NULL, blob_name TEXT, "
+                "blob_size INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        finally:
+            conn.close()
+    
+    def make_key(self, file_hash: str, *parts: str) -> str:
+        """
+        计算缓存键
+        
+        Args:
+            file_hash: 原始文件 SHA-256
+            *parts: 影响结果的其他因素（扩展名、处理模式等）
+        
+        Returns:
+            缓存键（十六进制字符串）
+        """
+        raw = "|".join([str(CACHE_FORMAT_VERSION), self.fingerprint, file_hash, *parts])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """
+        查询缓存
+        
+        Returns:
+            缓存的结果 dict（含 blob_path，如有），未命中返回 None
+        """
+        if not self.enabled:
+            return None
+        
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT meta, blob_name FROM entries WHERE cache_key = ?", (cache_key,)
+                ).fetchone()
+                if row is None:
+                    self._misses += 1
+                    return None
+                
+                meta = json.loads(row[0])
+                if row[1]:
+                    blob_path = self.blob_dir / row[1]
+                    if not blob_path.exists():
+                        # blob 被外部删除：索引失效
+                        conn.execute("DELETE FROM entries WHERE cache_key = ?", (cache_key,))
+                        self._misses += 1
+                        return None
+                    meta['blob_path'] = str(blob_path)
+                
+                conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE cache_key = ?", (time.time(), cache_key)
+                )
+                self._hits += 1
+                return meta
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"读取转换结果缓存失败: {e}")
+            return None
+    
+    def put(self, cache_key: str, meta: Dict, blob_file: Optional[str] = None) -> bool:
+        """
+        写入缓存
+        
+        Args:
+            cache_key: 缓存键
+            meta: 可 JSON 序列化的结果信息
+            blob_file: 需要缓存的输出文件路径（可选）
+        
+        Returns:
+            是否写入成功
+        """
+        if not self.enabled:
+            return False
+        
+        blob_name = None
+        blob_size = 0
+        try:
+            if blob_file:
+                blob_size = os.path.getsize(blob_file)
+                if self.max_bytes and blob_size > self.max_bytes:
+                    logger.debug(f"文件超过缓存上限，不缓存: {blob_file}")
+                    return False
+                
+                # 先写临时文件再原子替换，避免并发读到半个文件
+                blob_name = f"{cache_key[:2]}/{cache_key}{Path(blob_file).suffix}"
+                blob_path = self.blob_dir / blob_name
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = blob_path.with_name(f".{uuid.uuid4().hex}.tmp")
+                shutil.copyfile(blob_file, tmp_path)
+                os.replace(tmp_path, blob_path)
+            
+            now = time.time()
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (cache_key, meta, blob_name, blob_size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (cache_key, json.dumps(meta, ensure_ascii=False), blob_name, blob_size, now, now)
+                )
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"写入转换结果缓存失败: {e}")
+            return False
+        
+        if blob_size:
+            self._evict()
+        return True
+    
+    def restore_blob(self, entry: Dict, output_file: str) -> bool:
+        """把缓存的输出文件复制到目标路径"""
+        blob_path = entry.get('blob_path')
+        if not blob_path:
+            return False
+        try:
+            shutil.copyfile(blob_path, output_file)
+            return True
+        except Exception as e:
+            logger.error(f"恢复缓存文件失败: {blob_path} -> {output_file}, {e}")
+            return False
+    
+    def _evict(self):
+        """blob 总大小超过上限时，按最近访问时间淘汰最旧的条目"""
+        if not self.max_bytes:
+            return
+        
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.error(f"转换结果缓存淘汰失败: {e}")
+            return
+        
+        try:
+            total = conn.execute("SELECT COALESCE(SUM(blob_size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            
+            removed = 0
+            rows = conn.execute(
+                "SELECT cache_key, blob_name, blob_size FROM entries "
+                "WHERE blob_size > 0 ORDER BY last_access ASC"
+            ).fetchall()
+            for cache_key, blob_name, blob_size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE cache_key = ?", (cache_key,))
+                try:
+                    (self.blob_dir / blob_name).unlink()
+                except FileNotFoundError:
+                    pass
+                total -= blob_size
+                removed += 1
+            logger.info(f"转换结果缓存淘汰 {removed} 个条目，当前大小 {total / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            logger.error(f"转换结果缓存淘汰失败: {e}")
+        finally:
+            conn.close()
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息（命中/未命中为当前进程计数）"""
+        stats = {
+            "enabled": self.enabled,
+            "hits": self._hits,
+            "misses": self._misses
+        }
+        if not self.enabled:
+            return stats
+        
+        try:
+            conn = self._connect()
+            try:
+                count, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(blob_size), 0) FROM entries"
+                ).fetchone()
+            finally:
+                conn.close()
+            stats["entries"] = count
+            stats["size_mb"] = round(size / 1024 / 1024, 2)
+            stats["max_size_mb"] = round(self.max_bytes / 1024 / 1024, 2)
+        except Exception as e:
+            logger.error(f"获取缓存统计失败: {e}")
+        return stats
+
+
+def build_cache_entry(is_pure_text: bool, reason: str, convert_result: Optional[Dict] = None) -> Dict:
+    """
+    构建缓存条目：检测结论 + 转换结果中与内容相关的部分
+    
+    文档级去重命中的结果也按成功缓存，复用时由转换器根据去重存储的当前状态重新判断。
+    """
+    entry = {'is_pure_text': is_pure_text, 'reason': reason}
+    if convert_result is not None:
+        entry['convert'] = {
+            'message': convert_result["message"] if convert_result["success"] else "转换与清洗成功",
+            'pipeline_stats': convert_result.get("pipeline_stats"),
+            'doc_hash': convert_result.get("doc_hash"),
+            'content_hash': convert_result.get("content_hash")
+        }
+    return entry
+
+
+def create_result_cache(text_pipeline=None) -> ConversionCache:
+    """
+    根据全局配置创建转换结果缓存
+    
+    Args:
+        text_pipeline: TextPipeline 实例（与检测配置一起计算配置指纹）
+    """
+    from config import config
+    
+    enabled = config.ResultCache.ENABLED
+    # 检测参数影响判定结论，与管线配置一起计入指纹
+    fingerprint = (
+        f"pdf:{config.Detection.PDF_IMAGE_PREPASS}:"
+        f"{config.Detection.PDF_SAMPLE_THRESHOLD}:{config.Detection.PDF_SAMPLE_PAGES}"
+    )
+    if text_pipeline is not None:
+        fingerprint = f"{fingerprint}|{text_pipeline.config_fingerprint()}"
+        # 跨文档段落去重的结果取决于去重存储状态，不能按内容缓存
+        if text_pipeline.enable_cross_doc_dedup:
+            enabled = False
+    
+    return ConversionCache(
+        cache_dir=config.ResultCache.DIR,
+        index_path=config.ResultCache.INDEX_PATH or None,
+        max_size_mb=config.ResultCache.MAX_SIZE_MB,
+        fingerprint=fingerprint,
+        enabled=enabled
+    )
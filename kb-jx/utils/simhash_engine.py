@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SimHash 指纹引擎 - 整篇文档段落批量计算指纹
+
+simhash 库逐段落调用，每个特征（4 字符滑窗）在 Python 层做 MD5，速度慢，
+且按字符滑窗对中文段落并不理想。本引擎：
+- 分词后把每个 token 映射为整数 ID，n-gram 切片（shingle）的哈希在 NumPy 中向量化计算
+  （FNV-1a 组合 + splitmix64 混合，非加密、跨进程稳定）
+- 一次调用处理整篇文档的所有段落：所有 shingle 拼接后按位展开，按段落分段累加投票
+- 重复出现的 shingle 自然按出现次数加权（与 simhash 库的特征计数一致）
+
+分词策略（SIMHASH_TOKENIZER）：
+- cjk: 每个中日韩字符为一个 token，其余连续的字母数字为一个 token
+- char: 与 simhash 库相同的预处理（小写、只保留文字字符），每个字符为一个 token
+- legacy: 直接使用 simhash 库（与历史存储的指纹兼容，服务配置的默认值）
+
+注意：不同策略得到的指纹互不兼容，切换策略后已存储的指纹不再参与近重复比对。
+"""
+import re
+import zlib
+from typing import List, Optional, Tuple
+
+# 安全导入 numpy
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# 安全导入 simhash
+try:
+    from simhash import Simhash
+    HAS_SIMHASH = True
+except ImportError:
+    HAS_SIMHASH = False
+
+TOKENIZERS = ("cjk", "char", "legacy")
+
+_MASK64 = (1 << 64) - 1
+_FNV_OFFSET = 0xcbf29ce484222325
+_FNV_PRIME = 0x100000001b3
+
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+# cjk：非文字字符（含下划线）逐个替换为空格（保持字符偏移），中日韩字符逐字成 token，其余连续字符成一个单词 token
+_NON_TOKEN_RE = re.compile(r'[\W_]')
+# 中日韩字符码点区间（与 _CJK_RANGES 一致，用于向量化判断）
+_CJK_CODEPOINTS = ((0x3040, 0x30ff), (0x3400, 0x4dbf), (0x4e00, 0x9fff), (0xf900, 0xfaff), (0xac00, 0xd7af))
+# char：与 simhash 库默认的 reg 一致
+_CHAR_TOKEN_RE = re.compile(r'[\w\u4e00-\u9fcc]+')
+
+# 多字符 token（单词）的 ID 区间，避免与单字符的码点冲突
+_WORD_ID_FLAG = 1 << 32
+
+# 每批按位展开的 shingle 数上限（展开后为 N x 64 字节）
+_BATCH_SHINGLES = 65536
+
+
+def _mix64(h: int) -> int:
+    """splitmix64 末端混合（Python 整数版，与向量化版本结果一致）"""
+    h ^= h >> 30
+    h = (h * 0xbf58476d1ce4e5b9) & _MASK64
+    h ^= h >> 27
+    h = (h * 0x94d049bb133111eb) & _MASK64
+    h ^= h >> 31
+    return h
+
+
+def _hash_tokens(tokens) -> int:
+    """整段 token 序列作为一个 shingle 的哈希（段落 token 数不足 n 时使用）"""
+    h = _FNV_OFFSET
+    for token in tokens:
+        h = ((h ^ int(token)) * _FNV_PRIME) & _MASK64
+    return _mix64(h)
+
+
+if HAS_NUMPY:
+    def _mix64_array(h: "np.ndarray") -> "np.ndarray":
+        """splitmix64 末端混合（向量化，uint64 乘法按 2^64 回绕）"""
+        h = h ^ (h >> np.uint64(30))
+        h = h * np.uint64(0xbf58476d1ce4e5b9)
+        h = h ^ (h >> np.uint64(27))
+        h = h * np.uint64(0x94d049bb133111eb)
+        return h ^ (h >> np.uint64(31))
+
+
+class SimhashEngine:
+    """批量 SimHash 指纹计算"""
+    
+    def __init__(self, tokenizer: str = "legacy", ngram: int = 2):
+        """
+        Args:
+            tokenizer: 分词策略 legacy / cjk / char（默认 legacy，与已存储的指纹兼容）
+            ngram: shingle 包含的 token 数（legacy 模式不使用，固定为 simhash 库的 4 字符滑窗）
+        
+        Raises:
+            ValueError: 未知的分词策略
+        """
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"未知的 SimHash 分词策略: {tokenizer}（可选: {', '.join(TOKENIZERS)}）")
+        
+        # 未安装 NumPy 时退回 simhash 库
+        if tokenizer != "legacy" and not HAS_NUMPY:
+            tokenizer = "legacy"
+        self.tokenizer = tokenizer
+        self.ngram = max(1, ngram)
+    
+    @property
+    def available(self) -> bool:
+        """当前环境是否可以计算指纹"""
+        return HAS_NUMPY if self.tokenizer != "legacy" else HAS_SIMHASH
+    
+    def describe(self) -> str:
+        """引擎配置描述（计入管线配置指纹）"""
+        if self.tokenizer == "legacy":
+            return "legacy"
+        return f"{self.tokenizer}:{self.ngram}"
+    
+    def fingerprint(self, text: str) -> int:
+        """计算单个段落的指纹"""
+        return self.fingerprints([text])[0]
+    
+    def fingerprints(self, texts: List[str]) -> List[int]:
+        """
+        批量计算段落指纹
+        
+        Args:
+            texts: 段落文本列表
+        
+        Returns:
+            与输入顺序一致的 64 位指纹列表
+        """
+        if self.tokenizer == "legacy":
+            return [Simhash(text).value for text in texts]
+        
+        n = self.ngram
+        results: List[Optional[int]] = [None] * len(texts)
+        tokens, lengths = self._tokenize(texts)
+        offsets = np.cumsum(lengths) - lengths
+        
+        batch_ids: List[int] = []
+        batch_tokens: List["np.ndarray"] = []
+        batch_shingles = 0
+        for i, (offset, length) in enumerate(zip(offsets.tolist(), lengths.tolist())):
+            para_tokens = tokens[offset:offset + length]
+            if length <= n:
+                # 最多一个窗口：整段作为唯一 shingle，指纹即该 shingle 的哈希
+                results[i] = _hash_tokens(para_tokens)
+                continue
+            
+            batch_ids.append(i)
+            batch_tokens.append(para_tokens)
+            batch_shingles += length - n + 1
+            if batch_shingles >= _BATCH_SHINGLES:
+                self._fingerprint_batch(batch_ids, batch_tokens, results)
+                batch_ids, batch_tokens, batch_shingles = [], [], 0
+        
+        if batch_ids:
+            self._fingerprint_batch(batch_ids, batch_tokens, results)
+        return results
+    
+    def _tokenize(self, texts: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        整批段落一次转换为 token ID（uint64）
+        
+        Returns:
+            (所有段落拼接的 token ID 数组, 每个段落的 token 数)
+        """
+        lowered = [text.lower() for text in texts]
+        if self.tokenizer == "char":
+            joined = [''.join(_CHAR_TOKEN_RE.findall(text)) for text in lowered]
+            codepoints = np.frombuffer(''.join(joined).encode('utf-32-le'), dtype=np.uint32)
+            return codepoints.astype(np.uint64), np.array([len(text) for text in joined], dtype=np.int64)
+        
+        # 段落之间以空格分隔，替换不改变字符偏移，token 位置可直接映射回段落
+        cleaned = _NON_TOKEN_RE.sub(' ', ' '.join(lowered))
+        char_starts = np.cumsum([len(text) + 1 for text in lowered]) - np.array([len(text) + 1 for text in lowered])
+        codepoints = np.frombuffer(cleaned.encode('utf-32-le'), dtype=np.uint32)
+        
+        is_cjk = np.zeros(len(codepoints), dtype=bool)
+        for low, high in _CJK_CODEPOINTS:
+            is_cjk |= (codepoints >= low) & (codepoints <= high)
+        is_word = ~is_cjk & (codepoints != 32)
+        
+        ids = codepoints.astype(np.uint64)
+        keep = is_cjk
+        if is_word.any():
+            # 单词 token：单字符直接用码点，多字符用 CRC32 映射到单词区间
+            edges = np.diff(np.concatenate(([False], is_word, [False])).astype(np.int8))
+            word_starts = np.flatnonzero(edges == 1)
+            word_ends = np.flatnonzero(edges == -1)
+            multi = (word_ends - word_starts) > 1
+            ids[word_starts[multi]] = [
+                zlib.crc32(cleaned[start:end].encode('utf-8')) | _WORD_ID_FLAG
+                for start, end in zip(word_starts[multi].tolist(), word_ends[multi].tolist())
+            ]
+            keep[word_starts] = True
+        
+        positions = np.flatnonzero(keep)
+        para_index = np.searchsorted(char_starts, positions, side='right') - 1
+        return ids[positions], np.bincount(para_index, minlength=len(texts)).astype(np.int64)
+    
+    def _fingerprint_batch(self, ids: List[int], token_arrays: List["np.ndarray"],
+                           results: List[Optional[int]]):
+        """一批段落：向量化计算 shingle 哈希并按段落累加位投票"""
+        n = self.ngram
+        lengths = np.array([len(tokens) for tokens in token_arrays], dtype=np.int64)
+        tokens = np.concatenate(token_arrays)
+        window_count = len(tokens) - n + 1
+        
+        # 所有窗口的 FNV-1a 组合哈希（跨段落边界的窗口随后剔除）
+        hashes = np.full(window_count, _FNV_OFFSET, dtype=np.uint64)
+        for offset in range(n):
+            hashes = (hashes ^ tokens[offset:offset + window_count]) * np.uint64(_FNV_PRIME)
+        hashes = _mix64_array(hashes)
+        
+        # 每个段落的有效窗口：[段落起点, 段落起点 + 长度 - n]
+        starts = np.cumsum(lengths) - lengths
+        counts = lengths - n + 1
+        segment_starts = np.cumsum(counts) - counts
+        valid = np.arange(int(counts.sum())) + np.repeat(starts - segment_starts, counts)
+        hashes = hashes[valid]
+        
+        # 按位展开后分段求和：某位为 1 的 shingle 超过一半则指纹该位为 1
+        bits = np.unpackbits(hashes.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        ones = np.add.reduceat(bits, segment_starts, axis=0, dtype=np.int32)
+        votes = (ones * 2 > counts[:, None]).astype(np.uint8)
+        values = np.packbits(votes, axis=1, bitorder='little').view('<u8').ravel()
+        
+        for i, value in zip(ids, values):
+            results[i] = int(value)
+
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SimHash 指纹矩阵 - 批量汉明距离计算
+
+指纹保存在连续的 uint64 数组中（按行号寻址），一次调用即可把一个或一整篇文档的段落指纹
+与成千上万个候选指纹比对：XOR 后按位计数（NumPy >= 2.0 使用 np.bitwise_count，
+否则使用字节查表），不再逐对在 Python 层循环。
+
+未安装 NumPy 时使用 array('Q') 保存指纹并逐个 int.bit_count() 计算，接口不变。
+
+删除的指纹行进入空闲列表，后续写入时复用（行号在删除前后保持稳定，分块索引无需重排）。
+"""
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 安全导入 numpy
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+if HAS_NUMPY and not hasattr(np, "bitwise_count"):
+    # 每个字节的置位数
+    _POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: "np.ndarray") -> "np.ndarray":
+    """uint64 数组逐元素置位计数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values)
+    return _POPCOUNT_LUT[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+# 已删除行的比对距离（大于 64 位指纹的最大汉明距离）
+_REMOVED_DISTANCE = 255
+
+
+class FingerprintMatrix:
+    """按行存储的 SimHash 指纹矩阵"""
+    
+    # 全量比对时每次处理的 (查询数 x 指纹数) 上限，控制临时数组内存
+    SCAN_CHUNK_CELLS = 4_000_000
+    
+    def __init__(self, initial_capacity: int = 1024):
+        self.keys: List[Optional[str]] = []  # 行号 -> para_hash（已删除的行为 None）
+        self._rows: Dict[str, int] = {}  # para_hash -> 行号
+        self._free: List[int] = []  # 已删除、可复用的行号
+        self._size = 0
+        if HAS_NUMPY:
+            self._values = np.zeros(max(1, initial_capacity), dtype=np.uint64)
+        else:
+            self._values = array('Q')
+    
+    def __len__(self) -> int:
+        return self._size - len(self._free)
+    
+    @property
+    def kernel(self) -> str:
+        """当前使用的计算实现"""
+        return "numpy" if HAS_NUMPY else "python"
+    
+    def add(self, key: str, value: int) -> int:
+        """
+        写入指纹（同一 key 重复写入时原地更新）
+        
+        Returns:
+            指纹所在行号
+        """
+        row = self._rows.get(key)
+        if row is not None:
+            self._values[row] = value
+            return row
+        
+        if self._free:
+            row = self._free.pop()
+            self._values[row] = value
+            self.keys[row] = key
+            self._rows[key] = row
+            return row
+        
+        row = self._size
+        if HAS_NUMPY:
+            if row == len(self._values):
+                # 容量翻倍，均摊 O(1) 追加
+                grown = np.zeros(len(self._values) * 2, dtype=np.uint64)
+                grown[:row] = self._values
+                self._values = grown
+            self._values[row] = value
+        else:
+            self._values.append(value)
+        
+        self.keys.append(key)
+        self._rows[key] = row
+        self._size += 1
+        return row
+    
+    def get(self, key: str) -> Optional[int]:
+        """获取指纹值，不存在返回 None"""
+        row = self._rows.get(key)
+        return int(self._values[row]) if row is not None else None
+    
+    def remove(self, key: str) -> Optional[Tuple[int, int]]:
+        """
+        删除指纹（行号进入空闲列表）
+        
+        Returns:
+            (原行号, 指纹值)，不存在返回 None
+        """
+        row = self._rows.pop(key, None)
+        if row is None:
+            return None
+        self.keys[row] = None
+        self._free.append(row)
+        return row, int(self._values[row])
+    
+    def items(self):
+        """遍历 (para_hash, simhash_value)"""
+        for row, key in enumerate(self.keys):
+            if key is not None:
+                yield key, int(self._values[row])
+    
+    def clear(self):
+        self.keys = []
+        self._rows = {}
+        self._free = []
+        self._size = 0
+        if HAS_NUMPY:
+            self._values = np.zeros(len(self._values), dtype=np.uint64)
+        else:
+            self._values = array('Q')
+    
+    def nearest_in_rows(self, queries: Sequence[int], rows_list: Sequence[Iterable[int]],
+                        max_distance: int) -> List[Optional[Tuple[str, int]]]:
+        """
+        每个查询指纹只与各自的候选行比对（分块索引召回的候选）
+        
+        所有 (查询, 候选) 对拼接后一次完成 XOR 与置位计数，再按查询分段取最小值。
+        候选行可以重复（同一指纹落在多个相同块中），不影响结果。
+        
+        Args:
+            queries: 查询指纹列表
+            rows_list: 与 queries 对应的候选行号（可迭代对象）
+            max_distance: 汉明距离阈值
+        
+        Returns:
+            与输入顺序一致的 [(para_hash, 汉明距离) 或 None, ...]
+        """
+        if not HAS_NUMPY:
+            return [self._nearest_python(query, rows, max_distance) for query, rows in zip(queries, rows_list)]
+        
+        results: List[Optional[Tuple[str, int]]] = [None] * len(queries)
+        row_arrays = [np.fromiter(rows, dtype=np.int64) for rows in rows_list]
+        counts = np.array([len(rows) for rows in row_arrays], dtype=np.int64)
+        if not counts.any():
+            return results
+        
+        flat_rows = np.concatenate(row_arrays)
+        distances = _popcount(self._values[flat_rows] ^ np.repeat(np.array(queries, dtype=np.uint64), counts))
+        
+        # 按查询分段取最小距离（reduceat 不支持空段，只对非空段计算）
+        non_empty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[non_empty]
+        minimums = np.minimum.reduceat(distances, starts)
+        for i, start, minimum in zip(non_empty, starts, minimums):
+            if minimum <= max_distance:
+                offset = int(np.argmin(distances[start:start + counts[i]]))
+                results[i] = (self.keys[int(flat_rows[start + offset])], int(minimum))
+        return results
+    
+    def nearest_all(self, queries: Sequence[int], max_distance: int) -> List[Optional[Tuple[str, int]]]:
+        """
+        每个查询指纹与全部指纹比对（距离阈值超过索引上限时使用）
+        
+        Returns:
+            与输入顺序一致的 [(para_hash, 汉明距离) 或 None, ...]
+        """
+        if len(self) == 0:
+            return [None] * len(queries)
+        if not HAS_NUMPY:
+            all_rows = [row for row in range(self._size) if self.keys[row] is not None]
+            return [self._nearest_python(query, all_rows, max_distance) for query in queries]
+        
+        values = self._values[:self._size]
+        query_values = np.array(queries, dtype=np.uint64)
+        free_rows = np.array(self._free, dtype=np.int64)
+        chunk = max(1, self.SCAN_CHUNK_CELLS // self._size)
+        results: List[Optional[Tuple[str, int]]] = []
+        for start in range(0, len(query_values), chunk):
+            distances = _popcount(query_values[start:start + chunk, None] ^ values[None, :])
+            if len(free_rows):
+                # 已删除的行不参与比对（距离置为超过任何阈值的值）
+                distances[:, free_rows] = _REMOVED_DISTANCE
+            best_rows = distances.argmin(axis=1)
+            best = distances[np.arange(len(best_rows)), best_rows]
+            for row, distance in zip(best_rows, best):
+                results.append((self.keys[int(row)], int(distance)) if distance <= max_distance else None)
+        return results
+    
+    def _nearest_python(self, query: int, rows: Iterable[int], max_distance: int) -> Optional[Tuple[str, int]]:
+        """纯 Python 比对（未安装 NumPy 时）"""
+        best: Optional[Tuple[int, int]] = None
+        for row in rows:
+            distance = (query ^ self._values[row]).bit_count()
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (row, distance)
+                if distance == 0:
+                    break
+        return (self.keys[best[0]], best[1]) if best is not None else None
@@ -0,0 +1,153 @@
+"""
+流式上传接收 - 直接解析 multipart/form-data 请求体
+
+FastAPI 的 UploadFile 会先把整个请求体写入临时文件（SpooledTemporaryFile），
+批量上传时等于在磁盘上多留一份完整副本。这里按块解析原始请求流，
+文件字段的每个数据块直接写入目标路径，同时增量计算 SHA-256，
+峰值内存只与单个数据块大小相关，与批量大小无关。
+"""
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from utils.logger import get_logger
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    HAS_MULTIPART = True
+except ImportError:
+    try:
+        from multipart.multipart import MultipartParser, parse_options_header
+        HAS_MULTIPART = True
+    except ImportError:
+        HAS_MULTIPART = False
+
+logger = get_logger("stream_upload")
+
+
+class MultipartFileReceiver:
+    """流式 multipart 接收器：把指定字段的文件逐块写入磁盘"""
+    
+    def __init__(self, content_type: str, resolve_path: Callable[[str], Path],
+                 field_name: str = "files"):
+        """
+        初始化接收器
+        
+        Args:
+            content_type: 请求的 Content-Type 头（需包含 boundary）
+            resolve_path: 根据上传文件名返回保存路径的回调
+            field_name: 接收的表单字段名，其他字段忽略
+        
+        Raises:
+            ValueError: Content-Type 不是 multipart/form-data 或缺少 boundary
+        """
+        if not HAS_MULTIPART:
+            raise RuntimeError("python-multipart 未安装，无法使用流式上传")
+        
+        ctype, params = parse_options_header(content_type or "")
+        boundary = params.get(b"boundary")
+        if ctype != b"multipart/form-data" or not boundary:
+            raise ValueError("请求必须是带 boundary 的 multipart/form-data")
+        
+        self.resolve_path = resolve_path
+        self.field_name = field_name
+        self.entries: List[Optional[Dict]] = []
+        
+        # 当前 part 的解析状态
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._file = None
+        self._entry: Optional[Dict] = None
+        self._hasher = None
+        
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+    
+    async def receive(self, stream: AsyncIterator[bytes]) -> List[Optional[Dict]]:
+        """
+        消费请求流直到结束
+        
+        Args:
+            stream: 请求体异步迭代器（request.stream()）
+        
+        Returns:
+            文件条目列表，每项为 {'filename', 'original_file', 'sha256', 'size'}，
+            保存失败的文件为 None
+        """
+        try:
+            async for chunk in stream:
+                self._parser.write(chunk)
+            self._parser.finalize()
+        finally:
+            # 客户端中断时关闭未完成的文件
+            self._close_file()
+        return self.entries
+    
+    def _on_part_begin(self):
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+    
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+    
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+    
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if name != self.field_name or b"filename" not in options:
+            return
+        
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        try:
+            file_path = self.resolve_path(filename)
+            self._file = open(file_path, "wb")
+            self._hasher = hashlib.sha256()
+            self._entry = {'filename': filename, 'original_file': str(file_path), 'size': 0}
+        except Exception as e:
+            logger.error(f"保存文件 {filename} 失败: {e}")
+            # 记录失败但继续接收后续文件
+            self.entries.append(None)
+    
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            return
+        chunk = data[start:end]
+        try:
+            self._file.write(chunk)
+            self._hasher.update(chunk)
+            self._entry['size'] += len(chunk)
+        except Exception as e:
+            logger.error(f"写入文件 {self._entry['filename']} 失败: {e}")
+            self._close_file()
+            self._entry = None
+            self.entries.append(None)
+    
+    def _on_part_end(self):
+        if self._file is None:
+            return
+        self._close_file()
+        self._entry['sha256'] = self._hasher.hexdigest()
+        logger.debug(f"保存文件 [{len(self.entries)+1}]: {self._entry['filename']} ({self._entry['size']} bytes)")
+        self.entries.append(self._entry)
+        self._entry = None
+    
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
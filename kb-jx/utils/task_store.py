@@ -0,0 +1,644 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量任务存储模块 - 任务状态与工作队列，支持 Redis / SQLite / 内存三种后端
+
+- Redis：多节点共享，多个 API 进程入队、多个 worker 进程消费
+- SQLite：单节点多进程共享（同一存储目录）
+- 内存：仅单进程，重启后丢失
+
+每个任务的单文件结果单独追加保存（不写入任务状态），任务状态只保存计数，
+轮询与进度推送按偏移增量读取新完成的文件。
+"""
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, List
+from utils.logger import get_logger
+
+try:
+    from config import config as app_config
+    HAS_CONFIG = True
+except ImportError:
+    HAS_CONFIG = False
+
+logger = get_logger("task_store")
+
+
+class TaskStore:
+    """批量任务状态与工作队列存储"""
+    
+    def __init__(self, backend: str = "sqlite", redis_config: Optional[Dict] = None,
+                 sqlite_path: str = "storage/tasks.db", ttl_days: int = 7, redis_client=None):
+        """
+        初始化任务存储
+        
+        Args:
+            backend: "redis"、"sqlite" 或 "memory"
+            redis_config: Redis 配置 {"host": "127.0.0.1", "port": 6379, "db": 1, "password": "xxx"}
+            sqlite_path: SQLite 数据库文件路径
+            ttl_days: 任务状态保留天数
+            redis_client: 复用的 Redis 客户端（需 decode_responses=True；提供时不再按 redis_config 连接）
+        """
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        self.ttl_seconds = max(1, ttl_days) * 86400
+        self._redis = None
+        self._memory_tasks: Dict[str, Dict] = {}
+        self._memory_file_results: Dict[str, List[str]] = {}
+        self._memory_queue: "queue.Queue[Dict]" = queue.Queue()
+        self._memory_lock = threading.Lock()
+        
+        if backend == "redis" and redis_client is not None:
+            self._redis = redis_client
+        elif backend == "redis":
+            try:
+                import redis
+                socket_timeout = 5
+                if HAS_CONFIG:
+                    socket_timeout = app_config.Redis.SOCKET_TIMEOUT + app_config.TaskQueue.DEQUEUE_TIMEOUT
+                self._redis = redis.Redis(
+                    host=redis_config.get("host", "127.0.0.1"),
+                    port=redis_config.get("port", 6379),
+                    db=redis_config.get("db", 1),
+                    password=redis_config.get("password"),
+                    decode_responses=True,
+                    socket_connect_timeout=5,
+                    socket_timeout=socket_timeout  # 需大于出队阻塞时间
+                )
+                self._redis.ping()
+                logger.info(f"任务存储使用 Redis: {redis_config.get('host')}:{redis_config.get('port')}/{redis_config.get('db')}")
+            except Exception as e:
+                logger.error(f"任务存储 Redis 连接失败，回退到 SQLite: {e}")
+                self.backend = "sqlite"
+                self._redis = None
+        
+        if self.backend == "sqlite":
+            self._init_sqlite()
+            logger.info(f"任务存储使用 SQLite: {self.sqlite_path}")
+        elif self.backend == "memory":
+            logger.warning("任务存储使用内存模式：仅支持单进程，重启后任务状态将丢失")
+    
+    # ========== 键名与连接 ==========
+    
+    def _get_task_key(self, task_id: str) -> str:
+        """任务状态键名"""
+        if HAS_CONFIG:
+            return f"{app_config.Redis.TASK_KEY_PREFIX}:{task_id}"
+        return f"kbjx:task:{task_id}"
+    
+    def _get_file_results_key(self, task_id: str) -> str:
+        """单文件结果列表键名"""
+        return f"{self._get_task_key(task_id)}:files"
+    
+    def _get_heartbeat_key(self, task_id: str) -> str:
+        """任务心跳键名（领取/心跳时间戳，与任务状态分开写入，避免与进度更新互相覆盖）"""
+        return f"{self._get_task_key(task_id)}:heartbeat"
+    
+    def _get_queue_key(self) -> str:
+        """待处理队列键名"""
+        if HAS_CONFIG:
+            return app_config.Redis.TASK_QUEUE_KEY
+        return "kbjx:task:queue"
+    
+    def _get_processing_key(self) -> str:
+        """处理中列表键名"""
+        if HAS_CONFIG:
+            return app_config.Redis.TASK_PROCESSING_KEY
+        return "kbjx:task:processing"
+    
+    def _connect(self) -> sqlite3.Connection:
+        """创建 SQLite 连接（每次操作独立连接，线程/进程安全）"""
+        conn = sqlite3.connect(self.sqlite_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def _init_sqlite(self):
+        """初始化 SQLite 表结构"""
+        Path(self.sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, task_id TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'queued', worker TEXT, claimed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_files ("
+                "task_id TEXT NOT NULL, seq INTEGER NOT NULL, result TEXT NOT NULL, PRIMARY KEY (task_id, seq))"
+            )
+        finally:
+            conn.close()
+    
+    # ========== 任务状态 ==========
+    
+    def create_task(self, task_id: str, state: Dict) -> bool:
+        """
+        创建任务状态
+        
+        Args:
+            task_id: 任务 ID
+            state: 初始状态
+        
+        Returns:
+            是否成功
+        """
+        return self._save_task(task_id, dict(state))
+    
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        """
+        获取任务状态
+        
+        Args:
+            task_id: 任务 ID
+        
+        Returns:
+            任务状态，不存在返回 None
+        """
+        if self.backend == "redis" and self._redis:
+            try:
+                raw = self._redis.get(self._get_task_key(task_id))
+                return json.loads(raw) if raw else None
+            except Exception as e:
+                logger.error(f"Redis 查询任务失败: {e}")
+                return None
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT state FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+                return json.loads(row[0]) if row else None
+            except Exception as e:
+                logger.error(f"SQLite 查询任务失败: {e}")
+                return None
+            finally:
+                conn.close()
+        else:
+            with self._memory_lock:
+                task = self._memory_tasks.get(task_id)
+                return json.loads(json.dumps(task)) if task is not None else None
+    
+    def update_task(self, task_id: str, updates: Dict) -> bool:
+        """
+        合并更新任务状态（顶层键覆盖）
+        
+        每个任务同一时刻只有一个 worker 写入，读-改-写无需加锁。
+        
+        Args:
+            task_id: 任务 ID
+            updates: 需要更新的字段
+        
+        Returns:
+            是否成功
+        """
+        if self.backend == "memory":
+            with self._memory_lock:
+                self._memory_tasks.setdefault(task_id, {}).update(json.loads(json.dumps(updates)))
+            return True
+        
+        state = self.get_task(task_id) or {}
+        state.update(updates)
+        return self._save_task(task_id, state)
+    
+    def _save_task(self, task_id: str, state: Dict) -> bool:
+        """写入完整任务状态"""
+        if self.backend == "redis" and self._redis:
+            try:
+                self._redis.set(self._get_task_key(task_id), json.dumps(state, ensure_ascii=False), ex=self.ttl_seconds)
+                return True
+            except Exception as e:
+                logger.error(f"Redis 写入任务失败: {e}")
+                return False
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tasks (task_id, state, updated_at) VALUES (?, ?, ?)",
+                    (task_id, json.dumps(state, ensure_ascii=False), time.time())
+                )
+                return True
+            except Exception as e:
+                logger.error(f"SQLite 写入任务失败: {e}")
+                return False
+            finally:
+                conn.close()
+        else:
+            with self._memory_lock:
+                self._memory_tasks[task_id] = json.loads(json.dumps(state))
+            return True
+    
+    def purge_expired(self) -> int:
+        """
+        清理过期任务状态（Redis 依赖键 TTL，无需处理）
+        
+        Returns:
+            删除的任务数
+        """
+        if self.backend != "sqlite":
+            return 0
+        
+        cutoff = time.time() - self.ttl_seconds
+        conn = self._connect()
+        try:
+            deleted = conn.execute("DELETE FROM tasks WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM jobs WHERE status = 'done' AND claimed_at < ?", (cutoff,))
+            conn.execute("DELETE FROM task_files WHERE task_id NOT IN (SELECT task_id FROM tasks)")
+            if deleted:
+                logger.info(f"清理过期任务状态: {deleted} 个")
+            return deleted
+        except Exception as e:
+            logger.error(f"清理过期任务失败: {e}")
+            return 0
+        finally:
+            conn.close()
+    
+    # ========== 单文件结果 ==========
+    
+    def append_file_result(self, task_id: str, result: Dict) -> bool:
+        """
+        追加一个已完成文件的结果（按完成顺序）
+        
+        每个任务同一时刻只有一个 worker 写入，序号按已有结果数递增。
+        
+        Args:
+            task_id: 任务 ID
+            result: 单文件结果（需可 JSON 序列化）
+        
+        Returns:
+            是否成功
+        """
+        raw = json.dumps(result, ensure_ascii=False)
+        if self.backend == "redis" and self._redis:
+            try:
+                key = self._get_file_results_key(task_id)
+                pipe = self._redis.pipeline()
+                pipe.rpush(key, raw)
+                pipe.expire(key, self.ttl_seconds)
+                pipe.execute()
+                return True
+            except Exception as e:
+                logger.error(f"Redis 写入文件结果失败: {e}")
+                return False
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT INTO task_files (task_id, seq, result) "
+                    "VALUES (?, (SELECT COUNT(*) FROM task_files WHERE task_id = ?), ?)",
+                    (task_id, task_id, raw)
+                )
+                return True
+            except Exception as e:
+                logger.error(f"SQLite 写入文件结果失败: {e}")
+                return False
+            finally:
+                conn.close()
+        else:
+            with self._memory_lock:
+                self._memory_file_results.setdefault(task_id, []).append(raw)
+            return True
+    
+    def get_file_results(self, task_id: str, start: int = 0) -> List[Dict]:
+        """
+        读取单文件结果（从第 start 个开始，按完成顺序）
+        
+        Args:
+            task_id: 任务 ID
+            start: 起始偏移（已读取的结果数）
+        
+        Returns:
+            单文件结果列表
+        """
+        start = max(0, start)
+        if self.backend == "redis" and self._redis:
+            try:
+                rows = self._redis.lrange(self._get_file_results_key(task_id), start, -1)
+            except Exception as e:
+                logger.error(f"Redis 查询文件结果失败: {e}")
+                return []
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                rows = [row[0] for row in conn.execute(
+                    "SELECT result FROM task_files WHERE task_id = ? AND seq >= ? ORDER BY seq",
+                    (task_id, start)
+                )]
+            except Exception as e:
+                logger.error(f"SQLite 查询文件结果失败: {e}")
+                return []
+            finally:
+                conn.close()
+        else:
+            with self._memory_lock:
+                rows = self._memory_file_results.get(task_id, [])[start:]
+        return [json.loads(raw) for raw in rows]
+    
+    def clear_file_results(self, task_id: str) -> bool:
+        """
+        清空单文件结果（任务重新处理前调用）
+        
+        Returns:
+            是否成功
+        """
+        if self.backend == "redis" and self._redis:
+            try:
+                self._redis.delete(self._get_file_results_key(task_id))
+                return True
+            except Exception as e:
+                logger.error(f"Redis 清空文件结果失败: {e}")
+                return False
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM task_files WHERE task_id = ?", (task_id,))
+                return True
+            except Exception as e:
+                logger.error(f"SQLite 清空文件结果失败: {e}")
+                return False
+            finally:
+                conn.close()
+        else:
+            with self._memory_lock:
+                self._memory_file_results.pop(task_id, None)
+            return True
+    
+    # ========== 工作队列 ==========
+    
+    def enqueue(self, task_id: str, payload: Dict) -> bool:
+        """
+        提交任务到工作队列
+        
+        Args:
+            task_id: 任务 ID
+            payload: 任务参数（需可 JSON 序列化）
+        
+        Returns:
+            是否成功
+        """
+        job = {"task_id": task_id, "payload": payload}
+        if self.backend == "redis" and self._redis:
+            try:
+                self._redis.lpush(self._get_queue_key(), json.dumps(job, ensure_ascii=False))
+                return True
+            except Exception as e:
+                logger.error(f"Redis 入队失败: {e}")
+                return False
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT INTO jobs (task_id, payload) VALUES (?, ?)",
+                    (task_id, json.dumps(payload, ensure_ascii=False))
+                )
+                return True
+            except Exception as e:
+                logger.error(f"SQLite 入队失败: {e}")
+                return False
+            finally:
+                conn.close()
+        else:
+            self._memory_queue.put(job)
+            return True
+    
+    def dequeue(self, timeout: int = 2, worker: Optional[str] = None) -> Optional[Dict]:
+        """
+        领取一个任务（阻塞至多 timeout 秒）
+        
+        领取的任务进入"处理中"状态，处理完成后需调用 ack()。
+        
+        Args:
+            timeout: 最长等待秒数
+            worker: 领取者标识（用于日志与故障恢复）
+        
+        Returns:
+            {"task_id": str, "payload": dict, "job_id": ...}，无任务返回 None
+        """
+        worker = worker or default_worker_name()
+        
+        if self.backend == "redis" and self._redis:
+            try:
+                # BRPOPLPUSH（Redis 2.2+）：与 BLMOVE RIGHT LEFT 等价，兼容 Redis 5.x
+                raw = self._redis.brpoplpush(self._get_queue_key(), self._get_processing_key(), timeout)
+            except Exception as e:
+                logger.error(f"Redis 出队失败: {e}")
+                time.sleep(timeout)
+                return None
+            if raw is None:
+                return None
+            job = json.loads(raw)
+            job["job_id"] = raw
+            now = time.time()
+            try:
+                self._redis.set(self._get_heartbeat_key(job["task_id"]), now, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.error(f"Redis 记录任务心跳失败: {e}")
+            self.update_task(job["task_id"], {"worker": worker, "claimed_at": now})
+            return job
+        elif self.backend == "sqlite":
+            deadline = time.time() + timeout
+            while True:
+                job = self._claim_sqlite_job(worker)
+                if job is not None or time.time() >= deadline:
+                    return job
+                time.sleep(0.5)
+        else:
+            try:
+                job = self._memory_queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            job["job_id"] = None
+            return job
+    
+    def _claim_sqlite_job(self, worker: str) -> Optional[Dict]:
+        """SQLite：在写事务中领取最早的待处理任务"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, task_id, payload FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, claimed_at = ? WHERE id = ?",
+                (worker, time.time(), row[0])
+            )
+            conn.execute("COMMIT")
+            return {"task_id": row[1], "payload": json.loads(row[2]), "job_id": row[0]}
+        except Exception as e:
+            logger.error(f"SQLite 出队失败: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            return None
+        finally:
+            conn.close()
+    
+    def ack(self, job: Dict) -> bool:
+        """
+        确认任务处理完成，从处理中列表移除
+        
+        Args:
+            job: dequeue() 返回的任务
+        
+        Returns:
+            是否成功
+        """
+        if self.backend == "redis" and self._redis:
+            try:
+                self._redis.lrem(self._get_processing_key(), 1, job["job_id"])
+                return True
+            except Exception as e:
+                logger.error(f"Redis 确认任务失败: {e}")
+                return False
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                conn.execute("UPDATE jobs SET status = 'done' WHERE id = ?", (job["job_id"],))
+                return True
+            except Exception as e:
+                logger.error(f"SQLite 确认任务失败: {e}")
+                return False
+            finally:
+                conn.close()
+        return True
+    
+    def heartbeat(self, job: Dict, worker: Optional[str] = None) -> bool:
+        """
+        刷新处理中任务的心跳（处理期间定期调用，长任务不会被当作失效任务重新入队）
+        
+        Args:
+            job: dequeue() 返回的任务
+            worker: 领取者标识
+        
+        Returns:
+            任务是否仍由该 worker 持有（False 表示已被恢复到队列，可能被重复处理）
+        """
+        worker = worker or default_worker_name()
+        
+        if self.backend == "redis" and self._redis:
+            try:
+                # 处理中列表只包含正在处理的任务，LRANGE 逐项比较即可（LPOS 需要 Redis 6.0.6）
+                if job["job_id"] not in self._redis.lrange(self._get_processing_key(), 0, -1):
+                    return False
+                self._redis.set(self._get_heartbeat_key(job["task_id"]), time.time(), ex=self.ttl_seconds)
+                return True
+            except Exception as e:
+                logger.error(f"Redis 刷新任务心跳失败: {e}")
+                return True
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                return conn.execute(
+                    "UPDATE jobs SET claimed_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                    (time.time(), job["job_id"], worker)
+                ).rowcount > 0
+            except Exception as e:
+                logger.error(f"SQLite 刷新任务心跳失败: {e}")
+                return True
+            finally:
+                conn.close()
+        return True
+    
+    def recover_stale_jobs(self, timeout_seconds: int) -> int:
+        """
+        将超时没有心跳的任务重新放回队列（worker 崩溃或重启后恢复）
+        
+        多个进程同时恢复是安全的：只有成功从处理中列表移除任务的一方会重新入队。
+        
+        Args:
+            timeout_seconds: 最近一次领取/心跳后超过该时长即视为失效
+        
+        Returns:
+            重新入队的任务数
+        """
+        cutoff = time.time() - timeout_seconds
+        recovered = 0
+        
+        if self.backend == "redis" and self._redis:
+            try:
+                for raw in self._redis.lrange(self._get_processing_key(), 0, -1):
+                    job = json.loads(raw)
+                    heartbeat = self._redis.get(self._get_heartbeat_key(job["task_id"]))
+                    if heartbeat is None:
+                        # 旧版本领取的任务只在任务状态中记录领取时间
+                        heartbeat = (self.get_task(job["task_id"]) or {}).get("claimed_at", 0)
+                    if float(heartbeat) >= cutoff:
+                        continue
+                    if not self._redis.lrem(self._get_processing_key(), 1, raw):
+                        continue
+                    self._redis.rpush(self._get_queue_key(), raw)
+                    recovered += 1
+            except Exception as e:
+                logger.error(f"Redis 恢复任务失败: {e}")
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                recovered = conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL "
+                    "WHERE status = 'running' AND claimed_at < ?",
+                    (cutoff,)
+                ).rowcount
+            except Exception as e:
+                logger.error(f"SQLite 恢复任务失败: {e}")
+            finally:
+                conn.close()
+        
+        if recovered:
+            logger.warning(f"已将 {recovered} 个超时任务重新放回队列")
+        return recovered
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取队列统计信息
+        
+        Returns:
+            {"queued": xxx, "processing": xxx}
+        """
+        if self.backend == "redis" and self._redis:
+            try:
+                return {
+                    "queued": self._redis.llen(self._get_queue_key()),
+                    "processing": self._redis.llen(self._get_processing_key())
+                }
+            except Exception as e:
+                logger.error(f"Redis 统计失败: {e}")
+                return {"queued": 0, "processing": 0}
+        elif self.backend == "sqlite":
+            conn = self._connect()
+            try:
+                counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+                return {"queued": counts.get("queued", 0), "processing": counts.get("running", 0)}
+            finally:
+                conn.close()
+        else:
+            return {"queued": self._memory_queue.qsize(), "processing": 0}
+
+
+def default_worker_name() -> str:
+    """默认 worker 标识: 主机名:进程号:线程号"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def create_task_store() -> TaskStore:
+    """按配置创建任务存储（auto：Redis 启用时用 Redis，否则 SQLite）"""
+    backend = app_config.TaskQueue.BACKEND
+    if backend == "auto":
+        backend = "redis" if app_config.Redis.ENABLED else "sqlite"
+    return TaskStore(
+        backend=backend,
+        redis_config=app_config.get_redis_config(),
+        sqlite_path=app_config.TaskQueue.SQLITE_PATH,
+        ttl_days=app_config.TaskQueue.TASK_TTL_DAYS
+    )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量任务 worker 进程
+从共享任务队列（Redis / SQLite）领取批量任务并处理，可在多台机器上启动多个实例。
+API 进程设置 RUN_WORKER_IN_API=false 时，由本脚本负责消费队列。
+"""
+import asyncio
+import os
+import socket
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import config
+from utils.logger import setup_logger
+
+# 初始化日志
+logger = setup_logger()
+
+
+async def run_workers():
+    """启动配置数量的队列消费者"""
+    from api.v1.endpoints import run_queue_worker, task_store, worker_pool
+    
+    task_store.purge_expired()
+    workers = [
+        run_queue_worker(f"{socket.gethostname()}:{os.getpid()}:worker-{i}")
+        for i in range(config.TaskQueue.WORKER_CONCURRENCY)
+    ]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        worker_pool.shutdown(wait=False)
+
+
+def main():
+    """执行 worker 主循环"""
+    logger.info("=" * 60)
+    logger.info("批量任务 worker 启动")
+    logger.info("=" * 60)
+    
+    if not config.validate():
+        logger.error("配置验证失败，worker 退出")
+        sys.exit(1)
+    
+    try:
+        asyncio.run(run_workers())
+    except KeyboardInterrupt:
+        logger.info("worker 已停止")
+
+
+if __name__ == "__main__":
+    main()